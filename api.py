@@ -17,7 +17,9 @@ PROJECT_ROOT = Path(__file__).parent
 sys.path.insert(0, str(PROJECT_ROOT))
 
 from src.agent.dia_agent_fast import DiaAgentFast
-from src.llm_client import create_llm_api
+from src.llm_client import create_routing_llm_api
+from src.llm_metrics import get_metrics_registry
+from src.graph_client import close_graph_clients, graph_clients_stats
 
 
 # ============================================
@@ -83,6 +85,7 @@ class RiskReportResponse(BaseModel):
     """风险报告响应"""
     warnings: List[RiskWarningResponse]
     safe_medications: List[str]
+    unrecognized_medications: List[str] = []
     summary: str
 
 
@@ -108,6 +111,7 @@ class ClinicalReportResponse(BaseModel):
 # ============================================
 
 _agent = None
+_llm_api = None
 
 
 def _env_bool(name: str, default: bool) -> bool:
@@ -128,9 +132,10 @@ USE_REFLECTION = _env_bool("DIA_USE_REFLECTION", False)
 
 def get_agent():
     """获取或创建 Agent 实例"""
-    global _agent
+    global _agent, _llm_api
     if _agent is None:
-        llm_api = create_llm_api(LLM_PROVIDER)
+        # DIA_LLM_PROVIDER 支持逗号分隔多个提供商，此时启用多提供商路由
+        _llm_api = llm_api = create_routing_llm_api(LLM_PROVIDER)
         if USE_FAST_AGENT:
             _agent = DiaAgentFast(
                 llm_api=llm_api,
@@ -165,6 +170,9 @@ async def root():
 async def health_check():
     """健康检查"""
     agent = get_agent()
+    llm_api = getattr(agent, "llm_api", None)
+    fusion_cache = getattr(agent.decision_fusion, "fusion_cache", None)
+    rule_engine = getattr(agent.risk_detector, "rule_engine", None)
     return {
         "status": "healthy",
         "neo4j_connected": agent.risk_detector.driver is not None,
@@ -176,7 +184,11 @@ async def health_check():
             "reranker": "ready" if getattr(agent, "reranker", None) else "disabled",
             "cypher_retriever": "ready" if hasattr(agent, "cypher_retriever") else "disabled",
             "decision_fusion": "ready"
-        }
+        },
+        "llm_routing": llm_api.get_stats() if hasattr(llm_api, "get_stats") else None,
+        "fusion_cache": fusion_cache.get_stats() if fusion_cache else None,
+        "rule_engine": rule_engine.get_stats() if rule_engine else None,
+        "graph_clients": graph_clients_stats()
     }
 
 
@@ -251,6 +263,7 @@ async def quick_risk_check(request: QuickRiskCheckRequest):
                 for w in report.warnings
             ],
             safe_medications=report.safe_medications,
+            unrecognized_medications=report.unrecognized_medications,
             summary=report.summary
         )
     except Exception as e:
@@ -272,13 +285,32 @@ async def query_drug_info(request: DrugQueryRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/metrics/llm", tags=["监控"])
+async def llm_metrics(recent: int = 0):
+    """
+    LLM 调用指标
+    
+    按调用方（病例抽取、反思校验、决策融合、Text-to-Cypher 等）汇总
+    token 用量、耗时与缓存命中情况，可选返回最近调用明细。
+    """
+    registry = get_metrics_registry()
+    result = {"by_caller": registry.summary()}
+    if recent > 0:
+        result["recent"] = registry.recent(recent)
+    return result
+
+
 @app.on_event("shutdown")
 async def shutdown_event():
     """关闭时清理资源"""
-    global _agent
+    global _agent, _llm_api
     if _agent:
         _agent.close()
         _agent = None
+    if hasattr(_llm_api, "close"):
+        _llm_api.close()
+    _llm_api = None
+    close_graph_clients()
 
 
 # ============================================
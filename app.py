@@ -56,9 +56,10 @@ ENABLE_PREWARM = _env_bool("DIA_PREWARM", True)
 def _build_agent():
     """构建 Agent 实例"""
     global _llm_api
-    from src.llm_client import create_llm_api
+    from src.llm_client import create_routing_llm_api
 
-    _llm_api = create_llm_api(LLM_PROVIDER)
+    # DIA_LLM_PROVIDER 支持逗号分隔多个提供商，此时启用多提供商路由
+    _llm_api = create_routing_llm_api(LLM_PROVIDER)
 
     if USE_FAST_AGENT:
         from src.agent.dia_agent_fast import DiaAgentFast
@@ -104,6 +105,19 @@ def prewarm_agent_async():
     threading.Thread(target=_worker, daemon=True).start()
 
 
+def shutdown():
+    """退出时清理资源（Agent 连接、LLM 路由线程池）"""
+    global _agent, _llm_api
+    with _agent_lock:
+        if _agent is not None:
+            _agent.close()
+            _agent = None
+        if hasattr(_llm_api, "close"):
+            _llm_api.close()
+        _llm_api = None
+        _agent_ready.clear()
+
+
 # ============================================
 # 核心渲染函数
 # ============================================
@@ -1413,9 +1427,12 @@ if __name__ == "__main__":
 
     prewarm_agent_async()
     demo = create_demo()
-    demo.launch(
-        server_name="0.0.0.0",
-        server_port=7860,
-        share=False,
-        show_error=True,
-    )
+    try:
+        demo.launch(
+            server_name="0.0.0.0",
+            server_port=7860,
+            share=False,
+            show_error=True,
+        )
+    finally:
+        shutdown()
@@ -1,18 +1,32 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-Neo4j导入工具 - 执行Cypher脚本导入图谱数据
+Neo4j导入工具 - 导入图谱数据
 
 功能:
 1. 连接Neo4j数据库
-2. 执行import_graph.cypher脚本
-3. 验证导入结果
-4. 生成统计报告
+2. 导入图谱数据，两种模式:
+   - json（默认）: 直接读取 graph_data.jsonl（不存在时读取 graph_data.json），按节点/关系类型分组，
+     用参数化 UNWIND $rows MERGE 语句在显式事务中批量写入
+   - cypher: 逐条执行 import_graph.cypher 脚本
+   - incremental: 按药品内容哈希与在线图谱比对，只新增/更新/删除变化的药品及其关系（无需清库）
+3. 写入图谱版本戳（供 Cypher 结果缓存失效）
+4. 验证导入结果
+5. 生成统计报告
+
+用法:
+    python scripts/import_neo4j.py [--mode json|cypher|incremental] [--batch-size 500]
 """
 
 import sys
+import json
 import time
+import uuid
+import hashlib
+import argparse
+from collections import OrderedDict, defaultdict
 from pathlib import Path
+from typing import Any, Dict, Iterable, List, Tuple
 
 try:
     from neo4j import GraphDatabase
@@ -21,6 +35,140 @@ except ImportError:
     print("请运行: pip install neo4j")
     sys.exit(1)
 
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from src.graph.import_rows import group_import_rows, iter_graph_data
+
+
+# 约束和索引（与 src/graph/cypher_generator.py 保持一致）
+SCHEMA_STATEMENTS = [
+    "CREATE CONSTRAINT drug_name_unique IF NOT EXISTS FOR (d:Drug) REQUIRE d.name IS UNIQUE",
+    "CREATE CONSTRAINT brand_name_unique IF NOT EXISTS FOR (b:Brand) REQUIRE b.name IS UNIQUE",
+    "CREATE CONSTRAINT category_name_unique IF NOT EXISTS FOR (c:Category) REQUIRE c.name IS UNIQUE",
+    "CREATE INDEX drug_id_idx IF NOT EXISTS FOR (d:Drug) ON (d.id)",
+    "CREATE INDEX disease_name_idx IF NOT EXISTS FOR (dis:Disease) ON (dis.name)",
+    "CREATE INDEX metric_name_idx IF NOT EXISTS FOR (m:Metric) ON (m.name)",
+]
+
+# 各类节点/关系的 UNWIND 语句（按写入顺序）
+UNWIND_STATEMENTS = OrderedDict([
+    ("categories", "UNWIND $rows AS row MERGE (:Category {name: row.name})"),
+    ("metrics", """UNWIND $rows AS row
+MERGE (:Metric {name: row.name, full_name: row.full_name, unit: row.unit})"""),
+    ("drugs", """UNWIND $rows AS row
+MERGE (d:Drug {name: row.name})
+SET d = row.props"""),
+    ("brands", "UNWIND $rows AS row MERGE (:Brand {name: row.name})"),
+    ("diseases", "UNWIND $rows AS row MERGE (:Disease {name: row.name, type: row.type})"),
+    ("is_brand_of", """UNWIND $rows AS row
+MATCH (d:Drug {id: row.drug_id}), (b:Brand {name: row.brand})
+MERGE (b)-[:IS_BRAND_OF]->(d)"""),
+    ("belongs_to", """UNWIND $rows AS row
+MATCH (d:Drug {id: row.drug_id}), (c:Category {name: row.category})
+MERGE (d)-[:BELONGS_TO]->(c)"""),
+    ("treats", """UNWIND $rows AS row
+MATCH (d:Drug {id: row.drug_id}), (dis:Disease {name: row.disease, type: row.type})
+MERGE (d)-[:TREATS]->(dis)"""),
+    ("forbidden_for", """UNWIND $rows AS row
+MATCH (d:Drug {id: row.drug_id}), (dis:Disease {name: row.disease, type: row.type})
+MERGE (d)-[:FORBIDDEN_FOR {severity: '禁忌'}]->(dis)"""),
+])
+
+# 以药品为单位的关系（增量更新时整体删除后重建）
+DRUG_EDGE_KINDS = ("is_brand_of", "belongs_to", "treats", "forbidden_for", "contraindicated_if")
+
+DELETE_DRUG_EDGES = [
+    """UNWIND $names AS name
+MATCH (:Drug {name: name})-[r:BELONGS_TO|TREATS|FORBIDDEN_FOR|CONTRAINDICATED_IF]->()
+DELETE r""",
+    """UNWIND $names AS name
+MATCH (:Brand)-[r:IS_BRAND_OF]->(:Drug {name: name})
+DELETE r""",
+]
+
+DELETE_DRUGS = "UNWIND $names AS name MATCH (d:Drug {name: name}) DETACH DELETE d"
+
+# 删除不再被任何条目引用的孤立共享节点
+DELETE_ORPHANS = [
+    "MATCH (b:Brand) WHERE NOT b.name IN $brands AND NOT (b)--() DELETE b",
+    "MATCH (c:Category) WHERE NOT c.name IN $categories AND NOT (c)--() DELETE c",
+    "MATCH (dis:Disease) WHERE NOT [dis.name, dis.type] IN $diseases AND NOT (dis)--() DELETE dis",
+]
+
+# CONTRAINDICATED_IF 按属性组合合并，可选属性的组合不同时各用一条语句
+CONTRAINDICATION_PROPERTIES = ('operator', 'severity', 'value', 'value_min', 'value_max', 'unit')
+
+
+def contraindication_statement(keys: Tuple[str, ...]) -> str:
+    """指定属性组合的 CONTRAINDICATED_IF UNWIND 语句"""
+    props = ", ".join(f"{key}: row.{key}" for key in keys)
+    return f"""UNWIND $rows AS row
+MATCH (d:Drug {{id: row.drug_id}}), (m:Metric {{name: row.metric}})
+MERGE (d)-[:CONTRAINDICATED_IF {{{props}}}]->(m)"""
+
+
+def build_import_rows(graph_data: Iterable[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    将图谱数据转换为按节点/关系类型分组的参数行（语义见 src/graph/import_rows.py），
+    并为每个药品计算内容哈希
+    """
+    rows = group_import_rows(graph_data)
+
+    # 内容哈希覆盖药品属性和全部出边（含受其他条目影响的同名疾病节点连接），写入 Drug.content_hash
+    drug_edges = group_drug_edges(rows)
+    for row in rows["drugs"]:
+        payload = json.dumps(
+            [row["props"], {kind: sorted(json.dumps(edge, ensure_ascii=False, sort_keys=True) for edge in edges)
+                            for kind, edges in drug_edges[row["props"]["id"]].items()}],
+            ensure_ascii=False, sort_keys=True
+        )
+        row["props"]["content_hash"] = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    return rows
+
+
+def group_drug_edges(rows: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+    """按药品 id 分组关系行: {drug_id: {关系类型: [行, ...]}}"""
+    grouped: Dict[str, Dict[str, List[Dict[str, Any]]]] = defaultdict(lambda: defaultdict(list))
+    for kind in DRUG_EDGE_KINDS:
+        for row in rows.get(kind, []):
+            grouped[row["drug_id"]][kind].append(row)
+    return grouped
+
+
+def diff_drug_hashes(
+    rows: Dict[str, List[Dict[str, Any]]],
+    live_hashes: Dict[str, Any]
+) -> Tuple[List[str], List[str], List[str]]:
+    """
+    对比 graph_data 与在线图谱的药品内容哈希
+
+    Args:
+        rows: build_import_rows 的结果
+        live_hashes: 在线图谱 {Drug.name: Drug.content_hash}
+
+    Returns:
+        (新增药品名, 变化药品名, 删除药品名)
+    """
+    wanted = {row["name"]: row["props"]["content_hash"] for row in rows.get("drugs", [])}
+    added = [name for name in wanted if name not in live_hashes]
+    updated = [name for name, content_hash in wanted.items()
+               if name in live_hashes and live_hashes[name] != content_hash]
+    deleted = [name for name in live_hashes if name not in wanted]
+    return added, updated, deleted
+
+
+def unwind_statements(rows: Dict[str, List[Dict[str, Any]]]) -> List[Tuple[str, str, List[Dict[str, Any]]]]:
+    """按写入顺序展开 (类型, UNWIND 语句, 参数行)，CONTRAINDICATED_IF 按属性组合拆分"""
+    statements = [(kind, cypher, rows.get(kind, [])) for kind, cypher in UNWIND_STATEMENTS.items()]
+    shapes: Dict[Tuple[str, ...], List[Dict[str, Any]]] = OrderedDict()
+    for row in rows.get("contraindicated_if", []):
+        keys = tuple(key for key in CONTRAINDICATION_PROPERTIES if key in row)
+        shapes.setdefault(keys, []).append(row)
+    for keys, shape_rows in shapes.items():
+        statements.append(("contraindicated_if", contraindication_statement(keys), shape_rows))
+    return statements
+
 
 class Neo4jImporter:
     """Neo4j数据导入器"""
@@ -84,8 +232,13 @@ class Neo4jImporter:
         with open(filepath, 'r', encoding='utf-8') as f:
             content = f.read()
         
-        # 按分号分割语句
-        statements = [stmt.strip() for stmt in content.split(';') if stmt.strip() and not stmt.strip().startswith('//')]
+        # 按分号分割语句（去掉语句前的注释行，注释后紧跟的语句不能被整体跳过）
+        statements = []
+        for chunk in content.split(';'):
+            lines = [line for line in chunk.strip().splitlines() if not line.strip().startswith('//')]
+            stmt = "\n".join(lines).strip()
+            if stmt:
+                statements.append(stmt)
         
         print(f"📊 总语句数: {len(statements)}")
         
@@ -95,10 +248,6 @@ class Neo4jImporter:
             error_count = 0
             
             for i, stmt in enumerate(statements):
-                # 跳过注释
-                if stmt.startswith('//'):
-                    continue
-                
                 try:
                     session.run(stmt)
                     success_count += 1
@@ -118,6 +267,148 @@ class Neo4jImporter:
         print(f"   成功: {success_count}")
         print(f"   失败: {error_count}")
     
+    def import_graph_data(self, filepath: str, batch_size: int = 500) -> Dict[str, int]:
+        """
+        从图谱数据批量导入（参数化 UNWIND，每 batch_size 行一个显式事务）
+        
+        Args:
+            filepath: graph_data.jsonl / graph_data.json 路径
+            batch_size: 每个事务写入的行数
+        
+        Returns:
+            各节点/关系类型写入的行数
+        """
+        print(f"\n📖 读取图谱数据: {filepath}")
+        rows = build_import_rows(iter_graph_data(filepath))
+        
+        # 先建约束和索引，MERGE/MATCH 走索引查找
+        with self.driver.session() as session:
+            for stmt in SCHEMA_STATEMENTS:
+                session.run(stmt).consume()
+        
+        statements = unwind_statements(rows)
+        
+        counts: Dict[str, int] = defaultdict(int)
+        transactions = 0
+        with self.driver.session() as session:
+            for kind, cypher, kind_rows in statements:
+                for start in range(0, len(kind_rows), batch_size):
+                    batch = kind_rows[start:start + batch_size]
+                    session.execute_write(lambda tx: tx.run(cypher, rows=batch).consume())
+                    counts[kind] += len(batch)
+                    transactions += 1
+                if kind_rows:
+                    print(f"   {kind:20s}: {counts[kind]:5d} 行")
+        
+        print(f"\n✅ 导入完成! 共 {transactions} 个事务")
+        return dict(counts)
+    
+    def sync_graph_data(self, filepath: str, batch_size: int = 20) -> Dict[str, int]:
+        """
+        增量更新: 比对药品内容哈希，只写入变化的药品（图谱全程可用）
+        
+        每批 batch_size 个药品一个事务: 删除这些药品的旧关系，更新节点属性并重建关系；
+        graph_data 中已不存在的药品连同关系一起删除，随后清理无引用的孤立共享节点
+        
+        Args:
+            filepath: graph_data.jsonl / graph_data.json 路径
+            batch_size: 每个事务处理的药品数
+        
+        Returns:
+            {"added": n, "updated": n, "deleted": n, "unchanged": n}
+        """
+        print(f"\n📖 读取图谱数据: {filepath}")
+        rows = build_import_rows(iter_graph_data(filepath))
+        
+        with self.driver.session() as session:
+            for stmt in SCHEMA_STATEMENTS:
+                session.run(stmt).consume()
+            live_hashes = {
+                record["name"]: record["content_hash"]
+                for record in session.run("MATCH (d:Drug) RETURN d.name AS name, d.content_hash AS content_hash")
+            }
+        
+        added, updated, deleted = diff_drug_hashes(rows, live_hashes)
+        summary = {
+            "added": len(added),
+            "updated": len(updated),
+            "deleted": len(deleted),
+            "unchanged": len(rows.get("drugs", [])) - len(added) - len(updated),
+        }
+        print(f"📊 新增 {summary['added']}，更新 {summary['updated']}，"
+              f"删除 {summary['deleted']}，未变化 {summary['unchanged']}")
+        if not (added or updated or deleted):
+            return summary
+        
+        drug_rows = {row["name"]: row for row in rows["drugs"]}
+        drug_edges = group_drug_edges(rows)
+        changed = added + updated
+        
+        with self.driver.session() as session:
+            for start in range(0, len(deleted), batch_size):
+                names = deleted[start:start + batch_size]
+                session.execute_write(lambda tx: tx.run(DELETE_DRUGS, names=names).consume())
+            
+            for start in range(0, len(changed), batch_size):
+                names = changed[start:start + batch_size]
+                batch = self._drug_batch_rows(rows, [drug_rows[name] for name in names], drug_edges)
+                session.execute_write(lambda tx: self._write_drug_batch(tx, names, batch))
+            
+            session.execute_write(lambda tx: [
+                tx.run(stmt,
+                       brands=[row["name"] for row in rows.get("brands", [])],
+                       categories=[row["name"] for row in rows.get("categories", [])],
+                       diseases=[[row["name"], row["type"]] for row in rows.get("diseases", [])]).consume()
+                for stmt in DELETE_ORPHANS
+            ])
+        
+        print("✅ 增量更新完成!")
+        return summary
+    
+    @staticmethod
+    def _drug_batch_rows(
+        rows: Dict[str, List[Dict[str, Any]]],
+        drugs: List[Dict[str, Any]],
+        drug_edges: Dict[str, Dict[str, List[Dict[str, Any]]]]
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """一批药品的节点行、关系行及其引用的共享节点行"""
+        batch: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        batch["drugs"] = drugs
+        for drug in drugs:
+            for kind, edges in drug_edges[drug["props"]["id"]].items():
+                batch[kind].extend(edges)
+        
+        brands = {row["brand"] for row in batch["is_brand_of"]}
+        categories = {row["category"] for row in batch["belongs_to"]}
+        diseases = {(row["disease"], row["type"]) for kind in ("treats", "forbidden_for") for row in batch[kind]}
+        batch["brands"] = [row for row in rows.get("brands", []) if row["name"] in brands]
+        batch["categories"] = [row for row in rows.get("categories", []) if row["name"] in categories]
+        batch["diseases"] = [row for row in rows.get("diseases", []) if (row["name"], row["type"]) in diseases]
+        batch["metrics"] = rows.get("metrics", [])
+        return batch
+    
+    @staticmethod
+    def _write_drug_batch(tx, names: List[str], batch: Dict[str, List[Dict[str, Any]]]):
+        for stmt in DELETE_DRUG_EDGES:
+            tx.run(stmt, names=names).consume()
+        for _, cypher, kind_rows in unwind_statements(batch):
+            if kind_rows:
+                tx.run(cypher, rows=kind_rows).consume()
+    
+    def write_graph_version(self) -> str:
+        """
+        写入图谱版本戳 (:GraphMeta {name: 'graph'}).version
+        在线服务的 Cypher 结果缓存定期读取该值，版本变化时自动清空（见 src/cypher_cache.py）
+        """
+        version = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        with self.driver.session() as session:
+            session.run("""
+                MERGE (m:GraphMeta {name: 'graph'})
+                SET m.version = $version, m.imported_at = datetime()
+            """, version=version)
+        print(f"🏷️  图谱版本: {version}")
+        return version
+    
     def get_statistics(self):
         """获取图谱统计信息"""
         print("\n" + "=" * 60)
@@ -200,6 +491,14 @@ class Neo4jImporter:
 
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description="糖尿病药品知识图谱 Neo4j 导入工具")
+    parser.add_argument("--mode", choices=["json", "cypher", "incremental"], default="json",
+                        help="json: 从 graph_data.json 批量导入（默认）；cypher: 逐条执行 import_graph.cypher；"
+                             "incremental: 只写入内容变化的药品")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="每个事务写入的行数（json 模式，默认 500）或药品数（incremental 模式，默认 20）")
+    args = parser.parse_args()
+    
     print("=" * 60)
     print("🏥 糖尿病药品知识图谱 - Neo4j导入工具")
     print("=" * 60)
@@ -209,31 +508,46 @@ def main():
     NEO4J_USER = "neo4j"
     NEO4J_PASSWORD = "password123"  # 默认密码,请根据实际修改
     
-    # 项目根目录
-    PROJECT_ROOT = Path(__file__).parent.parent
     CYPHER_FILE = PROJECT_ROOT / "data" / "neo4j" / "import_graph.cypher"
+    # 优先逐行读取流水线输出的 graph_data.jsonl
+    GRAPH_DATA_FILE = PROJECT_ROOT / "data" / "processed" / "graph_data.jsonl"
+    if not GRAPH_DATA_FILE.exists():
+        GRAPH_DATA_FILE = GRAPH_DATA_FILE.with_suffix(".json")
     
     # 检查文件是否存在
-    if not CYPHER_FILE.exists():
+    if args.mode == "cypher" and not CYPHER_FILE.exists():
         print(f"❌ 错误: 找不到文件 {CYPHER_FILE}")
         print("请先运行 src/graph/cypher_generator.py 生成Cypher脚本")
         return
+    if args.mode in ("json", "incremental") and not GRAPH_DATA_FILE.exists():
+        print(f"❌ 错误: 找不到文件 {GRAPH_DATA_FILE}")
+        return
     
     # 连接Neo4j
     importer = Neo4jImporter(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD)
     
     try:
-        # 询问是否清空数据库
-        print("\n⚠️  是否清空现有数据库? (yes/no)")
-        print("   (如果是首次导入,建议选择yes)")
-        response = input("   请输入: ").strip().lower()
-        
-        if response in ['yes', 'y']:
-            importer.clear_database()
+        # 询问是否清空数据库（增量模式不清库）
+        if args.mode != "incremental":
+            print("\n⚠️  是否清空现有数据库? (yes/no)")
+            print("   (如果是首次导入,建议选择yes)")
+            response = input("   请输入: ").strip().lower()
+            
+            if response in ['yes', 'y']:
+                importer.clear_database()
         
         # 执行导入
         start_time = time.time()
-        importer.execute_cypher_file(CYPHER_FILE)
+        if args.mode == "incremental":
+            summary = importer.sync_graph_data(GRAPH_DATA_FILE, batch_size=args.batch_size or 20)
+            if summary["added"] or summary["updated"] or summary["deleted"]:
+                importer.write_graph_version()
+        elif args.mode == "json":
+            importer.import_graph_data(GRAPH_DATA_FILE, batch_size=args.batch_size or 500)
+            importer.write_graph_version()
+        else:
+            importer.execute_cypher_file(CYPHER_FILE)
+            importer.write_graph_version()
         elapsed_time = time.time() - start_time
         
         print(f"\n⏱️  导入耗时: {elapsed_time:.2f} 秒")
@@ -14,7 +14,9 @@ __all__ = [
     "config",
     "get_config",
     "LLMClient",
+    "RoutingLLMClient",
     "create_llm_api",
+    "create_routing_llm_api",
     "create_qwen_api",
     "create_deepseek_api",
     "create_openai_api",
@@ -39,7 +41,9 @@ def __getattr__(name):
 
     if name in {
         "LLMClient",
+        "RoutingLLMClient",
         "create_llm_api",
+        "create_routing_llm_api",
         "create_qwen_api",
         "create_deepseek_api",
         "create_openai_api",
@@ -47,7 +51,9 @@ def __getattr__(name):
     }:
         from .llm_client import (
             LLMClient,
+            RoutingLLMClient,
             create_llm_api,
+            create_routing_llm_api,
             create_qwen_api,
             create_deepseek_api,
             create_openai_api,
@@ -55,7 +61,9 @@ def __getattr__(name):
         )
         mapping = {
             "LLMClient": LLMClient,
+            "RoutingLLMClient": RoutingLLMClient,
             "create_llm_api": create_llm_api,
+            "create_routing_llm_api": create_routing_llm_api,
             "create_qwen_api": create_qwen_api,
             "create_deepseek_api": create_deepseek_api,
             "create_openai_api": create_openai_api,
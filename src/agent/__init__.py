@@ -7,8 +7,12 @@ Dia-Agent 智能诊疗助手模块
 - PatientProfile: 患者画像数据模型
 - CaseAnalyzer: 病例分析器
 - RiskDetector: 风险检测器
+- ContraindicationRuleEngine: 内存禁忌规则引擎
+- DrugResolver: 药品名解析（提及 -> Drug id）
+- PopulationScreener: 向量化人群筛查
 - DecisionFusion: 决策融合器
 - DiaAgent: 主协调器
+- BulkConsultRunner: 离线批量咨询运行器
 """
 
 from .patient_profile import (
@@ -35,6 +39,9 @@ from .risk_detector import (
     RiskSeverity,
 )
 
+from .rule_engine import ContraindicationRuleEngine
+from .drug_resolver import DrugResolver
+
 from .decision_fusion import (
     DecisionFusion,
     ClinicalReport,
@@ -65,6 +72,8 @@ __all__ = [
     "RiskWarning",
     "RiskReport",
     "RiskSeverity",
+    "ContraindicationRuleEngine",
+    "DrugResolver",
     
     # 决策融合
     "DecisionFusion",
@@ -77,6 +86,9 @@ __all__ = [
     "create_dia_agent",
     "DiaAgentFast",
     "get_fast_agent",
+    "BulkConsultRunner",
+    "PopulationScreener",
+    "ScreeningResult",
 ]
 
 
@@ -98,4 +110,16 @@ def __getattr__(name):
         }
         return mapping[name]
 
+    if name in {"PopulationScreener", "ScreeningResult"}:
+        from .population_screener import PopulationScreener, ScreeningResult
+        mapping = {
+            "PopulationScreener": PopulationScreener,
+            "ScreeningResult": ScreeningResult,
+        }
+        return mapping[name]
+
+    if name == "BulkConsultRunner":
+        from .bulk_consult import BulkConsultRunner
+        return BulkConsultRunner
+
     raise AttributeError(f"module 'src.agent' has no attribute '{name}'")
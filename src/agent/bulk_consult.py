@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+离线批量咨询运行器 (Bulk Consult Runner)
+从 JSONL 读取历史病例，本地并行完成病例分析和风险检测，
+通过 OpenAI 兼容的 Batch 接口统一提交 FUSION_PROMPT（不支持时并发调用），
+并以 JSONL 流式写出 ClinicalReport，支持断点续跑
+
+输入格式（每行一个病例）:
+    {"id": "case-001", "case_text": "患者男，55岁..."}
+
+输出格式（每行一个结果，同一 id 以最后一行为准）:
+    {"id": "case-001", "status": "ok", "report": {...}}
+    status: ok / llm_failed（Prompt 未取得 LLM 响应，report 为纯规则建议）/ error（本地分析失败）
+"""
+
+import io
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from ..llm_metrics import llm_call_tag
+
+
+# 支持 /v1/batches 的 OpenAI 兼容提供商
+BATCH_PROVIDERS = {"openai", "qwen", "siliconflow"}
+
+# Batch 任务终止状态
+_BATCH_TERMINAL = {"completed", "failed", "expired", "cancelled"}
+
+# 轮询出错时的退避上限（秒）
+_POLL_BACKOFF_MAX = 300.0
+
+
+class BatchPollError(RuntimeError):
+    """已提交的 Batch 任务连续查询失败（检查点保留，重启后继续轮询）"""
+
+
+class BulkConsultRunner:
+    """
+    批量咨询运行器
+
+    断点续跑:
+    - 输出文件中最后一行 status 为 ok 的病例视为完成，重启后跳过；error / llm_failed 的病例重新处理并追加新行
+    - 已提交但未取回结果的 Batch 任务 id 记录在检查点文件中，重启后继续轮询而不重复提交
+    - 已提交的 Batch 任务只有进入 failed / expired / cancelled 状态才改为并发调用；
+      查询状态或下载结果出错时退避重试，重试耗尽则中止运行并保留检查点，避免同一批请求付费两次
+    """
+
+    def __init__(
+        self,
+        agent,
+        output_path: str,
+        llm_client=None,
+        checkpoint_path: str = None,
+        chunk_size: int = 200,
+        max_workers: int = 8,
+        llm_concurrency: int = 8,
+        use_batch_api: Optional[bool] = None,
+        poll_interval: float = 30.0,
+        poll_retries: int = 5,
+        completion_window: str = "24h"
+    ):
+        """
+        Args:
+            agent: DiaAgentFast 实例（提供 prepare_consult / decision_fusion）
+            output_path: 结果 JSONL 路径（追加写入）
+            llm_client: LLMClient / RoutingLLMClient / Callable[[str], str]，默认使用 agent.llm_api
+            checkpoint_path: 检查点路径，默认 <output_path>.ckpt.json
+            chunk_size: 每批处理的病例数（一个 Batch 任务对应一个分块）
+            max_workers: 本地病例分析/风险检测并行度
+            llm_concurrency: 不支持 Batch 接口时的并发调用数
+            use_batch_api: 是否使用 Batch 接口（None=按提供商自动判断）
+            poll_interval: Batch 任务轮询间隔（秒）
+            poll_retries: 查询 Batch 任务状态 / 下载结果连续出错时的重试次数（指数退避）
+            completion_window: Batch 任务完成窗口
+        """
+        self.agent = agent
+        self.output_path = Path(output_path)
+        self.checkpoint_path = Path(checkpoint_path) if checkpoint_path else Path(f"{output_path}.ckpt.json")
+        self.llm_client = llm_client if llm_client is not None else getattr(agent, "llm_api", None)
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.llm_concurrency = llm_concurrency
+        self.poll_interval = poll_interval
+        self.poll_retries = poll_retries
+        self.completion_window = completion_window
+
+        if use_batch_api is None:
+            use_batch_api = self._batch_capable(self.llm_client)
+        elif use_batch_api and not self._batch_capable(self.llm_client):
+            print("⚠️ 当前 LLM 客户端不支持 Batch 接口，改为并发调用")
+            use_batch_api = False
+        self.use_batch_api = use_batch_api
+
+    # ==================== 主流程 ====================
+
+    def run(self, input_path: str) -> Dict[str, int]:
+        """
+        运行批量咨询
+
+        Args:
+            input_path: 病例 JSONL 路径
+
+        Returns:
+            统计信息 {"total", "skipped", "ok", "llm_failed", "error"}
+        """
+        cases = list(self._read_cases(input_path))
+        done = self._load_done_ids()
+        checkpoint = self._load_checkpoint()
+
+        todo = [c for c in cases if c["id"] not in done]
+        stats = {"total": len(cases), "skipped": len(cases) - len(todo), "ok": 0, "llm_failed": 0, "error": 0}
+        print(f"📦 批量咨询: 共 {len(cases)} 例，已完成 {stats['skipped']} 例，待处理 {len(todo)} 例")
+        print(f"   LLM 模式: {'Batch 接口' if self.use_batch_api else '并发调用'}")
+
+        # 优先恢复中断前已提交的 Batch 任务
+        pending = checkpoint.get("pending_batch")
+        if pending:
+            pending_ids = set(pending["ids"])
+            resumed = [c for c in todo if c["id"] in pending_ids]
+            todo = [c for c in todo if c["id"] not in pending_ids]
+            if resumed:
+                print(f"🔁 恢复 Batch 任务 {pending['batch_id']} ({len(resumed)} 例)")
+                self._process_chunk(resumed, stats, batch_id=pending["batch_id"])
+            else:
+                self._save_checkpoint({})
+
+        for start in range(0, len(todo), self.chunk_size):
+            chunk = todo[start:start + self.chunk_size]
+            self._process_chunk(chunk, stats)
+            print(f"  ✓ 进度: {stats['skipped'] + stats['ok'] + stats['llm_failed'] + stats['error']}/{stats['total']}")
+
+        print(f"✅ 批量咨询完成: 成功 {stats['ok']}，LLM 失败 {stats['llm_failed']}，失败 {stats['error']}，"
+              f"跳过 {stats['skipped']}")
+        return stats
+
+    def _process_chunk(self, chunk: List[Dict[str, Any]], stats: Dict[str, int], batch_id: str = None):
+        """处理一个分块: 本地准备 -> LLM -> 写出"""
+        prepared = self._prepare_all(chunk)
+
+        # 临床签名相同的病例只提交一次 Prompt（见 DecisionFusion 语义缓存）
+        prompts: Dict[str, str] = {}
+        representative: Dict[str, str] = {}
+        signature_owner: Dict[str, str] = {}
+        for case_id, (report, prompt, error) in prepared.items():
+            if error is not None or prompt is None:
+                continue
+            owner = signature_owner.setdefault(report.signature, case_id) if report.signature else case_id
+            representative[case_id] = owner
+            if owner == case_id:
+                prompts[case_id] = prompt
+
+        responses: Dict[str, Optional[str]] = {}
+        if prompts and self.llm_client is not None:
+            if self.use_batch_api:
+                responses = self._run_batch(prompts, batch_id=batch_id)
+            missing = {cid: p for cid, p in prompts.items() if responses.get(cid) is None}
+            if missing:
+                responses.update(self._run_concurrent(missing))
+        for case_id, owner in representative.items():
+            responses[case_id] = responses.get(owner)
+
+        with open(self.output_path, "a", encoding="utf-8") as f:
+            for case in chunk:
+                case_id = case["id"]
+                report, _, error = prepared[case_id]
+                if error is not None:
+                    record = {"id": case_id, "status": "error", "error": error}
+                    stats["error"] += 1
+                else:
+                    # 提交了 Prompt 却没有响应: 写出纯规则报告，但不算完成，重启后重试
+                    status = "llm_failed" if case_id in representative and responses.get(case_id) is None \
+                        and self.llm_client is not None else "ok"
+                    self.agent.decision_fusion.complete(report, responses.get(case_id))
+                    record = {"id": case_id, "status": status, "report": report.to_dict()}
+                    stats[status] += 1
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        # 结果已落盘，清除 Batch 检查点
+        self._save_checkpoint({})
+
+    def _prepare_all(self, chunk: List[Dict[str, Any]]) -> Dict[str, Tuple[Any, Optional[str], Optional[str]]]:
+        """本地并行执行病例分析、风险检测和规则建议"""
+        def prepare(case):
+            try:
+                report, prompt = self.agent.prepare_consult(case["case_text"], require_llm=False)
+                return case["id"], (report, prompt, None)
+            except Exception as e:
+                return case["id"], (None, None, f"{type(e).__name__}: {e}")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return dict(executor.map(prepare, chunk))
+
+    # ==================== LLM 调用 ====================
+
+    def _run_concurrent(self, prompts: Dict[str, str]) -> Dict[str, Optional[str]]:
+        """并发调用 LLM（不支持 Batch 接口或 Batch 中失败的请求）"""
+        def call(item):
+            case_id, prompt = item
+            try:
+                with llm_call_tag("bulk_consult"):
+                    return case_id, self.llm_client(prompt)
+            except Exception as e:
+                print(f"  ⚠️ LLM 调用失败 ({case_id}): {e}")
+                return case_id, None
+
+        with ThreadPoolExecutor(max_workers=self.llm_concurrency) as executor:
+            return dict(executor.map(call, prompts.items()))
+
+    def _run_batch(self, prompts: Dict[str, str], batch_id: str = None) -> Dict[str, Optional[str]]:
+        """
+        通过 /v1/batches 提交并等待结果
+
+        提交失败（任务未创建）或任务以非 completed 状态结束时，缺少的结果由调用方并发补齐；
+        任务已提交后查询出错会退避重试，重试耗尽时抛出 BatchPollError（检查点保留）
+        """
+        client = self.llm_client.client
+        if batch_id is None:
+            try:
+                batch_id = self._submit_batch(client, prompts)
+            except Exception as e:
+                print(f"  ⚠️ Batch 任务提交失败: {e}，改为并发调用")
+                return {}
+            self._save_checkpoint({"pending_batch": {"batch_id": batch_id, "ids": list(prompts)}})
+            print(f"  📤 已提交 Batch 任务 {batch_id} ({len(prompts)} 条)")
+
+        while True:
+            batch = self._poll_call(client.batches.retrieve, batch_id)
+            if batch.status in _BATCH_TERMINAL:
+                break
+            time.sleep(self.poll_interval)
+
+        responses = {}
+        if batch.output_file_id:
+            # expired / cancelled 的任务也可能已完成部分请求
+            content = self._poll_call(client.files.content, batch.output_file_id).text
+            responses = self._parse_batch_output(content)
+        if batch.status != "completed":
+            print(f"  ⚠️ Batch 任务 {batch_id} 状态: {batch.status}，未完成的请求改为并发调用")
+        return responses
+
+    def _poll_call(self, fn, *args):
+        """调用 Batch 查询接口，出错时指数退避重试"""
+        for attempt in range(self.poll_retries + 1):
+            try:
+                return fn(*args)
+            except Exception as e:
+                if attempt >= self.poll_retries:
+                    raise BatchPollError(f"Batch 接口连续 {attempt + 1} 次调用失败: {e}") from e
+                delay = min(self.poll_interval * (2 ** attempt), _POLL_BACKOFF_MAX)
+                print(f"  ⚠️ Batch 接口调用失败 ({type(e).__name__})，{delay:.0f}s 后重试")
+                time.sleep(delay)
+
+    def _submit_batch(self, client, prompts: Dict[str, str]) -> str:
+        """上传请求文件并创建 Batch 任务"""
+        lines = []
+        for case_id, prompt in prompts.items():
+            lines.append(json.dumps({
+                "custom_id": case_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": self.llm_client.model,
+                    "messages": [{"role": "user", "content": prompt}],
+                    "temperature": self.llm_client.temperature,
+                    "max_tokens": self.llm_client.max_tokens,
+                },
+            }, ensure_ascii=False))
+        payload = ("\n".join(lines) + "\n").encode("utf-8")
+
+        batch_file = client.files.create(
+            file=("fusion_requests.jsonl", io.BytesIO(payload)),
+            purpose="batch"
+        )
+        batch = client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=self.completion_window
+        )
+        return batch.id
+
+    @staticmethod
+    def _parse_batch_output(content: str) -> Dict[str, Optional[str]]:
+        """解析 Batch 输出 JSONL，返回 custom_id -> 响应文本"""
+        responses = {}
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            body = (item.get("response") or {}).get("body") or {}
+            try:
+                responses[item["custom_id"]] = body["choices"][0]["message"]["content"]
+            except (KeyError, IndexError, TypeError):
+                responses[item["custom_id"]] = None
+        return responses
+
+    @staticmethod
+    def _batch_capable(llm_client) -> bool:
+        """LLM 客户端是否可使用 Batch 接口（仅单个 OpenAI 兼容 LLMClient）"""
+        client = getattr(llm_client, "client", None)
+        return (
+            getattr(llm_client, "provider", None) in BATCH_PROVIDERS
+            and hasattr(client, "batches")
+            and hasattr(client, "files")
+        )
+
+    # ==================== 输入/输出/检查点 ====================
+
+    @staticmethod
+    def _read_cases(input_path: str) -> Iterable[Dict[str, Any]]:
+        """读取病例 JSONL（缺少 id 时使用行号）"""
+        with open(input_path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                case_text = item.get("case_text") or item.get("case") or item.get("text") or ""
+                yield {"id": str(item.get("id", line_no)), "case_text": case_text}
+
+    def _load_done_ids(self) -> Set[str]:
+        """从输出文件恢复已完成的病例 id（同一 id 以最后一行为准，只有 ok 算完成；忽略崩溃时写了一半的末行）"""
+        status: Dict[str, str] = {}
+        if not self.output_path.exists():
+            return set()
+        with open(self.output_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    status[str(record["id"])] = record.get("status")
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    continue
+        return {case_id for case_id, value in status.items() if value == "ok"}
+
+    def _load_checkpoint(self) -> Dict[str, Any]:
+        if not self.checkpoint_path.exists():
+            return {}
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError):
+            return {}
+
+    def _save_checkpoint(self, data: Dict[str, Any]):
+        """原子写入检查点"""
+        tmp_path = self.checkpoint_path.with_suffix(self.checkpoint_path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.checkpoint_path)
+
+
+# ============================================
+# 命令行入口
+# ============================================
+
+if __name__ == "__main__":
+    # 用法: python -m src.agent.bulk_consult cases.jsonl reports.jsonl
+    import argparse
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    from src.agent.dia_agent_fast import get_fast_agent
+    from src.llm_client import LLMClient
+
+    parser = argparse.ArgumentParser(description="Dia-Agent 离线批量咨询")
+    parser.add_argument("input", help="病例 JSONL 路径")
+    parser.add_argument("output", help="结果 JSONL 路径")
+    parser.add_argument("--provider", default=os.getenv("DIA_LLM_PROVIDER", "siliconflow"))
+    parser.add_argument("--chunk-size", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--no-batch", action="store_true", help="禁用 Batch 接口，改为并发调用")
+    args = parser.parse_args()
+
+    llm = LLMClient(provider=args.provider, cache_enabled=False)
+    agent = get_fast_agent(llm_api=llm, skip_rag=True)
+    runner = BulkConsultRunner(
+        agent,
+        output_path=args.output,
+        llm_client=llm,
+        chunk_size=args.chunk_size,
+        max_workers=args.workers,
+        use_batch_api=False if args.no_batch else None
+    )
+    try:
+        runner.run(args.input)
+    finally:
+        agent.close()
@@ -11,6 +11,7 @@ import re
 from typing import Optional, Callable, Dict, List, Any
 from pathlib import Path
 
+from ..llm_metrics import llm_call_tag
 from .patient_profile import (
     PatientProfile, 
     Complication, 
@@ -197,7 +198,8 @@ class CaseAnalyzer:
         
         # 第一次提取
         prompt1 = self.EXTRACTION_PROMPT.format(case_text=case_text)
-        response1 = self.llm_api(prompt1)
+        with llm_call_tag("case_analyzer.extraction"):
+            response1 = self.llm_api(prompt1)
         extracted = self._extract_json(response1)
         
         if not extracted:
@@ -213,7 +215,8 @@ class CaseAnalyzer:
                 case_text=case_text,
                 extracted_json=json.dumps(extracted, ensure_ascii=False, indent=2)
             )
-            response2 = self.llm_api(prompt2)
+            with llm_call_tag("case_analyzer.reflection"):
+                response2 = self.llm_api(prompt2)
             refined = self._extract_json(response2)
             
             if refined:
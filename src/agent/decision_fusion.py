@@ -5,10 +5,13 @@
 整合图谱规则和指南知识，生成带引用的诊疗建议
 """
 
-from typing import List, Dict, Optional, Callable, Any
+import os
+from typing import List, Dict, Optional, Callable, Any, Tuple
 from dataclasses import dataclass, field
 from pathlib import Path
 
+from ..llm_metrics import llm_call_tag, LLMCallRecord, get_metrics_registry
+from .fusion_cache import FusionCache
 from .patient_profile import PatientProfile
 from .risk_detector import RiskReport, RiskWarning, RiskSeverity
 
@@ -51,7 +54,29 @@ class ClinicalReport:
     rag_context: str = ""
     kg_context: str = ""
     llm_response: str = ""
+    signature: str = ""                              # 临床签名（语义缓存键）
     
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可 JSON 序列化的字典"""
+        return {
+            "patient_summary": self.patient_summary,
+            "risk_warnings": [w.to_dict() for w in self.risk_warnings],
+            "recommendations": [
+                {
+                    "action": r.action,
+                    "drug_name": r.drug_name,
+                    "reason": r.reason,
+                    "priority": r.priority,
+                    "evidence": [
+                        {"source_type": e.source_type, "reference": e.reference}
+                        for e in r.evidence
+                    ],
+                }
+                for r in self.recommendations
+            ],
+            "llm_response": self.llm_response,
+        }
+
     def to_markdown(self) -> str:
         """生成 Markdown 格式报告"""
         lines = ["# 📋 Dia-Agent 智能诊疗报告\n"]
@@ -118,17 +143,9 @@ class DecisionFusion:
     2. 绝对禁忌 > 相对禁忌 > 谨慎使用
     """
     
-    # 决策融合 Prompt
-    FUSION_PROMPT = """你是一位资深内分泌科临床药师，请根据以下信息为糖尿病患者提供用药调整建议。
-
-## 患者信息
-{patient_summary}
-
-## 用药风险警告（来自药品知识图谱，优先级最高）
-{risk_warnings}
-
-## 相关指南知识（来自《中国糖尿病防治指南2024》）
-{guideline_context}
+    # 决策融合 Prompt 静态前缀（角色、决策规则、输出格式）
+    # 放在病例信息之前且不做格式化，所有病例逐字节一致，支持前缀缓存的 LLM 服务可直接命中
+    FUSION_PROMPT_PREFIX = """你是一位资深内分泌科临床药师，请根据下方提供的患者信息、用药风险警告和指南知识，为糖尿病患者提供用药调整建议。
 
 ## 决策规则
 1. 对于"严重风险"的药物，必须建议停药或换药，不可忽视
@@ -152,16 +169,43 @@ class DecisionFusion:
 ### 总结
 [一段话总结诊疗方案]
 
+"""
+
+    # 决策融合 Prompt 可变后缀（每个病例不同）
+    FUSION_PROMPT_SUFFIX = """## 患者信息
+{patient_summary}
+
+## 用药风险警告（来自药品知识图谱，优先级最高）
+{risk_warnings}
+
+## 相关指南知识（来自《中国糖尿病防治指南2024》）
+{guideline_context}
+
 请开始分析："""
 
-    def __init__(self, llm_api: Callable[[str], str] = None):
+    # 完整模板（静态前缀 + 可变后缀）
+    FUSION_PROMPT = FUSION_PROMPT_PREFIX + FUSION_PROMPT_SUFFIX
+
+    def __init__(
+        self,
+        llm_api: Callable[[str], str] = None,
+        fusion_cache: Optional[FusionCache] = None,
+        cache_enabled: Optional[bool] = None
+    ):
         """
         初始化决策融合器
         
         Args:
             llm_api: LLM API 调用函数
+            fusion_cache: 语义缓存（按临床签名复用 LLM 综合分析）
+            cache_enabled: 是否启用语义缓存（None=读取环境变量 FUSION_CACHE_ENABLED）
         """
         self.llm_api = llm_api
+        if cache_enabled is None:
+            cache_enabled = os.getenv("FUSION_CACHE_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"}
+        if cache_enabled and fusion_cache is None:
+            fusion_cache = FusionCache()
+        self.fusion_cache = fusion_cache if cache_enabled else None
     
     def fuse(
         self,
@@ -182,52 +226,105 @@ class DecisionFusion:
         Returns:
             ClinicalReport 临床报告
         """
+        report, prompt = self.prepare(profile, risk_report, rag_context, kg_context)
+
+        # 2. 如果有 LLM，生成综合分析（命中语义缓存时 prepare 不返回 Prompt）
+        if report.llm_response:
+            print("  ♻️ 命中语义缓存，复用 LLM 综合分析")
+            self.complete(report, None)
+        elif prompt is not None:
+            print("  🤖 调用 LLM 生成综合分析...")
+            try:
+                with llm_call_tag("decision_fusion"):
+                    llm_response = self.llm_api(prompt)
+                self.complete(report, llm_response)
+                print("  ✅ LLM 分析完成")
+            except Exception as e:
+                print(f"  ⚠️ LLM 调用失败: {e}")
+                self.complete(report, None)
+        else:
+            self.complete(report, None)
+
+        print(f"  ✅ 决策融合完成，生成 {len(report.recommendations)} 条建议")
+
+        return report
+
+    def prepare(
+        self,
+        profile: PatientProfile,
+        risk_report: RiskReport,
+        rag_context: str = "",
+        kg_context: str = "",
+        require_llm: bool = True
+    ) -> Tuple[ClinicalReport, Optional[str]]:
+        """
+        决策融合的本地部分：生成规则建议并构建 LLM Prompt（不调用 LLM）
+
+        批量运行时先对所有病例执行 prepare，再统一提交 Prompt，最后调用 complete
+
+        Args:
+            require_llm: 为 True 时仅在配置了 llm_api 时返回 Prompt
+
+        Returns:
+            (报告, Prompt)；无需 LLM 分析或命中语义缓存时 Prompt 为 None
+            （命中时缓存的响应已写入 report.llm_response）
+        """
+        patient_summary = profile.to_clinical_summary()
         report = ClinicalReport(
-            patient_summary=profile.to_clinical_summary(),
+            patient_summary=patient_summary,
             risk_warnings=risk_report.warnings,
             rag_context=rag_context,
             kg_context=kg_context
         )
-        
+
         print("\n🔄 开始决策融合...")
-        
+
         # 1. 基于规则生成基础建议
         rule_recommendations = self._generate_rule_based_recommendations(
             profile, risk_report
         )
         report.recommendations.extend(rule_recommendations)
-        
-        # 2. 如果有 LLM，生成综合分析
-        if self.llm_api and (risk_report.warnings or rag_context):
-            print("  🤖 调用 LLM 生成综合分析...")
-            
-            # 构建 Prompt
+
+        prompt = None
+        if (self.llm_api or not require_llm) and (risk_report.warnings or rag_context):
+            if self.fusion_cache is not None:
+                report.signature = self.fusion_cache.signature.key(profile, risk_report, rag_context)
+                cached = self.fusion_cache.get(report.signature)
+                if cached is not None:
+                    report.llm_response = cached
+                    get_metrics_registry().record(LLMCallRecord(
+                        provider="fusion_cache", model="", tag="decision_fusion", cache_status="hit"
+                    ))
+                    return report, None
+
             risk_text = self._format_risks_for_prompt(risk_report)
-            prompt = self.FUSION_PROMPT.format(
-                patient_summary=profile.to_clinical_summary(),
+            prompt = self.FUSION_PROMPT_PREFIX + self.FUSION_PROMPT_SUFFIX.format(
+                patient_summary=patient_summary,
                 risk_warnings=risk_text or "无明显风险",
                 guideline_context=rag_context or "无相关指南检索结果"
             )
-            
-            try:
-                llm_response = self.llm_api(prompt)
-                report.llm_response = llm_response
-                
-                # 解析 LLM 建议并添加
-                llm_recommendations = self._parse_llm_recommendations(llm_response)
-                report.recommendations.extend(llm_recommendations)
-                
-                print("  ✅ LLM 分析完成")
-            except Exception as e:
-                print(f"  ⚠️ LLM 调用失败: {e}")
-        
+
+        return report, prompt
+
+    def complete(self, report: ClinicalReport, llm_response: Optional[str]) -> ClinicalReport:
+        """
+        决策融合的收尾部分：合并 LLM 响应中的建议，去重排序
+
+        Args:
+            report: prepare 返回的报告
+            llm_response: LLM 响应文本（None 表示未调用、调用失败或已命中语义缓存）
+        """
+        if llm_response:
+            report.llm_response = llm_response
+            if self.fusion_cache is not None and report.signature:
+                self.fusion_cache.put(report.signature, llm_response)
+        if report.llm_response:
+            report.recommendations.extend(self._parse_llm_recommendations(report.llm_response))
+
         # 3. 去重和排序
         report.recommendations = self._deduplicate_recommendations(report.recommendations)
-        
-        print(f"  ✅ 决策融合完成，生成 {len(report.recommendations)} 条建议")
-        
         return report
-    
+
     def _generate_rule_based_recommendations(
         self,
         profile: PatientProfile,
@@ -20,6 +20,8 @@ from src.agent.decision_fusion import DecisionFusion, ClinicalReport
 from src.retrieval.hybrid import HybridRetriever
 from src.retrieval.reranker import BGEReranker
 from src.graph.langchain_cypher import LangChainCypherRetriever
+from src.graph_client import get_graph_client
+from src.context_packer import ContextPacker
 
 
 class DiaAgent:
@@ -72,13 +74,12 @@ class DiaAgent:
         self._log("  ├─ CaseAnalyzer")
         self.case_analyzer = CaseAnalyzer(llm_api=llm_api)
         
+        # 共享图数据库客户端（风险检测与 Text-to-Cypher 共用一个连接池）
+        self.graph_client = get_graph_client(neo4j_uri, neo4j_user, neo4j_password)
+        
         # 2. 风险检测器
         self._log("  ├─ RiskDetector")
-        self.risk_detector = RiskDetector(
-            neo4j_uri=neo4j_uri,
-            neo4j_user=neo4j_user,
-            neo4j_password=neo4j_password
-        )
+        self.risk_detector = RiskDetector(graph_client=self.graph_client)
         
         # 3. 混合检索器
         self._log("  ├─ HybridRetriever")
@@ -90,14 +91,13 @@ class DiaAgent:
         # 4. Reranker
         self._log("  ├─ BGEReranker")
         self.reranker = BGEReranker()
+        self.context_packer = ContextPacker()
         
         # 5. Text-to-Cypher
         self._log("  ├─ CypherRetriever")
         self.cypher_retriever = LangChainCypherRetriever(
-            neo4j_uri=neo4j_uri,
-            neo4j_user=neo4j_user,
-            neo4j_password=neo4j_password,
-            llm_api=llm_api
+            llm_api=llm_api,
+            graph_client=self.graph_client
         )
         
         # 6. 决策融合器
@@ -154,6 +154,8 @@ class DiaAgent:
                 self._log(f"  • [{w.severity.value}] {w.drug_name}: {w.reason}")
         else:
             self._log("\n✅ 未检测到用药风险")
+        if report.unrecognized_medications:
+            self._log(f"❓ 未识别药品（未核对禁忌）: {', '.join(report.unrecognized_medications)}")
         
         return report
     
@@ -205,13 +207,12 @@ class DiaAgent:
             self._log(f"  📊 Rerank {len(unique_results)} 篇文档...")
             reranked = self.reranker.rerank(query, unique_results, top_k=min(top_k, 2))
             
-            # 合并内容
+            # 合并内容（在 token 预算内按命中句裁剪）
             context_parts = []
-            for i, doc in enumerate(reranked, 1):
+            for doc in self.context_packer.pack(query, reranked).rag_results:
                 header = doc.get('metadata', {}).get('header', '未知章节')
                 page = doc.get('metadata', {}).get('page', '?')
-                content = doc.get('document', '')[:500]
-                context_parts.append(f"【{header} - P.{page}】\n{content}")
+                context_parts.append(f"【{header} - P.{page}】\n{doc['packed_content']}")
             
             context = "\n\n".join(context_parts)
             self._log(f"  ✅ 返回 {len(reranked)} 篇相关文档")
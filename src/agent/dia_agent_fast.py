@@ -81,6 +81,8 @@ class DiaAgentFast:
             self.decision_fusion = DecisionFusion(llm_api=llm_api)
 
             # 2. 检索模块 - 可选
+            from src.context_packer import ContextPacker
+            self.context_packer = ContextPacker()
             self.hybrid_retriever = None
             self.reranker = None
 
@@ -112,6 +114,44 @@ class DiaAgentFast:
         4. 决策融合 (调用 LLM 生成建议)
         """
         t0 = time.time()
+        profile, risk_report, guideline_context = self._analyze(case_text)
+        t3 = time.time()
+        
+        # 4. 决策融合
+        self._log("🤖 生成建议...")
+        report = self.decision_fusion.fuse(
+            profile=profile,
+            risk_report=risk_report,
+            rag_context=guideline_context
+        )
+        t4 = time.time()
+        self._log(f"  ✓ 建议生成完成 ({t4-t3:.1f}s)")
+        
+        self._log(f"✅ 总耗时: {t4-t0:.1f}s")
+        
+        return report
+    
+    def prepare_consult(self, case_text: str, require_llm: bool = True):
+        """
+        执行咨询中不依赖 LLM 的部分（病例分析、风险检测、指南检索、规则建议）
+        
+        供批量运行器使用：先本地并行处理所有病例，再统一提交 FUSION_PROMPT
+        
+        Returns:
+            (ClinicalReport, Prompt)；Prompt 为 None 表示无需 LLM 分析，
+            拿到 LLM 响应后调用 self.decision_fusion.complete(report, response)
+        """
+        profile, risk_report, guideline_context = self._analyze(case_text)
+        return self.decision_fusion.prepare(
+            profile=profile,
+            risk_report=risk_report,
+            rag_context=guideline_context,
+            require_llm=require_llm
+        )
+    
+    def _analyze(self, case_text: str):
+        """病例分析 + 风险检测 + 指南检索"""
+        t0 = time.time()
         
         # 1. 病例分析
         self._log("📋 分析病历...")
@@ -138,25 +178,11 @@ class DiaAgentFast:
             if self.reranker and not self.skip_reranker:
                 results = self.reranker.rerank(query, results, top_k=2)
             
-            guideline_context = "\n".join([r.get('document', '')[:300] for r in results[:2]])
-            t3 = time.time()
-            self._log(f"  ✓ 指南检索完成 ({t3-t2:.1f}s)")
-        else:
-            t3 = t2
+            packed = self.context_packer.pack(query, results[:2])
+            guideline_context = "\n".join(r['packed_content'] for r in packed.rag_results)
+            self._log(f"  ✓ 指南检索完成 ({time.time()-t2:.1f}s)")
         
-        # 4. 决策融合
-        self._log("🤖 生成建议...")
-        report = self.decision_fusion.fuse(
-            profile=profile,
-            risk_report=risk_report,
-            rag_context=guideline_context
-        )
-        t4 = time.time()
-        self._log(f"  ✓ 建议生成完成 ({t4-t3:.1f}s)")
-        
-        self._log(f"✅ 总耗时: {t4-t0:.1f}s")
-        
-        return report
+        return profile, risk_report, guideline_context
     
     def quick_risk_check(
         self, 
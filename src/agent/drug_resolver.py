@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+药品名解析 (Drug Resolver)
+将自由文本中的药品提及（通用名、商品名、别名、带盐基/剂型的全称）解析为知识图谱 Drug 节点 id，
+使图谱查询可以使用 {id: $id} 精确索引查找，替代无法走索引且易误匹配的双向 CONTAINS
+
+解析规则（确定性）:
+1. 提及与词典词条完全一致 → 该词条对应的药品
+2. 否则用自动机扫描提及，取最左最长、互不重叠的词条，合并其药品
+词条包括: 药品全称、去除盐基/剂型后的成分名、商品名、CaseAnalyzer 别名
+成分名只对应单方制剂（"二甲双胍" 不会匹配 "西格列汀二甲双胍片"）
+"""
+
+import re
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from ..keyword_automaton import KeywordAutomaton
+from .rule_engine import DEFAULT_GRAPH_DATA
+
+
+# 盐基 / 给药方式前缀
+_PREFIXES = ("盐酸", "磷酸", "苯甲酸", "马来酸", "醋酸", "注射用")
+
+# 剂型后缀（按长度优先匹配）
+_DOSAGE_FORMS = tuple(sorted(
+    ("缓释片", "控释片", "速释片", "肠溶片", "分散片", "片", "胶囊", "注射液",
+     "混悬液", "口服液", "颗粒", "散", "微球", "周制剂"),
+    key=len, reverse=True
+))
+
+# 成分名后的盐基后缀（米格列奈钙 → 米格列奈）
+_SALT_SUFFIXES = ("钙", "钠")
+
+# 成分名后的规格/浓度标记（门冬胰岛素 30 → 门冬胰岛素，甘精胰岛素 U300 → 甘精胰岛素）
+_STRENGTH_PATTERN = re.compile(r'(?<=[\u4e00-\u9fff])u?\d+r?$')
+
+_PAREN_PATTERN = re.compile(r'[(（][^)）]*[)）]')
+
+
+def normalize_mention(text: str) -> str:
+    """去除空白并转为小写"""
+    return "".join(text.split()).lower()
+
+
+def ingredient_name(drug_name: str) -> str:
+    """从药品全称推导成分名: 去掉括号注释、盐基前缀、剂型后缀、规格标记"""
+    name = normalize_mention(_PAREN_PATTERN.sub("", drug_name))
+    for prefix in _PREFIXES:
+        if name.startswith(prefix) and len(name) > len(prefix) + 1:
+            name = name[len(prefix):]
+    for form in _DOSAGE_FORMS:
+        if name.endswith(form) and len(name) > len(form) + 1:
+            name = name[:-len(form)]
+            break
+    name = _STRENGTH_PATTERN.sub("", name)
+    for suffix in _SALT_SUFFIXES:
+        if name.endswith(suffix) and len(name) > 3:
+            name = name[:-len(suffix)]
+            break
+    return name
+
+
+class DrugResolver:
+    """
+    药品名解析器
+
+    Usage:
+        resolver = DrugResolver.from_graph_data()
+        resolver.resolve("格华止")        # -> ["1", "52"]
+        resolver.resolve_names("二甲双胍")  # -> ["盐酸二甲双胍片", "盐酸二甲双胍缓释片"]
+    """
+
+    def __init__(
+        self,
+        drugs: List[Tuple[str, str]],
+        brands: Iterable[Tuple[str, str]] = (),
+        aliases: Optional[Dict[str, str]] = None
+    ):
+        """
+        Args:
+            drugs: [(drug_id, drug_name), ...]，按图谱顺序
+            brands: [(brand_name, drug_id), ...]
+            aliases: 别名 -> 标准名（None=使用 CaseAnalyzer 的别名表）
+        """
+        self.drug_names: Dict[str, str] = OrderedDict(drugs)
+        self._order = {drug_id: i for i, drug_id in enumerate(self.drug_names)}
+        self._surfaces: Dict[str, Set[str]] = {}
+
+        for drug_id, name in self.drug_names.items():
+            self._add(normalize_mention(name), drug_id)
+            self._add(normalize_mention(_PAREN_PATTERN.sub("", name)), drug_id)
+
+        for drug_id, name in self.drug_names.items():
+            self._add(ingredient_name(name), drug_id)
+
+        for brand, drug_id in brands:
+            if drug_id not in self.drug_names or not brand:
+                continue
+            self._add(normalize_mention(brand), drug_id)
+            self._add(normalize_mention(_PAREN_PATTERN.sub("", brand)), drug_id)
+            for inner in re.findall(r'[(（]([^)）]*)[)）]', brand):
+                if re.fullmatch(r'[A-Za-z][A-Za-z0-9 \-]*', inner.strip()):
+                    self._add(normalize_mention(inner), drug_id)
+
+        if aliases is None:
+            from .case_analyzer import CaseAnalyzer
+            aliases = CaseAnalyzer(llm_api=None, use_reflection=False).drug_aliases
+        for alias, standard in aliases.items():
+            ids = self._surfaces.get(normalize_mention(standard))
+            if ids:
+                for drug_id in ids:
+                    self._add(normalize_mention(alias), drug_id)
+
+        self._automaton = KeywordAutomaton()
+        for surface, ids in self._surfaces.items():
+            self._automaton.add(surface, ids)
+        self._automaton.build()
+
+        self._cache: "OrderedDict[str, Tuple[str, ...]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def _add(self, surface: str, drug_id: str):
+        if surface:
+            self._surfaces.setdefault(surface, set()).add(drug_id)
+
+    @classmethod
+    def from_graph_data(cls, path: Optional[str] = None, **kwargs) -> "DrugResolver":
+        """从 graph_data.json 构建（同名药品以第一次出现的 id 为准，与 Drug.name 唯一约束一致）"""
+        with open(Path(path) if path else DEFAULT_GRAPH_DATA, "r", encoding="utf-8") as f:
+            graph_data = json.load(f)
+
+        owners: Dict[str, str] = OrderedDict()
+        brands = []
+        for item in graph_data:
+            drug = item["drug"]
+            owner = owners.setdefault(drug["name"], str(drug["id"]))
+            brands.extend((brand, owner) for brand in item.get("brands", []) if brand)
+        return cls([(drug_id, name) for name, drug_id in owners.items()], brands, **kwargs)
+
+    @classmethod
+    def from_neo4j(cls, driver, **kwargs) -> "DrugResolver":
+        """从图谱中的 Drug 节点和 Brand 关系构建（driver 可以是 Neo4j 驱动或 GraphClient）"""
+        with driver.session() as session:
+            drugs = [
+                (str(r["id"]), r["name"])
+                for r in session.run("MATCH (d:Drug) RETURN d.id AS id, d.name AS name ORDER BY d.id")
+            ]
+            brands = [
+                (r["brand"], str(r["id"]))
+                for r in session.run("MATCH (b:Brand)-[:IS_BRAND_OF]->(d:Drug) RETURN b.name AS brand, d.id AS id")
+            ]
+        return cls(drugs, brands, **kwargs)
+
+    def resolve(self, mention: str) -> List[str]:
+        """
+        将药品提及解析为 Drug id 列表（按图谱顺序，无法解析时为空列表）
+        """
+        key = normalize_mention(mention or "")
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return list(cached)
+
+        ids = self._surfaces.get(key) or self._surfaces.get(normalize_mention(_PAREN_PATTERN.sub("", key)))
+        if not ids:
+            ids = set()
+            for _, _, _, matched in self._automaton.find_longest(key):
+                ids |= matched
+        result = tuple(sorted(ids, key=self._order.__getitem__))
+
+        with self._cache_lock:
+            self._cache[key] = result
+            if len(self._cache) > 4096:
+                self._cache.popitem(last=False)
+        return list(result)
+
+    def resolve_names(self, mention: str) -> List[str]:
+        """将药品提及解析为 Drug 名称列表"""
+        return [self.drug_names[drug_id] for drug_id in self.resolve(mention)]
+
+    def surfaces(self) -> Iterator[Tuple[str, List[str]]]:
+        """全部词条: (规范化词条, Drug id 列表)"""
+        for surface, ids in self._surfaces.items():
+            yield surface, sorted(ids, key=self._order.__getitem__)
+
+    def __len__(self) -> int:
+        return len(self._surfaces)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+决策融合语义缓存 (Fusion Cache)
+将患者画像和风险报告归一化为临床签名（CKD 分期、HbA1c 分段、用药、并发症、触发的风险等），
+签名相同的咨询复用同一份 LLM 综合分析，避免因年龄、小数位等无关差异导致缓存未命中
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .patient_profile import PatientProfile
+from .risk_detector import RiskReport
+
+
+# 默认签名字段
+DEFAULT_SIGNATURE_FIELDS = [
+    "diabetes_type",
+    "ckd_stage",
+    "hba1c_band",
+    "medications",
+    "complications",
+    "warnings",
+    "guideline",
+]
+
+# 分段阈值（左闭右开）
+DEFAULT_BANDS = {
+    "hba1c": [7.0, 8.0, 9.0, 10.0],
+    "egfr": [15, 30, 45, 60, 90],
+    "age": [40, 65, 75],
+    "bmi": [24, 28],
+}
+
+
+def _band(value: Optional[float], thresholds: Sequence[float]) -> Optional[str]:
+    """将数值映射到分段标签，如 "7.0-8.0"、"<7.0"、">=10.0" """
+    if value is None:
+        return None
+    if value < thresholds[0]:
+        return f"<{thresholds[0]}"
+    for low, high in zip(thresholds, thresholds[1:]):
+        if low <= value < high:
+            return f"{low}-{high}"
+    return f">={thresholds[-1]}"
+
+
+def _normalize_name(name: str) -> str:
+    return "".join(name.split()).lower()
+
+
+class ClinicalSignature:
+    """
+    临床签名定义
+
+    Usage:
+        signature = ClinicalSignature(fields=["ckd_stage", "medications", "warnings"])
+        key = signature.key(profile, risk_report, rag_context)
+    """
+
+    def __init__(
+        self,
+        fields: Optional[List[str]] = None,
+        bands: Optional[Dict[str, Sequence[float]]] = None
+    ):
+        """
+        Args:
+            fields: 参与签名的字段（None=读取环境变量 FUSION_CACHE_SIGNATURE，逗号分隔）
+            bands: 各指标分段阈值，覆盖 DEFAULT_BANDS
+        """
+        if fields is None:
+            env_fields = os.getenv("FUSION_CACHE_SIGNATURE", "").strip()
+            fields = [f.strip() for f in env_fields.split(",") if f.strip()] or DEFAULT_SIGNATURE_FIELDS
+        self.bands = {**DEFAULT_BANDS, **(bands or {})}
+
+        self.extractors: Dict[str, Callable[[PatientProfile, RiskReport, str], Any]] = {
+            "diabetes_type": lambda p, r, c: p.diabetes_type,
+            "ckd_stage": lambda p, r, c: p.ckd_stage.value if p.renal.egfr is not None else None,
+            "egfr_band": lambda p, r, c: _band(p.renal.egfr, self.bands["egfr"]),
+            "hba1c_band": lambda p, r, c: _band(p.glycemic.hba1c, self.bands["hba1c"]),
+            "age_band": lambda p, r, c: _band(p.age, self.bands["age"]),
+            "bmi_band": lambda p, r, c: _band(p.vital_signs.bmi, self.bands["bmi"]),
+            "medications": lambda p, r, c: sorted({_normalize_name(n) for n in p.medication_names}),
+            "complications": lambda p, r, c: sorted({_normalize_name(n) for n in p.complication_names}),
+            "allergies": lambda p, r, c: sorted({_normalize_name(n) for n in p.allergies}),
+            "warnings": lambda p, r, c: sorted(
+                {f"{_normalize_name(w.drug_name)}|{w.risk_type}|{w.severity.value}" for w in r.warnings}
+            ),
+            "guideline": lambda p, r, c: hashlib.sha1(c.encode("utf-8")).hexdigest()[:16] if c else None,
+        }
+
+        unknown = [f for f in fields if f not in self.extractors]
+        if unknown:
+            raise ValueError(f"未知的签名字段: {unknown}，可选: {sorted(self.extractors)}")
+        self.fields = list(fields)
+
+    def compute(self, profile: PatientProfile, risk_report: RiskReport, rag_context: str = "") -> Dict[str, Any]:
+        """计算签名各字段取值"""
+        return {f: self.extractors[f](profile, risk_report, rag_context or "") for f in self.fields}
+
+    def key(self, profile: PatientProfile, risk_report: RiskReport, rag_context: str = "") -> str:
+        """计算签名哈希，作为缓存键"""
+        payload = json.dumps(self.compute(profile, risk_report, rag_context), ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class FusionCache:
+    """按临床签名缓存 LLM 综合分析（LRU + 可选过期时间）"""
+
+    def __init__(
+        self,
+        signature: Optional[ClinicalSignature] = None,
+        max_size: Optional[int] = None,
+        ttl: Optional[float] = None
+    ):
+        """
+        Args:
+            signature: 签名定义，默认 ClinicalSignature()
+            max_size: 缓存条目上限（None=读取 FUSION_CACHE_SIZE，默认 1024）
+            ttl: 过期时间（秒，None=读取 FUSION_CACHE_TTL，0 表示不过期）
+        """
+        self.signature = signature or ClinicalSignature()
+        self.max_size = max_size if max_size is not None else int(os.getenv("FUSION_CACHE_SIZE", "1024"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("FUSION_CACHE_TTL", "0"))
+        self._cache: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and self.ttl and time.time() - entry[1] > self.ttl:
+                del self._cache[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, response: str):
+        with self._lock:
+            self._cache[key] = (response, time.time())
+            self._cache.move_to_end(key)
+            if len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "fields": self.signature.fields,
+            }
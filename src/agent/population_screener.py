@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+人群批量筛查 (Population Screener)
+将禁忌规则编译为 NumPy 矩阵（药品 × 指标阈值、药品 × 禁忌疾病），
+患者画像载入为列式数组（指标值 + 用药/疾病位图），向量化计算全部违规，
+用于每晚对数万份患者画像做用药安全筛查
+
+结果与逐个调用 RiskDetector.detect_risks 一致，可按需生成单个患者的 RiskReport
+"""
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .patient_profile import PatientProfile
+from .risk_detector import RiskDetector, RiskReport
+from .rule_engine import ContraindicationRuleEngine, drug_name_matches, condition_matches
+
+
+# 比较运算符编码（其他运算符如 BETWEEN 不会触发，与 RiskDetector._check_threshold 一致）
+_OPERATORS = {"<": 0, "<=": 1, ">": 2, ">=": 3, "=": 4}
+
+KIND_INDICATOR = 0
+KIND_DISEASE = 1
+
+VIOLATION_DTYPE = np.dtype([
+    ("patient", np.int32),      # 患者下标
+    ("medication", np.int16),   # 患者用药列表中的位置
+    ("kind", np.int8),          # 0=指标禁忌, 1=疾病禁忌
+    ("rule", np.int32),         # 对应类型规则表中的下标
+])
+
+
+class ScreeningResult:
+    """筛查结果：紧凑违规表 + 按需生成的患者风险报告"""
+
+    def __init__(self, screener: "PopulationScreener", profiles: List[PatientProfile], violations: np.ndarray):
+        self.screener = screener
+        self.profiles = profiles
+        self.violations = violations
+        self._patient_starts = np.searchsorted(violations["patient"], np.arange(len(profiles) + 1))
+
+    def violation_counts(self) -> np.ndarray:
+        """每个患者的违规条数"""
+        return np.diff(self._patient_starts)
+
+    def flagged_patients(self) -> np.ndarray:
+        """存在违规的患者下标"""
+        return np.flatnonzero(self.violation_counts())
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """展开为可读的违规明细"""
+        records = []
+        for patient, medication, kind, rule_idx in self.violations.tolist():
+            profile = self.profiles[patient]
+            if kind == KIND_INDICATOR:
+                rule = self.screener.indicator_rules[rule_idx]
+                detail = {"metric": rule.metric, "operator": rule.operator, "threshold": rule.threshold}
+            else:
+                rule = self.screener.disease_rules[rule_idx]
+                detail = {"disease": rule.disease}
+            records.append({
+                "patient_index": patient,
+                "patient_id": profile.patient_id,
+                "medication": profile.current_medications[medication].name,
+                "drug": rule.drug,
+                "type": "指标禁忌" if kind == KIND_INDICATOR else "疾病禁忌",
+                "severity": rule.severity,
+                **detail,
+            })
+        return records
+
+    def report(self, index: int) -> RiskReport:
+        """生成单个患者的 RiskReport（与 RiskDetector.detect_risks 输出一致）"""
+        detector = self.screener.detector
+        profile = self.profiles[index]
+        rows = self.violations[self._patient_starts[index]:self._patient_starts[index + 1]]
+        patient_conditions = profile.complication_names + profile.medical_history
+
+        report = RiskReport(patient_id=profile.patient_id)
+        for position, medication in enumerate(profile.current_medications):
+            medication_rows = rows[rows["medication"] == position]
+            for _, _, kind, rule_idx in medication_rows.tolist():
+                if kind == KIND_INDICATOR:
+                    rule = self.screener.indicator_rules[rule_idx]
+                    warning = detector._build_indicator_warning(
+                        rule.drug, rule.metric, rule.operator, rule.threshold, rule.severity, profile
+                    )
+                else:
+                    rule = self.screener.disease_rules[rule_idx]
+                    warning = detector._build_disease_warning(
+                        rule.drug, rule.disease, rule.severity, rule.reason, patient_conditions
+                    )
+                report.warnings.append(warning)
+
+            if not len(medication_rows):
+                if detector._is_unrecognized(medication.name):
+                    report.unrecognized_medications.append(medication.name)
+                else:
+                    report.safe_medications.append(medication.name)
+
+        report.summary = detector._generate_summary(report, profile)
+        return report
+
+
+class PopulationScreener:
+    """
+    向量化人群筛查器
+
+    Usage:
+        screener = PopulationScreener()
+        result = screener.screen(profiles)
+        for i in result.flagged_patients():
+            print(result.report(i).to_text())
+    """
+
+    def __init__(self, rule_engine: Optional[ContraindicationRuleEngine] = None, chunk_size: int = 100000):
+        """
+        Args:
+            rule_engine: 禁忌规则引擎，默认从 graph_data.json 加载
+            chunk_size: 每次向量化计算的 (患者, 用药) 对数量，控制峰值内存
+        """
+        self.rule_engine = rule_engine or ContraindicationRuleEngine.from_graph_data()
+        self.detector = RiskDetector(neo4j_uri=None, rule_engine=self.rule_engine)
+        self.chunk_size = chunk_size
+        self.compile()
+
+    def compile(self):
+        """将当前规则快照编译为矩阵（规则刷新后需重新调用）"""
+        drugs = self.rule_engine.drugs
+        self.drug_names = [name for name, _, _ in drugs]
+
+        self.indicator_rules = [rule for _, indicators, _ in drugs for rule in indicators]
+        self.disease_rules = [rule for _, _, diseases in drugs for rule in diseases]
+        self._indicator_owner = np.array(
+            [i for i, (_, indicators, _) in enumerate(drugs) for _ in indicators], dtype=np.int32
+        )
+        self._disease_owner = np.array(
+            [i for i, (_, _, diseases) in enumerate(drugs) for _ in diseases], dtype=np.int32
+        )
+
+        # 指标阈值 / 运算符向量（drug × metric 以规则为列展开）
+        self.metric_names = sorted({rule.metric for rule in self.indicator_rules})
+        metric_index = {name: i for i, name in enumerate(self.metric_names)}
+        self._rule_metric = np.array([metric_index[r.metric] for r in self.indicator_rules], dtype=np.int32)
+        self._rule_threshold = np.array(
+            [np.nan if r.threshold is None else r.threshold for r in self.indicator_rules], dtype=np.float64
+        )
+        self._rule_operator = np.array([_OPERATORS.get(r.operator, -1) for r in self.indicator_rules], dtype=np.int8)
+
+        # 禁忌疾病名称表
+        self.disease_names = sorted({rule.disease for rule in self.disease_rules})
+        disease_index = {name: i for i, name in enumerate(self.disease_names)}
+        self._rule_disease = np.array([disease_index[r.disease] for r in self.disease_rules], dtype=np.int32)
+
+        self._drug_match_cache: Dict[str, np.ndarray] = {}
+        self._condition_match_cache: Dict[str, np.ndarray] = {}
+
+    # ==================== 载入患者 ====================
+
+    def _medication_matrix(self, med_vocab: List[str]) -> np.ndarray:
+        """用药词表 × 图谱药品的匹配矩阵（与 RiskDetector 使用相同的药品匹配方式）"""
+        rows = []
+        for med in med_vocab:
+            row = self._drug_match_cache.get(med)
+            if row is None:
+                resolver = self.detector.drug_resolver
+                resolved = set(resolver.resolve_names(med)) if resolver else set()
+                if resolved:
+                    row = np.array([name in resolved for name in self.drug_names], dtype=bool)
+                else:
+                    # 未启用解析器或无法解析时回退到名称包含匹配
+                    row = np.array([drug_name_matches(med, name) for name in self.drug_names], dtype=bool)
+                self._drug_match_cache[med] = row
+            rows.append(row)
+        return np.array(rows, dtype=bool).reshape(len(med_vocab), len(self.drug_names))
+
+    def _condition_matrix(self, cond_vocab: List[str]) -> np.ndarray:
+        """疾病词表 × 禁忌疾病的匹配矩阵"""
+        rows = []
+        for cond in cond_vocab:
+            row = self._condition_match_cache.get(cond)
+            if row is None:
+                row = np.array([condition_matches(name, cond) for name in self.disease_names], dtype=bool)
+                self._condition_match_cache[cond] = row
+            rows.append(row)
+        return np.array(rows, dtype=bool).reshape(len(cond_vocab), len(self.disease_names))
+
+    def _load_patients(self, profiles: List[PatientProfile]):
+        """将患者画像转换为列式数组"""
+        n = len(profiles)
+        metric_values = np.full((n, len(self.metric_names)), np.nan, dtype=np.float64)
+
+        med_vocab: Dict[str, int] = {}
+        cond_vocab: Dict[str, int] = {}
+        pair_patient, pair_position, pair_med = [], [], []
+        cond_patient, cond_idx = [], []
+
+        for p, profile in enumerate(profiles):
+            for k, metric in enumerate(self.metric_names):
+                value = self.detector._get_patient_metric(profile, metric)
+                if value is not None:
+                    metric_values[p, k] = value
+            for position, medication in enumerate(profile.current_medications):
+                pair_patient.append(p)
+                pair_position.append(position)
+                pair_med.append(med_vocab.setdefault(medication.name, len(med_vocab)))
+            for cond in profile.complication_names + profile.medical_history:
+                cond_patient.append(p)
+                cond_idx.append(cond_vocab.setdefault(cond, len(cond_vocab)))
+
+        return (
+            metric_values,
+            np.array(pair_patient, dtype=np.int32),
+            np.array(pair_position, dtype=np.int16),
+            np.array(pair_med, dtype=np.int32),
+            list(med_vocab),
+            np.array(cond_patient, dtype=np.int32),
+            np.array(cond_idx, dtype=np.int32),
+            list(cond_vocab),
+        )
+
+    def _patient_diseases(self, n: int, cond_patient: np.ndarray, cond_idx: np.ndarray,
+                          cond_to_disease: np.ndarray) -> np.ndarray:
+        """
+        患者 × 禁忌疾病 的命中矩阵
+        直接由 (患者, 疾病词) 对累加，不构造 患者 × 疾病词表 的稠密矩阵（疾病词表为自由文本，规模随人群增长）
+        """
+        patient_disease = np.zeros((n, len(self.disease_names)), dtype=bool)
+        for start in range(0, len(cond_patient), self.chunk_size):
+            chunk = slice(start, start + self.chunk_size)
+            pair_idx, disease_idx = np.nonzero(cond_to_disease[cond_idx[chunk]])
+            patient_disease[cond_patient[chunk][pair_idx], disease_idx] = True
+        return patient_disease
+
+    # ==================== 筛查 ====================
+
+    def _indicator_violations(self, metric_values: np.ndarray) -> np.ndarray:
+        """患者 × 指标规则 的违规矩阵"""
+        values = metric_values[:, self._rule_metric]
+        threshold = self._rule_threshold
+        op = self._rule_operator
+        with np.errstate(invalid="ignore"):
+            violated = np.select(
+                [op == 0, op == 1, op == 2, op == 3, op == 4],
+                [values < threshold, values <= threshold, values > threshold,
+                 values >= threshold, values == threshold],
+                default=False
+            )
+        return violated & ~np.isnan(values) & ~np.isnan(threshold)
+
+    def screen(self, profiles: List[PatientProfile]) -> ScreeningResult:
+        """
+        筛查一组患者
+
+        Args:
+            profiles: 患者画像列表
+
+        Returns:
+            ScreeningResult（违规表按 患者、用药位置、规则类型、规则顺序 排序）
+        """
+        (metric_values, pair_patient, pair_position, pair_med,
+         med_vocab, cond_patient, cond_idx, cond_vocab) = self._load_patients(profiles)
+
+        med_to_drug = self._medication_matrix(med_vocab)
+        med_indicator = med_to_drug[:, self._indicator_owner]
+        med_disease = med_to_drug[:, self._disease_owner]
+
+        patient_indicator = self._indicator_violations(metric_values)
+        patient_disease = self._patient_diseases(len(profiles), cond_patient, cond_idx,
+                                                 self._condition_matrix(cond_vocab))
+
+        parts = []
+        for start in range(0, len(pair_patient), self.chunk_size):
+            chunk = slice(start, start + self.chunk_size)
+            patients, meds = pair_patient[chunk], pair_med[chunk]
+            for kind, med_rules, patient_rules in (
+                (KIND_INDICATOR, med_indicator, patient_indicator[patients]),
+                (KIND_DISEASE, med_disease, patient_disease[patients][:, self._rule_disease]),
+            ):
+                pair_idx, rule_idx = np.nonzero(med_rules[meds] & patient_rules)
+                part = np.empty(len(pair_idx), dtype=VIOLATION_DTYPE)
+                part["patient"] = patients[pair_idx]
+                part["medication"] = pair_position[chunk][pair_idx]
+                part["kind"] = kind
+                part["rule"] = rule_idx
+                parts.append(part)
+
+        violations = np.concatenate(parts) if parts else np.empty(0, dtype=VIOLATION_DTYPE)
+        order = np.lexsort((violations["rule"], violations["kind"], violations["medication"], violations["patient"]))
+        return ScreeningResult(self, profiles, violations[order])
@@ -5,13 +5,17 @@
 基于患者画像查询知识图谱，检测用药风险和禁忌
 """
 
-from typing import List, Dict, Optional, Any
+import os
+from typing import List, Dict, Optional, Any, Tuple
 from dataclasses import dataclass, field
 from enum import Enum
 from pathlib import Path
-from neo4j import GraphDatabase
 
+
+from ..graph_client import GraphClient, get_graph_client
 from .patient_profile import PatientProfile
+from .rule_engine import ContraindicationRuleEngine, IndicatorRule, DiseaseRule, condition_matches, drug_name_matches
+from .drug_resolver import DrugResolver
 
 
 class RiskSeverity(str, Enum):
@@ -59,6 +63,7 @@ class RiskReport:
     patient_id: Optional[str] = None
     warnings: List[RiskWarning] = field(default_factory=list)
     safe_medications: List[str] = field(default_factory=list)
+    unrecognized_medications: List[str] = field(default_factory=list)  # 图谱中找不到的用药（未核对禁忌）
     summary: str = ""
     
     @property
@@ -105,6 +110,9 @@ class RiskReport:
         if self.safe_medications:
             lines.append(f"\n✅ 安全用药: {', '.join(self.safe_medications)}")
         
+        if self.unrecognized_medications:
+            lines.append(f"\n❓ 未识别药品 (知识图谱中未找到，请人工核对禁忌): {', '.join(self.unrecognized_medications)}")
+        
         if self.summary:
             lines.append(f"\n📝 总结: {self.summary}")
         
@@ -121,23 +129,103 @@ class RiskDetector:
         self,
         neo4j_uri: str = "bolt://localhost:7687",
         neo4j_user: str = "neo4j",
-        neo4j_password: str = "password123"
+        neo4j_password: str = "password123",
+        rule_engine: Optional[ContraindicationRuleEngine] = None,
+        rule_source: Optional[str] = None,
+        rule_refresh_interval: Optional[float] = None,
+        query_mode: Optional[str] = None,
+        drug_resolver: Optional[DrugResolver] = None,
+        drug_matching: Optional[str] = None,
+        graph_client: Optional[GraphClient] = None
     ):
         """
         初始化风险检测器
         
         Args:
-            neo4j_uri: Neo4j 连接 URI
+            neo4j_uri: Neo4j 连接 URI（为空时不连接，仅使用规则引擎）
             neo4j_user: Neo4j 用户名
             neo4j_password: Neo4j 密码
+            rule_engine: 内存禁忌规则引擎（提供时不再逐药查询 Neo4j）
+            rule_source: 未提供 rule_engine 时的规则来源（None=读取 RISK_RULE_SOURCE）:
+                "auto"  - Neo4j 可用时从图谱加载一次，否则读取 graph_data.json
+                "neo4j" / "json" - 指定来源
+                "off"   - 每个药品实时查询 Neo4j
+            rule_refresh_interval: 规则自动刷新间隔秒数（None=读取 RISK_RULE_REFRESH，默认 0 不刷新）
+            query_mode: 实时查询 Neo4j 时的方式（None=读取 RISK_QUERY_MODE）:
+                "batched"  - 一次 UNWIND 查询取回全部用药的指标禁忌和疾病禁忌
+                "per_drug" - 每个药品分别查询指标禁忌和疾病禁忌
+            drug_resolver: 药品名解析器（提供时按 Drug id 精确匹配）
+            drug_matching: 未提供 drug_resolver 时的药品匹配方式（None=读取 RISK_DRUG_MATCHING）:
+                "index"    - 用药名先解析为 Drug id，图谱查询使用 {id: $id} 索引查找
+                "contains" - 药品名双向 CONTAINS 匹配（旧行为）
+            graph_client: 共享图数据库客户端（None=按连接参数从 get_graph_client 获取）
         """
-        self.driver = None
+        self.graph_client = graph_client
+        if self.graph_client is None and neo4j_uri:
+            self.graph_client = get_graph_client(neo4j_uri, neo4j_user, neo4j_password)
+
+        if self.graph_client:
+            if self.graph_client.verify():
+                print("✅ RiskDetector: Neo4j 连接成功")
+            else:
+                print(f"⚠️ RiskDetector: Neo4j 连接失败: {self.graph_client.last_error}")
+
+        self.query_mode = (query_mode or os.getenv("RISK_QUERY_MODE", "batched")).strip().lower()
+
+        self.rule_engine = rule_engine
+        if self.rule_engine is None:
+            self.rule_engine = self._create_rule_engine(rule_source, rule_refresh_interval)
+
+        self.drug_resolver = drug_resolver
+        if self.drug_resolver is None:
+            self.drug_resolver = self._create_drug_resolver(drug_matching)
+
+    @property
+    def driver(self):
+        """Neo4j 驱动（每次访问时经 graph_client.verify() 检查，连接恢复后自动可用；不可用时为 None）"""
+        if self.graph_client and self.graph_client.verify():
+            return self.graph_client.driver
+        return None
+    
+    def _create_rule_engine(
+        self,
+        rule_source: Optional[str],
+        refresh_interval: Optional[float]
+    ) -> Optional[ContraindicationRuleEngine]:
+        """按配置创建规则引擎，加载失败时回退到实时查询"""
+        source = (rule_source or os.getenv("RISK_RULE_SOURCE", "auto")).strip().lower()
+        if refresh_interval is None:
+            refresh_interval = float(os.getenv("RISK_RULE_REFRESH", "0"))
+        if source == "off":
+            return None
+        if source == "auto":
+            source = "neo4j" if self.driver else "json"
+
+        try:
+            return ContraindicationRuleEngine(
+                source=source,
+                driver=self.graph_client if source == "neo4j" else None,
+                refresh_interval=refresh_interval
+            )
+        except Exception as e:
+            print(f"⚠️ RiskDetector: 禁忌规则引擎加载失败，使用实时查询: {e}")
+            return None
+
+    def _create_drug_resolver(self, drug_matching: Optional[str]) -> Optional[DrugResolver]:
+        """按配置创建药品名解析器（与规则来自同一数据源），加载失败时回退到 CONTAINS 匹配"""
+        matching = (drug_matching or os.getenv("RISK_DRUG_MATCHING", "index")).strip().lower()
+        if matching != "index":
+            return None
+
+        driver = self.rule_engine.driver if self.rule_engine else (self.graph_client if self.driver else None)
         try:
-            self.driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
-            self.driver.verify_connectivity()
-            print("✅ RiskDetector: Neo4j 连接成功")
+            if driver is not None and (self.rule_engine is None or self.rule_engine.source == "neo4j"):
+                return DrugResolver.from_neo4j(driver)
+            graph_data_path = self.rule_engine.graph_data_path if self.rule_engine else None
+            return DrugResolver.from_graph_data(graph_data_path)
         except Exception as e:
-            print(f"⚠️ RiskDetector: Neo4j 连接失败: {e}")
+            print(f"⚠️ RiskDetector: 药品名解析器加载失败，使用名称包含匹配: {e}")
+            return None
     
     def detect_risks(self, profile: PatientProfile) -> RiskReport:
         """
@@ -151,28 +239,50 @@ class RiskDetector:
         """
         report = RiskReport(patient_id=profile.patient_id)
         
-        if not self.driver:
+        if not self.rule_engine and not self.driver:
             report.summary = "无法连接知识图谱，风险检测受限"
             return report
         
         print("\n🔍 开始风险检测...")
         
+        # 用药名 -> Drug id（未启用解析器或无法解析时为 None，回退到名称包含匹配）
+        drug_ids = [
+            (self.drug_resolver.resolve(m.name) or None) if self.drug_resolver else None
+            for m in profile.current_medications
+        ]
+        
+        # 批量模式：一次往返取回全部用药的规则
+        batched_rules = None
+        if not self.rule_engine and self.query_mode == "batched" and profile.current_medications:
+            batched_rules = self._fetch_rules_batched([m.name for m in profile.current_medications], drug_ids)
+        
         # 1. 检测每个用药的禁忌
-        for medication in profile.current_medications:
+        for i, medication in enumerate(profile.current_medications):
             drug_name = medication.name
             print(f"  检查药品: {drug_name}")
             
-            # 1.1 检测指标禁忌 (eGFR, ALT 等)
-            indicator_warnings = self._check_indicator_contraindications(drug_name, profile)
+            if self.rule_engine:
+                if drug_ids[i] is not None:
+                    rules = self.rule_engine.match_names(self._drug_names(drug_ids[i]))
+                else:
+                    rules = self.rule_engine.match(drug_name)
+                indicator_warnings, disease_warnings = self._evaluate_rules(*rules, profile)
+            elif batched_rules is not None:
+                indicator_warnings, disease_warnings = self._evaluate_rules(*batched_rules[i], profile)
+            else:
+                # 1.1 检测指标禁忌 (eGFR, ALT 等)
+                indicator_warnings = self._check_indicator_contraindications(drug_name, profile, drug_ids[i])
+                # 1.2 检测疾病禁忌
+                disease_warnings = self._check_disease_contraindications(drug_name, profile, drug_ids[i])
             report.warnings.extend(indicator_warnings)
-            
-            # 1.2 检测疾病禁忌
-            disease_warnings = self._check_disease_contraindications(drug_name, profile)
             report.warnings.extend(disease_warnings)
             
-            # 如果没有警告，加入安全用药列表
-            if not any(w.drug_name == drug_name for w in report.warnings):
-                report.safe_medications.append(drug_name)
+            # 该用药没有警告时加入安全用药列表（警告上的药品名是图谱全称，不能与用药名比较；图谱中找不到的药品单独列出，不视为安全）
+            if not indicator_warnings and not disease_warnings:
+                if self._is_unrecognized(drug_name):
+                    report.unrecognized_medications.append(drug_name)
+                else:
+                    report.safe_medications.append(drug_name)
         
         # 2. 生成总结
         report.summary = self._generate_summary(report, profile)
@@ -184,49 +294,43 @@ class RiskDetector:
     def _check_indicator_contraindications(
         self, 
         drug_name: str, 
-        profile: PatientProfile
+        profile: PatientProfile,
+        drug_ids: Optional[List[str]] = None
     ) -> List[RiskWarning]:
-        """检测指标相关的禁忌"""
+        """检测指标相关的禁忌（提供 drug_ids 时按 Drug id 精确查找）"""
         warnings = []
         
         # 构建查询
-        cypher = """
-        MATCH (d:Drug)-[r:CONTRAINDICATED_IF]->(m:Metric)
-        WHERE d.name CONTAINS $drug_name OR $drug_name CONTAINS d.name
-        RETURN d.name AS drug, m.name AS metric, 
-               r.operator AS operator, r.value AS threshold, 
-               r.severity AS severity
-        """
+        if drug_ids is not None:
+            cypher = """
+            UNWIND $drug_ids AS drug_id
+            MATCH (d:Drug {id: drug_id})-[r:CONTRAINDICATED_IF]->(m:Metric)
+            RETURN d.name AS drug, m.name AS metric, 
+                   r.operator AS operator, r.value AS threshold, 
+                   r.severity AS severity
+            """
+            params = {"drug_ids": drug_ids}
+        else:
+            cypher = """
+            MATCH (d:Drug)-[r:CONTRAINDICATED_IF]->(m:Metric)
+            WHERE d.name CONTAINS $drug_name OR $drug_name CONTAINS d.name
+            RETURN d.name AS drug, m.name AS metric, 
+                   r.operator AS operator, r.value AS threshold, 
+                   r.severity AS severity
+            """
+            params = {"drug_name": drug_name}
         
         try:
-            with self.driver.session() as session:
-                results = session.run(cypher, drug_name=drug_name)
+            with self.graph_client.session() as session:
+                results = session.run(cypher, **params)
                 
                 for record in results:
-                    metric_name = record['metric']
-                    operator = record['operator']
-                    threshold = record['threshold']
-                    severity = record['severity'] or 'CRITICAL'
-                    
-                    # 获取患者对应指标值
-                    patient_value = self._get_patient_metric(profile, metric_name)
-                    
-                    if patient_value is None:
-                        continue
-                    
-                    # 检查是否违反禁忌
-                    is_violated = self._check_threshold(patient_value, operator, threshold)
-                    
-                    if is_violated:
-                        warnings.append(RiskWarning(
-                            drug_name=record['drug'],
-                            risk_type="指标禁忌",
-                            severity=self._parse_severity(severity),
-                            reason=f"{metric_name} {operator} {threshold}（患者: {patient_value}）",
-                            recommendation=f"请考虑停用或减量",
-                            patient_value=patient_value,
-                            threshold=threshold
-                        ))
+                    warning = self._build_indicator_warning(
+                        record['drug'], record['metric'], record['operator'],
+                        record['threshold'], record['severity'], profile
+                    )
+                    if warning:
+                        warnings.append(warning)
         except Exception as e:
             print(f"    ⚠️ 指标禁忌查询失败: {e}")
         
@@ -235,9 +339,10 @@ class RiskDetector:
     def _check_disease_contraindications(
         self, 
         drug_name: str, 
-        profile: PatientProfile
+        profile: PatientProfile,
+        drug_ids: Optional[List[str]] = None
     ) -> List[RiskWarning]:
-        """检测疾病相关的禁忌"""
+        """检测疾病相关的禁忌（提供 drug_ids 时按 Drug id 精确查找）"""
         warnings = []
         
         # 获取患者疾病/并发症列表
@@ -247,39 +352,207 @@ class RiskDetector:
             return warnings
         
         # 构建查询
-        cypher = """
-        MATCH (d:Drug)-[r:FORBIDDEN_FOR]->(dis:Disease)
-        WHERE (d.name CONTAINS $drug_name OR $drug_name CONTAINS d.name)
-        RETURN d.name AS drug, dis.name AS disease, 
-               r.severity AS severity, r.reason AS reason
-        """
+        if drug_ids is not None:
+            cypher = """
+            UNWIND $drug_ids AS drug_id
+            MATCH (d:Drug {id: drug_id})-[r:FORBIDDEN_FOR]->(dis:Disease)
+            RETURN d.name AS drug, dis.name AS disease, 
+                   r.severity AS severity, r.reason AS reason
+            """
+            params = {"drug_ids": drug_ids}
+        else:
+            cypher = """
+            MATCH (d:Drug)-[r:FORBIDDEN_FOR]->(dis:Disease)
+            WHERE (d.name CONTAINS $drug_name OR $drug_name CONTAINS d.name)
+            RETURN d.name AS drug, dis.name AS disease, 
+                   r.severity AS severity, r.reason AS reason
+            """
+            params = {"drug_name": drug_name}
         
         try:
-            with self.driver.session() as session:
-                results = session.run(cypher, drug_name=drug_name)
+            with self.graph_client.session() as session:
+                results = session.run(cypher, **params)
                 
                 for record in results:
-                    disease = record['disease']
-                    
-                    # 检查患者是否有该疾病
-                    has_disease = any(
-                        disease.lower() in cond.lower() or cond.lower() in disease.lower()
-                        for cond in patient_conditions
+                    warning = self._build_disease_warning(
+                        record['drug'], record['disease'], record['severity'],
+                        record['reason'], patient_conditions
                     )
-                    
-                    if has_disease:
-                        warnings.append(RiskWarning(
-                            drug_name=record['drug'],
-                            risk_type="疾病禁忌",
-                            severity=self._parse_severity(record['severity'] or '禁忌'),
-                            reason=f"患者存在 {disease}",
-                            recommendation=record['reason'] or "请评估是否需要换药"
-                        ))
+                    if warning:
+                        warnings.append(warning)
         except Exception as e:
             print(f"    ⚠️ 疾病禁忌查询失败: {e}")
         
         return warnings
     
+    def _fetch_rules_batched(
+        self,
+        drug_names: List[str],
+        drug_ids: Optional[List[Optional[List[str]]]] = None
+    ) -> Optional[List[Tuple[List[IndicatorRule], List[DiseaseRule]]]]:
+        """
+        一次会话取回所有用药的指标禁忌和疾病禁忌
+        （已解析的用药一次 UNWIND 按 id 精确查找，未解析的用药一次 UNWIND 按名称包含匹配）
+        
+        Args:
+            drug_names: 用药名列表
+            drug_ids: 与 drug_names 对应的 Drug id 列表（为 None 的项按名称包含匹配）
+        
+        Returns:
+            与 drug_names 一一对应的 (指标规则, 疾病规则)；查询失败返回 None（回退到逐药查询）
+        """
+        if drug_ids is None:
+            drug_ids = [None] * len(drug_names)
+        
+        queries = []
+        if any(ids is not None for ids in drug_ids):
+            queries.append(("""
+            UNWIND range(0, size($drug_ids) - 1) AS idx
+            UNWIND $drug_ids[idx] AS drug_id
+            MATCH (d:Drug {id: drug_id})-[r:CONTRAINDICATED_IF|FORBIDDEN_FOR]->(t)
+            WHERE (type(r) = 'CONTRAINDICATED_IF' AND t:Metric)
+               OR (type(r) = 'FORBIDDEN_FOR' AND t:Disease)
+            RETURN idx, type(r) AS rel_type, d.name AS drug, t.name AS target,
+                   r.operator AS operator, r.value AS threshold,
+                   r.severity AS severity, r.reason AS reason
+            """, {"drug_ids": [ids or [] for ids in drug_ids]}))
+        # 未解析的用药按名称包含匹配
+        unresolved = [idx for idx, ids in enumerate(drug_ids) if ids is None]
+        if unresolved:
+            queries.append(("""
+            UNWIND $idxs AS idx
+            WITH idx, $drugs[idx] AS drug_name
+            MATCH (d:Drug)-[r:CONTRAINDICATED_IF|FORBIDDEN_FOR]->(t)
+            WHERE (d.name CONTAINS drug_name OR drug_name CONTAINS d.name)
+              AND ((type(r) = 'CONTRAINDICATED_IF' AND t:Metric)
+                   OR (type(r) = 'FORBIDDEN_FOR' AND t:Disease))
+            RETURN idx, type(r) AS rel_type, d.name AS drug, t.name AS target,
+                   r.operator AS operator, r.value AS threshold,
+                   r.severity AS severity, r.reason AS reason
+            """, {"idxs": unresolved, "drugs": drug_names}))
+        
+        rules = [([], []) for _ in drug_names]
+        try:
+            with self.graph_client.session() as session:
+                for cypher, params in queries:
+                    for record in session.run(cypher, **params):
+                        indicator_rules, disease_rules = rules[record['idx']]
+                        if record['rel_type'] == 'CONTRAINDICATED_IF':
+                            indicator_rules.append(IndicatorRule(
+                                drug=record['drug'], metric=record['target'], operator=record['operator'],
+                                threshold=record['threshold'], severity=record['severity']
+                            ))
+                        else:
+                            disease_rules.append(DiseaseRule(
+                                drug=record['drug'], disease=record['target'],
+                                severity=record['severity'], reason=record['reason']
+                            ))
+        except Exception as e:
+            print(f"    ⚠️ 批量禁忌查询失败，改为逐药查询: {e}")
+            return None
+        
+        return rules
+    
+    def _is_unrecognized(self, drug_name: str) -> bool:
+        """
+        用药在图谱中找不到任何对应药品（精确解析和名称包含匹配均失败）
+        
+        药品表取自解析器（无解析器时取 JSON 规则引擎，图谱规则快照只含有规则的药品）；无法判断时返回 False
+        """
+        if self.drug_resolver:
+            if self.drug_resolver.resolve(drug_name):
+                return False
+            names = self.drug_resolver.drug_names.values()
+        elif self.rule_engine and self.rule_engine.source == "json":
+            names = [name for name, _, _ in self.rule_engine.drugs]
+        else:
+            return False
+        return not any(drug_name_matches(drug_name, name) for name in names)
+    
+    def _drug_names(self, drug_ids: List[str]) -> List[str]:
+        """Drug id -> 药品名"""
+        return [self.drug_resolver.drug_names[drug_id] for drug_id in drug_ids]
+    
+    def _evaluate_rules(
+        self,
+        indicator_rules: List[IndicatorRule],
+        disease_rules: List[DiseaseRule],
+        profile: PatientProfile
+    ):
+        """在本地评估规则：指标阈值比较和疾病匹配（与逐药查询路径结果一致）"""
+        indicator_warnings = []
+        for rule in indicator_rules:
+            warning = self._build_indicator_warning(
+                rule.drug, rule.metric, rule.operator, rule.threshold, rule.severity, profile
+            )
+            if warning:
+                indicator_warnings.append(warning)
+        
+        disease_warnings = []
+        patient_conditions = profile.complication_names + profile.medical_history
+        if patient_conditions:
+            for rule in disease_rules:
+                warning = self._build_disease_warning(
+                    rule.drug, rule.disease, rule.severity, rule.reason, patient_conditions
+                )
+                if warning:
+                    disease_warnings.append(warning)
+        
+        return indicator_warnings, disease_warnings
+    
+    def _build_indicator_warning(
+        self,
+        drug: str,
+        metric_name: str,
+        operator: str,
+        threshold: Optional[float],
+        severity: Optional[str],
+        profile: PatientProfile
+    ) -> Optional[RiskWarning]:
+        """根据一条 CONTRAINDICATED_IF 规则判断患者是否违反指标禁忌"""
+        # 获取患者对应指标值
+        patient_value = self._get_patient_metric(profile, metric_name)
+        
+        if patient_value is None:
+            return None
+        
+        # 检查是否违反禁忌
+        if not self._check_threshold(patient_value, operator, threshold):
+            return None
+        
+        return RiskWarning(
+            drug_name=drug,
+            risk_type="指标禁忌",
+            severity=self._parse_severity(severity or 'CRITICAL'),
+            reason=f"{metric_name} {operator} {threshold}（患者: {patient_value}）",
+            recommendation=f"请考虑停用或减量",
+            patient_value=patient_value,
+            threshold=threshold
+        )
+    
+    def _build_disease_warning(
+        self,
+        drug: str,
+        disease: str,
+        severity: Optional[str],
+        reason: Optional[str],
+        patient_conditions: List[str]
+    ) -> Optional[RiskWarning]:
+        """根据一条 FORBIDDEN_FOR 规则判断患者是否存在禁忌疾病"""
+        # 检查患者是否有该疾病
+        has_disease = any(condition_matches(disease, cond) for cond in patient_conditions)
+        
+        if not has_disease:
+            return None
+        
+        return RiskWarning(
+            drug_name=drug,
+            risk_type="疾病禁忌",
+            severity=self._parse_severity(severity or '禁忌'),
+            reason=f"患者存在 {disease}",
+            recommendation=reason or "请评估是否需要换药"
+        )
+    
     def _get_patient_metric(self, profile: PatientProfile, metric_name: str) -> Optional[float]:
         """获取患者的指标值"""
         metric_map = {
@@ -303,6 +576,8 @@ class RiskDetector:
     
     def _check_threshold(self, value: float, operator: str, threshold: float) -> bool:
         """检查值是否违反阈值"""
+        if threshold is None:
+            return False
         if operator == '<':
             return value < threshold
         elif operator == '<=':
@@ -349,29 +624,38 @@ class RiskDetector:
         if not self.driver:
             return []
         
-        cypher = """
-        MATCH (d:Drug)-[r]->(target)
-        WHERE (d.name CONTAINS $drug_name OR $drug_name CONTAINS d.name)
-          AND type(r) IN ['CONTRAINDICATED_IF', 'FORBIDDEN_FOR', 'DOSAGE_ADJUST_IF']
-        RETURN d.name AS drug, type(r) AS relation_type, 
-               target.name AS target, properties(r) AS properties
-        """
+        # 无法解析为 Drug id 时回退到名称包含匹配
+        drug_ids = self.drug_resolver.resolve(drug_name) if self.drug_resolver else []
+        if drug_ids:
+            cypher = """
+            UNWIND $drug_ids AS drug_id
+            MATCH (d:Drug {id: drug_id})-[r]->(target)
+            WHERE type(r) IN ['CONTRAINDICATED_IF', 'FORBIDDEN_FOR', 'DOSAGE_ADJUST_IF']
+            RETURN d.name AS drug, type(r) AS relation_type, 
+                   target.name AS target, properties(r) AS properties
+            """
+            params = {"drug_ids": drug_ids}
+        else:
+            cypher = """
+            MATCH (d:Drug)-[r]->(target)
+            WHERE (d.name CONTAINS $drug_name OR $drug_name CONTAINS d.name)
+              AND type(r) IN ['CONTRAINDICATED_IF', 'FORBIDDEN_FOR', 'DOSAGE_ADJUST_IF']
+            RETURN d.name AS drug, type(r) AS relation_type, 
+                   target.name AS target, properties(r) AS properties
+            """
+            params = {"drug_name": drug_name}
         
         results = []
         try:
-            with self.driver.session() as session:
-                records = session.run(cypher, drug_name=drug_name)
-                for record in records:
-                    results.append(record.data())
+            results = self.graph_client.query(cypher, params)
         except Exception as e:
             print(f"查询失败: {e}")
         
         return results
     
     def close(self):
-        """关闭连接"""
-        if self.driver:
-            self.driver.close()
+        """释放连接（共享驱动由 close_graph_clients 统一关闭）"""
+        self.graph_client = None
 
 
 # ============================================
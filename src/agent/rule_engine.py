@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+禁忌规则引擎 (Contraindication Rule Engine)
+将知识图谱中的 CONTRAINDICATED_IF / FORBIDDEN_FOR 规则一次性加载到内存，
+供 RiskDetector 在进程内匹配，避免每个药品两次 Neo4j 往返
+
+规则来源:
+- neo4j: 从图谱读取全部规则边（与在线查询结果完全一致）
+- json:  直接读取 data/processed/graph_data.json，按导入脚本的 MERGE 语义编译
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+DEFAULT_GRAPH_DATA = Path(__file__).parent.parent.parent / "data" / "processed" / "graph_data.json"
+
+# 导入脚本创建的 Metric 节点（与 src/graph/import_rows.METRIC_DEFINITIONS 一致），
+# 其他指标的 CONTRAINDICATED_IF 关系在 MATCH 时落空
+METRIC_NODES = ("eGFR", "CrCl", "ALT", "AST", "BMI")
+
+# FORBIDDEN_FOR 关系的固定严重程度（与 src/graph/import_rows.FORBIDDEN_SEVERITY 一致）
+FORBIDDEN_SEVERITY = "禁忌"
+
+
+def drug_name_matches(query: str, name: str) -> bool:
+    """药品名匹配，与 Cypher 一致: d.name CONTAINS $drug_name OR $drug_name CONTAINS d.name"""
+    return query in name or name in query
+
+
+def condition_matches(disease: str, condition: str) -> bool:
+    """禁忌疾病与患者疾病/并发症匹配（不区分大小写的双向包含）"""
+    disease, condition = disease.lower(), condition.lower()
+    return disease in condition or condition in disease
+
+
+@dataclass(frozen=True)
+class IndicatorRule:
+    """指标禁忌规则（对应一条 CONTRAINDICATED_IF 关系）"""
+    drug: str
+    metric: str
+    operator: str
+    threshold: Optional[float]
+    severity: Optional[str]
+
+
+@dataclass(frozen=True)
+class DiseaseRule:
+    """疾病禁忌规则（对应一条 FORBIDDEN_FOR 关系）"""
+    drug: str
+    disease: str
+    severity: Optional[str]
+    reason: Optional[str]
+
+
+class _CompiledRules:
+    """一次加载的不可变规则快照"""
+
+    def __init__(self, drugs: List[Tuple[str, List[IndicatorRule], List[DiseaseRule]]]):
+        self.drugs = drugs
+        self.indicator_count = sum(len(ind) for _, ind, _ in drugs)
+        self.disease_count = sum(len(dis) for _, _, dis in drugs)
+        self._match_cache: "OrderedDict[str, Tuple[List[IndicatorRule], List[DiseaseRule]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def match(self, drug_name: str) -> Tuple[List[IndicatorRule], List[DiseaseRule]]:
+        """
+        查找药品规则，匹配语义与 Cypher 一致:
+        d.name CONTAINS $drug_name OR $drug_name CONTAINS d.name
+        """
+        with self._lock:
+            cached = self._match_cache.get(drug_name)
+            if cached is not None:
+                self._match_cache.move_to_end(drug_name)
+                return cached
+
+        indicator_rules, disease_rules = [], []
+        for name, indicators, diseases in self.drugs:
+            if drug_name_matches(drug_name, name):
+                indicator_rules.extend(indicators)
+                disease_rules.extend(diseases)
+        result = (indicator_rules, disease_rules)
+
+        with self._lock:
+            self._match_cache[drug_name] = result
+            if len(self._match_cache) > 1024:
+                self._match_cache.popitem(last=False)
+        return result
+
+    def match_names(self, names: List[str]) -> Tuple[List[IndicatorRule], List[DiseaseRule]]:
+        """按药品名精确查找规则（names 来自 DrugResolver），结果按规则快照中的药品顺序排列"""
+        wanted = set(names)
+        indicator_rules, disease_rules = [], []
+        for name, indicators, diseases in self.drugs:
+            if name in wanted:
+                indicator_rules.extend(indicators)
+                disease_rules.extend(diseases)
+        return indicator_rules, disease_rules
+
+
+class ContraindicationRuleEngine:
+    """
+    内存禁忌规则引擎
+
+    Usage:
+        engine = ContraindicationRuleEngine.from_graph_data()
+        indicator_rules, disease_rules = engine.match("二甲双胍")
+    """
+
+    def __init__(
+        self,
+        source: str = "json",
+        graph_data_path: Optional[str] = None,
+        driver=None,
+        refresh_interval: float = 0
+    ):
+        """
+        Args:
+            source: 规则来源 "json" 或 "neo4j"
+            graph_data_path: graph_data.json / graph_data.jsonl 路径（source="json"）
+            driver: Neo4j 驱动或 GraphClient（source="neo4j"，只使用 session()）
+            refresh_interval: 自动刷新间隔（秒），0 表示只加载一次
+        """
+        if source not in {"json", "neo4j"}:
+            raise ValueError(f"未知的规则来源: {source}")
+        if source == "neo4j" and driver is None:
+            raise ValueError("source='neo4j' 需要提供 Neo4j 驱动")
+
+        self.source = source
+        self.graph_data_path = Path(graph_data_path) if graph_data_path else DEFAULT_GRAPH_DATA
+        self.driver = driver
+        self.refresh_interval = refresh_interval
+        self._rules: Optional[_CompiledRules] = None
+        self._loaded_at = 0.0
+        self._refresh_lock = threading.Lock()
+
+        self.reload()
+
+    @classmethod
+    def from_graph_data(cls, path: Optional[str] = None, **kwargs) -> "ContraindicationRuleEngine":
+        return cls(source="json", graph_data_path=path, **kwargs)
+
+    @classmethod
+    def from_neo4j(cls, driver, **kwargs) -> "ContraindicationRuleEngine":
+        return cls(source="neo4j", driver=driver, **kwargs)
+
+    # ==================== 加载 ====================
+
+    def reload(self):
+        """重新加载并编译规则（新快照构建完成后原子替换）"""
+        t0 = time.time()
+        if self.source == "neo4j":
+            drugs = self._load_from_neo4j()
+        else:
+            from ..graph.import_rows import iter_graph_data
+            drugs = self.compile_graph_data(iter_graph_data(self.graph_data_path))
+
+        self._rules = _CompiledRules(drugs)
+        self._loaded_at = time.monotonic()
+        print(f"✅ 禁忌规则引擎加载完成 ({self.source}): {len(drugs)} 个药品, "
+              f"{self._rules.indicator_count} 条指标规则, {self._rules.disease_count} 条疾病规则 "
+              f"({(time.time() - t0) * 1000:.0f}ms)")
+
+    def maybe_refresh(self):
+        """超过刷新间隔时从数据源重新加载；加载失败时继续使用旧快照"""
+        if not self.refresh_interval or time.monotonic() - self._loaded_at < self.refresh_interval:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            self.reload()
+        except Exception as e:
+            self._loaded_at = time.monotonic()
+            print(f"⚠️ 禁忌规则刷新失败，继续使用旧规则: {e}")
+        finally:
+            self._refresh_lock.release()
+
+    def _load_from_neo4j(self) -> List[Tuple[str, List[IndicatorRule], List[DiseaseRule]]]:
+        """从图谱读取全部规则边（每条关系一行，保留重复关系）"""
+        drugs: "OrderedDict[str, Tuple[List[IndicatorRule], List[DiseaseRule]]]" = OrderedDict()
+
+        with self.driver.session() as session:
+            for record in session.run("""
+                MATCH (d:Drug)-[r:CONTRAINDICATED_IF]->(m:Metric)
+                RETURN d.name AS drug, m.name AS metric,
+                       r.operator AS operator, r.value AS threshold,
+                       r.severity AS severity
+            """):
+                entry = drugs.setdefault(record["drug"], ([], []))
+                entry[0].append(IndicatorRule(
+                    drug=record["drug"], metric=record["metric"], operator=record["operator"],
+                    threshold=record["threshold"], severity=record["severity"]
+                ))
+
+            for record in session.run("""
+                MATCH (d:Drug)-[r:FORBIDDEN_FOR]->(dis:Disease)
+                RETURN d.name AS drug, dis.name AS disease,
+                       r.severity AS severity, r.reason AS reason
+            """):
+                entry = drugs.setdefault(record["drug"], ([], []))
+                entry[1].append(DiseaseRule(
+                    drug=record["drug"], disease=record["disease"],
+                    severity=record["severity"], reason=record["reason"]
+                ))
+
+        return [(name, ind, dis) for name, (ind, dis) in drugs.items()]
+
+    @staticmethod
+    def compile_graph_data(graph_data: Iterable[Dict[str, Any]]) -> List[Tuple[str, List[IndicatorRule], List[DiseaseRule]]]:
+        """
+        按导入语义编译图谱数据，使结果与导入后的图谱一致（关系行来自 src/graph/import_rows.py，
+        与 UNWIND 导入、neo4j-admin CSV 共用；同名药品、同名疾病节点、未定义指标的处理见该模块）
+        """
+        # 延迟导入：src.graph 包初始化时会导入本模块
+        from ..graph.import_rows import iter_import_rows
+
+        drugs: "OrderedDict[str, Tuple[List[IndicatorRule], List[DiseaseRule]]]" = OrderedDict()
+        names: Dict[str, str] = {}
+
+        for kind, row in iter_import_rows(graph_data):
+            if kind == "drugs":
+                names[row["props"]["id"]] = row["name"]
+                drugs[row["name"]] = ([], [])
+            elif kind == "forbidden_for":
+                name = names[row["drug_id"]]
+                drugs[name][1].append(DiseaseRule(
+                    drug=name, disease=row["disease"], severity=FORBIDDEN_SEVERITY, reason=None
+                ))
+            elif kind == "contraindicated_if":
+                name = names[row["drug_id"]]
+                drugs[name][0].append(IndicatorRule(
+                    drug=name, metric=row["metric"], operator=row["operator"],
+                    threshold=row.get("value"), severity=row["severity"]
+                ))
+
+        return [(name, ind, dis) for name, (ind, dis) in drugs.items()]
+
+    # ==================== 查询 ====================
+
+    def match(self, drug_name: str) -> Tuple[List[IndicatorRule], List[DiseaseRule]]:
+        """返回与药品名匹配的 (指标规则, 疾病规则)"""
+        self.maybe_refresh()
+        return self._rules.match(drug_name)
+
+    def match_names(self, names: List[str]) -> Tuple[List[IndicatorRule], List[DiseaseRule]]:
+        """返回指定药品名（精确匹配）的 (指标规则, 疾病规则)"""
+        self.maybe_refresh()
+        return self._rules.match_names(names)
+
+    @property
+    def drugs(self) -> List[Tuple[str, List[IndicatorRule], List[DiseaseRule]]]:
+        """当前规则快照: [(药品名, 指标规则, 疾病规则), ...]"""
+        self.maybe_refresh()
+        return self._rules.drugs
+
+    def get_stats(self) -> Dict[str, Any]:
+        rules = self._rules
+        return {
+            "source": self.source,
+            "drugs": len(rules.drugs),
+            "indicator_rules": rules.indicator_count,
+            "disease_rules": rules.disease_count,
+            "age_seconds": round(time.monotonic() - self._loaded_at, 1),
+            "refresh_interval": self.refresh_interval,
+        }
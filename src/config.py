@@ -49,6 +49,14 @@ class Neo4jConfig:
     user: str = field(default_factory=lambda: os.getenv("NEO4J_USER", "neo4j"))
     password: str = field(default_factory=lambda: os.getenv("NEO4J_PASSWORD", "password123"))
     database: str = field(default_factory=lambda: os.getenv("NEO4J_DATABASE", "neo4j"))
+    
+    # 连接池（所有组件共享一个驱动，见 src/graph_client.py）
+    max_connection_pool_size: int = field(default_factory=lambda: int(os.getenv("NEO4J_MAX_POOL_SIZE", "50")))
+    connection_acquisition_timeout: float = field(default_factory=lambda: float(os.getenv("NEO4J_ACQUISITION_TIMEOUT", "60")))
+    max_connection_lifetime: float = field(default_factory=lambda: float(os.getenv("NEO4J_MAX_CONNECTION_LIFETIME", "3600")))
+    connection_timeout: float = field(default_factory=lambda: float(os.getenv("NEO4J_CONNECTION_TIMEOUT", "10")))
+    # 健康检查结果缓存时间（秒）
+    health_interval: float = field(default_factory=lambda: float(os.getenv("NEO4J_HEALTH_INTERVAL", "30")))
 
 
 @dataclass
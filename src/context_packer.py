@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上下文打包 (Context Packer)
+在 token 预算内挑选并裁剪证据（Rerank 后的指南片段 + 知识图谱结果行），使总相关性最大:
+1. 每个指南片段按句切分，句子权重 = 基础权重 + 命中关键词的稀有度之和
+   （关键词在片段中出现的句子越少，命中它的句子越关键）
+2. 为每个片段生成若干候选版本（全文、命中句及前后各一句、仅命中句、最佳命中句、开头几句），
+   版本价值 = 片段分数 × 保留句子权重占比，代价 = 估算 token 数
+3. 分组背包（每个片段至多选一个版本）求预算内价值最大的组合；KG 结果行整行参与，不裁剪
+   （kg_first=True 时 KG 行作为硬性规则先占预算，不参与取舍，只有超出全部预算的尾部行被省略并计入 kg_omitted）
+
+结果按原始排名输出，裁剪后的正文写入 packed_content
+"""
+
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import jieba
+import numpy as np
+
+from .llm_metrics import estimate_tokens
+
+
+# 句子: 以中英文句末标点或换行结尾
+_SENTENCE_PATTERN = re.compile(r'[^。！？；!?;\n]+[。！？；!?;]*')
+
+# 不参与命中计算的问句用词
+_QUERY_STOPWORDS = frozenset({
+    "哪些", "什么", "可以", "不能", "能否", "是否", "如何", "怎么", "怎样", "应该", "需要", "使用", "患者",
+})
+
+# 未命中关键词的句子的权重
+_BASE_WEIGHT = 0.25
+
+# 预算较大时按 unit 个 token 为一格做背包，控制计算量
+_MAX_CAPACITY = 1000
+
+
+@dataclass
+class PackedContext:
+    """打包结果"""
+    rag_results: List[Dict]          # 选中的文档（副本，packed_content 为裁剪后的正文），保持原排名
+    kg_results: List[Dict]           # 选中的 KG 结果行，保持原顺序
+    tokens: int = 0                  # 选中内容的估算 token 数
+    budget: int = 0                  # 可用预算（已扣除预留部分）
+    dropped: int = 0                 # 未选中的候选数
+    trimmed: int = 0                 # 被裁剪的文档数
+    kg_omitted: int = 0              # kg_first 模式下超出预算被省略的 KG 行数
+
+
+@dataclass
+class _Candidate:
+    source: str                      # "rag" / "kg"
+    position: int                    # 在原列表中的下标
+    options: List[Tuple[int, float, str]] = field(default_factory=list)  # (token 数, 价值, 正文)
+
+
+def split_sentences(text: str) -> List[str]:
+    """按句切分（保留句末标点）"""
+    return [text[start:end] for start, end in sentence_spans(text)]
+
+
+def sentence_spans(text: str) -> List[Tuple[int, int]]:
+    """每句（去掉首尾空白）在原文中的 [start, end) 位置"""
+    spans = []
+    for match in _SENTENCE_PATTERN.finditer(text):
+        sentence = match.group()
+        if sentence.strip():
+            start = match.start() + len(sentence) - len(sentence.lstrip())
+            spans.append((start, match.end() - (len(sentence) - len(sentence.rstrip()))))
+    return spans
+
+
+def query_terms(query: str) -> Set[str]:
+    """问题关键词（jieba 搜索引擎模式分词，长词及其子词都参与匹配；去掉单字和问句用词）"""
+    return {
+        word.strip() for word in jieba.cut_for_search(query or "")
+        if len(word.strip()) >= 2 and word.strip() not in _QUERY_STOPWORDS
+    }
+
+
+def document_content(doc: Dict) -> str:
+    """指南切片正文（去掉入库时加的【章节】标题行，标题由引用标签给出）"""
+    content = doc.get('document', '').replace('【章节】', '').strip()
+    header = (doc.get('metadata') or {}).get('header')
+    if header and content.startswith(header + '\n'):
+        content = content[len(header) + 1:].strip()
+    return content
+
+
+def kg_row_text(record: Dict) -> str:
+    return ' | '.join(f"{key}: {value}" for key, value in record.items())
+
+
+class ContextPacker:
+    """
+    token 预算内的证据选择与裁剪
+
+    Usage:
+        packer = ContextPacker(token_budget=1500)
+        packed = packer.pack(question, reranked_docs, kg_rows)
+        for doc in packed.rag_results:
+            print(doc['packed_content'])
+    """
+
+    def __init__(
+        self,
+        token_budget: Optional[int] = None,
+        kg_score: float = 1.0,
+        estimate: Callable[[str], int] = estimate_tokens
+    ):
+        """
+        Args:
+            token_budget: 证据总 token 预算（None=读取 CONTEXT_TOKEN_BUDGET，默认 1500）
+            kg_score: 每条 KG 结果行的相关性分数（Rerank 分数归一化在 0~1 之间）
+            estimate: token 估算函数
+        """
+        self.token_budget = token_budget if token_budget is not None else \
+            int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+        self.kg_score = kg_score
+        self.estimate = estimate
+
+    @staticmethod
+    def document_score(doc: Dict, rank: int) -> float:
+        """Rerank 分数优先，其次 RRF / 检索分数，都没有时按排名递减"""
+        for key in ('rerank_score', 'rrf_score', 'score'):
+            if doc.get(key) is not None:
+                return max(float(doc[key]), 0.0)
+        return 1.0 / (rank + 1)
+
+    @staticmethod
+    def _render(sentences: List[str], keep: Sequence[int]) -> str:
+        """拼接保留的句子，不连续处和截断处用省略号"""
+        parts = ["…"] if keep and keep[0] != 0 else []
+        previous = keep[0] - 1 if keep else -1
+        for i in keep:
+            if i != previous + 1:
+                parts.append("…")
+            parts.append(sentences[i])
+            previous = i
+        if keep and keep[-1] != len(sentences) - 1:
+            parts.append("…")
+        return "".join(parts)
+
+    def _document_options(self, content: str, score: float, terms: Set[str], label_tokens: int):
+        sentences = split_sentences(content)
+        if not sentences:
+            return []
+        lowered = [s.lower() for s in sentences]
+        matched = [{term for term in terms if term.lower() in s} for s in lowered]
+        frequency = {term: sum(1 for m in matched if term in m) for term in terms}
+        weights = [_BASE_WEIGHT + sum(1.0 / frequency[term] for term in m) for m in matched]
+        total = sum(weights)
+
+        hit_positions = [i for i, m in enumerate(matched) if m]
+        selections = [list(range(len(sentences)))]
+        if hit_positions:
+            window = sorted({j for i in hit_positions for j in (i - 1, i, i + 1) if 0 <= j < len(sentences)})
+            best = max(hit_positions, key=lambda i: (weights[i], -i))
+            selections += [window, hit_positions, [best]]
+        selections += [list(range(min(n, len(sentences)))) for n in (3, 1)]
+
+        options = []
+        seen = set()
+        for keep in selections:
+            key = tuple(keep)
+            if key in seen:
+                continue
+            seen.add(key)
+            text = content if len(keep) == len(sentences) else self._render(sentences, keep)
+            value = score * sum(weights[i] for i in keep) / total
+            options.append((self.estimate(text) + label_tokens, value, text))
+        return options
+
+    def pack(
+        self,
+        question: str,
+        rag_results: Optional[List[Dict]] = None,
+        kg_results: Optional[List[Dict]] = None,
+        budget: Optional[int] = None,
+        reserved_tokens: int = 0,
+        kg_first: bool = False
+    ) -> PackedContext:
+        """
+        在预算内选择并裁剪证据
+
+        Args:
+            question: 用户问题（用于定位命中句）
+            rag_results: 按相关性排序的指南文档
+            kg_results: 知识图谱结果行
+            budget: 本次预算（None=初始化时的 token_budget）
+            reserved_tokens: 已被 Prompt 其他部分占用的 token 数
+            kg_first: KG 行不与指南片段竞争预算，按原顺序整行保留（超出全部预算时省略尾部），剩余预算用于指南
+        """
+        rag_results = rag_results or []
+        kg_results = kg_results or []
+        budget = max((budget if budget is not None else self.token_budget) - reserved_tokens, 0)
+        terms = query_terms(question)
+
+        reserved_kg, kg_tokens = [], 0
+        if kg_first:
+            for record in kg_results:
+                cost = self.estimate(kg_row_text(record)) + 2
+                if kg_tokens + cost > budget:
+                    break
+                reserved_kg.append(record)
+                kg_tokens += cost
+
+        candidates = []
+        for i, record in enumerate([] if kg_first else kg_results):
+            text = kg_row_text(record)
+            candidates.append(_Candidate("kg", i, [(self.estimate(text) + 2, self.kg_score, text)]))
+        for i, doc in enumerate(rag_results):
+            metadata = doc.get('metadata') or {}
+            label = f"【{metadata.get('header', '未知章节')} - P.{metadata.get('page', 'N/A')}】"
+            options = self._document_options(document_content(doc), self.document_score(doc, i),
+                                             terms, self.estimate(label) + 2)
+            candidates.append(_Candidate("rag", i, options))
+
+        chosen = self._select(candidates, budget - kg_tokens)
+
+        packed_rag, packed_kg = [], list(reserved_kg)
+        tokens, trimmed = kg_tokens, 0
+        for candidate, option in zip(candidates, chosen):
+            if option is None:
+                continue
+            cost, _, text = candidate.options[option]
+            tokens += cost
+            if candidate.source == "kg":
+                packed_kg.append(kg_results[candidate.position])
+            else:
+                doc = dict(rag_results[candidate.position])
+                doc['packed_content'] = text
+                packed_rag.append(doc)
+                trimmed += option > 0
+
+        kg_omitted = len(kg_results) - len(reserved_kg) if kg_first else 0
+        return PackedContext(
+            rag_results=packed_rag,
+            kg_results=packed_kg,
+            tokens=tokens,
+            budget=budget,
+            dropped=sum(1 for option in chosen if option is None) + kg_omitted,
+            trimmed=trimmed,
+            kg_omitted=kg_omitted,
+        )
+
+    @staticmethod
+    def _select(candidates: List[_Candidate], budget: int) -> List[Optional[int]]:
+        """分组背包: 每个候选至多选一个版本，总代价不超过预算，价值最大"""
+        unit = max(1, -(-budget // _MAX_CAPACITY))
+        capacity = budget // unit
+
+        best = np.zeros(capacity + 1)
+        choices = np.full((len(candidates), capacity + 1), -1, dtype=int)
+        costs = [[-(-cost // unit) for cost, _, _ in c.options] for c in candidates]
+
+        for i, candidate in enumerate(candidates):
+            stacked = [best]
+            for cost, (_, value, _) in zip(costs[i], candidate.options):
+                shifted = np.full(capacity + 1, -np.inf)
+                if cost <= capacity:
+                    shifted[cost:] = best[:capacity + 1 - cost] + value
+                stacked.append(shifted)
+            stacked = np.vstack(stacked)
+            choices[i] = stacked.argmax(axis=0) - 1
+            best = stacked.max(axis=0)
+
+        chosen: List[Optional[int]] = [None] * len(candidates)
+        remaining = capacity
+        for i in range(len(candidates) - 1, -1, -1):
+            option = int(choices[i, remaining])
+            if option >= 0:
+                chosen[i] = option
+                remaining -= costs[i][option]
+        return chosen
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cypher 查询结果缓存 (Cypher Result Cache)
+知识图谱在两次导入之间只读，相同的 Cypher（回退模板、示例匹配的查询、禁忌查询）
+反复执行会得到相同结果。缓存键由 规范化 Cypher + 参数 + 图谱版本号 组成:
+scripts/import_neo4j.py 每次导入后写入 (:GraphMeta {name: 'graph'}).version，
+缓存定期重新读取版本号，版本变化时清空全部条目
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+# 图谱版本戳（导入脚本写入，与 scripts/import_neo4j.py 保持一致）
+GRAPH_VERSION_QUERY = "MATCH (m:GraphMeta {name: 'graph'}) RETURN m.version AS version LIMIT 1"
+
+# 只缓存只读查询
+_WRITE_PATTERN = re.compile(
+    r'\b(CREATE|MERGE|DELETE|DETACH|SET|REMOVE|DROP|FOREACH|LOAD\s+CSV|CALL)\b', re.IGNORECASE
+)
+
+# 字符串字面量原样保留，其余连续空白压缩为一个空格
+_STRING_OR_SPACE = re.compile(r"('(?:\\.|[^'\\])*'|\"(?:\\.|[^\"\\])*\")|\s+")
+
+
+def normalize_cypher(cypher: str) -> str:
+    """规范化 Cypher 文本：压缩空白、去掉末尾分号（不改变字符串字面量）"""
+    text = _STRING_OR_SPACE.sub(lambda m: m.group(1) or " ", cypher).strip()
+    return text.rstrip(";").strip()
+
+
+def is_read_only(cypher: str) -> bool:
+    """粗略判断查询是否只读（字符串字面量中的关键字不计）"""
+    stripped = _STRING_OR_SPACE.sub(lambda m: "''" if m.group(1) else " ", cypher)
+    return not _WRITE_PATTERN.search(stripped)
+
+
+class CypherResultCache:
+    """
+    带图谱版本号的 Cypher 结果缓存（LRU + 可选过期时间）
+
+    Usage:
+        cache = CypherResultCache()
+        version = cache.current_version(fetch_version)
+        key = cache.key(cypher, params, version)
+        rows = cache.get(key)
+    """
+
+    def __init__(
+        self,
+        max_size: Optional[int] = None,
+        max_rows: Optional[int] = None,
+        ttl: Optional[float] = None,
+        version_check_interval: Optional[float] = None
+    ):
+        """
+        Args:
+            max_size: 缓存条目上限（None=读取 CYPHER_CACHE_SIZE，默认 2048）
+            max_rows: 单条结果的行数上限，超过则不缓存（None=读取 CYPHER_CACHE_MAX_ROWS，默认 5000）
+            ttl: 过期时间（秒，None=读取 CYPHER_CACHE_TTL，0 表示不过期）
+            version_check_interval: 重新读取图谱版本号的间隔（秒，None=读取 CYPHER_CACHE_VERSION_CHECK，默认 60）
+        """
+        self.max_size = max_size if max_size is not None else int(os.getenv("CYPHER_CACHE_SIZE", "2048"))
+        self.max_rows = max_rows if max_rows is not None else int(os.getenv("CYPHER_CACHE_MAX_ROWS", "5000"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("CYPHER_CACHE_TTL", "0"))
+        self.version_check_interval = (
+            version_check_interval if version_check_interval is not None
+            else float(os.getenv("CYPHER_CACHE_VERSION_CHECK", "60"))
+        )
+
+        self._cache: "OrderedDict[str, Tuple[List[Dict[str, Any]], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.version: Optional[str] = None
+        self._version_checked_at: Optional[float] = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def current_version(self, fetch_version: Callable[[], Optional[str]]) -> Optional[str]:
+        """
+        返回当前图谱版本号（超过检查间隔时调用 fetch_version 重新读取，版本变化则清空缓存）
+        读取失败时沿用旧版本号
+        """
+        now = time.monotonic()
+        if self._version_checked_at is not None and now - self._version_checked_at < self.version_check_interval:
+            return self.version
+
+        try:
+            version = fetch_version()
+        except Exception as e:
+            print(f"⚠️ 图谱版本读取失败，沿用缓存: {e}")
+            version = self.version
+
+        with self._lock:
+            if self._version_checked_at is not None and version != self.version:
+                self._cache.clear()
+                self.invalidations += 1
+                print(f"🔄 图谱版本变化 ({self.version} -> {version})，Cypher 结果缓存已清空")
+            self.version = version
+            self._version_checked_at = now
+        return version
+
+    @staticmethod
+    def key(cypher: str, params: Optional[Dict[str, Any]], version: Optional[str]) -> str:
+        """缓存键: 规范化 Cypher + 参数 + 图谱版本号"""
+        payload = json.dumps(
+            [normalize_cypher(cypher), params or {}, version],
+            ensure_ascii=False, sort_keys=True, default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and self.ttl and time.time() - entry[1] > self.ttl:
+                del self._cache[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return [dict(row) for row in entry[0]]
+
+    def put(self, key: str, rows: List[Dict[str, Any]]):
+        if len(rows) > self.max_rows:
+            return
+        with self._lock:
+            self._cache[key] = ([dict(row) for row in rows], time.time())
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "graph_version": self.version,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cypher 校验 (Cypher Validator)
+LLM 生成或示例匹配得到的 Cypher 在执行前经过三步检查:
+1. 词法分析: 按 Cypher 词法切分（字符串、反引号标识符、注释、参数分别识别），
+   只把处于关键字位置的 CREATE/SET/DELETE 等视为写操作，
+   属性名、别名、标签、字符串中的同名单词不会误判（如 d.offset、AS setting）
+2. 结果行数上限: 最终 RETURN 没有 LIMIT 时自动追加，字面量 LIMIT 超过上限时收紧
+3. EXPLAIN: 确认执行计划为只读查询，并拒绝任一算子预估行数超过预算的查询（如无约束的笛卡尔积）
+
+校验结果按 规范化 Cypher（查询形状，与参数取值无关）缓存，重复查询不再重复分析和 EXPLAIN
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from neo4j.exceptions import ClientError
+
+from .cypher_cache import normalize_cypher
+
+
+_TOKEN_PATTERN = re.compile(r"""
+    (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:\\.|[^'\\])*'|"(?:\\.|[^"\\])*")
+  | (?P<escaped>`(?:``|[^`])*`)
+  | (?P<param>\$\w+)
+  | (?P<number>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<space>\s+)
+  | (?P<symbol>.)
+""", re.VERBOSE | re.DOTALL)
+
+# 写操作 / 管理命令关键字
+WRITE_KEYWORDS = frozenset({
+    "CREATE", "MERGE", "DELETE", "DETACH", "SET", "REMOVE", "DROP", "FOREACH",
+    "LOAD", "CALL", "ALTER", "GRANT", "DENY", "REVOKE",
+})
+
+# 执行计划中的写算子（EXPLAIN 未返回 query_type 时使用）
+_WRITE_OPERATORS = ("Create", "Merge", "Delete", "Set", "Remove", "Foreach", "LoadCSV")
+
+
+@dataclass
+class CypherToken:
+    kind: str
+    value: str
+    start: int
+    end: int
+
+
+@dataclass
+class CypherValidation:
+    """校验结果"""
+    valid: bool
+    cypher: str                      # 可执行的 Cypher（已追加/收紧 LIMIT）
+    error: str = ""
+    estimated_rows: Optional[float] = None
+    explained: bool = False          # 是否经过 EXPLAIN 检查
+
+
+def tokenize_cypher(cypher: str) -> List[CypherToken]:
+    """切分 Cypher（丢弃空白和注释）"""
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(cypher):
+        kind = match.lastgroup
+        if kind in ("space", "comment"):
+            continue
+        tokens.append(CypherToken(kind, match.group(), match.start(), match.end()))
+    return tokens
+
+
+def _keyword_positions(tokens: List[CypherToken]) -> List[int]:
+    """处于关键字位置的单词下标（排除属性名、标签/关系类型、别名、映射键）"""
+    positions = []
+    for i, token in enumerate(tokens):
+        if token.kind != "word":
+            continue
+        prev = tokens[i - 1] if i > 0 else None
+        nxt = tokens[i + 1] if i + 1 < len(tokens) else None
+        if prev is not None and (prev.value in (".", ":") or prev.value.upper() == "AS"):
+            continue
+        if nxt is not None and nxt.value == ":" and prev is not None and prev.value in ("{", ","):
+            continue
+        positions.append(i)
+    return positions
+
+
+def check_read_only_cypher(cypher: str) -> Tuple[bool, str]:
+    """
+    静态检查 Cypher 是否为单条只读查询（不访问数据库）
+
+    Returns:
+        (是否通过, 错误信息)
+    """
+    tokens = tokenize_cypher(cypher)
+    for token in tokens:
+        if token.kind == "symbol" and token.value in ("'", '"', "`"):
+            return False, "Cypher 中存在未闭合的字符串或标识符"
+
+    for i, token in enumerate(tokens):
+        if token.value == ";" and any(t.value != ";" for t in tokens[i + 1:]):
+            return False, "仅允许单条 Cypher 语句"
+
+    keywords = {tokens[i].value.upper() for i in _keyword_positions(tokens)}
+    forbidden = sorted(keywords & WRITE_KEYWORDS)
+    if forbidden:
+        return False, f"检测到危险操作: {', '.join(forbidden)}（仅允许只读查询）"
+
+    if "MATCH" not in keywords:
+        return False, "Cypher 必须包含 MATCH 子句"
+    if "RETURN" not in keywords:
+        return False, "Cypher 必须包含 RETURN 子句"
+    return True, ""
+
+
+def apply_row_limit(cypher: str, row_limit: int) -> str:
+    """
+    为最终 RETURN 追加 LIMIT；字面量 LIMIT 超过上限时收紧（UNION 查询保持不变）
+    """
+    text = cypher.strip()
+    tokens = tokenize_cypher(text)
+    while tokens and tokens[-1].value == ";":
+        text = text[:tokens[-1].start].rstrip()
+        tokens.pop()
+    if row_limit <= 0:
+        return text
+
+    positions = _keyword_positions(tokens)
+    keywords = [(i, tokens[i].value.upper()) for i in positions]
+    if any(word == "UNION" for _, word in keywords):
+        return text
+
+    returns = [i for i, word in keywords if word == "RETURN"]
+    if not returns:
+        return text
+    limits = [i for i, word in keywords if word == "LIMIT" and i > returns[-1]]
+    if not limits:
+        return f"{text}\nLIMIT {row_limit}"
+
+    value = tokens[limits[-1] + 1] if limits[-1] + 1 < len(tokens) else None
+    if value is not None and value.kind == "number" and float(value.value) > row_limit:
+        return text[:value.start] + str(row_limit) + text[value.end:]
+    return text
+
+
+def _plan_operators(plan) -> List[Dict[str, Any]]:
+    """展开执行计划树（neo4j 驱动返回 dict，参数在 "args" 中；部分版本为带 arguments 属性的对象）"""
+    if plan is None:
+        return []
+    if not isinstance(plan, dict):
+        plan = {
+            "operatorType": getattr(plan, "operator_type", ""),
+            "args": getattr(plan, "arguments", {}),
+            "children": getattr(plan, "children", []),
+        }
+    operators = [plan]
+    for child in plan.get("children") or []:
+        operators.extend(_plan_operators(child))
+    return operators
+
+
+class CypherValidator:
+    """
+    Cypher 校验器（词法检查 + LIMIT 注入 + EXPLAIN 计划检查 + 查询形状缓存）
+
+    Usage:
+        validator = CypherValidator()
+        result = validator.validate(cypher, explain=graph_client.explain)
+        if result.valid:
+            graph_client.query(result.cypher, params)
+    """
+
+    def __init__(
+        self,
+        row_limit: Optional[int] = None,
+        max_estimated_rows: Optional[float] = None,
+        use_explain: Optional[bool] = None,
+        cache_size: Optional[int] = None
+    ):
+        """
+        Args:
+            row_limit: 结果行数上限（None=读取 CYPHER_ROW_LIMIT，默认 500，0 表示不限制）
+            max_estimated_rows: 执行计划任一算子的预估行数上限（None=读取 CYPHER_MAX_ESTIMATED_ROWS，默认 100000）
+            use_explain: 是否执行 EXPLAIN 检查（None=读取 CYPHER_EXPLAIN_ENABLED，默认启用）
+            cache_size: 校验结果缓存条目上限（None=读取 CYPHER_VALIDATION_CACHE_SIZE，默认 1024）
+        """
+        self.row_limit = row_limit if row_limit is not None else int(os.getenv("CYPHER_ROW_LIMIT", "500"))
+        self.max_estimated_rows = (
+            max_estimated_rows if max_estimated_rows is not None
+            else float(os.getenv("CYPHER_MAX_ESTIMATED_ROWS", "100000"))
+        )
+        if use_explain is None:
+            use_explain = os.getenv("CYPHER_EXPLAIN_ENABLED", "true").lower() == "true"
+        self.use_explain = use_explain
+        self.cache_size = cache_size if cache_size is not None else int(os.getenv("CYPHER_VALIDATION_CACHE_SIZE", "1024"))
+
+        self._cache: "OrderedDict[str, CypherValidation]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def validate(
+        self,
+        cypher: str,
+        params: Optional[Dict[str, Any]] = None,
+        explain: Optional[Callable[[str, Optional[Dict[str, Any]]], Any]] = None
+    ) -> CypherValidation:
+        """
+        校验 Cypher
+
+        Args:
+            cypher: Cypher 语句
+            params: 查询参数（仅用于 EXPLAIN，不影响缓存键）
+            explain: (cypher, params) -> ResultSummary，None 时只做静态检查
+        """
+        explain = explain if self.use_explain else None
+        key = normalize_cypher(cypher or "")
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and (cached.explained or not cached.valid or explain is None):
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        result = self._validate(cypher or "", params, explain)
+
+        with self._lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def _validate(self, cypher: str, params, explain) -> CypherValidation:
+        is_safe, error = check_read_only_cypher(cypher)
+        if not is_safe:
+            return CypherValidation(False, cypher, error)
+
+        limited = apply_row_limit(cypher, self.row_limit)
+        if explain is None:
+            return CypherValidation(True, limited)
+
+        try:
+            summary = explain(limited, params)
+        except ClientError as e:
+            return CypherValidation(False, limited, f"EXPLAIN 失败: {e.message or e}", explained=True)
+        except Exception as e:
+            # 连接问题等非查询本身的错误：保留静态检查结果，下次再尝试 EXPLAIN
+            print(f"⚠️ EXPLAIN 检查跳过: {e}")
+            return CypherValidation(True, limited)
+
+        operators = _plan_operators(getattr(summary, "plan", None))
+        query_type = getattr(summary, "query_type", None)
+        if query_type is not None and query_type != "r":
+            return CypherValidation(False, limited, f"执行计划不是只读查询 (query_type={query_type})", explained=True)
+        for operator in operators:
+            name = str(operator.get("operatorType", "")).split("@")[0]
+            if name.startswith(_WRITE_OPERATORS):
+                return CypherValidation(False, limited, f"执行计划包含写操作: {name}", explained=True)
+
+        estimates = [
+            (float((operator.get("args") or operator.get("arguments") or {}).get("EstimatedRows", 0) or 0),
+             str(operator.get("operatorType", "")).split("@")[0])
+            for operator in operators
+        ]
+        estimated_rows, operator_name = max(estimates, default=(0.0, ""))
+        if self.max_estimated_rows and estimated_rows > self.max_estimated_rows:
+            return CypherValidation(
+                False, limited,
+                f"预估行数过大: {operator_name} 约 {estimated_rows:.0f} 行（上限 {self.max_estimated_rows:.0f}）",
+                estimated_rows=estimated_rows, explained=True
+            )
+        return CypherValidation(True, limited, estimated_rows=estimated_rows, explained=True)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
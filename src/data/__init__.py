@@ -1,8 +1,9 @@
 # 数据处理模块
 """
-数据处理模块 - 指南解析、药品解析、实体抽取
+数据处理模块 - 指南解析、药品解析、实体抽取、流式处理流水线
 """
 
 from .guideline_parser import *
 from .drug_parser import *
 from .entity_extractor import *
+from .pipeline import *
@@ -13,10 +13,14 @@ Markdown解析器 - 将data.md解析为结构化JSON
 import re
 import json
 from dataclasses import dataclass, asdict, field
-from typing import Optional, List
+from typing import Iterator, Optional, List
 from pathlib import Path
 
 
+# 药品条目标题: ### 第 X 个：药品名
+DRUG_HEADER_PATTERN = re.compile(r'###\s*第\s*\d+\s*个[：:]')
+
+
 @dataclass
 class Drug:
     """药品数据结构"""
@@ -76,11 +80,8 @@ def split_into_drugs(content: str) -> List[str]:
     将整个文件按药品条目分割
     匹配: ### 第 X 个：药品名
     """
-    # 分割标记
-    pattern = r'###\s*第\s*\d+\s*个[：:]'
-    
     # 找到所有分割点
-    splits = list(re.finditer(pattern, content))
+    splits = list(DRUG_HEADER_PATTERN.finditer(content))
     
     drug_texts = []
     for i, match in enumerate(splits):
@@ -92,6 +93,27 @@ def split_into_drugs(content: str) -> List[str]:
     return drug_texts
 
 
+def iter_drug_texts(filepath: str) -> Iterator[str]:
+    """
+    逐行读取文件，惰性产出药品条目文本（内存占用与文件大小无关）
+    与 split_into_drugs 结果一致（条目标题需在同一行内）
+    """
+    current: Optional[List[str]] = None
+    with open(filepath, 'r', encoding='utf-8') as f:
+        for line in f:
+            start = 0
+            for match in DRUG_HEADER_PATTERN.finditer(line):
+                if current is not None:
+                    current.append(line[start:match.start()])
+                    yield "".join(current)
+                current = []
+                start = match.start()
+            if current is not None:
+                current.append(line[start:])
+    if current is not None:
+        yield "".join(current)
+
+
 def parse_drug_entry(text: str, index: int) -> Drug:
     """
     解析单个药品条目
@@ -162,25 +184,17 @@ def parse_all_drugs(filepath: str) -> List[Drug]:
         Drug对象列表
     """
     print(f"📖 正在读取文件: {filepath}")
+    print(f"📄 文件大小: {Path(filepath).stat().st_size} 字节")
     
-    with open(filepath, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    print(f"📄 文件大小: {len(content)} 字符")
-    
-    # 分割药品条目
-    drug_texts = split_into_drugs(content)
-    print(f"✂️  找到 {len(drug_texts)} 个药品条目")
-    
-    # 解析每个药品
+    # 逐条读取并解析（大文件请使用 src/data/pipeline.py 的并行流式处理）
     drugs = []
-    for i, text in enumerate(drug_texts):
+    for i, text in enumerate(iter_drug_texts(filepath)):
         try:
             drug = parse_drug_entry(text, i)
             drugs.append(drug)
-            print(f"✅ [{i+1}/{len(drug_texts)}] {drug.name}")
+            print(f"✅ [{i+1}] {drug.name}")
         except Exception as e:
-            print(f"❌ [{i+1}/{len(drug_texts)}] 解析失败: {e}")
+            print(f"❌ [{i+1}] 解析失败: {e}")
             continue
     
     print(f"\n🎉 成功解析 {len(drugs)} 个药品!")
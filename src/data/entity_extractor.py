@@ -9,13 +9,82 @@
 3. 提取Metric约束(eGFR < 30等)
 4. 构建关系数据
 5. 输出为Neo4j友好的JSON格式
+
+分类规则和疾病模式在初始化时编译: 字面量（及 前缀(甲|乙)后缀 形式的模式展开后）
+合并为一个 Aho-Corasick 自动机，其余模式预编译为正则；
+每段文本只扫描一遍即可得到全部实体命中及其位置，匹配语义与逐条 re.finditer 一致
 """
 
 import re
 import json
-from typing import List, Dict, Set, Tuple
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Set, Tuple
 from collections import defaultdict
 
+if __package__:
+    from ..keyword_automaton import KeywordAutomaton
+else:  # 直接作为脚本运行: python src/data/entity_extractor.py
+    import sys
+    from pathlib import Path
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+    from src.keyword_automaton import KeywordAutomaton
+
+
+# 正则元字符（不含这些字符的模式按字面量匹配）
+_REGEX_META = re.compile(r'[.^$*+?{}\[\]\\|()]')
+# 前缀(甲|乙|丙)后缀
+_ALTERNATION = re.compile(r'^([^()]*)\(([^()]*)\)([^()]*)$')
+
+# Metric约束: 各模式起始词互不相同，合并为一个正则一次扫描
+_METRIC_PATTERN = re.compile(
+    r'(?P<egfr>eGFR\s*(?P<egfr_op>[<>≥≤＜＞])\s*(?P<egfr_value>\d+)\s*(mL/min)?)'
+    r'|(?P<egfr_range>eGFR\s*(?P<egfr_min>\d+)-(?P<egfr_max>\d+))'
+    r'|(?P<crcl>(CrCl|肌酐清除率)\s*(?P<crcl_op>[<>≥≤＜＞])\s*(?P<crcl_value>\d+))'
+    r'|(?P<liver>(?P<liver_metric>ALT|AST|转氨酶)\s*>\s*(?P<liver_value>\d+)\s*倍)'
+)
+# 输出顺序与原先逐个模式扫描一致
+_METRIC_KINDS = ('egfr', 'egfr_range', 'crcl', 'liver')
+
+_MAX_DOSE_PATTERN = re.compile(r'最大剂量[为：:]*\s*(\d+[.\d]*)\s*(mg|g|μg|单位)')
+_START_DOSE_PATTERN = re.compile(r'起始剂量[为：:]*\s*(\d+[.\d]*)\s*(mg|g|μg)')
+_TIMING_PATTERNS = [
+    re.compile(r'(餐前|餐后|随餐|空腹|睡前|晨起)'),
+    re.compile(r'(早[餐晨午]|晚[餐饭]|中午)\s*(前|后|时)'),
+]
+
+
+@dataclass
+class EntityHit:
+    """实体命中"""
+    start: int
+    end: int
+    text: str       # 原文片段 text[start:end]
+    kind: str       # 'category' 或 'disease'
+    label: str      # 分类名 / 疾病模式
+    rule: int       # 规则序号（分类序号 / 疾病模式序号，越小优先级越高）
+
+
+def expand_literal_pattern(pattern: str) -> Optional[List[str]]:
+    """纯字面量或 前缀(甲|乙)后缀 形式的模式展开为字面量列表（按分支顺序），其他模式返回 None"""
+    if not _REGEX_META.search(pattern):
+        return [pattern]
+    match = _ALTERNATION.match(pattern)
+    if match is None or _REGEX_META.search(match.group(1) + match.group(3)):
+        return None
+    options = match.group(2).split('|')
+    if not all(option and not _REGEX_META.search(option) for option in options):
+        return None
+    return [match.group(1) + option + match.group(3) for option in options]
+
+
+def _fold(text: str) -> str:
+    """大小写折叠（保持长度不变，位置可直接映射回原文）"""
+    folded = text.casefold()
+    if len(folded) == len(text):
+        return folded
+    # 含折叠后变长的字符（如 ß）时逐字符处理，这些字符保持原样
+    return ''.join(ch if len(ch.casefold()) != 1 else ch.casefold() for ch in text)
+
 
 class EntityExtractor:
     """实体和关系提取器"""
@@ -102,15 +171,70 @@ class EntityExtractor:
                 r'甘油三酯\s*>\s*(\d+)\s*mg/dL',
             ],
         }
+        
+        self.compile_patterns()
+    
+    def compile_patterns(self):
+        """编译分类规则和疾病模式（修改 category_rules / disease_patterns 后需重新调用）"""
+        self._categories = list(self.category_rules)
+        self._automaton = KeywordAutomaton()
+        self._regexes: List[Tuple[str, int, str, "re.Pattern"]] = []
+        
+        rules = [('category', i, name, pattern)
+                 for i, (name, patterns) in enumerate(self.category_rules.items())
+                 for pattern in patterns]
+        rules += [('disease', i, pattern, pattern) for i, pattern in enumerate(self.disease_patterns)]
+        
+        for order, (kind, rule, label, pattern) in enumerate(rules):
+            literals = expand_literal_pattern(pattern)
+            if literals is None:
+                self._regexes.append((kind, rule, label, re.compile(pattern, re.IGNORECASE)))
+                continue
+            for branch, literal in enumerate(literals):
+                key = _fold(literal)
+                targets = self._automaton.get(key)
+                if targets is None:
+                    targets = []
+                    self._automaton.add(key, targets)
+                # (模式序号, 分支序号) 用于还原 re.finditer 的不重叠与分支优先级
+                targets.append((kind, rule, label, order, branch))
+        self._automaton.build()
+    
+    def scan(self, text: str, kinds: Tuple[str, ...] = ('category', 'disease')) -> List[EntityHit]:
+        """
+        扫描文本，返回全部实体命中（按位置排序）
+        
+        同一模式的命中互不重叠（与 re.finditer 一致），不同模式之间可以重叠
+        """
+        by_pattern = defaultdict(list)
+        for start, end, _, targets in self._automaton.iter(_fold(text)):
+            for kind, rule, label, order, branch in targets:
+                if kind in kinds:
+                    by_pattern[(kind, rule, label, order)].append((start, branch, end))
+        
+        hits = []
+        for (kind, rule, label, _), matches in by_pattern.items():
+            last_end = 0
+            for start, _, end in sorted(matches):
+                if start >= last_end:
+                    hits.append(EntityHit(start, end, text[start:end], kind, label, rule))
+                    last_end = end
+        
+        for kind, rule, label, regex in self._regexes:
+            if kind in kinds:
+                hits.extend(EntityHit(m.start(), m.end(), m.group(0), kind, label, rule)
+                            for m in regex.finditer(text))
+        
+        hits.sort(key=lambda h: (h.start, h.end))
+        return hits
     
     def infer_category(self, drug: Dict) -> str:
         """推断药物分类"""
         text = f"{drug['name']} {drug.get('ingredients', '')} {drug.get('pharmacology', '')}"
         
-        for category, patterns in self.category_rules.items():
-            for pattern in patterns:
-                if re.search(pattern, text, re.IGNORECASE):
-                    return category
+        hits = self.scan(text, kinds=('category',))
+        if hits:
+            return self._categories[min(hit.rule for hit in hits)]
         
         return '未分类'
     
@@ -128,19 +252,19 @@ class EntityExtractor:
         diseases = []
         seen = set()
         
-        for pattern in self.disease_patterns:
-            for match in re.finditer(pattern, text, re.IGNORECASE):
-                disease_name = match.group(0)
-                # 规范化名称
-                disease_name = disease_name.replace(' ', '')
-                
-                if disease_name not in seen:
-                    diseases.append({
-                        'name': disease_name,
-                        'type': source_type,
-                        'context': text[max(0, match.start()-20):match.end()+20]
-                    })
-                    seen.add(disease_name)
+        # 按 模式顺序 + 出现位置 去重，与逐个模式扫描的结果一致
+        hits = sorted(self.scan(text, kinds=('disease',)), key=lambda h: (h.rule, h.start))
+        for hit in hits:
+            # 规范化名称
+            disease_name = hit.text.replace(' ', '')
+            
+            if disease_name not in seen:
+                diseases.append({
+                    'name': disease_name,
+                    'type': source_type,
+                    'context': text[max(0, hit.start-20):hit.end+20]
+                })
+                seen.add(disease_name)
         
         return diseases
     
@@ -151,60 +275,59 @@ class EntityExtractor:
         Returns:
             约束列表,每个包含: metric, operator, value, unit等
         """
-        constraints = []
-        
-        # eGFR提取
-        # 1. 简单比较: eGFR < 30
-        for match in re.finditer(r'eGFR\s*([<>≥≤＜＞])\s*(\d+)\s*(mL/min)?', text):
-            operator = match.group(1).replace('＜', '<').replace('＞', '>')
-            value = float(match.group(2))
-            
-            constraints.append({
-                'metric': 'eGFR',
-                'operator': operator,
-                'value': value,
-                'unit': 'mL/min',
-                'severity': 'CRITICAL' if operator in ['<', '≤'] and value == 30 else 'WARNING',
-                'context': match.group(0)
-            })
+        found = {kind: [] for kind in _METRIC_KINDS}
         
-        # 2. 范围: eGFR 30-45
-        for match in re.finditer(r'eGFR\s*(\d+)-(\d+)', text):
-            constraints.append({
-                'metric': 'eGFR',
-                'operator': 'BETWEEN',
-                'value_min': float(match.group(1)),
-                'value_max': float(match.group(2)),
-                'unit': 'mL/min',
-                'severity': 'WARNING',
-                'context': match.group(0)
-            })
+        for match in _METRIC_PATTERN.finditer(text):
+            # 1. 简单比较: eGFR < 30
+            if match.group('egfr'):
+                operator = match.group('egfr_op').replace('＜', '<').replace('＞', '>')
+                value = float(match.group('egfr_value'))
+                found['egfr'].append({
+                    'metric': 'eGFR',
+                    'operator': operator,
+                    'value': value,
+                    'unit': 'mL/min',
+                    'severity': 'CRITICAL' if operator in ['<', '≤'] and value == 30 else 'WARNING',
+                    'context': match.group(0)
+                })
+            # 2. 范围: eGFR 30-45
+            elif match.group('egfr_range'):
+                found['egfr_range'].append({
+                    'metric': 'eGFR',
+                    'operator': 'BETWEEN',
+                    'value_min': float(match.group('egfr_min')),
+                    'value_max': float(match.group('egfr_max')),
+                    'unit': 'mL/min',
+                    'severity': 'WARNING',
+                    'context': match.group(0)
+                })
+            # CrCl提取
+            elif match.group('crcl'):
+                operator = match.group('crcl_op').replace('＜', '<').replace('＞', '>')
+                value = float(match.group('crcl_value'))
+                found['crcl'].append({
+                    'metric': 'CrCl',
+                    'operator': operator,
+                    'value': value,
+                    'unit': 'mL/min',
+                    'severity': 'CRITICAL' if operator == '<' and value <= 30 else 'WARNING',
+                    'context': match.group(0)
+                })
+            # ALT/AST提取
+            else:
+                name = match.group('liver_metric')
+                found['liver'].append({
+                    'metric': 'ALT' if 'ALT' in name else 'AST' if 'AST' in name else '转氨酶',
+                    'operator': '>',
+                    'value': float(match.group('liver_value')),
+                    'unit': '倍正常值',
+                    'severity': 'WARNING',
+                    'context': match.group(0)
+                })
         
-        # CrCl提取
-        for match in re.finditer(r'(CrCl|肌酐清除率)\s*([<>≥≤＜＞])\s*(\d+)', text):
-            operator = match.group(2).replace('＜', '<').replace('＞', '>')
-            value = float(match.group(3))
-            
-            constraints.append({
-                'metric': 'CrCl',
-                'operator': operator,
-                'value': value,
-                'unit': 'mL/min',
-                'severity': 'CRITICAL' if operator == '<' and value <= 30 else 'WARNING',
-                'context': match.group(0)
-            })
-        
-        # ALT/AST提取
-        for match in re.finditer(r'(ALT|AST|转氨酶)\s*>\s*(\d+)\s*倍', text):
-            metric_name = 'ALT' if 'ALT' in match.group(1) else 'AST' if 'AST' in match.group(1) else '转氨酶'
-            constraints.append({
-                'metric': metric_name,
-                'operator': '>',
-                'value': float(match.group(2)),
-                'unit': '倍正常值',
-                'severity': 'WARNING',
-                'context': match.group(0)
-            })
+        constraints = []
+        for kind in _METRIC_KINDS:
+            constraints.extend(found[kind])
         
         return constraints
     
@@ -213,22 +336,18 @@ class EntityExtractor:
         dosage_info = {}
         
         # 最大剂量
-        max_dose_match = re.search(r'最大剂量[为：:]*\s*(\d+[.\d]*)\s*(mg|g|μg|单位)', text)
+        max_dose_match = _MAX_DOSE_PATTERN.search(text)
         if max_dose_match:
             dosage_info['max_daily_dose'] = f"{max_dose_match.group(1)}{max_dose_match.group(2)}"
         
         # 起始剂量
-        start_dose_match = re.search(r'起始剂量[为：:]*\s*(\d+[.\d]*)\s*(mg|g|μg)', text)
+        start_dose_match = _START_DOSE_PATTERN.search(text)
         if start_dose_match:
             dosage_info['starting_dose'] = f"{start_dose_match.group(1)}{start_dose_match.group(2)}"
         
         # 服药时间
-        timing_patterns = [
-            r'(餐前|餐后|随餐|空腹|睡前|晨起)',
-            r'(早[餐晨午]|晚[餐饭]|中午)\s*(前|后|时)',
-        ]
-        for pattern in timing_patterns:
-            timing_match = re.search(pattern, text)
+        for pattern in _TIMING_PATTERNS:
+            timing_match = pattern.search(text)
             if timing_match:
                 dosage_info['timing'] = timing_match.group(0)
                 break
@@ -1,11 +1,38 @@
+"""
+指南 PDF 解析 - 按字体大小识别标题切片，表格转为 Markdown 追加到所在页
+
+并行解析（parse_pdf_parallel）:
+1. 页码按 pages_per_task 切分为若干区间，提交到进程池
+2. 每个子进程打开一次 PDF，同时提取该区间的文本块（文本 + 字号）和表格（按页索引）
+3. 全部字号汇总后计算标题阈值，按页码顺序合并切片，标题在区间边界处保持连续
+
+结果与 extract_tables_to_markdown + parse_pdf_with_headers 一致
+
+增量入库（vectorize_and_store）:
+切片 ID 为内容哈希，集合中已有的切片不再向量化，只更新变化的元数据并批量删除过期切片；
+向量化按文本长度分批（失败时自动减半重试），每批结果写入检查点文件，中断后重跑可继续
+
+近似重复去重（dedup_chunks）:
+重复的表格、页眉页脚会落入多个切片，入库前用 MinHash + LSH 聚类，
+每簇只保留一个切片，其余切片的页码记入元数据 pages，簇 ID 记入 cluster_id 供检索时去重
+"""
+
 import fitz  # PyMuPDF
 import pdfplumber
-import chromadb
-from chromadb.config import Settings
-from FlagEmbedding import BGEM3FlagModel
 import os
 import re
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+if __package__:
+    from ..near_dedup import cluster_near_duplicates
+else:  # 直接作为脚本运行: python src/data/guideline_parser.py
+    import sys
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+    from src.near_dedup import cluster_near_duplicates
 
 # 项目根目录
 PROJECT_ROOT = Path(__file__).parent.parent.parent
@@ -14,104 +41,147 @@ PROJECT_ROOT = Path(__file__).parent.parent.parent
 PDF_PATH = PROJECT_ROOT / "data" / "raw" / "中国糖尿病防治指南（2024版）.pdf"
 CHROMA_PATH = str(PROJECT_ROOT / "chroma_db")
 COLLECTION_NAME = "diabetes_guidelines_2024"
+EMBEDDING_MODEL = "BAAI/bge-m3"
+
+def table_to_markdown(table) -> str:
+    """pdfplumber 表格 -> Markdown"""
+    # 简单的Markdown转换
+    header = table[0]
+    rows = table[1:]
+    
+    # 清理None值
+    header = [str(h).replace('\n', ' ') if h else '' for h in header]
+    
+    md = f"| {' | '.join(header)} |\n"
+    md += f"| {' | '.join(['---'] * len(header))} |\n"
+    
+    for row in rows:
+        clean_row = [str(c).replace('\n', ' ') if c else '' for c in row]
+        md += f"| {' | '.join(clean_row)} |\n"
+    return md
+
+
+def extract_page_tables(page) -> Dict[int, str]:
+    """提取单页表格: {表格索引: markdown}（内容相同的表格只保留一份）"""
+    tables_md = {}
+    tables = page.extract_tables()
+    for table in tables:
+        if not table: continue
+        tables_md[tables.index(table)] = table_to_markdown(table)
+    return tables_md
+
 
 def extract_tables_to_markdown(pdf_path):
     """使用pdfplumber提取表格并转换为Markdown格式"""
     tables_md = {}
     with pdfplumber.open(pdf_path) as pdf:
         for i, page in enumerate(pdf.pages):
-            tables = page.extract_tables()
-            for table in tables:
-                if not table: continue
-                # 简单的Markdown转换
-                header = table[0]
-                rows = table[1:]
-                
-                # 清理None值
-                header = [str(h).replace('\n', ' ') if h else '' for h in header]
-                
-                md = f"| {' | '.join(header)} |\n"
-                md += f"| {' | '.join(['---'] * len(header))} |\n"
-                
-                for row in rows:
-                    clean_row = [str(c).replace('\n', ' ') if c else '' for c in row]
-                    md += f"| {' | '.join(clean_row)} |\n"
-                
+            for index, md in extract_page_tables(page).items():
                 # 存储: {页码_索引: markdown}
-                key = f"{i}_{tables.index(table)}"
-                tables_md[key] = md
+                tables_md[f"{i}_{index}"] = md
     return tables_md
 
-def parse_pdf_with_headers(pdf_path, tables_dict):
-    """解析PDF，基于字体大小识别标题进行切片"""
-    doc = fitz.open(pdf_path)
-    chunks = []
-    
-    current_header = "前言/未分类"
-    current_text = ""
+
+def tables_by_page(tables_dict: Dict[str, str]) -> Dict[int, List[str]]:
+    """{页码_索引: markdown} -> {页码: [markdown, ...]}（保持原顺序）"""
+    pages = {}
+    for key, md in tables_dict.items():
+        page_num = int(key.split('_', 1)[0])
+        pages.setdefault(page_num, []).append(md)
+    return pages
+
+
+def extract_page_blocks(page) -> Tuple[List[List[Tuple[str, float]]], List[float]]:
+    """
+    提取单页文本块
     
-    # 字体大小统计，用于识别标题
+    Returns:
+        (文本块列表 [[(去除首尾空白的文本, 字号), ...], ...]，本页全部 span 的字号)
+    """
+    blocks = []
     font_sizes = []
-    for page in doc:
-        blocks = page.get_text("dict")["blocks"]
-        for b in blocks:
-            if "lines" in b:
-                for l in b["lines"]:
-                    for s in l["spans"]:
-                        font_sizes.append(s["size"])
-    
-    # 假设标题是大字体（取前10%大的字体作为标题候选）
-    font_sizes.sort(reverse=True)
+    for b in page.get_text("dict")["blocks"]:
+        if "lines" not in b:
+            continue
+        spans = []
+        for l in b["lines"]:
+            for s in l["spans"]:
+                font_sizes.append(s["size"])
+                text = s["text"].strip()
+                if text:
+                    spans.append((text, s["size"]))
+        blocks.append(spans)
+    return blocks, font_sizes
+
+
+def extract_page_range(pdf_path, start: int, end: int) -> List[Dict]:
+    """
+    提取 [start, end) 页的文本块和表格（进程池任务，PDF 在子进程中各打开一次）
+    
+    Returns:
+        [{"page": 页码, "blocks": 文本块, "font_sizes": 字号, "tables": [markdown, ...]}, ...]
+    """
+    pages = []
+    with fitz.open(pdf_path) as doc, pdfplumber.open(pdf_path) as pdf:
+        for page_num in range(start, min(end, len(doc))):
+            blocks, font_sizes = extract_page_blocks(doc[page_num])
+            tables = list(extract_page_tables(pdf.pages[page_num]).values()) \
+                if page_num < len(pdf.pages) else []
+            pages.append({
+                "page": page_num,
+                "blocks": blocks,
+                "font_sizes": font_sizes,
+                "tables": tables,
+            })
+    return pages
+
+
+def compute_header_threshold(font_sizes: List[float]) -> float:
+    """假设标题是大字体（取前5%大的字体作为标题候选）"""
+    font_sizes = sorted(font_sizes, reverse=True)
     if font_sizes:
-        header_threshold = font_sizes[int(len(font_sizes) * 0.05)]
-    else:
-        header_threshold = 12
+        return font_sizes[int(len(font_sizes) * 0.05)]
+    return 12
 
-    print(f"标题字体阈值: {header_threshold}")
 
-    for page_num, page in enumerate(doc):
-        # 1. 提取文本块
-        blocks = page.get_text("dict")["blocks"]
-        
-        # 2. 检查是否有表格
-        # (简单起见，我们将表格追加到该页的文本末尾，或者尝试插入)
-        # 这里简化处理：如果在该页有表格，就追加到该页的chunk中
+def build_chunks(pages: List[Dict], header_threshold: float) -> List[Dict]:
+    """按页码顺序合并文本块和表格，大字号短文本作为标题切分"""
+    chunks = []
+    
+    current_header = "前言/未分类"
+    current_text = ""
+    page_num = 0
+    
+    for page in pages:
+        page_num = page["page"]
         
-        for b in blocks:
-            if "lines" in b:
-                block_text = ""
-                is_header = False
-                
-                for l in b["lines"]:
-                    for s in l["spans"]:
-                        text = s["text"].strip()
-                        if not text: continue
-                        
-                        # 检查是否为标题
-                        if s["size"] >= header_threshold and len(text) < 50:
-                            is_header = True
-                            # 保存上一个chunk
-                            if current_text:
-                                chunks.append({
-                                    "header": current_header,
-                                    "text": current_text,
-                                    "page": page_num
-                                })
-                            current_header = text
-                            current_text = "" # 重置文本
-                        
-                        block_text += text + " "
+        for spans in page["blocks"]:
+            block_text = ""
+            is_header = False
+            
+            for text, size in spans:
+                # 检查是否为标题
+                if size >= header_threshold and len(text) < 50:
+                    is_header = True
+                    # 保存上一个chunk
+                    if current_text:
+                        chunks.append({
+                            "header": current_header,
+                            "text": current_text,
+                            "page": page_num
+                        })
+                    current_header = text
+                    current_text = "" # 重置文本
                 
-                if not is_header:
-                    current_text += block_text + "\n"
+                block_text += text + " "
+            
+            if not is_header:
+                current_text += block_text + "\n"
         
-        # 检查该页是否有表格
-        # pdfplumber的页码从0开始，与fitz一致
-        # 我们查找以该页开头的表格key
-        for key, md in tables_dict.items():
-            if key.startswith(f"{page_num}_"):
-                current_text += f"\n\n【表格】\n{md}\n\n"
-
+        # 该页的表格追加到当前chunk
+        for md in page["tables"]:
+            current_text += f"\n\n【表格】\n{md}\n\n"
+    
     # 添加最后一个chunk
     if current_text:
         chunks.append({
@@ -119,50 +189,315 @@ def parse_pdf_with_headers(pdf_path, tables_dict):
             "text": current_text,
             "page": page_num
         })
-        
+    
     return chunks
 
-def vectorize_and_store(chunks):
-    """向量化并存入ChromaDB"""
-    print("正在加载BGE-M3模型...")
-    model = BGEM3FlagModel('BAAI/bge-m3', use_fp16=True) 
+def parse_pdf_with_headers(pdf_path, tables_dict):
+    """解析PDF，基于字体大小识别标题进行切片（单进程，表格由 extract_tables_to_markdown 提供）"""
+    page_tables = tables_by_page(tables_dict)
+    pages = []
+    with fitz.open(pdf_path) as doc:
+        for page_num, page in enumerate(doc):
+            blocks, font_sizes = extract_page_blocks(page)
+            pages.append({
+                "page": page_num,
+                "blocks": blocks,
+                "font_sizes": font_sizes,
+                "tables": page_tables.get(page_num, []),
+            })
+    
+    header_threshold = compute_header_threshold([size for page in pages for size in page["font_sizes"]])
+    print(f"标题字体阈值: {header_threshold}")
+    return build_chunks(pages, header_threshold)
+
+
+def parse_pdf_parallel(pdf_path, workers: Optional[int] = None, pages_per_task: Optional[int] = None):
+    """
+    按页区间并行解析PDF（文本块和表格在同一子进程中提取）
+    
+    Args:
+        pdf_path: PDF 路径
+        workers: 进程数（None=读取 DATA_PIPELINE_WORKERS，默认 CPU 核数；<=1 时在当前进程中执行）
+        pages_per_task: 每个任务的页数（None=读取 GUIDELINE_PAGES_PER_TASK，默认 16）
+    
+    Returns:
+        (切片列表, 表格数)
+    """
+    workers = workers if workers is not None else int(os.getenv("DATA_PIPELINE_WORKERS", "0")) or (os.cpu_count() or 1)
+    pages_per_task = max(pages_per_task or int(os.getenv("GUIDELINE_PAGES_PER_TASK", "16")), 1)
+    
+    with fitz.open(pdf_path) as doc:
+        page_count = len(doc)
+    ranges = [(start, start + pages_per_task) for start in range(0, page_count, pages_per_task)]
+    
+    if workers <= 1 or len(ranges) <= 1:
+        results = [extract_page_range(pdf_path, start, end) for start, end in ranges]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as pool:
+            results = list(pool.map(extract_page_range, [pdf_path] * len(ranges),
+                                    *zip(*ranges)))
+    pages = [page for result in results for page in result]
+    
+    header_threshold = compute_header_threshold([size for page in pages for size in page["font_sizes"]])
+    print(f"标题字体阈值: {header_threshold}")
+    return build_chunks(pages, header_threshold), sum(len(page["tables"]) for page in pages)
+
+
+def chunk_document(chunk: Dict) -> str:
+    """入库的文档文本"""
+    return f"【章节】{chunk['header']}\n{chunk['text']}"
+
+
+def chunk_id(document: str) -> str:
+    """内容哈希 ID（文本不变则 ID 不变，无需重新向量化）"""
+    return "chunk_" + hashlib.sha256(document.encode("utf-8")).hexdigest()[:16]
+
+
+def chunk_metadata(chunk: Dict) -> Dict:
+    """入库的元数据（近似重复簇的切片附带 cluster_id 和 pages）"""
+    metadata = {"header": chunk['header'], "page": chunk['page']}
+    for key in ("cluster_id", "pages"):
+        if key in chunk:
+            metadata[key] = chunk[key]
+    return metadata
+
+
+def metadata_update(metadata: Dict, existing: Dict) -> Dict:
+    """collection.update 的元数据（Chroma 按键合并，新元数据中没有的旧键需显式置为 None 才会被删除）"""
+    update = dict(metadata)
+    for key in existing or {}:
+        update.setdefault(key, None)
+    return update
+
+
+def dedup_chunks(chunks: List[Dict], threshold: Optional[float] = None, drop: Optional[bool] = None) -> List[Dict]:
+    """
+    近似重复切片去重
+    
+    Args:
+        chunks: 切片列表
+        threshold: MinHash 估计的 Jaccard 相似度阈值（None=读取 GUIDELINE_DEDUP_THRESHOLD，默认 0.8）
+        drop: 是否只保留每簇的代表切片（None=读取 GUIDELINE_DEDUP_DROP，默认 true）；
+              False 时保留全部切片，仅标记 cluster_id，由检索时去重
+    
+    Returns:
+        切片列表（保持原顺序）。多成员簇的切片带 cluster_id（"cluster_" + 代表切片内容哈希），
+        代表切片带 pages（簇内全部页码，逗号分隔）；代表切片为簇内文本最长者
+    """
+    threshold = threshold if threshold is not None else float(os.getenv("GUIDELINE_DEDUP_THRESHOLD", "0.8"))
+    if drop is None:
+        drop = os.getenv("GUIDELINE_DEDUP_DROP", "true").lower() == "true"
+    
+    labels = cluster_near_duplicates([chunk['text'] for chunk in chunks], threshold)
+    clusters: Dict[int, List[int]] = {}
+    for i, label in enumerate(labels):
+        clusters.setdefault(label, []).append(i)
+    
+    result = []
+    for i, chunk in enumerate(chunks):
+        members = clusters[labels[i]]
+        if len(members) == 1:
+            result.append(chunk)
+            continue
+        canonical = max(members, key=lambda m: (len(chunks[m]['text']), -m))
+        if drop and i != canonical:
+            continue
+        tagged = dict(chunk)
+        tagged["cluster_id"] = "cluster_" + chunk_id(chunk_document(chunks[canonical]))[len("chunk_"):]
+        if i == canonical:
+            tagged["pages"] = ",".join(str(p) for p in sorted({chunks[m]['page'] for m in members}))
+        result.append(tagged)
+    return result
+
+
+def plan_chunk_sync(chunks: List[Dict], existing: Dict[str, Dict]) -> Dict[str, object]:
+    """
+    对比新切片与集合中已有切片
+    
+    Args:
+        chunks: parse_pdf_* 生成的切片
+        existing: 集合中已有的 {id: metadata}
+    
+    Returns:
+        {"records": {id: (document, metadata)}（内容相同的切片只保留第一个）,
+         "to_embed": 需要向量化的 id, "to_update": 仅元数据变化的 id, "stale": 需要删除的 id}
+    """
+    records = {}
+    for chunk in chunks:
+        document = chunk_document(chunk)
+        records.setdefault(chunk_id(document), (document, chunk_metadata(chunk)))
+    
+    return {
+        "records": records,
+        "to_embed": [cid for cid in records if cid not in existing],
+        "to_update": [cid for cid, (_, metadata) in records.items()
+                      if cid in existing and existing[cid] != metadata],
+        "stale": [cid for cid in existing if cid not in records],
+    }
+
+
+def load_checkpoint(path: str, model_name: str) -> Dict[str, List[float]]:
+    """读取检查点中已完成的向量（模型不一致或文件损坏的部分丢弃）"""
+    embeddings = {}
+    if not os.path.exists(path):
+        return embeddings
+    with open(path, 'r', encoding='utf-8') as f:
+        for i, line in enumerate(f):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break  # 中断时写了一半的行
+            if i == 0:
+                if record.get("model") != model_name:
+                    return {}
+                continue
+            embeddings[record["id"]] = record["embedding"]
+    return embeddings
+
+
+def embed_documents(
+    documents: Dict[str, str],
+    encode: Callable[[List[str]], object],
+    checkpoint_path: Optional[str] = None,
+    model_name: str = EMBEDDING_MODEL,
+    max_batch_size: Optional[int] = None,
+    max_batch_chars: Optional[int] = None
+) -> Dict[str, List[float]]:
+    """
+    向量化文档（按长度排序后分批，批大小自适应，进度写入检查点）
+    
+    Args:
+        documents: {id: 文本}
+        encode: 文本列表 -> 向量矩阵
+        checkpoint_path: 检查点文件（None=不记录进度）
+        model_name: 嵌入模型名（检查点与模型不一致时作废）
+        max_batch_size: 每批最多文档数（None=读取 GUIDELINE_EMBED_BATCH_SIZE，默认 64）
+        max_batch_chars: 每批最多字符数（None=读取 GUIDELINE_EMBED_BATCH_CHARS，默认 32000）
+    
+    Returns:
+        {id: 向量}
+    """
+    max_batch_size = max_batch_size or int(os.getenv("GUIDELINE_EMBED_BATCH_SIZE", "64"))
+    max_batch_chars = max_batch_chars or int(os.getenv("GUIDELINE_EMBED_BATCH_CHARS", "32000"))
     
-    print(f"初始化ChromaDB: {CHROMA_PATH}")
-    client = chromadb.PersistentClient(path=CHROMA_PATH)
+    embeddings = {}
+    if checkpoint_path:
+        embeddings = {cid: vec for cid, vec in load_checkpoint(checkpoint_path, model_name).items()
+                      if cid in documents}
+        if embeddings:
+            print(f"从检查点恢复 {len(embeddings)} 个向量")
+    
+    # 长度相近的文档放在同一批，减少 padding
+    pending = sorted((cid for cid in documents if cid not in embeddings), key=lambda cid: len(documents[cid]))
+    if not pending:
+        return embeddings
+    
+    checkpoint = None
+    if checkpoint_path:
+        resume = bool(embeddings)
+        checkpoint = open(checkpoint_path, 'a' if resume else 'w', encoding='utf-8')
+        if not resume:
+            checkpoint.write(json.dumps({"model": model_name}) + "\n")
     
-    # 获取或创建集合
     try:
-        collection = client.get_collection(name=COLLECTION_NAME)
-        print("集合已存在，正在删除旧数据...")
-        client.delete_collection(name=COLLECTION_NAME)
-        collection = client.create_collection(name=COLLECTION_NAME)
-    except:
-        collection = client.create_collection(name=COLLECTION_NAME)
-        
-    print("开始向量化和入库...")
-    batch_size = 10
-    total = len(chunks)
+        batch_size = max_batch_size
+        position = 0
+        while position < len(pending):
+            batch = [pending[position]]
+            chars = len(documents[pending[position]])
+            for cid in pending[position + 1:position + batch_size]:
+                chars += len(documents[cid])
+                if chars > max_batch_chars:
+                    break
+                batch.append(cid)
+            
+            try:
+                vectors = encode([documents[cid] for cid in batch])
+            except Exception as e:
+                if len(batch) == 1:
+                    raise
+                batch_size = max(1, len(batch) // 2)
+                print(f"⚠️ 向量化失败（{len(batch)} 个/批），减小批大小到 {batch_size}: {e}")
+                continue
+            
+            for cid, vector in zip(batch, vectors):
+                embeddings[cid] = [float(x) for x in vector]
+                if checkpoint:
+                    checkpoint.write(json.dumps({"id": cid, "embedding": embeddings[cid]}) + "\n")
+            if checkpoint:
+                checkpoint.flush()
+            
+            position += len(batch)
+            # 成功后逐步恢复批大小
+            batch_size = min(max_batch_size, batch_size * 2)
+            print(f"进度: {position}/{len(pending)}")
+    finally:
+        if checkpoint:
+            checkpoint.close()
     
-    for i in range(0, total, batch_size):
-        batch = chunks[i:i+batch_size]
-        
-        # 准备数据
-        ids = [f"chunk_{i+j}" for j in range(len(batch))]
-        documents = [f"【章节】{c['header']}\n{c['text']}" for c in batch]
-        metadatas = [{"header": c['header'], "page": c['page']} for c in batch]
-        
-        # 生成Embedding
-        embeddings = model.encode(documents, batch_size=len(batch))['dense_vecs']
+    return embeddings
+
+
+def _in_batches(ids: List[str], size: int):
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def vectorize_and_store(chunks, client=None, encode=None, checkpoint_path: Optional[str] = None):
+    """
+    增量向量化并存入ChromaDB（只向量化新增/修改的切片）
+    
+    Args:
+        chunks: 切片列表
+        client: ChromaDB 客户端（None=打开 CHROMA_PATH）
+        encode: 文本列表 -> 向量矩阵（None=需要时加载 BGE-M3）
+        checkpoint_path: 检查点文件（None=CHROMA_PATH 下的 {集合名}.checkpoint.jsonl）
+    """
+    if client is None:
+        import chromadb
+        print(f"初始化ChromaDB: {CHROMA_PATH}")
+        client = chromadb.PersistentClient(path=CHROMA_PATH)
+    checkpoint_path = checkpoint_path or os.path.join(CHROMA_PATH, f"{COLLECTION_NAME}.checkpoint.jsonl")
+    
+    collection = client.get_or_create_collection(name=COLLECTION_NAME)
+    existing_data = collection.get(include=["metadatas"])
+    existing = dict(zip(existing_data["ids"], existing_data["metadatas"]))
+    
+    plan = plan_chunk_sync(chunks, existing)
+    records = plan["records"]
+    print(f"切片 {len(records)} 个: 新增/修改 {len(plan['to_embed'])}，"
+          f"元数据变化 {len(plan['to_update'])}，过期 {len(plan['stale'])}，"
+          f"未变化 {len(records) - len(plan['to_embed']) - len(plan['to_update'])}")
+    
+    max_batch = getattr(client, "get_max_batch_size", lambda: 5000)()
+    
+    if plan["to_embed"]:
+        if encode is None:
+            from FlagEmbedding import BGEM3FlagModel
+            print("正在加载BGE-M3模型...")
+            model = BGEM3FlagModel(EMBEDDING_MODEL, use_fp16=True)
+            encode = lambda documents: model.encode(documents, batch_size=len(documents))['dense_vecs']
         
-        # 存入
-        collection.add(
-            ids=ids,
-            embeddings=embeddings.tolist(),
-            documents=documents,
-            metadatas=metadatas
-        )
-        print(f"进度: {min(i+batch_size, total)}/{total}")
+        print("开始向量化...")
+        embeddings = embed_documents({cid: records[cid][0] for cid in plan["to_embed"]}, encode, checkpoint_path)
         
+        for batch in _in_batches(plan["to_embed"], max_batch):
+            collection.upsert(
+                ids=batch,
+                embeddings=[embeddings[cid] for cid in batch],
+                documents=[records[cid][0] for cid in batch],
+                metadatas=[records[cid][1] for cid in batch]
+            )
+    
+    for batch in _in_batches(plan["to_update"], max_batch):
+        collection.update(ids=batch, metadatas=[metadata_update(records[cid][1], existing[cid]) for cid in batch])
+    
+    for batch in _in_batches(plan["stale"], max_batch):
+        collection.delete(ids=batch)
+    
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    
     print("入库完成!")
     return collection
 
@@ -171,14 +506,16 @@ def main():
         print(f"错误: 找不到文件 {PDF_PATH}")
         return
 
-    print("1. 提取表格...")
-    tables = extract_tables_to_markdown(PDF_PATH)
-    print(f"提取了 {len(tables)} 个表格")
-    
-    print("2. 解析PDF并切分...")
-    chunks = parse_pdf_with_headers(PDF_PATH, tables)
+    print("1. 并行解析PDF（文本块 + 表格）并切分...")
+    chunks, table_count = parse_pdf_parallel(PDF_PATH)
+    print(f"提取了 {table_count} 个表格")
     print(f"生成了 {len(chunks)} 个切片")
     
+    print("2. 近似重复切片去重...")
+    total = len(chunks)
+    chunks = dedup_chunks(chunks)
+    print(f"去重后 {len(chunks)} 个切片（合并 {total - len(chunks)} 个近似重复）")
+    
     print("3. 向量化入库...")
     vectorize_and_store(chunks)
     
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+药品说明书流式处理流水线 - 解析 + 实体提取 并行执行，结果逐条写出
+
+流程:
+1. iter_drug_texts 逐行读取原始 Markdown，惰性产出药品条目文本
+2. 条目按 chunk_size 打包提交到进程池，每个子进程完成 解析(parse_drug_entry) + 提取(process_drug)
+3. 进程池中同时在途的批次数有上限，结果按输入顺序逐条写入 JSONL（可选同时写出 JSON 数组）
+
+内存占用只与 workers × chunk_size 有关，与输入文件大小无关；
+输出与 parse_all_drugs + save_to_json + process_all_drugs 的结果逐字节一致
+"""
+
+import os
+import json
+import argparse
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .drug_parser import iter_drug_texts, parse_drug_entry
+from .entity_extractor import EntityExtractor
+
+
+# 子进程内复用的提取器（规则只初始化一次）
+_extractor: Optional[EntityExtractor] = None
+
+
+def _get_extractor() -> EntityExtractor:
+    global _extractor
+    if _extractor is None:
+        _extractor = EntityExtractor()
+    return _extractor
+
+
+def process_entries(batch: List[Tuple[int, str]]) -> List[Tuple[int, Optional[Dict], Optional[Dict], str]]:
+    """
+    解析并提取一批条目（在子进程中执行）
+
+    Returns:
+        [(条目序号, 结构化药品, 图谱数据, 错误信息), ...]，失败的条目药品和图谱数据为 None
+    """
+    extractor = _get_extractor()
+    results = []
+    for index, text in batch:
+        try:
+            drug = asdict(parse_drug_entry(text, index))
+        except Exception as e:
+            results.append((index, None, None, f"解析失败: {e}"))
+            continue
+        try:
+            results.append((index, drug, extractor.process_drug(drug), ""))
+        except Exception as e:
+            results.append((index, drug, None, f"提取失败: {e}"))
+    return results
+
+
+def batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """按 size 打包（最后一批可能不足）"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def imap_ordered(
+    fn: Callable[[Any], Any],
+    items: Iterable[Any],
+    workers: int,
+    max_pending: Optional[int] = None
+) -> Iterator[Any]:
+    """
+    按输入顺序产出 fn(item) 结果，进程池中在途任务不超过 max_pending
+    （Executor.map 会一次性提交整个输入，无法流式处理大文件）
+
+    Args:
+        workers: 进程数（<=1 时在当前进程中顺序执行）
+        max_pending: 在途任务上限（默认 workers × 2）
+    """
+    if workers <= 1:
+        for item in items:
+            yield fn(item)
+        return
+
+    max_pending = max_pending or workers * 2
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(fn, item))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class JsonArrayWriter:
+    """
+    逐条写出 JSON 数组，格式与 json.dump(items, ensure_ascii=False, indent=2) 一致
+    供仍读取 JSON 数组的下游（导入脚本、规则引擎）使用
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'w', encoding='utf-8')
+        self.count = 0
+
+    def write(self, item: Dict):
+        text = json.dumps(item, ensure_ascii=False, indent=2).replace('\n', '\n  ')
+        self._file.write(('[\n  ' if self.count == 0 else ',\n  ') + text)
+        self.count += 1
+
+    def close(self):
+        self._file.write('\n]' if self.count else '[]')
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class JsonlWriter:
+    """逐条写出 JSONL（每行一个 JSON 对象）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'w', encoding='utf-8')
+        self.count = 0
+
+    def write(self, item: Dict):
+        self._file.write(json.dumps(item, ensure_ascii=False) + '\n')
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_jsonl(path: str) -> Iterator[Dict]:
+    """逐行读取 JSONL"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def iter_processed_drugs(
+    input_file: str,
+    workers: Optional[int] = None,
+    chunk_size: Optional[int] = None
+) -> Iterator[Tuple[int, Optional[Dict], Optional[Dict], str]]:
+    """
+    流式解析 + 提取，按输入顺序产出 (条目序号, 结构化药品, 图谱数据, 错误信息)
+
+    Args:
+        input_file: 原始药品说明书 Markdown
+        workers: 进程数（None=读取 DATA_PIPELINE_WORKERS，默认 CPU 核数）
+        chunk_size: 每个任务包含的条目数（None=读取 DATA_PIPELINE_CHUNK_SIZE，默认 16）
+    """
+    workers = workers if workers is not None else int(os.getenv("DATA_PIPELINE_WORKERS", "0")) or (os.cpu_count() or 1)
+    chunk_size = chunk_size if chunk_size is not None else int(os.getenv("DATA_PIPELINE_CHUNK_SIZE", "16"))
+
+    batches = batched(enumerate(iter_drug_texts(input_file)), max(chunk_size, 1))
+    for results in imap_ordered(process_entries, batches, workers):
+        yield from results
+
+
+def run_pipeline(
+    input_file: str,
+    output_dir: str,
+    workers: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    write_json: bool = True
+) -> Dict[str, Any]:
+    """
+    原始 Markdown -> drugs_structured.jsonl / graph_data.jsonl（可选同时写出 .json）
+
+    Args:
+        input_file: 原始药品说明书 Markdown
+        output_dir: 输出目录
+        workers: 进程数（见 iter_processed_drugs）
+        chunk_size: 每个任务包含的条目数（见 iter_processed_drugs）
+        write_json: 是否同时写出 JSON 数组文件（兼容现有下游）
+
+    Returns:
+        统计信息
+    """
+    output = Path(output_dir)
+    output.mkdir(parents=True, exist_ok=True)
+
+    writers = [
+        ('drugs', JsonlWriter(str(output / "drugs_structured.jsonl"))),
+        ('graph', JsonlWriter(str(output / "graph_data.jsonl"))),
+    ]
+    if write_json:
+        writers += [
+            ('drugs', JsonArrayWriter(str(output / "drugs_structured.json"))),
+            ('graph', JsonArrayWriter(str(output / "graph_data.json"))),
+        ]
+
+    stats = {
+        'entries': 0,
+        'drugs': 0,
+        'failed': 0,
+        'categories': defaultdict(int),
+        'total_treats': 0,
+        'total_forbidden': 0,
+        'total_constraints': 0,
+    }
+
+    print(f"📖 流式处理: {input_file}")
+    try:
+        for index, drug, drug_graph, error in iter_processed_drugs(input_file, workers, chunk_size):
+            stats['entries'] += 1
+            if drug is None or drug_graph is None:
+                stats['failed'] += 1
+                print(f"❌ [{index + 1}] {error}")
+                continue
+
+            for kind, writer in writers:
+                writer.write(drug if kind == 'drugs' else drug_graph)
+
+            stats['drugs'] += 1
+            stats['categories'][drug_graph['category']] += 1
+            stats['total_treats'] += len(drug_graph['treats'])
+            stats['total_forbidden'] += len(drug_graph['forbidden_diseases'])
+            stats['total_constraints'] += len(drug_graph['metric_constraints'])
+            if stats['drugs'] % 1000 == 0:
+                print(f"⏳ 已处理 {stats['drugs']} 个药品")
+    finally:
+        for _, writer in writers:
+            writer.close()
+
+    stats['categories'] = dict(stats['categories'])
+    stats['outputs'] = [writer.path for _, writer in writers]
+    return stats
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="药品说明书流式解析 + 实体提取")
+    parser.add_argument("--input", default="data/raw/data.md", help="原始药品说明书 Markdown")
+    parser.add_argument("--output-dir", default="data/processed", help="输出目录")
+    parser.add_argument("--workers", type=int, default=None, help="进程数（默认 CPU 核数）")
+    parser.add_argument("--chunk-size", type=int, default=None, help="每个任务包含的条目数")
+    parser.add_argument("--jsonl-only", action="store_true", help="只写出 JSONL，不写 JSON 数组")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("🏭 药品数据流水线")
+    print("=" * 60)
+
+    if not Path(args.input).exists():
+        print(f"❌ 错误: 找不到文件 {args.input}")
+        return
+
+    stats = run_pipeline(args.input, args.output_dir, args.workers, args.chunk_size,
+                         write_json=not args.jsonl_only)
+
+    print("\n" + "=" * 60)
+    print("📈 处理统计")
+    print("=" * 60)
+    print(f"条目数: {stats['entries']}")
+    print(f"成功: {stats['drugs']}，失败: {stats['failed']}")
+    print(f"总Metric约束数: {stats['total_constraints']}")
+    print(f"总适应症关系: {stats['total_treats']}")
+    print(f"总禁忌关系: {stats['total_forbidden']}")
+    for path in stats['outputs']:
+        print(f"💾 {path}")
+
+
+if __name__ == "__main__":
+    main()
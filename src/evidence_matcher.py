@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+证据比对 (Evidence Matcher)
+比对知识图谱结果行与指南片段中的用药规则，找出指南中与图谱重复的句子和两者不一致之处
+
+1. KG 结果行解析为规则事实: (药品, 指标, 区间, 强度) 或 (药品, 疾病, 强度)
+   强度分为 禁用 / 慎用；查询模板只返回阈值不返回指标名时，指标取问题中唯一提到的指标
+2. 由药品词表（DrugResolver 词条、药品分类，KG 中的药品名优先）和指标、疾病同义词构建一个关键词自动机，
+   每个指南句子扫描一次得到药品、指标、疾病提及；指标后紧跟的运算符 + 数值解析为区间，
+   句子按逗号分句，分句中的 禁用 / 慎用 / 可用 说法决定该分句规则的强度
+3. 分句中的规则都能在 KG 中找到同药品、同指标、同区间、同强度的事实，且分句中的药品、指标、疾病提及
+   全部落在这些规则里时，该分句视为重复，只去掉这样的分句（没有规则的分句、提到 KG 未覆盖的药品的分句保留）；
+   指南允许使用而 KG 禁用（区间相交），或指南禁用的区间超出 KG 的禁用区间时，视为冲突
+
+只比对同一句中出现药品名的规则，不跨句推断主语
+"""
+
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from .context_packer import document_content, sentence_spans
+from .keyword_automaton import KeywordAutomaton
+from .agent.drug_resolver import DrugResolver, ingredient_name, normalize_mention
+from .agent.rule_engine import METRIC_NODES
+from .graph.cypher_templates import CATEGORY_SYNONYMS, DISEASE_SYNONYMS, METRIC_SYNONYMS
+
+
+FORBID = "禁用"
+CAUTION = "慎用"
+PERMIT = "可用"
+
+_FORBID_SEVERITIES = {"critical", "禁忌", "禁用", "绝对禁忌", "forbidden", "contraindicated"}
+_CAUTION_SEVERITIES = {"warning", "慎用", "相对禁忌", "caution"}
+
+# 分句强度提示词（按 禁用 > 慎用 > 可用 的顺序判断，"不可用" 不会被当作可用）
+_FORBID_CUES = ("禁用", "禁忌", "停用", "停药", "禁止", "不推荐", "不建议", "不宜", "不应", "不能", "不可", "不得", "避免")
+_CAUTION_CUES = ("慎用", "减量", "减少剂量", "调整剂量", "剂量调整", "最大剂量")
+_PERMIT_CUES = ("可用", "可以使用", "可使用", "可继续", "继续使用", "无需调整", "无需减量", "不需调整",
+                "不需要调整", "可安全", "安全使用")
+
+# 分句（含分句后的逗号、冒号，去掉分句后按原文拼接剩余部分）
+_CLAUSE_DELIMITERS = "，,：:"
+_CLAUSE_PATTERN = re.compile(r'[^，,：:]+[，,：:]*')
+_SENTENCE_END = re.compile(r'[。！？；!?;…]+\s*$')
+
+# 指标后的条件: 运算符 + 数值 / 数值范围 / 数值 + 以下、以上
+_NUMBER = r'(\d+(?:\.\d+)?)'
+_UNIT = r'(?:\s*ml/min(?:/1\.73\s*m[²2])?)?'
+_CONDITION_PATTERN = re.compile(
+    r'\s*(?:值|水平)?\s*(?:为|在|是|处于)?\s*(?:'
+    r'(小于等于|大于等于|不超过|不高于|不低于|小于|低于|少于|不足|大于|高于|超过|<=|>=|≤|≥|<|>|＜|＞)\s*' + _NUMBER +
+    r'|' + _NUMBER + r'\s*(?:-|~|～|—|至|到)\s*' + _NUMBER +
+    r'|' + _NUMBER + _UNIT + r'\s*(及以下|以下|及以上|以上))'
+)
+_OPERATOR_MAP = {
+    "小于等于": "<=", "不超过": "<=", "不高于": "<=", "<=": "<=", "≤": "<=", "及以下": "<=",
+    "大于等于": ">=", "不低于": ">=", ">=": ">=", "≥": ">=", "及以上": ">=",
+    "小于": "<", "低于": "<", "少于": "<", "不足": "<", "<": "<", "＜": "<", "以下": "<",
+    "大于": ">", "高于": ">", "超过": ">", ">": ">", "＞": ">", "以上": ">",
+}
+
+_INF = float("inf")
+
+
+@dataclass(frozen=True)
+class Condition:
+    """指标区间"""
+    metric: str
+    operator: str                    # < / <= / > / >= / BETWEEN
+    low: float
+    high: float
+
+    @classmethod
+    def parse(cls, metric: str, operator: str, value=None, value_max=None) -> Optional["Condition"]:
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return None
+        if operator == "BETWEEN":
+            try:
+                high = float(value_max)
+            except (TypeError, ValueError):
+                return None
+            return cls(metric, operator, min(value, high), max(value, high))
+        if operator in ("<", "<="):
+            return cls(metric, operator, -_INF, value)
+        if operator in (">", ">="):
+            return cls(metric, operator, value, _INF)
+        return None
+
+    def same_range(self, other: "Condition") -> bool:
+        """端点相同即视为同一区间（"< 30" 与 "≤ 30" 是同一条规则的不同写法）"""
+        return self.metric == other.metric and self.low == other.low and self.high == other.high
+
+    def within(self, other: "Condition") -> bool:
+        return self.metric == other.metric and other.low <= self.low and self.high <= other.high
+
+    def overlaps(self, other: "Condition") -> bool:
+        if self.metric != other.metric:
+            return False
+        low, high = max(self.low, other.low), min(self.high, other.high)
+        if low < high:
+            return True
+        # 端点相接时只有两边都包含端点才相交（"≥ 30" 与 "< 30" 不相交）
+        return low == high and self._closed_at(low) and other._closed_at(low)
+
+    def _closed_at(self, point: float) -> bool:
+        if self.operator == "BETWEEN":
+            return True
+        return self.operator in ("<=", ">=") or (point != self.low and point != self.high)
+
+    def __str__(self) -> str:
+        if self.operator == "BETWEEN":
+            return f"{self.metric} {self.low:g}-{self.high:g}"
+        value = self.high if self.operator in ("<", "<=") else self.low
+        return f"{self.metric} {self.operator} {value:g}"
+
+
+@dataclass(frozen=True)
+class RuleFact:
+    """一条用药规则（来自 KG 结果行或指南句子）"""
+    drug: str                        # 成分名（"盐酸二甲双胍片" -> "二甲双胍"）
+    strength: Optional[str]          # 禁用 / 慎用 / 可用，KG 未给出严重程度时为 None
+    condition: Optional[Condition] = None
+    disease: Optional[str] = None
+
+    @property
+    def subject(self) -> str:
+        return str(self.condition) if self.condition else self.disease
+
+    def describe(self) -> str:
+        return f"{self.drug} {self.subject} {self.strength or '限制使用'}"
+
+
+@dataclass
+class EvidenceConflict:
+    """指南与 KG 不一致的一处"""
+    drug: str
+    subject: str                     # 指标区间或疾病
+    kg: str                          # KG 规则描述
+    rag: str                         # 指南原句
+    header: str = "未知章节"
+    page: str = "N/A"
+
+    def describe(self) -> str:
+        return f"{self.drug}（{self.subject}）: 图谱「{self.kg}」，指南【{self.header} - P.{self.page}】「{self.rag}」"
+
+
+@dataclass
+class EvidenceOverlap:
+    """比对结果"""
+    rag_results: List[Dict]          # 去掉重复分句后的文档（副本），全部重复的文档被移除
+    removed_sentences: int = 0       # 整句去掉的句子数
+    removed_clauses: int = 0         # 保留句子中去掉的分句数
+    removed_documents: int = 0
+    conflicts: List[EvidenceConflict] = field(default_factory=list)
+
+
+@dataclass
+class _Clause:
+    """指南句子的一个分句"""
+    text: str                        # 原文（含分句后的逗号）
+    strength: Optional[str]
+    drugs: List[str]
+    subjects: List[Tuple[Optional[Condition], Optional[str]]]
+    loose_metrics: int = 0           # 后面没有区间的指标提及
+
+
+@lru_cache(maxsize=1)
+def _default_drug_resolver() -> Optional[DrugResolver]:
+    """默认药品词表（graph_data.json 不存在时只识别 KG 结果行中的药品）"""
+    try:
+        return DrugResolver.from_graph_data()
+    except OSError:
+        return None
+
+
+def disease_key(name: str) -> str:
+    """疾病名归一为 DISEASE_SYNONYMS 中的槽位值（如 "急性心力衰竭" -> "心力衰竭"）"""
+    for key, (_, keywords) in DISEASE_SYNONYMS.items():
+        if any(keyword.lower() in name.lower() for keyword in keywords):
+            return key
+    return normalize_mention(name)
+
+
+def severity_strength(severity) -> Optional[str]:
+    value = str(severity or "").strip().lower()
+    if value in _FORBID_SEVERITIES:
+        return FORBID
+    if value in _CAUTION_SEVERITIES:
+        return CAUTION
+    return None
+
+
+def clause_strength(clause: str) -> Optional[str]:
+    for strength, cues in ((FORBID, _FORBID_CUES), (CAUTION, _CAUTION_CUES), (PERMIT, _PERMIT_CUES)):
+        if any(cue in clause for cue in cues):
+            return strength
+    return None
+
+
+class EvidenceMatcher:
+    """
+    KG 规则与指南句子的比对器（每次查询按 KG 结果行构建一次）
+
+    Usage:
+        matcher = EvidenceMatcher(kg_rows, question)
+        overlap = matcher.compare(reranked_docs)
+        overlap.rag_results, overlap.conflicts
+    """
+
+    def __init__(self, kg_results: Optional[List[Dict]] = None, question: str = "",
+                 drug_resolver: Optional[DrugResolver] = None):
+        """
+        Args:
+            kg_results: 知识图谱结果行
+            question: 用户问题（结果行不含指标名时用于确定指标）
+            drug_resolver: 药品名解析器，用于识别 KG 结果之外的药品（默认从 graph_data.json 构建）
+        """
+        self._automaton = KeywordAutomaton()
+        for metric, synonyms in METRIC_SYNONYMS.items():
+            for synonym in synonyms:
+                self._automaton.add(synonym.lower(), ("metric", metric))
+        for key, (surfaces, _) in DISEASE_SYNONYMS.items():
+            for surface in surfaces:
+                self._automaton.add(surface.lower(), ("disease", key))
+
+        question_metrics = {value for kind, value in self._mentions(question.lower()) if kind == "metric"}
+        self.question_metric = question_metrics.pop() if len(question_metrics) == 1 else None
+
+        # 药品词表: 分类和全部药品词条（KG 中没有的药品也要识别出来，提到它们的分句不能去掉）
+        for category, keywords in CATEGORY_SYNONYMS.items():
+            for keyword in keywords:
+                self._automaton.add(keyword.lower(), ("drug", category))
+        resolver = drug_resolver or _default_drug_resolver()
+        if resolver is not None:
+            for surface, ids in resolver.surfaces():
+                self._automaton.add(surface, ("drug", ingredient_name(resolver.drug_names[ids[0]])))
+
+        self.facts: List[RuleFact] = []
+        for row in kg_results or []:
+            fact = self.row_fact(row)
+            if fact is not None:
+                self.facts.append(fact)
+                self._add_drug(row["药品名称"])
+        self._automaton.build()
+
+    def _add_drug(self, name: str):
+        key = ingredient_name(name)
+        for surface in (normalize_mention(name), key):
+            if surface:
+                self._automaton.add(surface, ("drug", key))
+
+    def _mentions(self, text: str) -> List[Tuple[str, str]]:
+        return [value for _, _, _, value in self._automaton.find_longest(text)]
+
+    def row_fact(self, row: Dict) -> Optional[RuleFact]:
+        """KG 结果行 -> 规则事实（无法确定药品、指标区间或疾病的行返回 None）"""
+        name = row.get("药品名称")
+        if not name:
+            return None
+        drug = ingredient_name(str(name))
+        relation = row.get("关系类型") or row.get("禁忌类型")
+        target = row.get("目标名称") or row.get("禁忌项")
+        strength = severity_strength(row.get("严重程度"))
+
+        disease = row.get("禁忌疾病") or (target if relation == "FORBIDDEN_FOR" else None)
+        if disease:
+            return RuleFact(drug, strength or FORBID, disease=disease_key(str(disease)))
+
+        if relation not in (None, "CONTRAINDICATED_IF", "DOSAGE_ADJUST_IF") or "运算符" not in row:
+            return None
+        metric = target if target in METRIC_NODES else (None if target else self.question_metric)
+        condition = Condition.parse(metric, row.get("运算符"), row.get("阈值")) if metric else None
+        if condition is None:
+            return None
+        if relation == "DOSAGE_ADJUST_IF":
+            strength = CAUTION
+        return RuleFact(drug, strength, condition=condition)
+
+    def sentence_facts(self, sentence: str) -> List[RuleFact]:
+        """指南句子中的规则（没有药品名或没有强度说法的句子返回空列表）"""
+        return list(dict.fromkeys(fact for fact, _ in self._clause_facts(self._clauses(sentence))))
+
+    def _clauses(self, sentence: str) -> List[_Clause]:
+        clauses = []
+        for text in _CLAUSE_PATTERN.findall(sentence):
+            lowered = text.lower()
+            clause = _Clause(text, clause_strength(lowered), [], [])
+            for _, end, _, (kind, value) in self._automaton.find_longest(lowered):
+                if kind == "drug":
+                    clause.drugs.append(value)
+                elif kind == "disease":
+                    clause.subjects.append((None, value))
+                else:
+                    condition = self._condition_after(lowered, end, value)
+                    if condition is not None:
+                        clause.subjects.append((condition, None))
+                    else:
+                        clause.loose_metrics += 1
+            clauses.append(clause)
+        return clauses
+
+    @staticmethod
+    def _clause_facts(clauses: List[_Clause]) -> List[Tuple[RuleFact, Set[int]]]:
+        """分句中的规则及其涉及的分句（条件、强度说法、药品所在的分句）"""
+        sentence_drugs = list(dict.fromkeys(drug for clause in clauses for drug in clause.drugs))
+        facts = []
+        for i, clause in enumerate(clauses):
+            if not clause.subjects:
+                continue
+            # 条件分句自身没有强度说法时，取其后最近的说法（"eGFR < 30 时，禁用二甲双胍"）
+            j = i if clause.strength else next((k for k in range(i + 1, len(clauses)) if clauses[k].strength), None)
+            if j is None:
+                continue
+            # 药品取条件到强度说法之间的分句，没有时取整句（"二甲双胍在 eGFR < 30 时禁用，30-45 时减量"）
+            drugs = list(dict.fromkeys(drug for k in range(i, j + 1) for drug in clauses[k].drugs)) or sentence_drugs
+            for drug in drugs:
+                involved = {i, j} | {k for k, other in enumerate(clauses) if drug in other.drugs}
+                for condition, disease in clause.subjects:
+                    facts.append((RuleFact(drug, clauses[j].strength, condition=condition, disease=disease), involved))
+        return facts
+
+    def _covered_clauses(self, clauses: List[_Clause], facts: List[Tuple[RuleFact, Set[int]]]) -> Set[int]:
+        """与 KG 重复的分句: 涉及的规则都被 KG 覆盖，且分句中的每个提及都落在这些规则里"""
+        used_drugs: Dict[int, Set[str]] = {}
+        uncovered: Set[int] = set()
+        involved_any: Set[int] = set()
+        subjects_used: Set[int] = set()
+        for fact, involved in facts:
+            involved_any |= involved
+            if not self.is_covered(fact):
+                uncovered |= involved
+            for k in involved:
+                used_drugs.setdefault(k, set()).add(fact.drug)
+        for fact, involved in facts:
+            subjects_used |= {k for k in involved if (fact.condition, fact.disease) in clauses[k].subjects}
+
+        return {
+            i for i, clause in enumerate(clauses)
+            if i in involved_any and i not in uncovered and not clause.loose_metrics
+            and set(clause.drugs) <= used_drugs.get(i, set())
+            and (not clause.subjects or i in subjects_used)
+        }
+
+    @staticmethod
+    def _trim(clauses: List[_Clause], removable: Set[int]) -> str:
+        """去掉重复分句后的句子（最后一个分句被去掉时，句末标点移到剩余部分末尾）"""
+        kept = [clause.text for i, clause in enumerate(clauses) if i not in removable]
+        if len(clauses) - 1 in removable:
+            end = _SENTENCE_END.search(clauses[-1].text)
+            kept[-1] = kept[-1].rstrip().rstrip(_CLAUSE_DELIMITERS) + (end.group() if end else "")
+        return "".join(kept)
+
+    @staticmethod
+    def _condition_after(clause: str, end: int, metric: str) -> Optional[Condition]:
+        match = _CONDITION_PATTERN.match(clause, end)
+        if match is None:
+            return None
+        word, value, low, high, bound, suffix = match.groups()
+        if word:
+            return Condition.parse(metric, _OPERATOR_MAP[word], value)
+        if low:
+            return Condition.parse(metric, "BETWEEN", low, high)
+        return Condition.parse(metric, _OPERATOR_MAP[suffix], bound)
+
+    def is_covered(self, fact: RuleFact) -> bool:
+        """KG 中有同药品、同指标区间（或同疾病）、强度一致的事实"""
+        if fact.strength == PERMIT:
+            return False
+        for kg in self.facts:
+            if kg.drug != fact.drug or kg.strength not in (None, fact.strength):
+                continue
+            if fact.condition and kg.condition and fact.condition.same_range(kg.condition):
+                return True
+            if fact.disease and fact.disease == kg.disease:
+                return True
+        return False
+
+    def conflicts_with(self, fact: RuleFact) -> List[RuleFact]:
+        """与指南规则不一致的 KG 事实"""
+        related = [kg for kg in self.facts if kg.drug == fact.drug and kg.strength is not None]
+        if fact.disease:
+            related = [kg for kg in related if kg.disease == fact.disease]
+            return [kg for kg in related if fact.strength == PERMIT and kg.strength == FORBID]
+
+        related = [kg for kg in related if kg.condition and kg.condition.metric == fact.condition.metric]
+        if fact.strength == PERMIT:
+            return [kg for kg in related if kg.strength == FORBID and kg.condition.overlaps(fact.condition)]
+        if fact.strength == FORBID and related and not any(
+                kg.strength == FORBID and fact.condition.within(kg.condition) for kg in related):
+            return related
+        return []
+
+    def compare(self, rag_results: Sequence[Dict]) -> EvidenceOverlap:
+        """去掉指南中与 KG 重复的分句，并找出两者不一致之处（只删去重复部分，其余原文包括换行、表格保持不变）"""
+        overlap = EvidenceOverlap(rag_results=[])
+        seen_conflicts = set()
+        for doc in rag_results:
+            metadata = doc.get("metadata") or {}
+            content = document_content(doc)
+            edits: List[Tuple[int, int, str]] = []
+            for start, end in sentence_spans(content):
+                sentence = content[start:end]
+                clauses = self._clauses(sentence) if self.facts else []
+                facts = self._clause_facts(clauses)
+                for fact in dict.fromkeys(fact for fact, _ in facts):
+                    for kg in self.conflicts_with(fact):
+                        key = (kg, sentence)
+                        if key not in seen_conflicts:
+                            seen_conflicts.add(key)
+                            overlap.conflicts.append(EvidenceConflict(
+                                drug=fact.drug, subject=fact.subject, kg=kg.describe(), rag=sentence,
+                                header=str(metadata.get("header", "未知章节")), page=str(metadata.get("page", "N/A")),
+                            ))
+                removable = self._covered_clauses(clauses, facts)
+                if removable and len(removable) == len(clauses):
+                    overlap.removed_sentences += 1
+                    edits.append((start, end, ""))
+                elif removable:
+                    overlap.removed_clauses += len(removable)
+                    edits.append((start, end, self._trim(clauses, removable)))
+
+            if not edits:
+                overlap.rag_results.append(doc)
+                continue
+            remaining = self._apply_edits(content, edits)
+            if remaining:
+                overlap.rag_results.append(dict(doc, document=remaining))
+            else:
+                overlap.removed_documents += 1
+        return overlap
+
+    @staticmethod
+    def _apply_edits(content: str, edits: List[Tuple[int, int, str]]) -> str:
+        """按位置替换原文中的句子；整行被删去时连同行尾换行一起删去，不留空行"""
+        parts, last = [], 0
+        for start, end, text in edits:
+            if not text and (start == 0 or content[start - 1] == "\n"):
+                while end < len(content) and content[end] in " \t":
+                    end += 1
+                if end < len(content) and content[end] == "\n":
+                    end += 1
+            parts.append(content[last:start])
+            parts.append(text)
+            last = end
+        parts.append(content[last:])
+        return "".join(parts).strip()
@@ -8,12 +8,79 @@ Cypher生成器 - 将图谱数据转换为Neo4j导入脚本
 2. 生成节点创建语句(Drug, Brand, Category, Disease, Metric)
 3. 生成关系创建语句
 4. 生成索引和约束
-5. 输出为.cypher文件
+5. 输出为.cypher文件，或输出带类型表头的节点/关系 CSV（供 neo4j-admin database import 离线批量导入）
 """
 
 import json
+import time
+import uuid
+import argparse
 from collections import defaultdict
-from typing import List, Dict, Set
+from pathlib import Path
+from typing import Any, List, Dict, Set, Tuple
+
+from .import_rows import (
+    METRIC_DEFINITIONS, DOSAGE_PROPERTIES, FORBIDDEN_SEVERITY, iter_graph_data, iter_import_rows, metric_rows
+)
+
+
+# neo4j-admin CSV 表头（ID 空间与标签同名；Disease 的 ID 只用于连接关系，不写入属性）
+CSV_HEADERS = {
+    "nodes_drug": ["id:ID(Drug)", "name", "en_name"] + list(DOSAGE_PROPERTIES),
+    "nodes_brand": ["name:ID(Brand)"],
+    "nodes_category": ["name:ID(Category)"],
+    "nodes_disease": [":ID(Disease)", "name", "type"],
+    "nodes_metric": ["name:ID(Metric)", "full_name", "unit"],
+    "nodes_graphmeta": ["name:ID(GraphMeta)", "version"],
+    "rels_is_brand_of": [":START_ID(Brand)", ":END_ID(Drug)"],
+    "rels_belongs_to": [":START_ID(Drug)", ":END_ID(Category)"],
+    "rels_treats": [":START_ID(Drug)", ":END_ID(Disease)"],
+    "rels_forbidden_for": [":START_ID(Drug)", ":END_ID(Disease)", "severity"],
+    "rels_contraindicated_if": [":START_ID(Drug)", ":END_ID(Metric)", "operator", "severity",
+                                "value:float", "value_min:float", "value_max:float", "unit"],
+}
+
+# CONTRAINDICATED_IF 的阈值列（列类型按行内数值决定，与其他导入方式一样保留 int / float）
+THRESHOLD_KEYS = ("value", "value_min", "value_max")
+
+CSV_LABELS = {
+    "nodes_drug": "Drug", "nodes_brand": "Brand", "nodes_category": "Category",
+    "nodes_disease": "Disease", "nodes_metric": "Metric", "nodes_graphmeta": "GraphMeta",
+    "rels_is_brand_of": "IS_BRAND_OF", "rels_belongs_to": "BELONGS_TO", "rels_treats": "TREATS",
+    "rels_forbidden_for": "FORBIDDEN_FOR", "rels_contraindicated_if": "CONTRAINDICATED_IF",
+}
+
+
+def contraindication_csv(row: Dict[str, Any]) -> Tuple[str, List[str]]:
+    """
+    CONTRAINDICATED_IF 行对应的 CSV 文件名和表头
+
+    neo4j-admin 按列声明类型，整数阈值写入 :long 列的文件（如 rels_contraindicated_if_long_float_float），
+    全部为浮点数（或缺失）时写入 rels_contraindicated_if
+    """
+    types = [
+        "long" if isinstance(row.get(key), int) and not isinstance(row.get(key), bool) else "float"
+        for key in THRESHOLD_KEYS
+    ]
+    name = "rels_contraindicated_if"
+    if "long" in types:
+        name += "_" + "_".join(types)
+    header = CSV_HEADERS["rels_contraindicated_if"][:4] + \
+        [f"{key}:{kind}" for key, kind in zip(THRESHOLD_KEYS, types)] + ["unit"]
+    return name, header
+
+
+def csv_line(values: List) -> str:
+    """CSV 行: 字符串加引号，数字原样，None 为空字段（neo4j-admin 视为属性不存在）"""
+    fields = []
+    for value in values:
+        if value is None:
+            fields.append("")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            fields.append(str(value))
+        else:
+            fields.append('"' + str(value).replace('"', '""') + '"')
+    return ",".join(fields) + "\n"
 
 
 class CypherGenerator:
@@ -76,15 +143,7 @@ class CypherGenerator:
             "",
         ]
         
-        metric_definitions = {
-            'eGFR': '肾小球滤过率',
-            'CrCl': '肌酐清除率',
-            'ALT': '丙氨酸氨基转移酶',
-            'AST': '天冬氨酸氨基转移酶',
-            'BMI': '体重指数',
-        }
-        
-        for metric, full_name in metric_definitions.items():
+        for metric, full_name in METRIC_DEFINITIONS.items():
             unit = 'mL/min' if metric in ['eGFR', 'CrCl'] else ''
             stmt = f"MERGE (m:Metric {{name: '{metric}', full_name: '{full_name}', unit: '{unit}'}})"
             statements.append(stmt + ";")
@@ -255,12 +314,124 @@ class CypherGenerator:
         print(f"Brand节点: {len(self.brands)}")
         print(f"Drug节点: {len(graph_data)}")
         
+        script = '\n'.join(statements)
         print("\n✅ Cypher脚本生成完成!")
-        print(f"📄 文件大小: {len('\n'.join(statements)) // 1024} KB")
+        print(f"📄 文件大小: {len(script) // 1024} KB")
+    
+    def generate_bulk_csv(self, graph_data_file: str, output_dir: str) -> str:
+        """
+        生成 neo4j-admin database import 使用的节点/关系 CSV（逐条流式写出，不生成 Cypher 语句）
+        
+        节点和关系来自 import_rows.iter_import_rows（与 UNWIND 导入、规则引擎语义相同），
+        graph_data.jsonl 逐行读取，内存占用与药品数量无关（只保留去重所需的名称集合）；
+        字符串列用引号包裹，空字段表示属性不存在（""=空字符串）；字段可能含换行，导入命令带 --multiline-fields=true
+        
+        Args:
+            graph_data_file: graph_data.jsonl（流式）或 graph_data.json 路径
+            output_dir: CSV 输出目录
+        
+        Returns:
+            neo4j-admin 导入命令
+        """
+        print("=" * 60)
+        print("🔧 neo4j-admin CSV 生成器")
+        print("=" * 60)
+        
+        print(f"📖 读取: {graph_data_file}")
+        
+        output = Path(output_dir)
+        output.mkdir(parents=True, exist_ok=True)
+        headers = dict(CSV_HEADERS)
+        labels = dict(CSV_LABELS)
+        files = {}
+        counts = defaultdict(int)
+        
+        def open_csv(name: str):
+            files[name] = open(output / f"{name}.csv", 'w', encoding='utf-8', newline='')
+            files[name].write(",".join(headers[name]) + "\n")
+        
+        try:
+            for name in CSV_HEADERS:
+                open_csv(name)
+            
+            def write(name: str, row: List):
+                files[name].write(csv_line(row))
+                counts[name] += 1
+            
+            # 导入行逐条转换为 CSV 行（语义见 import_rows.py），节点在第一次出现时写出
+            for kind, row in iter_import_rows(iter_graph_data(graph_data_file)):
+                if kind == "drugs":
+                    props = row["props"]
+                    write("nodes_drug", [props["id"], props["name"], props["en_name"]] +
+                          [props.get(key) for key in DOSAGE_PROPERTIES])
+                elif kind == "brands":
+                    write("nodes_brand", [row["name"]])
+                elif kind == "categories":
+                    write("nodes_category", [row["name"]])
+                elif kind == "diseases":
+                    write("nodes_disease", [f"{row['type']}:{row['name']}", row["name"], row["type"]])
+                elif kind == "is_brand_of":
+                    write("rels_is_brand_of", [row["brand"], row["drug_id"]])
+                elif kind == "belongs_to":
+                    write("rels_belongs_to", [row["drug_id"], row["category"]])
+                elif kind == "treats":
+                    write("rels_treats", [row["drug_id"], f"{row['type']}:{row['disease']}"])
+                elif kind == "forbidden_for":
+                    write("rels_forbidden_for", [row["drug_id"], f"{row['type']}:{row['disease']}", FORBIDDEN_SEVERITY])
+                elif kind == "contraindicated_if":
+                    name, header = contraindication_csv(row)
+                    if name not in files:
+                        headers[name] = header
+                        labels[name] = CSV_LABELS["rels_contraindicated_if"]
+                        open_csv(name)
+                    write(name, [
+                        row["drug_id"], row["metric"], row["operator"], row["severity"], row.get("value"),
+                        row.get("value_min"), row.get("value_max"), row.get("unit"),
+                    ])
+            
+            for row in metric_rows():
+                write("nodes_metric", [row["name"], row["full_name"], row["unit"]])
+            write("nodes_graphmeta", ['graph', f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"])
+        finally:
+            for f in files.values():
+                f.close()
+        
+        # 约束和索引需在导入后创建
+        schema = [stmt for stmt in self.generate_constraints_and_indexes() if stmt and not stmt.startswith('//')]
+        with open(output / "schema.cypher", 'w', encoding='utf-8') as f:
+            f.write('\n'.join(schema) + '\n')
+        
+        node_args = " ".join(f"--nodes={labels[name]}={output / name}.csv"
+                             for name in headers if name.startswith("nodes_"))
+        rel_args = " ".join(f"--relationships={labels[name]}={output / name}.csv"
+                            for name in headers if name.startswith("rels_"))
+        command = (f"neo4j-admin database import full {node_args} {rel_args} "
+                   f"--multiline-fields=true --overwrite-destination neo4j")
+        
+        print("\n" + "=" * 60)
+        print("📈 生成统计")
+        print("=" * 60)
+        for name in headers:
+            print(f"{name:25s}: {counts[name]}")
+        print(f"\n✅ CSV 生成完成: {output}")
+        print("💡 停止 Neo4j 后执行导入，启动后运行 schema.cypher 创建约束和索引:")
+        print(f"   {command}")
+        return command
 
 
 def main():
+    parser = argparse.ArgumentParser(description="将 graph_data.json 转换为 Neo4j 导入文件")
+    parser.add_argument("--format", choices=["cypher", "csv"], default="cypher",
+                        help="cypher: import_graph.cypher 脚本（默认）；csv: neo4j-admin 批量导入 CSV")
+    args = parser.parse_args()
+    
     generator = CypherGenerator()
+    if args.format == "csv":
+        generator.generate_bulk_csv(
+            graph_data_file="graph_data.jsonl" if Path("graph_data.jsonl").exists() else "graph_data.json",
+            output_dir="bulk_import"
+        )
+        return
     generator.generate_all_cypher(
         graph_data_file="graph_data.json",
         output_file="import_graph.cypher"
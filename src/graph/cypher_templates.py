@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+意图 → Cypher 模板库 (Cypher Template Library)
+基于 configs/schema.json 的 query_patterns 和 few_shot_examples.json 的示例类别，
+为常见知识图谱问题提供参数化 Cypher 模板，由快速槽位抽取器填充参数，无需调用 LLM
+
+槽位:
+- drug:     药品（DrugResolver 解析为 Drug id，查询使用 {id: $id} 索引查找）
+- metric:   指标（eGFR / CrCl / ALT / AST / BMI）
+- operator / value: 比较运算符和阈值（如 "小于30"）
+- disease:  禁忌疾病关键词
+- category: 药物分类（图谱中的 Category 名称）
+
+匹配规则（确定性）: 按顺序检查各意图，所需槽位齐全、不含多余槽位、且命中意图提示词时才使用模板；
+出现多个同类槽位或模板不支持的说法（监测、剂量调整、多条件组合等）时不匹配，交给 LLM 生成
+"""
+
+import re
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..keyword_automaton import KeywordAutomaton
+from ..agent.drug_resolver import DrugResolver, normalize_mention
+from ..agent.rule_engine import DEFAULT_GRAPH_DATA, METRIC_NODES
+
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+
+# 指标同义词（指标名来自 METRIC_NODES）
+METRIC_SYNONYMS = {
+    "eGFR": ["egfr", "肾小球滤过率", "肾功能"],
+    "CrCl": ["crcl", "肌酐清除率"],
+    "ALT": ["alt", "谷丙转氨酶"],
+    "AST": ["ast", "谷草转氨酶"],
+    "BMI": ["bmi", "体重指数"],
+}
+
+# 禁忌疾病: 槽位值 -> (问题中的说法, 图谱疾病名 CONTAINS 关键词)
+DISEASE_SYNONYMS = {
+    "心力衰竭": (["心力衰竭", "心衰"], ["心力衰竭", "心衰"]),
+    "酮症酸中毒": (["酮症酸中毒", "酮症"], ["酮症酸中毒"]),
+    "代谢性酸中毒": (["代谢性酸中毒"], ["代谢性酸中毒"]),
+    "肾功能不全": (["肾功能不全", "肾功能损害", "肾功能受损", "肾损害", "肾衰竭", "终末期肾病"], ["肾功能", "肾病"]),
+    "肝功能不全": (["肝功能不全", "肝功能损害", "肝损害", "肝病"], ["肝功能", "肝病"]),
+    "感染": (["感染"], ["感染"]),
+    "休克": (["休克"], ["休克"]),
+    "心肌梗死": (["心肌梗死", "心梗"], ["心肌梗死"]),
+    "呼吸衰竭": (["呼吸衰竭"], ["呼吸衰竭"]),
+    "低血糖": (["低血糖"], ["低血糖"]),
+    "胰腺炎": (["胰腺炎"], ["胰腺炎"]),
+    "膀胱癌": (["膀胱癌"], ["膀胱癌"]),
+    "甲状腺髓样癌": (["甲状腺髓样癌", "mtc"], ["甲状腺髓样癌", "MTC"]),
+    "1型糖尿病": (["1型糖尿病"], ["1型糖尿病"]),
+    "酒精中毒": (["酒精中毒", "酗酒"], ["酒精中毒", "酗酒"]),
+    "妊娠": (["妊娠", "孕妇", "怀孕"], ["妊娠", "孕"]),
+}
+
+# 分类同义词（分类名来自 graph_data.json）
+CATEGORY_SYNONYMS = {
+    "双胍类": ["双胍"],
+    "磺脲类": ["磺脲", "磺酰脲"],
+    "GLP-1激动剂": ["glp-1", "glp1"],
+    "α-糖苷酶抑制剂": ["糖苷酶抑制剂", "糖苷酶"],
+    "胆汁酸螯合剂": ["胆汁酸"],
+    "胰岛素": ["胰岛素"],
+}
+
+# 运算符说法（长的在前）
+_OPERATOR_PATTERN = re.compile(
+    r'(小于等于|大于等于|不超过|不高于|不低于|小于|低于|少于|不足|大于|高于|超过|<=|>=|≤|≥|<|>|＜|＞)'
+    r'\s*(\d+(?:\.\d+)?)'
+)
+_OPERATOR_MAP = {
+    "小于等于": "<=", "不超过": "<=", "不高于": "<=", "<=": "<=", "≤": "<=",
+    "大于等于": ">=", "不低于": ">=", ">=": ">=", "≥": ">=",
+    "小于": "<", "低于": "<", "少于": "<", "不足": "<", "<": "<", "＜": "<",
+    "大于": ">", "高于": ">", "超过": ">", ">": ">", "＞": ">",
+}
+
+# 模板不支持的说法（出现时交给 LLM）
+UNSUPPORTED_MARKERS = ["监测", "剂量", "调整", "减量", "商品名", "既", "同时", "并且", "以及", "适应症"]
+
+CONTRAINDICATION_CUES = ["禁用", "禁忌", "不能", "不可", "不宜", "慎用", "限制", "能否", "能不能", "可以", "可否", "注意"]
+
+
+@dataclass
+class QuestionSlots:
+    """从问题中抽取的槽位"""
+    drug_ids: List[str] = field(default_factory=list)
+    drug_mentions: List[str] = field(default_factory=list)
+    metrics: List[str] = field(default_factory=list)
+    operators: List[Tuple[str, float]] = field(default_factory=list)
+    numbers: List[float] = field(default_factory=list)
+    diseases: List[str] = field(default_factory=list)
+    categories: List[str] = field(default_factory=list)
+
+    def filled(self) -> Dict[str, bool]:
+        return {
+            "drug": bool(self.drug_ids),
+            "metric": bool(self.metrics),
+            "value": bool(self.numbers),
+            "disease": bool(self.diseases),
+            "category": bool(self.categories),
+        }
+
+
+@dataclass
+class TemplateMatch:
+    """模板匹配结果"""
+    intent: str
+    pattern: str                 # 对应 schema.json 中的 query_patterns 名称
+    cypher: str
+    params: Dict[str, Any]
+    slots: QuestionSlots
+
+
+@dataclass(frozen=True)
+class CypherTemplate:
+    """参数化 Cypher 模板"""
+    intent: str
+    pattern: str
+    required: Tuple[str, ...]
+    cues: Tuple[str, ...]
+    cypher: str
+
+
+TEMPLATES = [
+    CypherTemplate(
+        intent="drug_metric_threshold",
+        pattern="指标禁忌查询",
+        required=("drug", "metric"),
+        cues=tuple(CONTRAINDICATION_CUES) + ("多少", "阈值", "以下", "以上"),
+        cypher="""UNWIND $drug_ids AS drug_id
+MATCH (d:Drug {id: drug_id})-[r:CONTRAINDICATED_IF]->(m:Metric {name: $metric})
+RETURN d.name AS 药品名称, r.operator AS 运算符, r.value AS 阈值, r.severity AS 严重程度""",
+    ),
+    CypherTemplate(
+        intent="drug_disease_contraindication",
+        pattern="疾病禁忌查询",
+        required=("drug", "disease"),
+        cues=tuple(CONTRAINDICATION_CUES) + ("吗",),
+        cypher="""UNWIND $drug_ids AS drug_id
+MATCH (d:Drug {id: drug_id})-[r:FORBIDDEN_FOR]->(dis:Disease)
+WHERE any(k IN $disease_keywords WHERE dis.name CONTAINS k)
+RETURN d.name AS 药品名称, dis.name AS 禁忌疾病, r.severity AS 严重程度""",
+    ),
+    CypherTemplate(
+        intent="drug_detail",
+        pattern="药物详情查询",
+        required=("drug",),
+        cues=tuple(CONTRAINDICATION_CUES) + ("事项", "风险"),
+        cypher="""UNWIND $drug_ids AS drug_id
+MATCH (d:Drug {id: drug_id})-[r]->(target)
+WHERE type(r) IN ['CONTRAINDICATED_IF', 'FORBIDDEN_FOR', 'REQUIRES_MONITORING', 'DOSAGE_ADJUST_IF']
+RETURN d.name AS 药品名称, type(r) AS 关系类型, target.name AS 目标名称,
+       r.severity AS 严重程度, r.operator AS 运算符, r.value AS 阈值""",
+    ),
+    CypherTemplate(
+        intent="metric_threshold_contraindication",
+        pattern="指标禁忌查询",
+        required=("metric", "value"),
+        cues=tuple(CONTRAINDICATION_CUES) + ("哪些",),
+        # 指标落在问题给出的范围内时必然触发的规则（如 "eGFR < 30" 命中 "< 30"、"< 45"）
+        cypher="""MATCH (d:Drug)-[r:CONTRAINDICATED_IF]->(m:Metric {name: $metric})
+WHERE ($operator IN ['<', '<='] AND r.operator IN ['<', '<='] AND r.value >= $threshold)
+   OR ($operator IN ['>', '>='] AND r.operator IN ['>', '>='] AND r.value <= $threshold)
+RETURN d.name AS 药品名称, r.operator AS 运算符, r.value AS 阈值, r.severity AS 严重程度
+ORDER BY r.value""",
+    ),
+    CypherTemplate(
+        intent="metric_contraindication",
+        pattern="指标禁忌查询",
+        required=("metric",),
+        cues=tuple(CONTRAINDICATION_CUES),
+        cypher="""MATCH (d:Drug)-[r:CONTRAINDICATED_IF]->(m:Metric {name: $metric})
+RETURN d.name AS 药品名称, r.operator AS 运算符, r.value AS 阈值, r.severity AS 严重程度
+ORDER BY r.value""",
+    ),
+    CypherTemplate(
+        intent="disease_contraindication",
+        pattern="疾病禁忌查询",
+        required=("disease",),
+        cues=tuple(CONTRAINDICATION_CUES),
+        cypher="""MATCH (d:Drug)-[r:FORBIDDEN_FOR]->(dis:Disease)
+WHERE any(k IN $disease_keywords WHERE dis.name CONTAINS k)
+RETURN d.name AS 药品名称, dis.name AS 禁忌疾病, r.severity AS 严重程度""",
+    ),
+    CypherTemplate(
+        intent="category_contraindication",
+        pattern="药物分类查询",
+        required=("category",),
+        cues=("禁用", "禁忌", "不能", "不宜"),
+        cypher="""MATCH (c:Category {name: $category})<-[:BELONGS_TO]-(d:Drug)
+MATCH (d)-[r]->(target)
+WHERE type(r) IN ['CONTRAINDICATED_IF', 'FORBIDDEN_FOR']
+RETURN d.name AS 药品名称, type(r) AS 禁忌类型, target.name AS 禁忌项,
+       r.operator AS 运算符, r.value AS 阈值""",
+    ),
+    CypherTemplate(
+        intent="category_drugs",
+        pattern="药物分类查询",
+        required=("category",),
+        cues=("哪些", "有什么", "列出", "品种", "包括", "都有"),
+        cypher="""MATCH (d:Drug)-[:BELONGS_TO]->(c:Category {name: $category})
+RETURN d.name AS 药品名称, d.max_daily_dose AS 最大日剂量""",
+    ),
+    CypherTemplate(
+        intent="category_list",
+        pattern="药物分类查询",
+        required=(),
+        cues=("类别", "分类", "种类"),
+        cypher="""MATCH (c:Category)
+RETURN c.name AS 类别名称
+ORDER BY c.name""",
+    ),
+]
+
+
+class CypherTemplateLibrary:
+    """
+    意图模板库
+
+    Usage:
+        library = CypherTemplateLibrary()
+        match = library.match("eGFR小于30的患者不能使用哪些药物？")
+        if match:
+            results = graph_client.query(match.cypher, match.params)
+    """
+
+    def __init__(
+        self,
+        drug_resolver: Optional[DrugResolver] = None,
+        graph_data_path: Optional[str] = None,
+        schema_path: Optional[str] = None
+    ):
+        """
+        Args:
+            drug_resolver: 药品名解析器（默认从 graph_data.json 构建）
+            graph_data_path: graph_data.json 路径（读取分类名称）
+            schema_path: schema.json 路径（读取 query_patterns 描述）
+        """
+        self.drug_resolver = drug_resolver or DrugResolver.from_graph_data(graph_data_path)
+
+        with open(schema_path or PROJECT_ROOT / "configs" / "schema.json", "r", encoding="utf-8") as f:
+            self.patterns = json.load(f).get("query_patterns", {})
+        unknown = {t.pattern for t in TEMPLATES} - set(self.patterns)
+        if unknown:
+            raise ValueError(f"模板引用了 schema 中不存在的查询模式: {sorted(unknown)}")
+
+        with open(Path(graph_data_path) if graph_data_path else DEFAULT_GRAPH_DATA, "r", encoding="utf-8") as f:
+            self.categories = sorted({item.get("category") or "未分类" for item in json.load(f)})
+
+        # 全部槽位词条放入一个自动机，最左最长匹配消除歧义（如 "肾功能不全" 优先于 "肾功能"）
+        self._automaton = KeywordAutomaton()
+        for surface, ids in self.drug_resolver.surfaces():
+            self._automaton.add(surface, ("drug", tuple(ids)))
+        for metric in METRIC_NODES:
+            for surface in [metric] + METRIC_SYNONYMS.get(metric, []):
+                self._automaton.add(normalize_mention(surface), ("metric", metric))
+        for disease, (surfaces, _) in DISEASE_SYNONYMS.items():
+            for surface in surfaces:
+                self._automaton.add(normalize_mention(surface), ("disease", disease))
+        for category in self.categories:
+            if category in {"未分类", "其他"}:
+                continue
+            for surface in [category] + CATEGORY_SYNONYMS.get(category, []):
+                self._automaton.add(normalize_mention(surface), ("category", category))
+        self._automaton.build()
+
+    def extract_slots(self, question: str) -> QuestionSlots:
+        """抽取问题中的槽位"""
+        text = normalize_mention(question)
+        slots = QuestionSlots()
+
+        for start, end, surface, (slot, value) in self._automaton.find_longest(text):
+            if slot == "drug":
+                slots.drug_mentions.append(text[start:end])
+                slots.drug_ids.extend(i for i in value if i not in slots.drug_ids)
+            else:
+                target = {"metric": slots.metrics, "disease": slots.diseases, "category": slots.categories}[slot]
+                if value not in target:
+                    target.append(value)
+
+        for op, number in _OPERATOR_PATTERN.findall(question):
+            slots.operators.append((_OPERATOR_MAP[op], float(number)))
+        slots.numbers = [float(n) for n in re.findall(r'(?<![A-Za-z\-])(\d+(?:\.\d+)?)(?!型)', question)]
+        return slots
+
+    def match(self, question: str) -> Optional[TemplateMatch]:
+        """
+        匹配模板；无法可靠匹配时返回 None（由 LLM 生成 Cypher）
+        """
+        if any(marker in question for marker in UNSUPPORTED_MARKERS):
+            return None
+
+        slots = self.extract_slots(question)
+        if len(slots.metrics) > 1 or len(slots.diseases) > 1 or len(slots.categories) > 1:
+            return None
+        if len(slots.operators) > 1 or len(slots.numbers) > len(slots.operators):
+            return None
+
+        filled = slots.filled()
+        for template in TEMPLATES:
+            if any(not filled[s] for s in template.required):
+                continue
+            if any(filled[s] for s in filled if s not in template.required):
+                continue
+            if not any(cue in question for cue in template.cues):
+                continue
+            return TemplateMatch(
+                intent=template.intent,
+                pattern=template.pattern,
+                cypher=template.cypher,
+                params=self._build_params(slots),
+                slots=slots,
+            )
+        return None
+
+    def _build_params(self, slots: QuestionSlots) -> Dict[str, Any]:
+        params: Dict[str, Any] = {}
+        if slots.drug_ids:
+            params["drug_ids"] = list(slots.drug_ids)
+        if slots.metrics:
+            params["metric"] = slots.metrics[0]
+        if slots.operators:
+            params["operator"], params["threshold"] = slots.operators[0]
+        if slots.diseases:
+            params["disease_keywords"] = DISEASE_SYNONYMS[slots.diseases[0]][1]
+        if slots.categories:
+            params["category"] = slots.categories[0]
+        return params
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Few-shot 示例索引 (Few-shot Example Index)
+示例库在加载时一次性完成分词和向量化，查询时只对问题本身分词/编码，
+通过一次矩阵乘法给全部示例打分，取最相关的 top-k 写入 Prompt
+
+打分方式:
+1. 词法（默认）: 示例关键词集合展开为加权 0/1 矩阵，问题关键词向量与之相乘
+   得到加权交集分数，与原先逐条 jieba 比较的结果一致
+2. 向量（FEW_SHOT_EMBEDDING=true 或传入 embed_fn）: 示例问题预先编码并归一化，
+   问题向量与之相乘得到余弦相似度；编码失败时回退到词法打分
+"""
+
+import os
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import jieba
+import numpy as np
+
+
+EmbedFn = Callable[[List[str]], "np.ndarray"]
+
+
+def load_bge_m3_embed_fn() -> EmbedFn:
+    """加载 BGE-M3 稠密向量编码函数（模型名读取 EmbeddingConfig）"""
+    from FlagEmbedding import BGEM3FlagModel
+    from ..config import EmbeddingConfig
+
+    config = EmbeddingConfig()
+    model = BGEM3FlagModel(config.model_name, use_fp16=config.use_fp16)
+    return lambda texts: model.encode(list(texts))['dense_vecs']
+
+
+class FewShotExampleIndex:
+    """
+    Few-shot 示例向量索引
+
+    Usage:
+        index = FewShotExampleIndex(examples, keyword_weights={'eGFR': 3})
+        index.select("eGFR小于30禁用哪些药", top_k=3)
+    """
+
+    def __init__(
+        self,
+        examples: Sequence[Dict],
+        keyword_weights: Optional[Dict[str, float]] = None,
+        embed_fn: Optional[EmbedFn] = None,
+        use_embeddings: Optional[bool] = None
+    ):
+        """
+        Args:
+            examples: 示例列表（每项至少包含 question）
+            keyword_weights: 关键词权重（问题中出现即计入，未列出的词权重为 1）
+            embed_fn: 文本列表 -> 向量矩阵（None 且启用向量打分时加载 BGE-M3）
+            use_embeddings: 是否使用向量打分（None=读取 FEW_SHOT_EMBEDDING，默认关闭）
+        """
+        self.examples = list(examples)
+        self.keyword_weights = dict(keyword_weights or {})
+        self._lowered_keywords = [(kw, kw.lower()) for kw in self.keyword_weights]
+
+        # 词法索引: 原始分词集合（用于 Jaccard）+ 加权关键词矩阵
+        self._tokens: List[Set[str]] = [self.tokenize(ex['question']) for ex in self.examples]
+        keyword_sets = [self._expand(tokens, ex['question']) for tokens, ex in zip(self._tokens, self.examples)]
+        self._vocab: Dict[str, int] = {}
+        for keywords in keyword_sets:
+            for word in sorted(keywords):
+                self._vocab.setdefault(word, len(self._vocab))
+
+        self._weights = np.array(
+            [self.keyword_weights.get(word, 1) for word in self._vocab], dtype=np.float32
+        )
+        self._matrix = np.zeros((len(self.examples), len(self._vocab)), dtype=np.float32)
+        for i, keywords in enumerate(keyword_sets):
+            self._matrix[i, [self._vocab[w] for w in keywords]] = 1.0
+        self._matrix *= self._weights
+        self._totals = self._matrix.sum(axis=1)
+
+        # 向量索引（可选）
+        if use_embeddings is None:
+            use_embeddings = embed_fn is not None or \
+                os.getenv("FEW_SHOT_EMBEDDING", "false").lower() == "true"
+        self.embed_fn = None
+        self._embeddings = None
+        if use_embeddings and self.examples:
+            try:
+                self.embed_fn = embed_fn or load_bge_m3_embed_fn()
+                self._embeddings = self._normalize(self.embed_fn([ex['question'] for ex in self.examples]))
+            except Exception as e:
+                print(f"⚠️  示例向量化失败，使用关键词打分: {e}")
+                self.embed_fn = None
+                self._embeddings = None
+
+    @property
+    def uses_embeddings(self) -> bool:
+        return self._embeddings is not None
+
+    @staticmethod
+    def tokenize(text: str) -> Set[str]:
+        return set(jieba.cut(text))
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix[None, :]
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def _expand(self, tokens: Set[str], text: str) -> Set[str]:
+        """分词结果 + 原文中出现的加权关键词"""
+        lowered = text.lower()
+        return tokens | {kw for kw, low in self._lowered_keywords if low in lowered}
+
+    def keywords(self, text: str) -> Set[str]:
+        return self._expand(self.tokenize(text), text)
+
+    def _query_vector(self, keywords: Set[str]) -> Tuple[np.ndarray, float]:
+        """问题关键词 -> 词表上的 0/1 向量，以及问题关键词的权重总和（含词表外的词）"""
+        vector = np.zeros(len(self._vocab), dtype=np.float32)
+        total = 0.0
+        for word in keywords:
+            total += self.keyword_weights.get(word, 1)
+            position = self._vocab.get(word)
+            if position is not None:
+                vector[position] = 1.0
+        return vector, total
+
+    def overlap_scores(self, question: str) -> np.ndarray:
+        """每个示例与问题的加权关键词交集分数"""
+        vector, _ = self._query_vector(self.keywords(question))
+        return self._matrix @ vector
+
+    def weighted_jaccard(self, question: str) -> np.ndarray:
+        """每个示例与问题的加权 Jaccard 相似度"""
+        vector, total = self._query_vector(self.keywords(question))
+        intersection = self._matrix @ vector
+        union = self._totals + total - intersection
+        return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+    def similarity_scores(self, question: str) -> np.ndarray:
+        """选取示例用的分数: 有向量索引时为余弦相似度，否则为加权交集分数"""
+        if self._embeddings is not None:
+            try:
+                query = self._normalize(self.embed_fn([question]))[0]
+                return self._embeddings @ query
+            except Exception as e:
+                print(f"⚠️  问题向量化失败，使用关键词打分: {e}")
+        return self.overlap_scores(question)
+
+    def search(self, question: str, top_k: int = 3) -> List[Tuple[int, float]]:
+        """返回 [(示例下标, 分数), ...]，分数降序，同分保持示例原顺序"""
+        if not self.examples or top_k <= 0:
+            return []
+        scores = self.similarity_scores(question)
+        order = np.argsort(-scores, kind="stable")[:top_k]
+        return [(int(i), float(scores[i])) for i in order]
+
+    def select(self, question: str, top_k: int = 3) -> List[Dict]:
+        """最相关的 top_k 个示例"""
+        return [self.examples[i] for i, _ in self.search(question, top_k)]
+
+    def best_match(self, question: str) -> Tuple[Optional[Dict], float]:
+        """加权 Jaccard 最高的示例及其分数（同分取靠前的示例）"""
+        if not self.examples:
+            return None, 0.0
+        scores = self.weighted_jaccard(question)
+        best = int(np.argmax(scores))
+        return self.examples[best], float(scores[best])
+
+    def jaccard(self, question: str, position: int) -> float:
+        """问题与第 position 个示例的分词 Jaccard 相似度（示例分词已缓存）"""
+        words = self.tokenize(question)
+        example_words = self._tokens[position]
+        union = len(words | example_words)
+        return len(words & example_words) / union if union > 0 else 0.0
+
+    def __len__(self) -> int:
+        return len(self.examples)
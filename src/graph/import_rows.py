@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图谱导入行 (Import Rows)
+将 graph_data 条目转换为按节点/关系类型区分的参数行，是导入语义的唯一实现，供以下组件共用:
+- CypherGenerator.generate_bulk_csv（neo4j-admin CSV）
+- scripts/import_neo4j.py（UNWIND 批量导入 / 增量更新）
+- ContraindicationRuleEngine.compile_graph_data（内存禁忌规则）
+
+与逐条执行 import_graph.cypher 得到的图谱一致:
+- Drug.name 唯一约束：同名药品只保留第一次出现的条目，后续条目只创建 Brand/Category/Disease 节点，不创建关系
+- Disease 节点按 (name, type) 合并；TREATS/FORBIDDEN_FOR 按名称 MATCH，会连到当时已存在的全部同名节点
+- CONTRAINDICATED_IF 按 (药品, 指标, 属性) 合并，指标必须是已定义的 Metric 节点
+"""
+
+import json
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Tuple, Union
+
+
+# 临床指标节点定义
+METRIC_DEFINITIONS = {
+    'eGFR': '肾小球滤过率',
+    'CrCl': '肌酐清除率',
+    'ALT': '丙氨酸氨基转移酶',
+    'AST': '天冬氨酸氨基转移酶',
+    'BMI': '体重指数',
+}
+
+# 药品节点上的剂量属性
+DOSAGE_PROPERTIES = ('max_daily_dose', 'starting_dose', 'timing', 'route')
+
+# FORBIDDEN_FOR 关系的固定严重程度
+FORBIDDEN_SEVERITY = '禁忌'
+
+# Disease 节点类型（TREATS 连到适应症节点，FORBIDDEN_FOR 连到禁忌节点）
+DISEASE_RELATIONS = (("treats", '适应症', 'treats'), ("forbidden_for", '禁忌', 'forbidden_diseases'))
+
+
+def iter_graph_data(path: Union[str, Path]) -> Iterator[Dict[str, Any]]:
+    """逐条读取图谱数据：.jsonl（graph_data.jsonl）逐行流式读取，其他按 JSON 数组读取"""
+    if str(path).endswith(".jsonl"):
+        from ..data.pipeline import iter_jsonl
+        yield from iter_jsonl(str(path))
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        yield from json.load(f)
+
+
+def metric_rows() -> List[Dict[str, Any]]:
+    """Metric 节点行（固定定义，与图谱数据无关）"""
+    return [
+        {"name": name, "full_name": full_name, "unit": 'mL/min' if name in ['eGFR', 'CrCl'] else ''}
+        for name, full_name in METRIC_DEFINITIONS.items()
+    ]
+
+
+def iter_import_rows(graph_data: Iterable[Dict[str, Any]]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    按条目顺序流式产出 (类型, 参数行)
+
+    类型: drugs / brands / categories / diseases（节点，只在第一次出现时产出）、
+          is_brand_of / belongs_to / treats / forbidden_for / contraindicated_if（关系，只属于同名药品的第一个条目）
+    Metric 节点不在此产出，见 metric_rows()
+    """
+    owners = set()
+    brands = set()
+    categories = set()
+    disease_types: Dict[str, List[str]] = {}
+
+    for item in graph_data:
+        drug = item['drug']
+        drug_id = str(drug['id'])
+        owner = drug['name'] not in owners
+        edges = set()
+
+        def edge(kind: str, row: Dict[str, Any]):
+            key = (kind, tuple(sorted(row.items())))
+            if owner and key not in edges:
+                edges.add(key)
+                return [(kind, row)]
+            return []
+
+        if owner:
+            owners.add(drug['name'])
+            props = {"id": drug_id, "name": drug['name'], "en_name": drug.get('en_name', '') or ''}
+            dosage_info = drug.get('dosage_info', {})
+            props.update({key: dosage_info[key] for key in DOSAGE_PROPERTIES if dosage_info.get(key)})
+            yield "drugs", {"name": drug['name'], "props": props}
+
+        for brand in item.get('brands', []):
+            if brand:
+                if brand not in brands:
+                    brands.add(brand)
+                    yield "brands", {"name": brand}
+                yield from edge("is_brand_of", {"drug_id": drug_id, "brand": brand})
+
+        category = item.get('category', '未分类')
+        if category not in categories:
+            categories.add(category)
+            yield "categories", {"name": category}
+        yield from edge("belongs_to", {"drug_id": drug_id, "category": category})
+
+        for kind, disease_type, key in DISEASE_RELATIONS:
+            for disease in item.get(key, []):
+                types = disease_types.setdefault(disease['name'], [])
+                if disease_type not in types:
+                    types.append(disease_type)
+                    yield "diseases", {"name": disease['name'], "type": disease_type}
+                for existing_type in types:
+                    yield from edge(kind, {"drug_id": drug_id, "disease": disease['name'], "type": existing_type})
+
+        for constraint in item.get('metric_constraints', []):
+            if constraint['metric'] not in METRIC_DEFINITIONS:
+                continue
+            row = {
+                "drug_id": drug_id,
+                "metric": constraint['metric'],
+                "operator": constraint['operator'],
+                "severity": str(constraint.get('severity', 'WARNING')),
+            }
+            if 'value' in constraint:
+                row["value"] = constraint['value']
+            if 'value_min' in constraint:
+                row["value_min"] = constraint['value_min']
+                row["value_max"] = constraint['value_max']
+            if constraint.get('unit'):
+                row["unit"] = constraint['unit']
+            yield from edge("contraindicated_if", row)
+
+
+def group_import_rows(graph_data: Iterable[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """将 iter_import_rows 的结果按类型分组（含 Metric 节点，Category 按名称排序）"""
+    rows: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    rows["metrics"] = metric_rows()
+    for kind, row in iter_import_rows(graph_data):
+        rows[kind].append(row)
+    rows["categories"].sort(key=lambda row: row["name"])
+    return dict(rows)
@@ -3,9 +3,10 @@
 """
 LangChain Text-to-Cypher 检索器
 基于 LangChain 实现的增强版 Text-to-Cypher，支持：
-1. Schema 信息注入到 Prompt
-2. Few-shot 示例动态选择
-3. 查询失败回退机制
+1. 常见问题直接使用参数化意图模板（无需 LLM）
+2. Schema 信息注入到 Prompt
+3. Few-shot 示例动态选择
+4. 查询失败回退机制
 """
 
 import json
@@ -13,9 +14,15 @@ import os
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Any, Callable
 from dataclasses import dataclass
-from neo4j import GraphDatabase
 import re
 
+from ..llm_metrics import llm_call_tag
+from ..graph_client import GraphClient, get_graph_client
+from ..prompt_builder import PromptBuilder
+from ..cypher_validator import CypherValidator
+from .cypher_templates import CypherTemplateLibrary
+from .few_shot_index import EmbedFn, FewShotExampleIndex
+
 # 项目根目录
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 
@@ -28,7 +35,8 @@ class CypherResult:
     results: List[Dict] = None
     error: Optional[str] = None
     fallback_used: bool = False
-    source: str = "llm"  # "llm", "example_match", "fallback"
+    source: str = "llm"  # "template", "llm", "example_match", "fallback"
+    params: Optional[Dict[str, Any]] = None
     
     def __post_init__(self):
         if self.results is None:
@@ -40,9 +48,10 @@ class LangChainCypherRetriever:
     LangChain 增强的 Text-to-Cypher 检索器
     
     特点:
-    1. Prompt 包含完整 Schema 信息
-    2. 动态选择最相关的 Few-shot 示例
-    3. 多层回退机制（LLM -> 示例匹配 -> 预定义模板）
+    1. 常见意图直接填充参数化模板
+    2. Prompt 包含完整 Schema 信息
+    3. 动态选择最相关的 Few-shot 示例
+    4. 多层回退机制（意图模板 -> LLM -> 示例匹配 -> 预定义模板）
     """
     
     # 预定义的回退查询模板
@@ -69,6 +78,20 @@ LIMIT 50"""
         }
     }
     
+    # 示例选择的关键词权重
+    EXAMPLE_KEYWORD_WEIGHTS = {
+        'eGFR': 3, 'egfr': 3, '肾功能': 3,
+        '小于': 2, '<': 2, '大于': 2, '>': 2,
+        '禁用': 3, '禁忌': 3, '不能': 2,
+        '药物': 2, '药品': 2, '哪些': 1,
+        '双胍': 3, 'SGLT2': 3, 'GLP-1': 3, 'DPP-4': 3,
+        '分类': 2, '类型': 2, '属于': 2,
+        '心力衰竭': 3, '肝功能': 3,
+        '二甲双胍': 3, '格列': 2,
+        '30': 2, '45': 2, '60': 2,
+        '监测': 2, '调整': 2, '剂量': 2,
+    }
+    
     def __init__(
         self,
         schema_path: str = None,
@@ -76,7 +99,12 @@ LIMIT 50"""
         neo4j_uri: str = "bolt://localhost:7687",
         neo4j_user: str = "neo4j",
         neo4j_password: str = "password123",
-        llm_api: Callable[[str], str] = None
+        llm_api: Callable[[str], str] = None,
+        graph_client: Optional[GraphClient] = None,
+        template_library: Optional[CypherTemplateLibrary] = None,
+        use_templates: Optional[bool] = None,
+        embed_fn: Optional[EmbedFn] = None,
+        use_example_embeddings: Optional[bool] = None
     ):
         """
         初始化检索器
@@ -88,6 +116,11 @@ LIMIT 50"""
             neo4j_user: Neo4j 用户名
             neo4j_password: Neo4j 密码
             llm_api: LLM API 调用函数 (接收 prompt, 返回响应文本)
+            graph_client: 共享图数据库客户端（None=按连接参数从 get_graph_client 获取）
+            template_library: 意图模板库（None=按需创建）
+            use_templates: 是否优先使用意图模板（None=读取 CYPHER_TEMPLATES_ENABLED，默认启用）
+            embed_fn: 示例选择使用的文本编码函数（None=按 FEW_SHOT_EMBEDDING 加载 BGE-M3）
+            use_example_embeddings: 是否按向量相似度选择示例（None=读取 FEW_SHOT_EMBEDDING，默认关键词打分）
         """
         # 默认路径
         if schema_path is None:
@@ -106,24 +139,43 @@ LIMIT 50"""
             examples_data = json.load(f)
             self.examples = examples_data['examples']
             self.prompt_template = examples_data['prompt_template']
-        
-        # 连接 Neo4j
-        self.driver = None
-        print(f"🔌 连接 Neo4j: {neo4j_uri}")
-        try:
-            self.driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
-            self.driver.verify_connectivity()
+        self.example_index = FewShotExampleIndex(
+            self.examples, self.EXAMPLE_KEYWORD_WEIGHTS,
+            embed_fn=embed_fn, use_embeddings=use_example_embeddings
+        )
+        
+        # 连接 Neo4j（与其他组件共享驱动）
+        self.graph_client = graph_client or get_graph_client(neo4j_uri, neo4j_user, neo4j_password)
+        print(f"🔌 连接 Neo4j: {self.graph_client.uri}")
+        if self.graph_client.verify():
             print("✅ Neo4j 连接成功")
-        except Exception as e:
-            print(f"⚠️  Neo4j 连接失败: {e}")
-            print("   查询将使用回退模式")
+        else:
+            print(f"⚠️  Neo4j 连接失败: {self.graph_client.last_error}")
+            print("   查询将使用回退模式（每次查询重新检查连接）")
         
         # LLM API
         self.llm_api = llm_api
         
+        # 意图模板库
+        if use_templates is None:
+            use_templates = os.getenv("CYPHER_TEMPLATES_ENABLED", "true").lower() == "true"
+        self.template_library = template_library
+        if self.template_library is None and use_templates:
+            try:
+                self.template_library = CypherTemplateLibrary()
+            except Exception as e:
+                print(f"⚠️  意图模板库加载失败: {e}")
+        
         # 构建 Schema 描述字符串（用于 Prompt）
         self.schema_description = self._build_schema_description()
         
+        # Prompt 静态前缀缓存（Schema、规则、选中的示例只格式化一次）
+        self.prompt_builder = PromptBuilder()
+        self.prompt_version = PromptBuilder.fingerprint(self.schema, examples_data)
+        
+        # Cypher 校验（词法检查 + LIMIT 注入 + EXPLAIN，按查询形状缓存）
+        self.cypher_validator = CypherValidator()
+        
         print("✅ LangChain Cypher 检索器初始化完成")
     
     def _build_schema_description(self) -> str:
@@ -155,94 +207,50 @@ LIMIT 50"""
     def _select_relevant_examples(self, question: str, top_k: int = 3) -> List[Dict]:
         """
         基于问题相似度选择最相关的 Few-shot 示例
-        使用关键词权重匹配
+        示例在初始化时已建立索引，这里只对问题分词/编码一次
         """
-        import jieba
-        
-        # 关键词权重
-        KEYWORD_WEIGHTS = {
-            'eGFR': 3, 'egfr': 3, '肾功能': 3,
-            '小于': 2, '<': 2, '大于': 2, '>': 2,
-            '禁用': 3, '禁忌': 3, '不能': 2,
-            '药物': 2, '药品': 2, '哪些': 1,
-            '双胍': 3, 'SGLT2': 3, 'GLP-1': 3, 'DPP-4': 3,
-            '分类': 2, '类型': 2, '属于': 2,
-            '心力衰竭': 3, '肝功能': 3,
-            '二甲双胍': 3, '格列': 2,
-            '30': 2, '45': 2, '60': 2,
-            '监测': 2, '调整': 2, '剂量': 2,
-        }
-        
-        def extract_keywords(text):
-            words = set(jieba.cut(text))
-            # 添加特殊关键词
-            for kw in KEYWORD_WEIGHTS.keys():
-                if kw.lower() in text.lower():
-                    words.add(kw)
-            return words
-        
-        def calculate_score(q1, q2):
-            kw1 = extract_keywords(q1)
-            kw2 = extract_keywords(q2)
-            intersection = kw1 & kw2
-            if not intersection:
-                return 0
-            return sum(KEYWORD_WEIGHTS.get(w, 1) for w in intersection)
-        
-        # 计算每个示例的相似度分数
-        scored_examples = []
-        for example in self.examples:
-            score = calculate_score(question, example['question'])
-            scored_examples.append((score, example))
-        
-        # 按分数排序，返回 top_k
-        scored_examples.sort(key=lambda x: x[0], reverse=True)
-        return [ex for _, ex in scored_examples[:top_k]]
+        return self.example_index.select(question, top_k)
     
     def _build_prompt(self, question: str, num_examples: int = 3) -> str:
         """
         构建完整的 Prompt
         包含: System Prompt + Schema + Few-shot Examples + User Question
         """
-        # System Prompt
-        system_prompt = self.prompt_template.get('system', '').format(schema=self.schema_description)
-        
         # 选择相关示例
-        selected_examples = self._select_relevant_examples(question, num_examples)
+        positions = tuple(i for i, _ in self.example_index.search(question, num_examples))
+        
+        # 静态前缀: System Prompt + Schema + 示例，同一组示例逐字节一致
+        prefix = self.prompt_builder.prefix(
+            (self.prompt_version, positions), lambda: self._render_prompt_prefix(positions)
+        )
+        
+        # User Question
+        user_prompt = self.prompt_template.get('user_template', '').format(user_question=question)
+        return prefix + user_prompt
+    
+    def _render_prompt_prefix(self, positions: Tuple[int, ...]) -> str:
+        system_prompt = self.prompt_builder.prefix(
+            (self.prompt_version, "system"),
+            lambda: self.prompt_template.get('system', '').format(schema=self.schema_description)
+        )
         
-        # 格式化示例
         examples_text = ""
-        for i, ex in enumerate(selected_examples, 1):
+        for i, position in enumerate(positions, 1):
+            ex = self.examples[position]
             examples_text += self.prompt_template.get('few_shot_format', '').format(
                 index=i,
                 question=ex['question'],
                 cypher=ex['cypher'],
                 explanation=ex.get('explanation', '')
             )
-        
-        # User Question
-        user_prompt = self.prompt_template.get('user_template', '').format(user_question=question)
-        
-        # 组合完整 Prompt
-        full_prompt = f"{system_prompt}\n\n{examples_text}\n{user_prompt}"
-        
-        return full_prompt
+        return f"{system_prompt}\n\n{examples_text}\n"
     
-    def _validate_cypher(self, cypher: str) -> Tuple[bool, str]:
-        """验证 Cypher 安全性"""
-        FORBIDDEN = ['CREATE', 'DELETE', 'REMOVE', 'SET', 'MERGE', 'DROP', 'DETACH', 'ALTER']
-        cypher_upper = cypher.upper()
-        
-        for kw in FORBIDDEN:
-            if kw in cypher_upper:
-                return False, f"检测到危险操作: {kw}"
-        
-        if 'MATCH' not in cypher_upper:
-            return False, "缺少 MATCH 子句"
-        if 'RETURN' not in cypher_upper:
-            return False, "缺少 RETURN 子句"
-        
-        return True, ""
+    def _validate_cypher(self, cypher: str, params: Optional[Dict[str, Any]] = None) -> Tuple[bool, str]:
+        """验证 Cypher 安全性（Neo4j 可用时同时检查 EXPLAIN 执行计划）"""
+        validation = self.cypher_validator.validate(
+            cypher, params, explain=self.graph_client.explain if self.driver else None
+        )
+        return validation.valid, validation.error
     
     def _extract_cypher(self, text: str) -> str:
         """从 LLM 输出中提取 Cypher 代码"""
@@ -260,14 +268,15 @@ LIMIT 50"""
         # 如果没有代码块，返回原文本
         return text.strip()
     
-    def _execute_cypher(self, cypher: str) -> List[Dict]:
-        """执行 Cypher 查询"""
+    def _execute_cypher(self, cypher: str, params: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        """执行 Cypher 查询（先校验并限制返回行数，只读结果按图谱版本缓存）"""
         if not self.driver:
             raise RuntimeError("Neo4j 未连接")
         
-        with self.driver.session() as session:
-            result = session.run(cypher)
-            return [record.data() for record in result]
+        validation = self.cypher_validator.validate(cypher, params, explain=self.graph_client.explain)
+        if not validation.valid:
+            raise ValueError(f"Cypher 校验失败: {validation.error}")
+        return self.graph_client.query(validation.cypher, params)
     
     def _find_fallback_template(self, question: str) -> Optional[str]:
         """根据问题找到合适的回退模板"""
@@ -290,6 +299,7 @@ LIMIT 50"""
         执行 Text-to-Cypher 查询
         
         回退策略:
+        0. 命中意图模板时直接填充参数（不调用 LLM）
         1. 尝试使用 LLM 生成 Cypher
         2. 如果 LLM 失败，尝试从示例库匹配
         3. 如果示例匹配失败，使用预定义模板
@@ -306,14 +316,24 @@ LIMIT 50"""
         print(f"{'='*60}")
         
         cypher = None
+        params = None
         source = "llm"
         
+        # 步骤0: 意图模板
+        if self.template_library:
+            match = self.template_library.match(question)
+            if match:
+                cypher, params = match.cypher, match.params
+                source = "template"
+                print(f"🧩 [步骤0] 命中意图模板: {match.intent} {params}")
+        
         # 步骤1: 尝试使用 LLM 生成
-        if use_llm and self.llm_api:
+        if cypher is None and use_llm and self.llm_api:
             print("🤖 [步骤1] 使用 LLM 生成 Cypher...")
             try:
                 prompt = self._build_prompt(question)
-                response = self.llm_api(prompt)
+                with llm_call_tag("langchain_cypher"):
+                    response = self.llm_api(prompt)
                 cypher = self._extract_cypher(response)
                 
                 # 验证
@@ -331,10 +351,11 @@ LIMIT 50"""
         # 步骤2: 尝试从示例库匹配
         if cypher is None:
             print("📚 [步骤2] 从示例库匹配...")
-            selected = self._select_relevant_examples(question, top_k=1)
-            if selected and self._calculate_similarity(question, selected[0]['question']) > 0.2:
-                cypher = selected[0]['cypher']
-                print(f"  ✅ 匹配到示例: {selected[0]['question'][:40]}...")
+            hits = self.example_index.search(question, top_k=1)
+            if hits and self.example_index.jaccard(question, hits[0][0]) > 0.2:
+                example = self.examples[hits[0][0]]
+                cypher = example['cypher']
+                print(f"  ✅ 匹配到示例: {example['question'][:40]}...")
                 source = "example_match"
             else:
                 print("  ⚠️ 未找到足够相似的示例")
@@ -363,11 +384,12 @@ LIMIT 50"""
                 success=False,
                 cypher=cypher,
                 error="Neo4j 未连接",
-                source=source
+                source=source,
+                params=params
             )
         
         try:
-            results = self._execute_cypher(cypher)
+            results = self._execute_cypher(cypher, params)
             print(f"  ✅ 查询成功，返回 {len(results)} 条结果")
             
             return CypherResult(
@@ -375,7 +397,8 @@ LIMIT 50"""
                 cypher=cypher,
                 results=results,
                 source=source,
-                fallback_used=(source != "llm")
+                fallback_used=(source not in ("llm", "template")),
+                params=params
             )
         except Exception as e:
             print(f"  ❌ 查询执行失败: {e}")
@@ -383,28 +406,20 @@ LIMIT 50"""
                 success=False,
                 cypher=cypher,
                 error=str(e),
-                source=source
+                source=source,
+                params=params
             )
     
-    def _calculate_similarity(self, q1: str, q2: str) -> float:
-        """计算两个问题的相似度"""
-        import jieba
-        
-        words1 = set(jieba.cut(q1))
-        words2 = set(jieba.cut(q2))
-        
-        intersection = len(words1 & words2)
-        union = len(words1 | words2)
-        
-        return intersection / union if union > 0 else 0
+    @property
+    def driver(self):
+        """Neo4j 驱动（每次查询前经 graph_client.verify() 检查，未连接时为 None）"""
+        if self.graph_client and self.graph_client.verify():
+            return self.graph_client.driver
+        return None
     
     def close(self):
-        """关闭连接"""
-        if self.driver:
-            self.driver.close()
-    
-    def __del__(self):
-        self.close()
+        """释放连接（共享驱动由 close_graph_clients 统一关闭）"""
+        self.graph_client = None
 
 
 # ============================================
@@ -6,20 +6,45 @@ Text-to-Cypher 引擎 - 自然语言转 Neo4j 查询
 
 import json
 import os
-from typing import Dict, List, Optional, Tuple
-from neo4j import GraphDatabase
+from typing import Any, Dict, List, Optional, Tuple
 import re
 
+from ..llm_metrics import llm_call_tag
+from ..graph_client import GraphClient, get_graph_client
+from ..prompt_builder import PromptBuilder
+from ..cypher_validator import CypherValidator, check_read_only_cypher
+from .cypher_templates import CypherTemplateLibrary
+from .few_shot_index import EmbedFn, FewShotExampleIndex
+
 
 class TextToCypherEngine:
     """Text-to-Cypher 转换引擎"""
     
+    # 重要关键词及其权重（示例选择与示例匹配共用）
+    KEYWORD_WEIGHTS = {
+        'eGFR': 3, 'egfr': 3, 'EGFR': 3,
+        '小于': 2, '<': 2, '大于': 2, '>': 2,
+        '禁用': 3, '禁忌': 3, '不能': 2, '不可': 2,
+        '药物': 2, '药品': 2, '哪些': 1,
+        '双胍': 3, 'SGLT2': 3, 'GLP-1': 3, '磺脲': 3,
+        '分类': 2, '类型': 2, '属于': 2,
+        '心力衰竭': 3, '肾功能': 3, '肝功能': 3,
+        '二甲双胍': 3, '格列': 2,
+        '30': 2, '45': 2, '60': 2,
+        '适应症': 2, '治疗': 2,
+    }
+    
     def __init__(self, 
                  schema_path: str = "schema.json",
                  examples_path: str = "text_to_cypher_examples.json",
                  neo4j_uri: str = "bolt://localhost:7687",
                  neo4j_user: str = "neo4j",
-                 neo4j_password: str = "password123"):
+                 neo4j_password: str = "password123",
+                 graph_client: Optional[GraphClient] = None,
+                 template_library: Optional[CypherTemplateLibrary] = None,
+                 use_templates: Optional[bool] = None,
+                 embed_fn: Optional[EmbedFn] = None,
+                 use_example_embeddings: Optional[bool] = None):
         """
         初始化 Text-to-Cypher 引擎
         
@@ -29,6 +54,11 @@ class TextToCypherEngine:
             neo4j_uri: Neo4j 连接 URI
             neo4j_user: 用户名
             neo4j_password: 密码
+            graph_client: 共享图数据库客户端（None=按连接参数从 get_graph_client 获取）
+            template_library: 意图模板库（None=按需创建）
+            use_templates: 是否优先使用意图模板（None=读取 CYPHER_TEMPLATES_ENABLED，默认启用）
+            embed_fn: 示例选择使用的文本编码函数（None=按 FEW_SHOT_EMBEDDING 加载 BGE-M3）
+            use_example_embeddings: 是否按向量相似度选择示例（None=读取 FEW_SHOT_EMBEDDING，默认关键词打分）
         """
         print("🔧 初始化 Text-to-Cypher 引擎...")
         
@@ -41,23 +71,48 @@ class TextToCypherEngine:
             self.examples_data = json.load(f)
             self.examples = self.examples_data['examples']
             self.prompt_template = self.examples_data['prompt_template']
+        self.example_index = FewShotExampleIndex(
+            self.examples, self.KEYWORD_WEIGHTS,
+            embed_fn=embed_fn, use_embeddings=use_example_embeddings
+        )
         
-        # 连接 Neo4j
-        try:
-            self.driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
-            self.driver.verify_connectivity()
+        # Prompt 静态前缀缓存（Schema、规则、选中的示例只格式化一次）
+        self.prompt_builder = PromptBuilder()
+        self.prompt_version = PromptBuilder.fingerprint(self.schema, self.examples_data)
+        
+        # Cypher 校验（词法检查 + LIMIT 注入 + EXPLAIN，按查询形状缓存）
+        self.cypher_validator = CypherValidator()
+        
+        # 连接 Neo4j（与其他组件共享驱动）
+        self.graph_client = graph_client or get_graph_client(neo4j_uri, neo4j_user, neo4j_password)
+        if self.graph_client.verify():
             print("✅ Neo4j 连接成功")
-        except Exception as e:
-            print(f"⚠️  Neo4j 连接失败: {e}")
-            print("   Text-to-Cypher 功能将受限（可生成但无法执行）")
-            self.driver = None
+        else:
+            print(f"⚠️  Neo4j 连接失败: {self.graph_client.last_error}")
+            print("   Text-to-Cypher 功能将受限（可生成但无法执行，连接恢复后自动可用）")
+        
+        # 意图模板库（常见问题无需调用 LLM）
+        if use_templates is None:
+            use_templates = os.getenv("CYPHER_TEMPLATES_ENABLED", "true").lower() == "true"
+        self.template_library = template_library
+        if self.template_library is None and use_templates:
+            try:
+                self.template_library = CypherTemplateLibrary()
+            except Exception as e:
+                print(f"⚠️  意图模板库加载失败: {e}")
         
         print("✅ Text-to-Cypher 引擎就绪")
     
-    def __del__(self):
-        """关闭连接"""
-        if self.driver:
-            self.driver.close()
+    @property
+    def driver(self):
+        """当前可用的 Neo4j 驱动（按请求检查连接，不可用时为 None）"""
+        if self.graph_client and self.graph_client.verify():
+            return self.graph_client.driver
+        return None
+    
+    def close(self):
+        """释放连接（共享驱动由 close_graph_clients 统一关闭）"""
+        self.graph_client = None
     
     def build_few_shot_prompt(self, user_question: str, num_examples: int = 3) -> str:
         """
@@ -70,26 +125,36 @@ class TextToCypherEngine:
         Returns:
             完整的 Prompt
         """
-        # 系统 Prompt（包含 Schema）
-        schema_str = json.dumps(self.schema, ensure_ascii=False, indent=2)
-        system_prompt = self.prompt_template['system'].format(schema=schema_str)
+        # Few-shot 示例（从示例索引中选择与问题最相关的示例）
+        positions = tuple(i for i, _ in self.example_index.search(user_question, num_examples))
+        
+        # 静态前缀: 系统 Prompt（包含 Schema）+ 示例，同一组示例逐字节一致
+        prefix = self.prompt_builder.prefix(
+            (self.prompt_version, positions), lambda: self._render_prompt_prefix(positions)
+        )
+        
+        # 用户问题
+        user_prompt = self.prompt_template['user_template'].format(user_question=user_question)
+        return prefix + user_prompt
+    
+    def _render_prompt_prefix(self, positions: Tuple[int, ...]) -> str:
+        system_prompt = self.prompt_builder.prefix(
+            (self.prompt_version, "system"),
+            lambda: self.prompt_template['system'].format(
+                schema=json.dumps(self.schema, ensure_ascii=False, indent=2)
+            )
+        )
         
-        # Few-shot 示例（简化版，实际应用中可用向量检索选择最相关的示例）
         few_shot_examples = ""
-        for i, example in enumerate(self.examples[:num_examples], 1):
+        for i, position in enumerate(positions, 1):
+            example = self.examples[position]
             few_shot_examples += self.prompt_template['few_shot_format'].format(
                 index=i,
                 question=example['question'],
                 cypher=example['cypher'],
                 explanation=example['explanation']
             )
-        
-        # 用户问题
-        user_prompt = self.prompt_template['user_template'].format(user_question=user_question)
-        
-        # 组合完整 Prompt
-        full_prompt = f"{system_prompt}\n\n{few_shot_examples}\n{user_prompt}"
-        return full_prompt
+        return f"{system_prompt}\n\n{few_shot_examples}\n"
     
     @staticmethod
     def validate_cypher(cypher: str) -> Tuple[bool, str]:
@@ -102,26 +167,8 @@ class TextToCypherEngine:
         Returns:
             (是否安全, 错误信息)
         """
-        # 危险关键词黑名单
-        FORBIDDEN_KEYWORDS = [
-            'CREATE', 'DELETE', 'REMOVE', 'SET', 
-            'MERGE', 'DROP', 'DETACH', 'ALTER'
-        ]
-        
-        cypher_upper = cypher.upper()
-        
-        for keyword in FORBIDDEN_KEYWORDS:
-            if keyword in cypher_upper:
-                return False, f"检测到危险操作: {keyword}（仅允许只读查询）"
-        
-        # 必须包含 MATCH 和 RETURN
-        if 'MATCH' not in cypher_upper:
-            return False, "Cypher 必须包含 MATCH 子句"
-        
-        if 'RETURN' not in cypher_upper:
-            return False, "Cypher 必须包含 RETURN 子句"
-        
-        return True, ""
+        # 按 Cypher 词法识别关键字，属性名/别名/字符串中的同名单词不会误判
+        return check_read_only_cypher(cypher)
     
     def generate_cypher(self, user_question: str, llm_api_function=None) -> Optional[str]:
         """
@@ -145,7 +192,8 @@ class TextToCypherEngine:
         
         # 调用 LLM
         print("  🤖 调用 LLM 生成 Cypher...")
-        cypher = llm_api_function(prompt)
+        with llm_call_tag("text_to_cypher"):
+            cypher = llm_api_function(prompt)
         
         # 清理和提取 Cypher（去除可能的 Markdown 标记）
         cypher = self._extract_cypher(cypher)
@@ -158,51 +206,29 @@ class TextToCypherEngine:
         
         return cypher
     
+    def generate_parameterized_cypher(
+        self,
+        user_question: str,
+        llm_api_function=None
+    ) -> Tuple[Optional[str], Dict[str, Any], str]:
+        """
+        生成 Cypher 及其参数：优先使用意图模板，未命中时调用 generate_cypher
+        
+        Returns:
+            (Cypher, 参数, 来源)，来源为 "template" / "llm" / "example_match"
+        """
+        if self.template_library:
+            match = self.template_library.match(user_question)
+            if match:
+                print(f"  🧩 命中意图模板: {match.intent}")
+                return match.cypher, match.params, "template"
+        
+        source = "llm" if llm_api_function else "example_match"
+        return self.generate_cypher(user_question, llm_api_function), {}, source
+    
     def _match_from_examples(self, user_question: str) -> Optional[str]:
         """从示例库中匹配最相似的问题（使用jieba分词和关键词权重）"""
-        import jieba
-        
-        # 重要关键词及其权重
-        KEYWORD_WEIGHTS = {
-            'eGFR': 3, 'egfr': 3, 'EGFR': 3,
-            '小于': 2, '<': 2, '大于': 2, '>': 2,
-            '禁用': 3, '禁忌': 3, '不能': 2, '不可': 2,
-            '药物': 2, '药品': 2, '哪些': 1,
-            '双胍': 3, 'SGLT2': 3, 'GLP-1': 3, '磺脲': 3,
-            '分类': 2, '类型': 2, '属于': 2,
-            '心力衰竭': 3, '肾功能': 3, '肝功能': 3,
-            '二甲双胍': 3, '格列': 2,
-            '30': 2, '45': 2, '60': 2,
-            '适应症': 2, '治疗': 2,
-        }
-        
-        def extract_keywords(text):
-            """提取关键词"""
-            words = list(jieba.cut(text))
-            # 添加原文中的特殊关键词
-            for kw in KEYWORD_WEIGHTS.keys():
-                if kw.lower() in text.lower():
-                    words.append(kw)
-            return set(words)
-        
-        def calculate_similarity(q1, q2):
-            """计算问题相似度（加权Jaccard）"""
-            kw1 = extract_keywords(q1)
-            kw2 = extract_keywords(q2)
-            
-            intersection_score = sum(KEYWORD_WEIGHTS.get(w, 1) for w in kw1 & kw2)
-            union_score = sum(KEYWORD_WEIGHTS.get(w, 1) for w in kw1 | kw2)
-            
-            return intersection_score / union_score if union_score > 0 else 0
-        
-        best_match = None
-        best_score = 0
-        
-        for example in self.examples:
-            score = calculate_similarity(user_question, example['question'])
-            if score > best_score:
-                best_score = score
-                best_match = example
+        best_match, best_score = self.example_index.best_match(user_question)
         
         if best_match and best_score >= 0.15:
             print(f"  ✅ 匹配到示例 (相似度: {best_score:.2f}): {best_match['question'][:40]}...")
@@ -223,12 +249,13 @@ class TextToCypherEngine:
         # 如果没有代码块，返回原文本（去除首尾空白）
         return text.strip()
     
-    def execute_cypher(self, cypher: str) -> List[Dict]:
+    def execute_cypher(self, cypher: str, params: Optional[Dict[str, Any]] = None) -> List[Dict]:
         """
         执行 Cypher 查询
         
         Args:
             cypher: Cypher 查询语句
+            params: 查询参数（意图模板）
         
         Returns:
             查询结果列表
@@ -236,17 +263,13 @@ class TextToCypherEngine:
         if not self.driver:
             raise RuntimeError("Neo4j 未连接，无法执行查询")
         
-        # 安全验证
-        is_safe, error_msg = self.validate_cypher(cypher)
-        if not is_safe:
-            raise ValueError(f"不安全的 Cypher 查询: {error_msg}")
-        
-        # 执行查询
-        with self.driver.session() as session:
-            result = session.run(cypher)
-            records = [record.data() for record in result]
+        # 安全验证（词法检查 + EXPLAIN 执行计划检查，自动追加 LIMIT）
+        validation = self.cypher_validator.validate(cypher, params, explain=self.graph_client.explain)
+        if not validation.valid:
+            raise ValueError(f"不安全的 Cypher 查询: {validation.error}")
         
-        return records
+        # 执行查询（只读结果按图谱版本缓存）
+        return self.graph_client.query(validation.cypher, params)
     
     def query(self, user_question: str, llm_api_function=None) -> Dict:
         """
@@ -260,6 +283,8 @@ class TextToCypherEngine:
             {
                 'question': str,
                 'cypher': str,
+                'params': Dict,
+                'source': str,
                 'results': List[Dict],
                 'success': bool,
                 'error': str (if failed)
@@ -268,6 +293,8 @@ class TextToCypherEngine:
         response = {
             'question': user_question,
             'cypher': None,
+            'params': {},
+            'source': None,
             'results': [],
             'success': False,
             'error': None
@@ -275,16 +302,18 @@ class TextToCypherEngine:
         
         try:
             # 生成 Cypher
-            cypher = self.generate_cypher(user_question, llm_api_function)
+            cypher, params, source = self.generate_parameterized_cypher(user_question, llm_api_function)
             if not cypher:
                 response['error'] = "无法生成有效的 Cypher 查询"
                 return response
             
             response['cypher'] = cypher
+            response['params'] = params
+            response['source'] = source
             
             # 执行查询
             if self.driver:
-                results = self.execute_cypher(cypher)
+                results = self.execute_cypher(cypher, params)
                 response['results'] = results
                 response['success'] = True
             else:
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Neo4j 图数据库客户端工厂 (Graph Client)
+进程内按连接参数共享同一个带连接池的 Neo4j 驱动，
+RiskDetector、TextToCypherEngine、LangChainCypherRetriever 从这里取会话，
+连接池大小、获取超时、连接寿命统一由 Neo4jConfig 配置
+
+驱动创建时不建立连接；首次健康检查才握手，结果在 health_interval 内复用，
+多个组件启动时只会握手一次，连接失败也只会等待一次超时；
+query() / explain() 遇到连接错误时立即作废健康状态，下次检查重新握手
+
+只读查询通过 query() 执行时使用带图谱版本号的结果缓存（见 src/cypher_cache.py）
+"""
+
+import os
+import time
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from neo4j import GraphDatabase
+from neo4j.exceptions import ServiceUnavailable, SessionExpired
+
+from .config import Neo4jConfig
+from .cypher_cache import CypherResultCache, GRAPH_VERSION_QUERY, is_read_only
+
+
+# 说明连接不可用的错误（Cypher 语法等客户端错误不影响健康状态）
+_CONNECTION_ERRORS = (ServiceUnavailable, SessionExpired, OSError)
+
+
+class GraphClient:
+    """
+    共享 Neo4j 客户端（懒连接 + 健康状态跟踪）
+
+    Usage:
+        client = get_graph_client()
+        if client.verify():
+            with client.session() as session:
+                session.run("MATCH (d:Drug) RETURN count(d)")
+    """
+
+    def __init__(
+        self,
+        uri: str,
+        user: str,
+        password: str,
+        database: Optional[str] = None,
+        config: Optional[Neo4jConfig] = None,
+        result_cache: Optional[CypherResultCache] = None
+    ):
+        """
+        Args:
+            uri: Neo4j 连接 URI
+            user: 用户名
+            password: 密码
+            database: 数据库名（None=服务端默认库）
+            config: 连接池配置，默认 Neo4jConfig()（读取 NEO4J_* 环境变量）
+            result_cache: 查询结果缓存（None=按 CYPHER_CACHE_ENABLED 创建，默认启用）
+        """
+        self.config = config or Neo4jConfig()
+        self.uri = uri
+        self.user = user
+        self._password = password
+        self.database = database
+
+        self._driver = None
+        self._lock = threading.Lock()
+        self._healthy: Optional[bool] = None
+        self._checked_at = 0.0
+        self.last_error: Optional[str] = None
+        self.failures = 0
+
+        self.result_cache = result_cache
+        if self.result_cache is None and os.getenv("CYPHER_CACHE_ENABLED", "true").lower() == "true":
+            self.result_cache = CypherResultCache()
+
+    @property
+    def driver(self):
+        """底层 Neo4j 驱动（首次访问时创建，不会阻塞握手）"""
+        if self._driver is None:
+            with self._lock:
+                if self._driver is None:
+                    self._driver = self._create_driver()
+        return self._driver
+
+    def _create_driver(self):
+        return GraphDatabase.driver(
+            self.uri,
+            auth=(self.user, self._password),
+            max_connection_pool_size=self.config.max_connection_pool_size,
+            connection_acquisition_timeout=self.config.connection_acquisition_timeout,
+            max_connection_lifetime=self.config.max_connection_lifetime,
+            connection_timeout=self.config.connection_timeout,
+        )
+
+    def verify(self, force: bool = False) -> bool:
+        """
+        检查连接是否可用（结果缓存 health_interval 秒）
+
+        Args:
+            force: 忽略缓存，重新握手
+        """
+        if not force and self._healthy is not None and \
+                time.monotonic() - self._checked_at < self.config.health_interval:
+            return self._healthy
+
+        with self._lock:
+            if not force and self._healthy is not None and \
+                    time.monotonic() - self._checked_at < self.config.health_interval:
+                return self._healthy
+            try:
+                if self._driver is None:
+                    self._driver = self._create_driver()
+                self._driver.verify_connectivity()
+                self._healthy = True
+                self.last_error = None
+            except Exception as e:
+                self._healthy = False
+                self.failures += 1
+                self.last_error = str(e)
+            self._checked_at = time.monotonic()
+            return self._healthy
+
+    def record_failure(self, error: Exception):
+        """查询时发现连接异常，标记为不可用（下次 verify 重新握手）"""
+        with self._lock:
+            self._healthy = None
+            self.failures += 1
+            self.last_error = str(error)
+
+    def session(self, **kwargs):
+        """从共享连接池获取会话"""
+        if self.database and "database" not in kwargs:
+            kwargs["database"] = self.database
+        return self.driver.session(**kwargs)
+
+    def graph_version(self) -> Optional[str]:
+        """读取图谱版本戳（导入脚本写入的 GraphMeta.version，未写入时为 None）"""
+        try:
+            with self.session() as session:
+                record = session.run(GRAPH_VERSION_QUERY).single()
+                return record["version"] if record else None
+        except _CONNECTION_ERRORS as e:
+            self.record_failure(e)
+            raise
+
+    def explain(self, cypher: str, params: Optional[Dict[str, Any]] = None):
+        """EXPLAIN 查询（不执行），返回包含执行计划和 query_type 的 ResultSummary"""
+        try:
+            with self.session() as session:
+                return session.run(f"EXPLAIN {cypher}", params or {}).consume()
+        except _CONNECTION_ERRORS as e:
+            self.record_failure(e)
+            raise
+
+    def query(
+        self,
+        cypher: str,
+        params: Optional[Dict[str, Any]] = None,
+        use_cache: bool = True
+    ) -> List[Dict[str, Any]]:
+        """
+        执行查询并返回 record.data() 列表；只读查询命中缓存时不访问数据库
+
+        Args:
+            cypher: Cypher 语句
+            params: 查询参数
+            use_cache: 是否使用结果缓存
+        """
+        key = None
+        if use_cache and self.result_cache is not None and is_read_only(cypher):
+            version = self.result_cache.current_version(self.graph_version)
+            key = self.result_cache.key(cypher, params, version)
+            rows = self.result_cache.get(key)
+            if rows is not None:
+                return rows
+
+        try:
+            with self.session() as session:
+                rows = [record.data() for record in session.run(cypher, params or {})]
+        except _CONNECTION_ERRORS as e:
+            self.record_failure(e)
+            raise
+
+        if key is not None:
+            self.result_cache.put(key, rows)
+        return rows
+
+    def close(self):
+        """关闭驱动和连接池（进程退出时调用）"""
+        with self._lock:
+            if self._driver is not None:
+                self._driver.close()
+                self._driver = None
+            self._healthy = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "uri": self.uri,
+            "healthy": self._healthy,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "max_connection_pool_size": self.config.max_connection_pool_size,
+            "result_cache": self.result_cache.get_stats() if self.result_cache else None,
+        }
+
+
+_clients: Dict[Tuple[str, str, str, Optional[str]], GraphClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_graph_client(
+    uri: Optional[str] = None,
+    user: Optional[str] = None,
+    password: Optional[str] = None,
+    database: Optional[str] = None
+) -> GraphClient:
+    """
+    获取进程内共享的图数据库客户端（未指定的参数读取 Neo4jConfig）
+
+    同一 (URI, 用户, 密码, 数据库) 只创建一个客户端
+    """
+    config = Neo4jConfig()
+    uri = uri or config.uri
+    user = user or config.user
+    password = password if password is not None else config.password
+    key = (uri, user, password, database)
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = GraphClient(uri, user, password, database=database, config=config)
+            _clients[key] = client
+        return client
+
+
+def close_graph_clients():
+    """关闭全部共享客户端"""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+def graph_clients_stats() -> Dict[str, Dict[str, Any]]:
+    """全部共享客户端的健康状态"""
+    with _clients_lock:
+        return {f"{uri}|{user}|{database or ''}": client.get_stats()
+                for (uri, user, _, database), client in _clients.items()}
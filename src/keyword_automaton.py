@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多模式关键词自动机 (Aho-Corasick)
+一次扫描文本即可找出词典中出现的全部关键词，
+用于药品名解析和实体抽取等需要同时匹配大量词条的场景
+"""
+
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick 关键词自动机
+
+    Usage:
+        automaton = KeywordAutomaton()
+        automaton.add("二甲双胍", "metformin")
+        automaton.add("格华止", "metformin")
+        automaton.build()
+        for start, end, keyword, value in automaton.iter("患者服用格华止"):
+            ...
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[str, Any]]] = [[]]
+        self._dict_suffix: List[int] = [0]
+        self._built = True
+
+    def __len__(self) -> int:
+        return sum(len(out) for out in self._output)
+
+    def add(self, keyword: str, value: Any = None):
+        """添加关键词（同一关键词重复添加时覆盖 value）"""
+        if not keyword:
+            return
+        node = 0
+        for ch in keyword:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = nxt
+        self._output[node] = [(keyword, value)]
+        self._built = False
+
+    def build(self):
+        """构建失败指针（添加完所有关键词后调用）"""
+        queue = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            queue.append(child)
+
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+
+        # 输出链：指向失败链上最近的有输出节点
+        self._dict_suffix = [0] * len(self._goto)
+        order = deque(self._goto[0].values())
+        while order:
+            node = order.popleft()
+            fail = self._fail[node]
+            self._dict_suffix[node] = fail if self._output[fail] else self._dict_suffix[fail]
+            order.extend(self._goto[node].values())
+
+        self._built = True
+
+    def iter(self, text: str) -> Iterator[Tuple[int, int, str, Any]]:
+        """
+        扫描文本，按结束位置顺序产出全部匹配（含重叠）
+
+        Yields:
+            (start, end, keyword, value)，text[start:end] == keyword
+        """
+        if not self._built:
+            self.build()
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+
+            out_node = node
+            while out_node:
+                for keyword, value in self._output[out_node]:
+                    yield i + 1 - len(keyword), i + 1, keyword, value
+                out_node = self._dict_suffix[out_node]
+
+    def find_longest(self, text: str) -> List[Tuple[int, int, str, Any]]:
+        """最左最长、互不重叠的匹配"""
+        matches = sorted(self.iter(text), key=lambda m: (m[0], -(m[1] - m[0])))
+        result = []
+        last_end = 0
+        for match in matches:
+            if match[0] >= last_end:
+                result.append(match)
+                last_end = match[1]
+        return result
+
+    def get(self, keyword: str) -> Optional[Any]:
+        """精确查找关键词对应的 value"""
+        node = 0
+        for ch in keyword:
+            node = self._goto[node].get(ch)
+            if node is None:
+                return None
+        return self._output[node][0][1] if self._output[node] else None
+
+    def __contains__(self, keyword: str) -> bool:
+        node = 0
+        for ch in keyword:
+            node = self._goto[node].get(ch)
+            if node is None:
+                return False
+        return bool(self._output[node])
@@ -6,11 +6,17 @@ LLM 客户端封装
 """
 
 import os
-from typing import Optional, Callable
+import time
+import random
+import contextvars
+from typing import Optional, Callable, List, Dict, Any, Union
 from pathlib import Path
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import threading
 
+from .llm_metrics import LLMCallRecord, current_call_tag, estimate_tokens, get_metrics_registry
+
 
 class LLMClient:
     """
@@ -27,7 +33,13 @@ class LLMClient:
         temperature: float = 0.7,
         max_tokens: int = 2000,
         cache_enabled: Optional[bool] = None,
-        cache_max_size: int = 256
+        cache_max_size: int = 256,
+        max_retries: Optional[int] = None,
+        timeout: Optional[float] = None,
+        backoff_base: Optional[float] = None,
+        backoff_max: float = 8.0,
+        breaker_threshold: Optional[int] = None,
+        breaker_recovery: Optional[float] = None
     ):
         """
         初始化 LLM 客户端
@@ -41,6 +53,12 @@ class LLMClient:
             max_tokens: 最大生成 token 数
             cache_enabled: 是否启用请求缓存（None=读取环境变量）
             cache_max_size: 缓存条目上限
+            max_retries: 瞬时错误（超时、连接中断、429、5xx）的重试次数（None=读取 LLM_MAX_RETRIES，默认 2）
+            timeout: 单次请求超时秒数（None=读取 LLM_TIMEOUT，默认 60）
+            backoff_base: 指数退避基数秒数（None=读取 LLM_RETRY_BACKOFF，默认 0.5），带全抖动
+            backoff_max: 单次退避上限秒数
+            breaker_threshold: 连续失败多少次后熔断（None=读取 LLM_BREAKER_THRESHOLD，默认 5）
+            breaker_recovery: 熔断后多久放行试探请求（None=读取 LLM_BREAKER_RECOVERY，默认 30）
         """
         self.provider = provider.lower()
         self.temperature = temperature
@@ -51,6 +69,16 @@ class LLMClient:
         self.cache_max_size = int(os.getenv("LLM_CACHE_SIZE", str(cache_max_size)))
         self._cache = OrderedDict()
         self._cache_lock = threading.Lock()
+
+        # 重试 / 超时 / 熔断
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("LLM_MAX_RETRIES", "2"))
+        self.timeout = timeout if timeout is not None else float(os.getenv("LLM_TIMEOUT", "60"))
+        self.backoff_base = backoff_base if backoff_base is not None else float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(
+            failure_threshold=breaker_threshold if breaker_threshold is not None else int(os.getenv("LLM_BREAKER_THRESHOLD", "5")),
+            recovery_timeout=breaker_recovery if breaker_recovery is not None else float(os.getenv("LLM_BREAKER_RECOVERY", "30"))
+        )
         
         # 默认配置
         self.configs = {
@@ -134,7 +162,12 @@ class LLMClient:
         if self.provider == "claude":
             try:
                 import anthropic
-                self.client = anthropic.Anthropic(api_key=self.api_key)
+                # 重试由 chat() 统一处理，关闭 SDK 自带重试
+                self.client = anthropic.Anthropic(
+                    api_key=self.api_key,
+                    timeout=self.timeout,
+                    max_retries=0
+                )
             except ImportError:
                 print("⚠️ 请安装 anthropic: pip install anthropic")
         else:
@@ -143,7 +176,9 @@ class LLMClient:
                 import openai
                 self.client = openai.OpenAI(
                     api_key=self.api_key,
-                    base_url=self.base_url
+                    base_url=self.base_url,
+                    timeout=self.timeout,
+                    max_retries=0
                 )
             except ImportError:
                 print("⚠️ 请安装 openai: pip install openai")
@@ -162,54 +197,429 @@ class LLMClient:
         if self.client is None:
             raise RuntimeError("LLM 客户端未初始化")
 
+        tag = current_call_tag()
+        t0 = time.monotonic()
+
         cache_key = f"{self.provider}|{self.model}|{self.temperature}|{self.max_tokens}|{system or ''}|{prompt}"
         if self.cache_enabled:
             with self._cache_lock:
                 cached = self._cache.get(cache_key)
                 if cached is not None:
                     self._cache.move_to_end(cache_key)
-                    return cached
+            if cached is not None:
+                self._record_usage(tag, None, prompt, system, cached, time.monotonic() - t0, cache_status="hit")
+                return cached
+
+        if not self.breaker.allow_request():
+            self._record_usage(tag, None, prompt, system, "", time.monotonic() - t0, success=False)
+            raise CircuitOpenError(f"{self.provider}/{self.model} 熔断中，快速失败")
+
+        attempt = 0
+        while True:
+            try:
+                response, response_text = self._request(prompt, system)
+                break
+            except Exception as e:
+                retryable = self._is_retryable(e)
+                if not retryable or attempt >= self.max_retries:
+                    # 非瞬时错误（如 400 参数错误、401/403 鉴权失败）不计入熔断，
+                    # 也不算成功：不关闭半开的熔断器、不清零失败计数
+                    if retryable:
+                        self.breaker.record_failure()
+                    else:
+                        self.breaker.release_probe()
+                    self._record_usage(tag, None, prompt, system, "", time.monotonic() - t0, success=False)
+                    print(f"❌ LLM 调用失败: {e}")
+                    raise
+                delay = self._backoff_delay(attempt, e)
+                attempt += 1
+                print(f"⚠️ LLM 调用失败 ({type(e).__name__})，{delay:.1f}s 后第 {attempt} 次重试")
+                time.sleep(delay)
+
+        self.breaker.record_success()
+        self._record_usage(tag, response, prompt, system, response_text, time.monotonic() - t0)
+
+        if self.cache_enabled:
+            with self._cache_lock:
+                self._cache[cache_key] = response_text
+                self._cache.move_to_end(cache_key)
+                if len(self._cache) > self.cache_max_size:
+                    self._cache.popitem(last=False)
+
+        return response_text
+
+    def _request(self, prompt: str, system: str = None):
+        """发送单次请求，返回 (原始响应, 响应文本)"""
+        if self.provider == "claude":
+            # Claude API
+            messages = [{"role": "user", "content": prompt}]
+            response = self.client.messages.create(
+                model=self.model,
+                max_tokens=self.max_tokens,
+                system=system or "你是一个专业的医学助手。",
+                messages=messages,
+                timeout=self.timeout
+            )
+            return response, response.content[0].text
 
+        # OpenAI 兼容接口
+        messages = []
+        if system:
+            messages.append({"role": "system", "content": system})
+        messages.append({"role": "user", "content": prompt})
+
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            timeout=self.timeout
+        )
+        return response, response.choices[0].message.content
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        """是否为瞬时错误：超时、连接中断、限流 (429) 或服务端错误 (5xx)"""
+        if isinstance(error, (TimeoutError, ConnectionError)):
+            return True
+        status = getattr(error, "status_code", None)
+        if status is None:
+            status = getattr(getattr(error, "response", None), "status_code", None)
+        if isinstance(status, int):
+            return status in (408, 409, 429) or status >= 500
+        name = type(error).__name__
+        return any(key in name for key in ("Timeout", "Connection", "RateLimit", "InternalServer", "Overloaded"))
+
+    def _backoff_delay(self, attempt: int, error: Exception) -> float:
+        """指数退避 + 全抖动；服务端返回 Retry-After 时优先使用"""
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
         try:
-            response_text = ""
-            if self.provider == "claude":
-                # Claude API
-                messages = [{"role": "user", "content": prompt}]
-                response = self.client.messages.create(
-                    model=self.model,
-                    max_tokens=self.max_tokens,
-                    system=system or "你是一个专业的医学助手。",
-                    messages=messages
-                )
-                response_text = response.content[0].text
-            else:
-                # OpenAI 兼容接口
-                messages = []
-                if system:
-                    messages.append({"role": "system", "content": system})
-                messages.append({"role": "user", "content": prompt})
-                
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    temperature=self.temperature,
-                    max_tokens=self.max_tokens
-                )
-                response_text = response.choices[0].message.content
+            retry_after = float(headers.get("retry-after"))
+            return min(max(retry_after, 0.0), self.backoff_max)
+        except (TypeError, ValueError):
+            pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
 
-            if self.cache_enabled:
-                with self._cache_lock:
-                    self._cache[cache_key] = response_text
-                    self._cache.move_to_end(cache_key)
-                    if len(self._cache) > self.cache_max_size:
-                        self._cache.popitem(last=False)
+    def _record_usage(
+        self,
+        tag: str,
+        response: Any,
+        prompt: str,
+        system: Optional[str],
+        response_text: str,
+        latency: float,
+        cache_status: str = "miss",
+        success: bool = True
+    ):
+        """
+        记录 token 用量与耗时（优先使用提供商返回的 usage，否则本地估算）
+        本地缓存命中、熔断快速失败和失败调用没有消耗 token，记为 0，只计入调用次数
+        """
+        record = LLMCallRecord(
+            provider=self.provider,
+            model=self.model,
+            tag=tag,
+            latency=latency,
+            cache_status=cache_status,
+            success=success
+        )
 
-            return response_text
-        
+        usage = getattr(response, "usage", None)
+        if cache_status == "hit" or not success:
+            record.usage_source = "none"
+        elif usage is not None and self.provider == "claude":
+            record.prompt_tokens = getattr(usage, "input_tokens", 0) or 0
+            record.completion_tokens = getattr(usage, "output_tokens", 0) or 0
+            record.cached_prompt_tokens = getattr(usage, "cache_read_input_tokens", 0) or 0
+        elif usage is not None:
+            record.prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+            record.completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+            details = getattr(usage, "prompt_tokens_details", None)
+            record.cached_prompt_tokens = getattr(details, "cached_tokens", 0) or 0
+        else:
+            record.usage_source = "estimate"
+            record.prompt_tokens = estimate_tokens(prompt) + estimate_tokens(system or "")
+            record.completion_tokens = estimate_tokens(response_text)
+
+        get_metrics_registry().record(record)
+    
+    def __call__(self, prompt: str) -> str:
+        """允许直接调用"""
+        return self.chat(prompt)
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断器打开时快速失败"""
+
+
+class CircuitBreaker:
+    """
+    熔断器
+    连续失败达到阈值后打开（快速失败），冷却时间过后进入半开状态，
+    放行一次试探请求：成功则关闭，失败则重新打开
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, recovery_timeout: float = 30.0):
+        """
+        Args:
+            failure_threshold: 触发熔断的连续失败次数
+            recovery_timeout: 熔断后等待多久（秒）放行试探请求
+        """
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state_locked()
+
+    def _state_locked(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at >= self.recovery_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow_request(self) -> bool:
+        """当前是否允许发起请求（半开状态下只放行一个试探请求）"""
+        with self._lock:
+            state = self._state_locked()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def available(self) -> bool:
+        """是否可能放行请求（关闭，或半开且试探名额未被占用），不占用试探名额"""
+        with self._lock:
+            state = self._state_locked()
+            return state == self.CLOSED or (state == self.HALF_OPEN and not self._probing)
+
+    def release_probe(self):
+        """归还半开状态的试探名额（请求结果不能说明提供商是否恢复），状态与失败计数不变"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class ProviderStats:
+    """单个提供商的滚动延迟 / 错误率统计"""
+
+    def __init__(self, window_size: int = 100):
+        self._latencies = deque(maxlen=window_size)
+        self._outcomes = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            self._outcomes.append(ok)
+            if ok:
+                self._latencies.append(latency)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """延迟分位数（秒），无样本时返回 None"""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, int(round(p / 100 * (len(samples) - 1)))))
+        return samples[index]
+
+    @property
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self._outcomes:
+                return 0.0
+            return 1 - sum(self._outcomes) / len(self._outcomes)
+
+    @property
+    def sample_count(self) -> int:
+        with self._lock:
+            return len(self._outcomes)
+
+
+class RoutingLLMClient:
+    """
+    多提供商路由客户端
+
+    - 按滚动 p50 延迟和错误率为每次请求选择最优提供商
+    - 首选提供商超过其延迟分位数仍未返回时，向次优提供商发送对冲请求，取先返回的结果
+    - 失败的提供商由熔断器移出轮转，冷却后自动试探恢复
+    """
+
+    def __init__(
+        self,
+        clients: List[LLMClient],
+        hedge_percentile: float = 95.0,
+        hedge_min_delay: float = 0.5,
+        hedge_default_delay: float = 5.0,
+        window_size: int = 100,
+        failure_threshold: int = 3,
+        recovery_timeout: float = 30.0,
+        max_workers: int = 8
+    ):
+        """
+        初始化路由客户端
+
+        Args:
+            clients: 参与路由的 LLMClient 列表（顺序即无统计数据时的优先级）
+            hedge_percentile: 触发对冲请求的延迟分位数
+            hedge_min_delay: 对冲等待的下限（秒）
+            hedge_default_delay: 首选提供商尚无延迟样本时的对冲等待（秒）
+            window_size: 滚动统计窗口大小
+            failure_threshold: 熔断的连续失败次数
+            recovery_timeout: 熔断冷却时间（秒）
+            max_workers: 请求线程池大小
+        """
+        if not clients:
+            raise ValueError("RoutingLLMClient 至少需要一个 LLMClient")
+
+        self.clients = list(clients)
+        self.names = [f"{c.provider}/{c.model}" for c in self.clients]
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_default_delay = hedge_default_delay
+        self.stats = {name: ProviderStats(window_size) for name in self.names}
+        self.breakers = {
+            name: CircuitBreaker(failure_threshold, recovery_timeout)
+            for name in self.names
+        }
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-route")
+
+        print(f"✅ LLM 路由客户端初始化: {', '.join(self.names)}")
+
+    def _score(self, index: int) -> tuple:
+        """排序键：错误率优先，其次 p50 延迟，最后是配置顺序"""
+        stats = self.stats[self.names[index]]
+        p50 = stats.percentile(50)
+        return (round(stats.error_rate, 2), p50 if p50 is not None else 0.0, index)
+
+    def _candidates(self) -> List[int]:
+        """按优先级排序、且可以放行请求的提供商下标（熔断中、或半开但试探请求已在途的跳过）"""
+        ranked = sorted(range(len(self.clients)), key=self._score)
+        return [i for i in ranked if self.breakers[self.names[i]].available()]
+
+    def _hedge_delay(self, index: int) -> float:
+        threshold = self.stats[self.names[index]].percentile(self.hedge_percentile)
+        if threshold is None:
+            return self.hedge_default_delay
+        return max(self.hedge_min_delay, threshold)
+
+    def _call(self, index: int, prompt: str, system: str = None) -> str:
+        """调用单个提供商并记录统计"""
+        name = self.names[index]
+        if not self.breakers[name].allow_request():
+            raise CircuitOpenError(f"{name} 处于熔断状态")
+        t0 = time.monotonic()
+        try:
+            response = self.clients[index].chat(prompt, system=system)
+        except CircuitOpenError:
+            # 内层 LLMClient 的熔断器已计入这些失败，不重复计数，只归还半开的试探名额
+            self.breakers[name].release_probe()
+            raise
         except Exception as e:
-            print(f"❌ LLM 调用失败: {e}")
+            # 与 LLMClient 相同的分类：只有瞬时错误计入熔断和错误率，
+            # 非瞬时错误（如 400 参数错误）不说明提供商是否可用
+            if LLMClient._is_retryable(e):
+                self.stats[name].record(time.monotonic() - t0, ok=False)
+                self.breakers[name].record_failure()
+            else:
+                self.breakers[name].release_probe()
             raise
-    
+        self.stats[name].record(time.monotonic() - t0, ok=True)
+        self.breakers[name].record_success()
+        return response
+
+    def _submit(self, index: int, prompt: str, system: str = None):
+        """提交到线程池，携带调用方上下文（遥测标签等）"""
+        context = contextvars.copy_context()
+        return self._executor.submit(context.run, self._call, index, prompt, system)
+
+    def chat(self, prompt: str, system: str = None) -> str:
+        """
+        发送对话请求（自动路由、对冲与故障转移）
+
+        Args:
+            prompt: 用户提示
+            system: 系统提示（可选）
+
+        Returns:
+            最先成功返回的模型响应文本
+        """
+        candidates = self._candidates()
+        if not candidates:
+            raise RuntimeError("所有 LLM 提供商均处于熔断状态")
+
+        pending = {self._submit(candidates[0], prompt, system): candidates[0]}
+        backups = candidates[1:]
+        hedge_delay = self._hedge_delay(candidates[0])
+        last_error = None
+
+        while pending:
+            timeout = hedge_delay if backups and len(pending) == 1 else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                # 首选提供商超过延迟分位数仍未返回 -> 对冲
+                index = backups.pop(0)
+                print(f"  ⏱️ {self.names[pending[next(iter(pending))]]} 响应慢，对冲请求 {self.names[index]}")
+                pending[self._submit(index, prompt, system)] = index
+                continue
+
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    last_error = e
+                    print(f"  ⚠️ {self.names[index]} 调用失败: {e}")
+
+            # 所有在途请求都失败时，故障转移到下一个提供商
+            if not pending and backups:
+                index = backups.pop(0)
+                pending[self._submit(index, prompt, system)] = index
+
+        raise last_error or RuntimeError("LLM 调用失败")
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """各提供商的路由统计"""
+        return {
+            name: {
+                "p50": self.stats[name].percentile(50),
+                "p95": self.stats[name].percentile(95),
+                "error_rate": self.stats[name].error_rate,
+                "samples": self.stats[name].sample_count,
+                "circuit": self.breakers[name].state,
+            }
+            for name in self.names
+        }
+
+    def close(self):
+        """关闭请求线程池（不等待仍在途的对冲请求）"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
     def __call__(self, prompt: str) -> str:
         """允许直接调用"""
         return self.chat(prompt)
@@ -243,6 +653,34 @@ def create_llm_api(
     return client
 
 
+def create_routing_llm_api(
+    providers: Union[str, List[str]],
+    default_provider: str = "siliconflow",
+    **kwargs
+) -> Union[LLMClient, RoutingLLMClient]:
+    """
+    创建多提供商路由 LLM API
+
+    Args:
+        providers: 提供商名称列表，或逗号分隔的字符串（如 DIA_LLM_PROVIDER="siliconflow,deepseek"）
+        default_provider: 未指定任何提供商时使用的提供商
+        **kwargs: 透传给 RoutingLLMClient 的路由参数
+
+    Returns:
+        多个提供商时返回 RoutingLLMClient，只有一个时直接返回 LLMClient
+
+    Usage:
+        llm_api = create_routing_llm_api(os.getenv("DIA_LLM_PROVIDER", "siliconflow"))
+        agent = DiaAgentFast(llm_api=llm_api)
+    """
+    if isinstance(providers, str):
+        providers = providers.split(",")
+    names = [p.strip() for p in providers if p.strip()] or [default_provider]
+    if len(names) == 1:
+        return create_llm_api(names[0])
+    return RoutingLLMClient([LLMClient(provider=name) for name in names], **kwargs)
+
+
 def create_qwen_api(api_key: str = None, model: str = "qwen-turbo") -> Callable[[str], str]:
     """创建通义千问 API"""
     return create_llm_api("qwen", model=model, api_key=api_key)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLM 调用遥测
+记录每次调用的 token 用量、耗时、提供商、模型、调用方标签和缓存状态，
+按调用方标签汇总，供 API 导出以定位最耗费的 Prompt
+"""
+
+import re
+import time
+import threading
+import contextvars
+from collections import deque, defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict, field
+from typing import Any, Dict, List, Optional
+
+
+# 当前调用方标签（llm_api 是 Callable[[str], str]，通过上下文变量传递标签）
+_current_tag = contextvars.ContextVar("llm_call_tag", default="untagged")
+
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u9fff\uff00-\uffef]')
+_WORD_PATTERN = re.compile(r'[A-Za-z0-9_]+|[^\sA-Za-z0-9_\u3000-\u303f\u3400-\u9fff\uff00-\uffef]')
+
+_tokenizer = None
+_tokenizer_loaded = False
+
+
+@contextmanager
+def llm_call_tag(tag: str):
+    """
+    为代码块内的 LLM 调用设置调用方标签
+
+    Usage:
+        with llm_call_tag("decision_fusion"):
+            response = self.llm_api(prompt)
+    """
+    token = _current_tag.set(tag)
+    try:
+        yield
+    finally:
+        _current_tag.reset(token)
+
+
+def current_call_tag() -> str:
+    """获取当前调用方标签"""
+    return _current_tag.get()
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    本地估算 token 数（提供商未返回 usage 时使用）
+    优先使用 tiktoken，未安装时按中文每字 1 token、英文单词/符号按长度近似
+    """
+    global _tokenizer, _tokenizer_loaded
+    if not text:
+        return 0
+
+    if not _tokenizer_loaded:
+        _tokenizer_loaded = True
+        try:
+            import tiktoken
+            _tokenizer = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _tokenizer = None
+
+    if _tokenizer is not None:
+        return len(_tokenizer.encode(text))
+
+    cjk = len(_CJK_PATTERN.findall(text))
+    others = sum(max(1, len(w) // 4) for w in _WORD_PATTERN.findall(text))
+    return cjk + others
+
+
+@dataclass
+class LLMCallRecord:
+    """单次 LLM 调用记录"""
+    provider: str
+    model: str
+    tag: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_prompt_tokens: int = 0    # 提供商侧前缀缓存命中的 token
+    latency: float = 0.0             # 秒
+    cache_status: str = "miss"       # "miss" / "hit"（本地缓存）
+    usage_source: str = "provider"   # "provider" / "estimate" / "none"（缓存命中或失败，不计 token）
+    success: bool = True
+    timestamp: float = field(default_factory=time.time)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class LLMMetricsRegistry:
+    """进程内 LLM 调用指标注册表"""
+
+    def __init__(self, max_records: int = 1000):
+        """
+        Args:
+            max_records: 保留的最近调用明细条数（汇总统计不受此限制）
+        """
+        self._records = deque(maxlen=max_records)
+        self._totals = defaultdict(lambda: defaultdict(float))
+        self._latencies = defaultdict(lambda: deque(maxlen=max_records))
+        self._lock = threading.Lock()
+
+    def record(self, record: LLMCallRecord):
+        """记录一次调用"""
+        with self._lock:
+            self._records.append(record)
+            totals = self._totals[record.tag]
+            totals["calls"] += 1
+            totals["errors"] += 0 if record.success else 1
+            totals["cache_hits"] += 1 if record.cache_status == "hit" else 0
+            totals["prompt_tokens"] += record.prompt_tokens
+            totals["completion_tokens"] += record.completion_tokens
+            totals["cached_prompt_tokens"] += record.cached_prompt_tokens
+            totals["latency_total"] += record.latency
+            if record.cache_status != "hit":
+                self._latencies[record.tag].append(record.latency)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """按调用方标签汇总，按 prompt token 消耗降序"""
+        with self._lock:
+            result = {}
+            for tag, totals in self._totals.items():
+                latencies = sorted(self._latencies[tag])
+                calls = int(totals["calls"])
+                result[tag] = {
+                    "calls": calls,
+                    "errors": int(totals["errors"]),
+                    "cache_hits": int(totals["cache_hits"]),
+                    "cache_hit_rate": totals["cache_hits"] / calls if calls else 0.0,
+                    "prompt_tokens": int(totals["prompt_tokens"]),
+                    "completion_tokens": int(totals["completion_tokens"]),
+                    "cached_prompt_tokens": int(totals["cached_prompt_tokens"]),
+                    "avg_latency": totals["latency_total"] / calls if calls else 0.0,
+                    "p95_latency": latencies[int(0.95 * (len(latencies) - 1))] if latencies else None,
+                }
+        return dict(sorted(result.items(), key=lambda kv: kv[1]["prompt_tokens"], reverse=True))
+
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """最近的调用明细"""
+        with self._lock:
+            records = list(self._records)[-limit:]
+        return [r.to_dict() for r in records]
+
+    def reset(self):
+        """清空所有指标"""
+        with self._lock:
+            self._records.clear()
+            self._totals.clear()
+            self._latencies.clear()
+
+
+# 全局注册表实例
+_registry = LLMMetricsRegistry()
+
+
+def get_metrics_registry() -> LLMMetricsRegistry:
+    """获取全局 LLM 指标注册表"""
+    return _registry
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+近似重复检测 (MinHash + LSH)
+文本按字符 n-gram 切分为 shingle，MinHash 签名估计两段文本的 Jaccard 相似度；
+签名分段（band）后同一段哈希相同的文本成为候选对，只对候选对核对签名相似度，
+避免两两比较。相似度不低于阈值的文本用并查集合并为同一簇
+
+用于指南切片入库去重（重复表格、页眉页脚）和检索结果去重
+"""
+
+import zlib
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+class MinHasher:
+    """
+    MinHash 签名
+
+    Usage:
+        hasher = MinHasher()
+        signatures = hasher.signatures(texts)
+        MinHasher.jaccard(signatures[0], signatures[1])
+    """
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        """
+        Args:
+            num_perm: 哈希函数个数（签名长度）
+            shingle_size: 字符 n-gram 长度
+            seed: 随机种子（固定后签名可跨进程、跨运行比较）
+        """
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 31, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, 1 << 31, size=num_perm).astype(np.uint64)
+
+    def shingles(self, text: str) -> np.ndarray:
+        """去空白、小写后的字符 n-gram 哈希（crc32，结果与进程无关）"""
+        normalized = "".join(text.lower().split())
+        n = self.shingle_size
+        grams = {normalized[i:i + n] for i in range(max(len(normalized) - n + 1, 1))}
+        return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = self.shingles(text)
+        values = (np.outer(self._a, hashes) + self._b[:, None]) % _MERSENNE_PRIME & _MAX_HASH
+        return values.min(axis=1)
+
+    def signatures(self, texts: List[str]) -> np.ndarray:
+        """(文本数, num_perm) 签名矩阵"""
+        if not texts:
+            return np.zeros((0, self.num_perm), dtype=np.uint64)
+        return np.vstack([self.signature(text) for text in texts])
+
+    @staticmethod
+    def jaccard(signature_a: np.ndarray, signature_b: np.ndarray) -> float:
+        """签名估计的 Jaccard 相似度"""
+        return float(np.mean(signature_a == signature_b))
+
+
+def choose_bands(num_perm: int, threshold: float) -> int:
+    """
+    选择 LSH 分段数: 候选概率曲线拐点 (1/b)^(1/r) 略低于阈值，保证召回，
+    误报由签名相似度核对过滤
+    """
+    best = num_perm
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        if (1 / bands) ** (1 / rows) <= threshold - 0.1:
+            best = bands
+    return best
+
+
+def candidate_pairs(signatures: np.ndarray, bands: int) -> Set[Tuple[int, int]]:
+    """LSH: 任一分段完全相同的文本对"""
+    pairs = set()
+    if len(signatures) < 2:
+        return pairs
+    rows = signatures.shape[1] // bands
+    for band in range(bands):
+        buckets: Dict[bytes, List[int]] = {}
+        for i, segment in enumerate(signatures[:, band * rows:(band + 1) * rows]):
+            buckets.setdefault(segment.tobytes(), []).append(i)
+        for members in buckets.values():
+            for x in range(len(members)):
+                for y in range(x + 1, len(members)):
+                    pairs.add((members[x], members[y]))
+    return pairs
+
+
+def cluster_near_duplicates(
+    texts: List[str],
+    threshold: float = 0.8,
+    hasher: Optional[MinHasher] = None,
+    bands: Optional[int] = None
+) -> List[int]:
+    """
+    近似重复聚类
+
+    Args:
+        texts: 文本列表
+        threshold: 签名 Jaccard 相似度阈值
+        hasher: MinHash 签名器（默认 MinHasher()）
+        bands: LSH 分段数（None=按阈值自动选择）
+
+    Returns:
+        每个文本所属簇的标签（簇内最小下标）
+    """
+    hasher = hasher or MinHasher()
+    signatures = hasher.signatures(texts)
+    bands = bands or choose_bands(hasher.num_perm, threshold)
+
+    parent = list(range(len(texts)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in sorted(candidate_pairs(signatures, bands)):
+        if MinHasher.jaccard(signatures[i], signatures[j]) >= threshold:
+            root_i, root_j = find(i), find(j)
+            if root_i != root_j:
+                parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    return [find(i) for i in range(len(texts))]
+
+
+def collapse_clusters(results: List[Dict]) -> List[Dict]:
+    """
+    检索结果近似重复去重: 同一 cluster_id（入库时 MinHash 聚类得到）只保留排名最高的一条，
+    被合并的结果 ID 记入 duplicate_ids；没有 cluster_id 的结果按 ID 区分
+    """
+    collapsed = []
+    kept = {}
+    for item in results:
+        cluster = (item.get('metadata') or {}).get('cluster_id') or item['id']
+        if cluster in kept:
+            kept[cluster].setdefault('duplicate_ids', []).append(item['id'])
+            continue
+        item = dict(item)
+        kept[cluster] = item
+        collapsed.append(item)
+    return collapsed
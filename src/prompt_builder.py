@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prompt 组装缓存 (Prompt Builder)
+Prompt 由 静态前缀（角色、Schema、规则、输出格式、选中的示例）+ 可变后缀（本次问题/病例）组成。
+静态前缀按 配置指纹 + 段落键 缓存，每个配置版本只格式化一次，请求时只拼接后缀；
+同一配置下前缀逐字节一致，支持前缀缓存的 LLM 服务可以直接命中
+"""
+
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
+
+
+class PromptBuilder:
+    """
+    静态前缀缓存
+
+    Usage:
+        builder = PromptBuilder()
+        version = builder.fingerprint(schema, prompt_template)
+        prompt = builder.build((version, "system"), lambda: SYSTEM.format(schema=...), suffix)
+    """
+
+    def __init__(self, max_size: int = None):
+        """
+        Args:
+            max_size: 缓存的前缀数量上限（None=读取 PROMPT_PREFIX_CACHE_SIZE，默认 256）
+        """
+        self.max_size = max_size if max_size is not None else int(os.getenv("PROMPT_PREFIX_CACHE_SIZE", "256"))
+        self._prefixes: "OrderedDict[Hashable, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def fingerprint(*parts: Any) -> str:
+        """配置指纹: 配置内容变化（Schema、模板、示例库）时前缀缓存自然失效"""
+        payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+    def prefix(self, key: Hashable, render: Callable[[], str]) -> str:
+        """返回 key 对应的静态前缀（未缓存时调用 render 生成）"""
+        with self._lock:
+            cached = self._prefixes.get(key)
+            if cached is not None:
+                self._prefixes.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        text = render()
+        with self._lock:
+            self._prefixes[key] = text
+            self._prefixes.move_to_end(key)
+            while len(self._prefixes) > self.max_size:
+                self._prefixes.popitem(last=False)
+        return text
+
+    def build(self, key: Hashable, render: Callable[[], str], suffix: str) -> str:
+        """静态前缀 + 可变后缀"""
+        return self.prefix(key, render) + suffix
+
+    def clear(self):
+        with self._lock:
+            self._prefixes.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._prefixes),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
@@ -3,33 +3,50 @@
 """
 Context Fusion - 数据融合模块
 将 RAG 检索结果和 KG 查询结果融合为统一的 Context
+指南中与 KG 规则重复的分句先被去掉，两者不一致之处单独提示（见 src/evidence_matcher.py），
+KG 硬性规则先占 token 预算，指南证据在剩余预算内挑选和裁剪（见 src/context_packer.py）
 """
 
+import os
 from typing import List, Dict, Optional
 
+from ..context_packer import ContextPacker
+from ..evidence_matcher import EvidenceMatcher
+from ..llm_metrics import estimate_tokens
+
 
 class ContextFusion:
     """Context 融合器 - 合并 RAG 和 KG 的检索结果"""
     
-    def __init__(self, kg_priority: bool = True):
+    def __init__(self, kg_priority: bool = True, packer: Optional[ContextPacker] = None,
+                 drop_redundant: Optional[bool] = None):
         """
         初始化融合器
         
         Args:
             kg_priority: 知识图谱是否优先（True 表示 KG > RAG）
+            packer: 证据打包器（默认按 CONTEXT_TOKEN_BUDGET 创建）
+            drop_redundant: 是否去掉指南中与 KG 规则重复的句子（None=读取 CONTEXT_DROP_KG_COVERED，默认启用）
         """
         self.kg_priority = kg_priority
+        self.packer = packer or ContextPacker()
+        self.drop_redundant = drop_redundant if drop_redundant is not None else \
+            os.getenv("CONTEXT_DROP_KG_COVERED", "true").lower() == "true"
     
-    def format_rag_context(self, rag_results: List[Dict]) -> str:
+    def format_rag_context(self, rag_results: List[Dict], question: str = "") -> str:
         """
         格式化 RAG 检索结果
         
         Args:
-            rag_results: Reranked 文档列表
+            rag_results: Reranked 文档列表（未经 ContextPacker 打包时先按预算打包）
+            question: 用户问题（用于裁剪时定位命中句）
         
         Returns:
             格式化文本
         """
+        if any('packed_content' not in doc for doc in rag_results):
+            rag_results = self.packer.pack(question, rag_results).rag_results
+        
         if not rag_results:
             return "（未检索到相关指南内容）"
         
@@ -37,11 +54,7 @@ class ContextFusion:
         for i, doc in enumerate(rag_results, 1):
             header = doc.get('metadata', {}).get('header', '未知章节')
             page = doc.get('metadata', {}).get('page', 'N/A')
-            content = doc.get('document', '').replace('【章节】', '').strip()
-            
-            # 截断过长内容
-            if len(content) > 300:
-                content = content[:300] + "..."
+            content = doc['packed_content']
             
             formatted.append(f"{i}. 【{header} - P.{page}】\n   {content}")
         
@@ -71,7 +84,8 @@ class ContextFusion:
     def merge(self, 
               rag_results: Optional[List[Dict]] = None, 
               kg_results: Optional[List[Dict]] = None,
-              user_question: str = "") -> str:
+              user_question: str = "",
+              token_budget: Optional[int] = None) -> str:
         """
         融合 RAG 和 KG 结果
         
@@ -79,31 +93,61 @@ class ContextFusion:
             rag_results: RAG 检索结果（Reranked）
             kg_results: 知识图谱查询结果
             user_question: 用户问题
+            token_budget: Context 的 token 预算（None=打包器默认预算，问题和段落标题计入预算）
         
         Returns:
             融合后的 Context 文本
         """
+        # 指南与 KG 比对: 去掉重复的句子，记录不一致之处（基于完整的 KG 结果，打包前进行）
+        overlap = EvidenceMatcher(kg_results, user_question).compare(rag_results or [])
+        if self.drop_redundant:
+            rag_results = overlap.rag_results
+        conflict_context = '\n'.join(
+            f"{i}. {conflict.describe()}" for i, conflict in enumerate(overlap.conflicts, 1)
+        )
+        
+        # 在预算内选择证据（KG 行不参与取舍，整体超出预算时省略的条数在标题中注明）
+        reserved = estimate_tokens(user_question) + 40 if user_question else 40
+        reserved += estimate_tokens(conflict_context)
+        packed = self.packer.pack(user_question, rag_results, kg_results,
+                                  budget=token_budget, reserved_tokens=reserved, kg_first=True)
+        rag_results, kg_results = packed.rag_results, packed.kg_results
+        
+        kg_section = None
+        if kg_results or packed.kg_omitted:
+            kg_section = "【临床硬性规则】（来自知识图谱）"
+            if packed.kg_omitted:
+                kg_section = f"【临床硬性规则】（来自知识图谱，超出上下文预算，省略 {packed.kg_omitted} 条）"
+            if kg_results:
+                kg_section += f"\n{self.format_kg_context(kg_results, user_question)}"
+        
+        rag_title = "【指南参考知识】（来自《中国糖尿病防治指南2024》）"
+        removed = overlap.removed_sentences + overlap.removed_clauses
+        if self.drop_redundant and removed:
+            rag_title = f"【指南参考知识】（来自《中国糖尿病防治指南2024》，已省略 {removed} 处与临床硬性规则重复的内容）"
+        
         context_parts = []
         
         # 优先级排序
         if self.kg_priority:
             # KG 优先
-            if kg_results:
-                kg_context = self.format_kg_context(kg_results, user_question)
-                context_parts.append(f"【临床硬性规则】（来自知识图谱）\n{kg_context}")
+            if kg_section:
+                context_parts.append(kg_section)
             
             if rag_results:
-                rag_context = self.format_rag_context(rag_results)
-                context_parts.append(f"【指南参考知识】（来自《中国糖尿病防治指南2024》）\n{rag_context}")
+                rag_context = self.format_rag_context(rag_results, user_question)
+                context_parts.append(f"{rag_title}\n{rag_context}")
         else:
             # RAG 优先
             if rag_results:
-                rag_context = self.format_rag_context(rag_results)
-                context_parts.append(f"【指南参考知识】（来自《中国糖尿病防治指南2024》）\n{rag_context}")
+                rag_context = self.format_rag_context(rag_results, user_question)
+                context_parts.append(f"{rag_title}\n{rag_context}")
             
-            if kg_results:
-                kg_context = self.format_kg_context(kg_results, user_question)
-                context_parts.append(f"【临床硬性规则】（来自知识图谱）\n{kg_context}")
+            if kg_section:
+                context_parts.append(kg_section)
+        
+        if conflict_context:
+            context_parts.append(f"【证据冲突】（指南与知识图谱不一致，以临床硬性规则为准）\n{conflict_context}")
         
         # 拼接
         if not context_parts:
@@ -117,25 +161,28 @@ class ContextFusion:
         
         return merged_context
     
-    def detect_conflict(self, rag_results: List[Dict], kg_results: List[Dict]) -> Dict:
+    def detect_conflict(self, rag_results: List[Dict], kg_results: List[Dict],
+                        user_question: str = "") -> Dict:
         """
-        检测 RAG 和 KG 结果是否冲突
+        检测 RAG 和 KG 结果是否冲突（同一药品、同一指标或疾病上，指南与图谱规则不一致）
         
         Args:
             rag_results: RAG 结果
             kg_results: KG 结果
+            user_question: 用户问题（KG 结果行不含指标名时用于确定指标）
         
         Returns:
             {
                 'has_conflict': bool,
-                'description': str
+                'description': str,
+                'conflicts': List[EvidenceConflict]
             }
         """
-        # 简化实现：实际应用中可以使用 NLP 技术检测语义冲突
-        # 这里仅作为接口示例
+        conflicts = EvidenceMatcher(kg_results, user_question).compare(rag_results or []).conflicts
         return {
-            'has_conflict': False,
-            'description': '未实现冲突检测逻辑'
+            'has_conflict': bool(conflicts),
+            'description': '；'.join(c.describe() for c in conflicts) if conflicts else '指南与知识图谱规则未发现不一致',
+            'conflicts': conflicts
         }
 
 
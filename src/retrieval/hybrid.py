@@ -5,16 +5,25 @@
 结合向量检索（ChromaDB）和关键词检索（BM25）
 """
 
+import os
 import chromadb
 from FlagEmbedding import BGEM3FlagModel
 from rank_bm25 import BM25Okapi
 import jieba
-from typing import List, Dict
+from typing import List, Dict, Optional
 import numpy as np
 import threading
 from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor
 
+if __package__:
+    from ..near_dedup import collapse_clusters
+else:  # 直接作为脚本运行: python src/retrieval/hybrid.py
+    import sys
+    from pathlib import Path
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+    from src.near_dedup import collapse_clusters
+
 
 class VectorRetriever:
     """向量检索器 - 基于 ChromaDB + BGE-M3"""
@@ -176,16 +185,21 @@ class KeywordRetriever:
 class HybridRetriever:
     """混合检索器 - 融合向量检索和关键词检索"""
     
-    def __init__(self, chroma_path: str = "./chroma_db", collection_name: str = "diabetes_guidelines_2024"):
+    def __init__(self, chroma_path: str = "./chroma_db", collection_name: str = "diabetes_guidelines_2024",
+                 dedup: Optional[bool] = None):
         """
         初始化混合检索器
         
         Args:
             chroma_path: ChromaDB 存储路径
             collection_name: 集合名称
+            dedup: 是否按切片元数据 cluster_id 合并近似重复结果（None=读取 RETRIEVAL_DEDUP，默认启用）
         """
         self.vector_retriever = VectorRetriever(chroma_path, collection_name)
         self.keyword_retriever = KeywordRetriever(chroma_path, collection_name)
+        if dedup is None:
+            dedup = os.getenv("RETRIEVAL_DEDUP", "true").lower() == "true"
+        self.dedup = dedup
     
     def reciprocal_rank_fusion(self, 
                                 vector_results: List[Dict], 
@@ -249,12 +263,225 @@ class HybridRetriever:
         return fused_results
     
     def retrieve(self, query: str, top_k: int = 10) -> List[Dict]:
+        """
+        向量检索
+        
+        Args:
+            query: 查询文本
+            top_k: 返回结果数量
+        
+        Returns:
+            List of {id, document, metadata, score}
+        """
+        # 查询向量化（带缓存）
+        query_embedding = self._encode_query(query)
+        
+        # 检索
+        results = self.collection.query(
+            query_embeddings=[query_embedding.tolist()],
+            n_results=top_k
+        )
+        
+        # 格式化结果
+        retrieved = []
+        for i in range(len(results['ids'][0])):
+            retrieved.append({
+                'id': results['ids'][0][i],
+                'document': results['documents'][0][i],
+                'metadata': results['metadatas'][0][i],
+                'score': 1 - results['distances'][0][i],  # 转换为相似度
+                'source': 'vector'
+            })
+        
+        return retrieved
+
+
+class KeywordRetriever:
+    """关键词检索器 - 基于 BM25"""
+
+    _index_cache = {}
+    _index_lock = threading.Lock()
+    
+    def __init__(self, chroma_path: str = "./chroma_db", collection_name: str = "diabetes_guidelines_2024"):
+        """
+        初始化关键词检索器
+        
+        Args:
+            chroma_path: ChromaDB 存储路径（用于加载文档）
+            collection_name: 集合名称
+        """
+        print("🔧 初始化关键词检索器...")
+
+        cache_key = (chroma_path, collection_name)
+        cached = None
+        with KeywordRetriever._index_lock:
+            cached = KeywordRetriever._index_cache.get(cache_key)
+
+        if cached is None:
+            # 从 ChromaDB 加载所有文档
+            client = chromadb.PersistentClient(path=chroma_path)
+            collection = client.get_collection(name=collection_name)
+
+            # 获取所有文档
+            all_data = collection.get()
+            documents = all_data['documents']
+            ids = all_data['ids']
+            metadatas = all_data['metadatas']
+
+            # 分词并建立BM25索引
+            print(f"📄 对 {len(documents)} 篇文档分词...")
+            tokenized_corpus = [list(jieba.cut(doc)) for doc in documents]
+            bm25 = BM25Okapi(tokenized_corpus)
+
+            with KeywordRetriever._index_lock:
+                if cache_key not in KeywordRetriever._index_cache:
+                    KeywordRetriever._index_cache[cache_key] = (documents, ids, metadatas, bm25)
+                cached = KeywordRetriever._index_cache[cache_key]
+
+        self.documents, self.ids, self.metadatas, self.bm25 = cached
+        print("✅ 关键词检索器就绪")
+    
+    def retrieve(self, query: str, top_k: int = 10) -> List[Dict]:
+        """
+        BM25 关键词检索
+        
+        Args:
+            query: 查询文本
+            top_k: 返回结果数量
+        
+        Returns:
+            List of {id, document, metadata, score}
+        """
+        # 查询分词
+        tokenized_query = list(jieba.cut(query))
+        
+        # BM25 打分
+        scores = self.bm25.get_scores(tokenized_query)
+        
+        # 获取 Top-K
+        top_indices = np.argsort(scores)[::-1][:top_k]
+        
+        # 格式化结果
+        retrieved = []
+        for idx in top_indices:
+            if scores[idx] > 0:  # 过滤零分结果
+                retrieved.append({
+                    'id': self.ids[idx],
+                    'document': self.documents[idx],
+                    'metadata': self.metadatas[idx],
+                    'score': float(scores[idx]),
+                    'source': 'keyword'
+                })
+        
+        return retrieved
+
+
+class HybridRetriever:
+    """混合检索器 - 融合向量检索和关键词检索"""
+    
+    def __init__(self, chroma_path: str = "./chroma_db", collection_name: str = "diabetes_guidelines_2024",
+                 dedup: Optional[bool] = None):
+        """
+        初始化混合检索器
+        
+        Args:
+            chroma_path: ChromaDB 存储路径
+            collection_name: 集合名称
+            dedup: 是否按切片元数据 cluster_id 合并近似重复结果（None=读取 RETRIEVAL_DEDUP，默认启用）
+        """
+        self.vector_retriever = VectorRetriever(chroma_path, collection_name)
+        self.keyword_retriever = KeywordRetriever(chroma_path, collection_name)
+        if dedup is None:
+            dedup = os.getenv("RETRIEVAL_DEDUP", "true").lower() == "true"
+        self.dedup = dedup
+    
+    def reciprocal_rank_fusion(self, 
+                                vector_results: List[Dict], 
+                                keyword_results: List[Dict], 
+                                k: int = 60) -> List[Dict]:
+        """
+        Reciprocal Rank Fusion (RRF) 算法融合结果
+        
+        公式: RRF_score(d) = Σ 1/(k + rank_i(d))
+        
+        Args:
+            vector_results: 向量检索结果
+            keyword_results: 关键词检索结果
+            k: RRF 参数（默认60）
+        
+        Returns:
+            融合后的结果列表
+        """
+        # 构建排名字典
+        rrf_scores = {}
+        
+        # 向量检索排名
+        for rank, item in enumerate(vector_results, start=1):
+            doc_id = item['id']
+            if doc_id not in rrf_scores:
+                rrf_scores[doc_id] = {
+                    'score': 0,
+                    'document': item['document'],
+                    'metadata': item['metadata'],
+                    'sources': []
+                }
+            rrf_scores[doc_id]['score'] += 1 / (k + rank)
+            rrf_scores[doc_id]['sources'].append('vector')
+        
+        # 关键词检索排名
+        for rank, item in enumerate(keyword_results, start=1):
+            doc_id = item['id']
+            if doc_id not in rrf_scores:
+                rrf_scores[doc_id] = {
+                    'score': 0,
+                    'document': item['document'],
+                    'metadata': item['metadata'],
+                    'sources': []
+                }
+            rrf_scores[doc_id]['score'] += 1 / (k + rank)
+            rrf_scores[doc_id]['sources'].append('keyword')
+        
+        # 排序
+        fused_results = [
+            {
+                'id': doc_id,
+                'document': data['document'],
+                'metadata': data['metadata'],
+                'rrf_score': data['score'],
+                'sources': data['sources']
+            }
+            for doc_id, data in rrf_scores.items()
+        ]
+        fused_results.sort(key=lambda x: x['rrf_score'], reverse=True)
+        
+        return fused_results
+    
+    @staticmethod
+    def collapse_clusters(results: List[Dict]) -> List[Dict]:
+        """
+        近似重复去重: 同一 cluster_id（入库时 MinHash 聚类得到）只保留排名最高的一条，
+        被合并的结果 ID 记入 duplicate_ids；没有 cluster_id 的结果按 ID 区分
+        """
+        collapsed = []
+        kept = {}
+        for item in results:
+            cluster = (item.get('metadata') or {}).get('cluster_id') or item['id']
+            if cluster in kept:
+                kept[cluster].setdefault('duplicate_ids', []).append(item['id'])
+                continue
+            item = dict(item)
+            kept[cluster] = item
+            collapsed.append(item)
+        return collapsed
+    
+    def retrieve(self, query: str, top_k: int = 10, dedup: Optional[bool] = None) -> List[Dict]:
         """
         混合检索
         
         Args:
             query: 查询文本
             top_k: 初筛数量（每个检索器）
+            dedup: 是否合并近似重复结果（None=使用初始化时的设置）
         
         Returns:
             融合后的检索结果
@@ -272,6 +499,8 @@ class HybridRetriever:
         # RRF 融合
         print("  🔀 融合结果中...")
         fused_results = self.reciprocal_rank_fusion(vector_results, keyword_results)
+        if self.dedup if dedup is None else dedup:
+            fused_results = collapse_clusters(fused_results)
         
         print(f"  ✅ 返回 {len(fused_results)} 条结果")
         return fused_results
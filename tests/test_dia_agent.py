@@ -156,6 +156,773 @@ class TestRiskDetector(unittest.TestCase):
         self.assertEqual(len(egfr_warnings), 0)
 
 
+class TestContraindicationRuleEngine(unittest.TestCase):
+    """测试内存禁忌规则引擎"""
+
+    def test_compile_follows_import_semantics(self):
+        """测试编译结果与导入后图谱一致（同名药品、重复疾病节点、未知指标）"""
+        from src.agent.rule_engine import ContraindicationRuleEngine
+
+        graph_data = [
+            {"drug": {"id": "1", "name": "甲药"},
+             "treats": [{"name": "糖尿病"}],
+             "forbidden_diseases": [{"name": "糖尿病"}, {"name": "心力衰竭"}],
+             "metric_constraints": [
+                 {"metric": "eGFR", "operator": "<", "value": 30.0, "severity": "CRITICAL"},
+                 {"metric": "eGFR", "operator": "<", "value": 30.0, "severity": "CRITICAL"},
+                 {"metric": "HbA1c", "operator": ">", "value": 10.0},
+             ]},
+            {"drug": {"id": "2", "name": "甲药"},
+             "forbidden_diseases": [{"name": "肝功能不全"}],
+             "metric_constraints": [{"metric": "eGFR", "operator": "<", "value": 45.0}]},
+        ]
+        drugs = ContraindicationRuleEngine.compile_graph_data(graph_data)
+
+        self.assertEqual(len(drugs), 1)
+        name, indicators, diseases = drugs[0]
+        self.assertEqual([r.threshold for r in indicators], [30.0])
+        self.assertEqual([r.disease for r in diseases], ["糖尿病", "糖尿病", "心力衰竭"])
+
+    def test_detector_with_rule_engine(self):
+        """测试 RiskDetector 使用规则引擎检测 eGFR 禁忌"""
+        from src.agent.patient_profile import create_patient_profile
+        from src.agent.risk_detector import RiskDetector, RiskSeverity
+        from src.agent.rule_engine import ContraindicationRuleEngine
+
+        detector = RiskDetector(rule_engine=ContraindicationRuleEngine.from_graph_data())
+        profile = create_patient_profile(egfr=28, medications=["盐酸二甲双胍片", "利格列汀"])
+        report = detector.detect_risks(profile)
+        detector.close()
+
+        metformin = [w for w in report.warnings if w.drug_name == "盐酸二甲双胍片"]
+        self.assertEqual(metformin[0].severity, RiskSeverity.CRITICAL)
+        self.assertIn("eGFR < 30", metformin[0].reason)
+
+    def test_unresolved_drug_not_safe(self):
+        """测试解析失败的用药回退到名称包含匹配，图谱中找不到的药品单独列出（不计入安全用药和风险）"""
+        from src.agent.patient_profile import create_patient_profile
+        from src.agent.risk_detector import RiskDetector
+        from src.agent.rule_engine import ContraindicationRuleEngine
+
+        detector = RiskDetector(neo4j_uri=None, rule_engine=ContraindicationRuleEngine.from_graph_data())
+        profile = create_patient_profile(
+            egfr=90, complications=["低血糖"], medications=["胰岛素", "门冬胰岛素", "阿司匹林", "利格列汀"]
+        )
+        report = detector.detect_risks(profile)
+
+        drugs = {w.drug_name for w in report.warnings if w.risk_type == "疾病禁忌"}
+        self.assertIn("重组人胰岛素注射液", drugs)
+        self.assertIn("门冬胰岛素 50 注射液", drugs)
+        self.assertEqual(report.unrecognized_medications, ["阿司匹林"])
+        self.assertEqual(report.safe_medications, ["利格列汀"])
+        self.assertNotIn("阿司匹林", {w.drug_name for w in report.warnings})
+
+
+class TestBatchedRiskQuery(unittest.TestCase):
+    """测试 RiskDetector 批量 UNWIND 查询模式"""
+
+    def test_single_round_trip_same_report(self):
+        """测试全部用药只查询一次，且报告与规则引擎路径一致"""
+        from src.agent.patient_profile import create_patient_profile
+        from src.agent.risk_detector import RiskDetector
+        from src.agent.rule_engine import ContraindicationRuleEngine
+        from src.agent.drug_resolver import DrugResolver
+
+        engine = ContraindicationRuleEngine.from_graph_data()
+        resolver = DrugResolver.from_graph_data()
+        queries = []
+
+        class FakeSession:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                return False
+
+            def run(self, cypher, drug_ids):
+                queries.append(drug_ids)
+                for idx, ids in enumerate(drug_ids):
+                    indicator_rules, disease_rules = engine.match_names([resolver.drug_names[i] for i in ids])
+                    for r in indicator_rules:
+                        yield {"idx": idx, "rel_type": "CONTRAINDICATED_IF", "drug": r.drug, "target": r.metric,
+                               "operator": r.operator, "threshold": r.threshold, "severity": r.severity, "reason": None}
+                    for r in disease_rules:
+                        yield {"idx": idx, "rel_type": "FORBIDDEN_FOR", "drug": r.drug, "target": r.disease,
+                               "operator": None, "threshold": None, "severity": r.severity, "reason": r.reason}
+
+        profile = create_patient_profile(
+            egfr=28, complications=["心力衰竭"], medications=["二甲双胍", "格列美脲", "利格列汀"]
+        )
+
+        class FakeClient:
+            driver = object()
+
+            def verify(self):
+                return True
+
+            def session(self):
+                return FakeSession()
+
+        batched = RiskDetector(rule_source="off", query_mode="batched", drug_resolver=resolver,
+                               graph_client=FakeClient())
+        report = batched.detect_risks(profile)
+        expected = RiskDetector(rule_engine=engine).detect_risks(profile)
+
+        self.assertEqual(len(queries), 1)
+        self.assertEqual([w.to_dict() for w in report.warnings], [w.to_dict() for w in expected.warnings])
+        self.assertEqual(report.safe_medications, expected.safe_medications)
+
+
+class TestGraphClient(unittest.TestCase):
+    """测试共享 Neo4j 客户端"""
+
+    def test_shared_driver_single_handshake(self):
+        """测试同一连接参数共享一个客户端，多个组件只握手一次"""
+        from src.graph_client import get_graph_client, close_graph_clients
+        from src.agent.risk_detector import RiskDetector
+
+        handshakes = []
+
+        class FakeDriver:
+            def verify_connectivity(self):
+                handshakes.append(1)
+
+            def close(self):
+                pass
+
+        client = get_graph_client("bolt://shared-test:7687", "neo4j", "secret")
+        self.assertIs(get_graph_client("bolt://shared-test:7687", "neo4j", "secret"), client)
+        client._driver = FakeDriver()
+
+        first = RiskDetector(graph_client=client, rule_source="off")
+        second = RiskDetector(graph_client=client, rule_source="off")
+        self.assertIs(first.driver, second.driver)
+        self.assertEqual(len(handshakes), 1)
+        self.assertTrue(client.get_stats()["healthy"])
+
+        first.close()
+        self.assertIsNotNone(second.driver)
+        close_graph_clients()
+
+    def test_components_reconnect_and_use_client_session(self):
+        """测试启动时连接失败的组件在连接恢复后可用，查询经 GraphClient.session() 选择数据库"""
+        from src.graph_client import GraphClient
+        from src.config import Neo4jConfig
+        from src.agent.risk_detector import RiskDetector
+        from src.agent.patient_profile import create_patient_profile
+
+        up = []
+        sessions = []
+
+        class FakeSession:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                return False
+
+            def run(self, cypher, **params):
+                return iter([])
+
+        class FakeDriver:
+            def verify_connectivity(self):
+                if not up:
+                    raise ConnectionError("down")
+
+            def session(self, **kwargs):
+                sessions.append(kwargs)
+                return FakeSession()
+
+            def close(self):
+                pass
+
+        client = GraphClient("bolt://reconnect-test:7687", "neo4j", "secret", database="tnb",
+                             config=Neo4jConfig(health_interval=0), result_cache=None)
+        client._driver = FakeDriver()
+
+        detector = RiskDetector(graph_client=client, rule_source="off", query_mode="batched", drug_matching="contains")
+        profile = create_patient_profile(egfr=28, medications=["二甲双胍"])
+        self.assertIsNone(detector.driver)
+        self.assertEqual(detector.detect_risks(profile).summary, "无法连接知识图谱，风险检测受限")
+
+        up.append(1)
+        self.assertIsNotNone(detector.driver)
+        detector.detect_risks(profile)
+        self.assertEqual(sessions, [{"database": "tnb"}])
+
+
+    def test_query_connection_error_invalidates_health(self):
+        """测试查询遇到连接错误时作废缓存的健康状态，下次检查重新握手；查询语句错误不影响健康状态"""
+        from neo4j.exceptions import ServiceUnavailable
+        from src.graph_client import GraphClient
+        from src.config import Neo4jConfig
+
+        handshakes = []
+        errors = [ValueError("Invalid input 'RETRUN'"), ServiceUnavailable("connection lost")]
+
+        class FakeSession:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                return False
+
+            def run(self, cypher, params=None):
+                raise errors.pop(0)
+
+        class FakeDriver:
+            def verify_connectivity(self):
+                handshakes.append(1)
+
+            def session(self, **kwargs):
+                return FakeSession()
+
+        client = GraphClient("bolt://health-test:7687", "neo4j", "secret",
+                             config=Neo4jConfig(health_interval=3600))
+        client._driver = FakeDriver()
+        client.result_cache = None
+        self.assertTrue(client.verify())
+
+        with self.assertRaises(ValueError):
+            client.query("MATCH (d) RETRUN d")
+        self.assertTrue(client.verify())
+        self.assertEqual(len(handshakes), 1)
+
+        with self.assertRaises(ServiceUnavailable):
+            client.query("MATCH (d:Drug) RETURN d")
+        self.assertEqual(client.get_stats()["last_error"], "connection lost")
+        self.assertTrue(client.verify())
+        self.assertEqual(len(handshakes), 2)
+
+
+class TestCypherResultCache(unittest.TestCase):
+    """测试带图谱版本号的 Cypher 结果缓存"""
+
+    def test_cache_invalidated_by_graph_version(self):
+        """测试相同查询命中缓存，图谱版本变化后重新查询，写操作不缓存"""
+        from src.graph_client import GraphClient
+        from src.cypher_cache import CypherResultCache, GRAPH_VERSION_QUERY, normalize_cypher
+
+        state = {"version": "v1", "queries": 0}
+
+        class FakeRecord(dict):
+            def data(self):
+                return dict(self)
+
+        class FakeResult(list):
+            def single(self):
+                return self[0] if self else None
+
+        class FakeSession:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                return False
+
+            def run(self, cypher, params=None):
+                if cypher == GRAPH_VERSION_QUERY:
+                    return FakeResult([FakeRecord(version=state["version"])])
+                state["queries"] += 1
+                return FakeResult([FakeRecord(drug="盐酸二甲双胍片")])
+
+        client = GraphClient("bolt://cache-test:7687", "neo4j", "secret",
+                             result_cache=CypherResultCache(version_check_interval=0))
+        client._driver = type("FakeDriver", (), {"session": lambda self, **kw: FakeSession()})()
+
+        cypher = "MATCH (d:Drug)\n  WHERE d.name = 'A  B'\nRETURN d.name AS drug;"
+        self.assertEqual(normalize_cypher(cypher), "MATCH (d:Drug) WHERE d.name = 'A  B' RETURN d.name AS drug")
+
+        self.assertEqual(client.query(cypher), [{"drug": "盐酸二甲双胍片"}])
+        client.query("MATCH (d:Drug) WHERE d.name = 'A  B' RETURN d.name AS drug")
+        self.assertEqual(state["queries"], 1)
+
+        state["version"] = "v2"
+        client.query(cypher)
+        self.assertEqual(state["queries"], 2)
+        self.assertEqual(client.result_cache.get_stats()["invalidations"], 1)
+
+        client.query("MERGE (d:Drug {name: 'X'}) RETURN d.name AS drug")
+        client.query("MERGE (d:Drug {name: 'X'}) RETURN d.name AS drug")
+        self.assertEqual(state["queries"], 4)
+
+
+class TestCypherValidator(unittest.TestCase):
+    """测试 Cypher 词法校验、LIMIT 注入与 EXPLAIN 计划检查"""
+
+    def test_tokenized_read_only_check(self):
+        """测试属性名/别名/字符串中的关键字不误判，真正的写操作被拒绝"""
+        from src.cypher_validator import check_read_only_cypher
+
+        self.assertEqual(check_read_only_cypher(
+            "MATCH (d:Drug) WHERE d.name <> 'DELETE' RETURN d.offset AS setting SKIP 1"
+        ), (True, ""))
+        self.assertFalse(check_read_only_cypher("MATCH (d:Drug) SET d.x = 1 RETURN d")[0])
+        self.assertFalse(check_read_only_cypher("MATCH (d) RETURN d; MATCH (n) DETACH DELETE n")[0])
+        self.assertFalse(check_read_only_cypher("RETURN 1")[0])
+
+    def test_limit_injection(self):
+        """测试自动追加 LIMIT、收紧过大的 LIMIT"""
+        from src.cypher_validator import apply_row_limit
+
+        self.assertEqual(apply_row_limit("MATCH (d) RETURN d;", 100), "MATCH (d) RETURN d\nLIMIT 100")
+        self.assertEqual(apply_row_limit("MATCH (d) RETURN d LIMIT 5000", 100), "MATCH (d) RETURN d LIMIT 100")
+        self.assertEqual(apply_row_limit("MATCH (d) RETURN d LIMIT 10", 100), "MATCH (d) RETURN d LIMIT 10")
+
+    def test_explain_plan_budget_and_cache(self):
+        """测试预估行数超预算的查询被拒绝，同一查询形状只 EXPLAIN 一次"""
+        from types import SimpleNamespace
+        from src.cypher_validator import CypherValidator
+
+        calls = []
+
+        def explain(cypher, params):
+            calls.append(cypher)
+            rows = 5e6 if "(a), (b)" in cypher else 40
+            return SimpleNamespace(query_type="r", plan={
+                "operatorType": "ProduceResults@neo4j", "identifiers": ["a", "b"],
+                "args": {"EstimatedRows": 40.0, "planner": "COST", "runtime": "PIPELINED"},
+                "children": [{"operatorType": "CartesianProduct@neo4j", "identifiers": ["a", "b"],
+                              "args": {"EstimatedRows": float(rows)}, "children": []}],
+            })
+
+        validator = CypherValidator(row_limit=50, max_estimated_rows=1e5, use_explain=True)
+        result = validator.validate("MATCH (a), (b) RETURN a, b", explain=explain)
+        self.assertFalse(result.valid)
+        self.assertIn("CartesianProduct", result.error)
+
+        first = validator.validate("MATCH (d:Drug {id: $id}) RETURN d", {"id": "1"}, explain=explain)
+        second = validator.validate("MATCH (d:Drug {id: $id})\nRETURN d", {"id": "2"}, explain=explain)
+        self.assertTrue(first.valid)
+        self.assertTrue(first.cypher.endswith("LIMIT 50"))
+        self.assertIs(first, second)
+        self.assertEqual(len(calls), 2)
+
+        # 旧版驱动的执行计划对象: 参数在 arguments 属性中
+        object_plan = SimpleNamespace(operator_type="AllNodesScan@neo4j",
+                                      arguments={"EstimatedRows": 2e5}, children=[])
+        scan = validator.validate(
+            "MATCH (n) RETURN n", explain=lambda c, p: SimpleNamespace(query_type="r", plan=object_plan)
+        )
+        self.assertFalse(scan.valid)
+        self.assertEqual(scan.estimated_rows, 2e5)
+
+        writes = validator.validate(
+            "MATCH (d) RETURN d.x AS x", explain=lambda c, p: SimpleNamespace(query_type="rw", plan=None)
+        )
+        self.assertFalse(writes.valid)
+
+
+class TestGraphImportRows(unittest.TestCase):
+    """测试批量/增量导入的参数行与导入脚本语义一致"""
+
+    @classmethod
+    def setUpClass(cls):
+        import json
+        import importlib.util
+        from src.agent.rule_engine import DEFAULT_GRAPH_DATA
+
+        spec = importlib.util.spec_from_file_location(
+            "import_neo4j", Path(__file__).parent.parent / "scripts" / "import_neo4j.py"
+        )
+        cls.module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(cls.module)
+
+        with open(DEFAULT_GRAPH_DATA, encoding="utf-8") as f:
+            cls.graph_data = json.load(f)
+
+    def test_rows_match_compiled_rules(self):
+        """测试 UNWIND 导入行与规则引擎编译的禁忌规则一致（同名药品、同名疾病节点）"""
+        from collections import Counter
+        from src.agent.rule_engine import ContraindicationRuleEngine
+
+        rows = self.module.build_import_rows(self.graph_data)
+        compiled = ContraindicationRuleEngine.compile_graph_data(self.graph_data)
+        names = {row["props"]["id"]: row["name"] for row in rows["drugs"]}
+
+        self.assertEqual(len(names), len(compiled))
+        self.assertEqual(
+            Counter((names[r["drug_id"]], r["disease"]) for r in rows["forbidden_for"]),
+            Counter((rule.drug, rule.disease) for _, _, diseases in compiled for rule in diseases)
+        )
+        self.assertEqual(
+            Counter((names[r["drug_id"]], r["metric"], r["operator"], r.get("value")) for r in rows["contraindicated_if"]),
+            Counter((rule.drug, rule.metric, rule.operator, rule.threshold)
+                    for _, indicators, _ in compiled for rule in indicators)
+        )
+
+    def test_incremental_diff_only_changed_drugs(self):
+        """测试修改一个药品的说明书内容只影响该药品的内容哈希"""
+        import copy
+
+        rows = self.module.build_import_rows(self.graph_data)
+        live = {row["name"]: row["props"]["content_hash"] for row in rows["drugs"]}
+        self.assertEqual(self.module.diff_drug_hashes(rows, live), ([], [], []))
+
+        edited = copy.deepcopy(self.graph_data)
+        edited[0]["drug"]["dosage_info"]["timing"] = "餐前"
+        edited[0]["metric_constraints"][0]["value"] = 45
+        removed = edited.pop()
+        added, updated, deleted = self.module.diff_drug_hashes(self.module.build_import_rows(edited), live)
+        self.assertEqual(added, [])
+        self.assertEqual(updated, [edited[0]["drug"]["name"]])
+        self.assertEqual(deleted, [removed["drug"]["name"]])
+
+    def test_bulk_csv_matches_import_rows(self):
+        """测试 neo4j-admin CSV 与批量导入写入的关系一致"""
+        import csv
+        import tempfile
+        from collections import Counter
+        from src.agent.rule_engine import DEFAULT_GRAPH_DATA
+        from src.graph.cypher_generator import CypherGenerator
+
+        rows = self.module.build_import_rows(self.graph_data)
+        with tempfile.TemporaryDirectory() as output_dir:
+            CypherGenerator().generate_bulk_csv(str(DEFAULT_GRAPH_DATA), output_dir)
+
+            def read(name):
+                with open(Path(output_dir) / f"{name}.csv", encoding="utf-8") as f:
+                    return list(csv.reader(f))[1:]
+
+            self.assertEqual(len(read("nodes_drug")), len(rows["drugs"]))
+            self.assertEqual(len(read("nodes_disease")), len(rows["diseases"]))
+            for kind in ("treats", "forbidden_for"):
+                self.assertEqual(
+                    Counter((r[0], r[1]) for r in read(f"rels_{kind}")),
+                    Counter((r["drug_id"], f"{r['type']}:{r['disease']}") for r in rows[kind])
+                )
+            contraindications = read("rels_contraindicated_if")
+            self.assertEqual(len(contraindications), len(rows["contraindicated_if"]))
+            self.assertEqual(contraindications[0][5:7], ["", ""])
+
+    def test_bulk_csv_types_match_import_rows(self):
+        """测试 CSV 的 Disease 节点不带额外属性、整数阈值保持整数类型、导入命令支持多行字段"""
+        import copy
+        import csv
+        import json
+        import tempfile
+        from src.graph.cypher_generator import CypherGenerator
+
+        graph_data = copy.deepcopy(self.graph_data)
+        item = next(i for i in graph_data if i.get("metric_constraints"))
+        item["metric_constraints"][0]["value"] = 45
+        with tempfile.TemporaryDirectory() as tmp:
+            source = Path(tmp) / "graph_data.json"
+            source.write_text(json.dumps(graph_data, ensure_ascii=False), encoding="utf-8")
+            command = CypherGenerator().generate_bulk_csv(str(source), tmp)
+
+            with open(Path(tmp) / "nodes_disease.csv", encoding="utf-8") as f:
+                self.assertEqual(next(csv.reader(f)), [":ID(Disease)", "name", "type"])
+            with open(Path(tmp) / "rels_contraindicated_if_long_float_float.csv", encoding="utf-8") as f:
+                header, *rows = list(csv.reader(f))
+            self.assertIn("value:long", header)
+            self.assertEqual([r[header.index("value:long")] for r in rows], ["45"])
+
+        self.assertIn("--multiline-fields=true", command)
+        self.assertIn("--relationships=CONTRAINDICATED_IF=", command.split("rels_contraindicated_if.csv")[1])
+
+    def test_bulk_csv_streams_jsonl(self):
+        """测试从 graph_data.jsonl 逐行生成的 CSV 与 graph_data.json 生成的一致"""
+        import json
+        import tempfile
+        from src.agent.rule_engine import DEFAULT_GRAPH_DATA
+        from src.graph.cypher_generator import CypherGenerator, CSV_HEADERS
+
+        with tempfile.TemporaryDirectory() as tmp:
+            jsonl = Path(tmp) / "graph_data.jsonl"
+            with open(jsonl, "w", encoding="utf-8") as f:
+                for item in self.graph_data:
+                    f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            CypherGenerator().generate_bulk_csv(str(DEFAULT_GRAPH_DATA), str(Path(tmp) / "from_json"))
+            CypherGenerator().generate_bulk_csv(str(jsonl), str(Path(tmp) / "from_jsonl"))
+
+            for name in CSV_HEADERS:
+                if name == "nodes_graphmeta":
+                    continue
+                expected = (Path(tmp) / "from_json" / f"{name}.csv").read_text(encoding="utf-8")
+                self.assertEqual((Path(tmp) / "from_jsonl" / f"{name}.csv").read_text(encoding="utf-8"), expected)
+
+
+class TestEntityExtractor(unittest.TestCase):
+    """测试单次扫描的多模式实体提取"""
+
+    def setUp(self):
+        from src.data.entity_extractor import EntityExtractor
+        self.extractor = EntityExtractor()
+
+    def test_reproduces_graph_data(self):
+        """测试对 drugs_structured.json 重新提取得到的结果与 graph_data.json 完全一致"""
+        import json
+
+        processed = PROJECT_ROOT / "data" / "processed"
+        with open(processed / "drugs_structured.json", encoding="utf-8") as f:
+            drugs = json.load(f)
+        with open(processed / "graph_data.json", encoding="utf-8") as f:
+            expected = json.load(f)
+        self.assertEqual([self.extractor.process_drug(drug) for drug in drugs], expected)
+
+    def test_hits_with_spans(self):
+        """测试实体命中带位置，大小写不敏感，疾病按模式顺序去重"""
+        text = "禁用于ckd患者及2 型糖尿病酮症酸中毒，心衰"
+        hits = self.extractor.scan(text, kinds=('disease',))
+        for hit in hits:
+            self.assertEqual(text[hit.start:hit.end], hit.text)
+        self.assertIn("ckd", [hit.text for hit in hits])
+
+        names = [d["name"] for d in self.extractor.extract_diseases(text, "禁忌")]
+        self.assertEqual(names, ["2型糖尿病", "糖尿病", "酮症酸中毒", "心衰", "ckd"])
+        self.assertEqual(self.extractor.infer_category({"name": "利拉鲁肽", "pharmacology": "GLP-1受体激动剂"}),
+                         "GLP-1激动剂")
+
+
+class TestGuidelineParser(unittest.TestCase):
+    """测试指南 PDF 按页区间并行解析与单进程解析结果一致"""
+
+    def test_parallel_matches_serial(self):
+        """测试标题跨页区间延续、表格按页追加，并行结果与逐页解析一致"""
+        import tempfile
+        import fitz
+        from src.data.guideline_parser import (
+            extract_tables_to_markdown, parse_pdf_with_headers, parse_pdf_parallel
+        )
+
+        doc = fitz.open()
+        for p in range(5):
+            page = doc.new_page()
+            if p % 2 == 0:
+                page.insert_text((50, 60), f"Chapter {p}", fontsize=24)
+            for k in range(8):
+                page.insert_text((50, 100 + k * 14), f"page {p} line {k}", fontsize=10)
+            if p == 3:
+                for r in range(3):
+                    for c in range(2):
+                        rect = fitz.Rect(60 + c * 100, 420 + r * 20, 160 + c * 100, 440 + r * 20)
+                        page.draw_rect(rect, color=(0, 0, 0), width=0.8)
+                        page.insert_text((rect.x0 + 3, rect.y0 + 14), f"r{r}c{c}", fontsize=9)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            pdf_path = str(Path(tmp_dir) / "guideline.pdf")
+            doc.save(pdf_path)
+            tables = extract_tables_to_markdown(pdf_path)
+            expected = parse_pdf_with_headers(pdf_path, tables)
+            chunks, table_count = parse_pdf_parallel(pdf_path, workers=2, pages_per_task=2)
+
+        self.assertEqual(chunks, expected)
+        self.assertEqual(table_count, len(tables))
+        self.assertEqual([c["header"] for c in chunks], ["Chapter 0", "Chapter 2", "Chapter 4"])
+        self.assertIn("【表格】", chunks[1]["text"])
+
+    def test_incremental_vectorization_plan(self):
+        """测试内容哈希 ID：只有新增/修改的切片需要向量化，中断后从检查点继续"""
+        import tempfile
+        from src.data.guideline_parser import chunk_document, chunk_id, plan_chunk_sync, embed_documents
+
+        chunks = [{"header": f"h{i}", "text": f"text {i}", "page": i} for i in range(10)]
+        existing = {chunk_id(chunk_document(c)): {"header": c["header"], "page": c["page"]} for c in chunks}
+
+        edited = [dict(c) for c in chunks[1:]]
+        edited[0]["text"] += " 修订"
+        edited[1]["page"] = 99
+        plan = plan_chunk_sync(edited + [dict(edited[2])], existing)
+        self.assertEqual(len(plan["records"]), 9)
+        self.assertEqual(plan["to_embed"], [chunk_id(chunk_document(edited[0]))])
+        self.assertEqual(plan["to_update"], [chunk_id(chunk_document(edited[1]))])
+        self.assertEqual(len(plan["stale"]), 2)
+
+        calls = []
+
+        def encode(texts):
+            calls.append(len(texts))
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            return [[float(len(t))] for t in texts]
+
+        documents = {str(i): "x" * i for i in range(1, 9)}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            checkpoint = str(Path(tmp_dir) / "checkpoint.jsonl")
+            with self.assertRaises(KeyboardInterrupt):
+                embed_documents(documents, encode, checkpoint, max_batch_size=4)
+            calls.clear()
+            embeddings = embed_documents(documents, lambda texts: calls.append(len(texts)) or
+                                         [[float(len(t))] for t in texts], checkpoint, max_batch_size=4)
+        self.assertEqual(calls, [4])
+        self.assertEqual(embeddings, {cid: [float(len(doc))] for cid, doc in documents.items()})
+
+
+class TestNearDuplicateDedup(unittest.TestCase):
+    """测试 MinHash + LSH 近似重复切片去重"""
+
+    def setUp(self):
+        base = "二甲双胍禁用于eGFR低于30的患者，肾功能不全患者应减量并定期监测肾功能和乳酸水平。" * 4
+        self.chunks = [
+            {"header": "用药", "text": base, "page": 3},
+            {"header": "其他", "text": "生活方式干预包括饮食控制和规律运动，每周至少150分钟中等强度运动。", "page": 5},
+            {"header": "附录", "text": base + "（见表3）", "page": 40},
+            {"header": "用药", "text": base, "page": 41},
+        ]
+
+    def test_clusters_near_duplicates(self):
+        """测试近似重复文本归为同一簇，不相关文本单独成簇"""
+        from src.near_dedup import cluster_near_duplicates
+
+        self.assertEqual(cluster_near_duplicates([c["text"] for c in self.chunks]), [0, 1, 0, 0])
+
+    def test_dedup_chunks_keeps_canonical(self):
+        """测试每簇保留最长的切片，其余页码记入 pages，仅标记模式保留全部切片"""
+        from src.data.guideline_parser import dedup_chunks
+
+        deduped = dedup_chunks(self.chunks, threshold=0.8, drop=True)
+        self.assertEqual([c["page"] for c in deduped], [5, 40])
+        self.assertEqual(deduped[1]["pages"], "3,40,41")
+        self.assertNotIn("cluster_id", deduped[0])
+
+        tagged = dedup_chunks(self.chunks, threshold=0.8, drop=False)
+        self.assertEqual(len(tagged), 4)
+        self.assertEqual({c["cluster_id"] for c in tagged if c["page"] != 5}, {deduped[1]["cluster_id"]})
+
+    def test_metadata_update_drops_stale_cluster_keys(self):
+        """测试切片离开近似重复簇后，集合中的 cluster_id / pages 被删除，再次同步时不再判为变化"""
+        import tempfile
+        import chromadb
+        from src.data.guideline_parser import COLLECTION_NAME, plan_chunk_sync, vectorize_and_store
+
+        encode = lambda texts: [[float(len(t)), 1.0] for t in texts]
+        tagged = [dict(self.chunks[0], cluster_id="cluster_x", pages="3,41"), self.chunks[1]]
+        client = chromadb.EphemeralClient()
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                checkpoint = f"{tmp}/checkpoint.jsonl"
+                vectorize_and_store(tagged, client=client, encode=encode, checkpoint_path=checkpoint)
+                collection = vectorize_and_store(self.chunks[:2], client=client, encode=encode,
+                                                 checkpoint_path=checkpoint)
+
+            stored = collection.get(include=["metadatas"])
+            self.assertEqual([set(m) for m in stored["metadatas"]], [{"header", "page"}] * 2)
+            plan = plan_chunk_sync(self.chunks[:2], dict(zip(stored["ids"], stored["metadatas"])))
+            self.assertEqual((plan["to_embed"], plan["to_update"], plan["stale"]), ([], [], []))
+        finally:
+            client.delete_collection(COLLECTION_NAME)
+
+    def test_query_time_collapse(self):
+        """测试检索结果按 cluster_id 合并，保留排名最高的一条"""
+        from src.near_dedup import collapse_clusters
+
+        results = [
+            {"id": "a", "metadata": {"cluster_id": "c1"}, "rrf_score": 0.3},
+            {"id": "b", "metadata": {}, "rrf_score": 0.2},
+            {"id": "c", "metadata": {"cluster_id": "c1"}, "rrf_score": 0.1},
+        ]
+        collapsed = collapse_clusters(results)
+        self.assertEqual([r["id"] for r in collapsed], ["a", "b"])
+        self.assertEqual(collapsed[0]["duplicate_ids"], ["c"])
+
+
+class TestDrugDataPipeline(unittest.TestCase):
+    """测试药品说明书流式并行流水线与逐条处理结果一致"""
+
+    RAW_DATA = PROJECT_ROOT / "data" / "raw" / "data.md"
+    PROCESSED = PROJECT_ROOT / "data" / "processed"
+
+    def test_stream_matches_split(self):
+        """测试逐行流式切分与整文件正则切分结果一致"""
+        from src.data.drug_parser import iter_drug_texts, split_into_drugs
+
+        with open(self.RAW_DATA, encoding="utf-8") as f:
+            expected = split_into_drugs(f.read())
+        self.assertEqual(list(iter_drug_texts(str(self.RAW_DATA))), expected)
+
+    def test_parallel_pipeline_reproduces_outputs(self):
+        """测试多进程流水线输出与现有 drugs_structured.json / graph_data.json 逐字节一致"""
+        import json
+        import tempfile
+        from src.data.pipeline import run_pipeline, iter_jsonl
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            stats = run_pipeline(str(self.RAW_DATA), output_dir, workers=2, chunk_size=8)
+            output = Path(output_dir)
+            for name in ("drugs_structured", "graph_data"):
+                self.assertEqual(
+                    (output / f"{name}.json").read_bytes(),
+                    (self.PROCESSED / f"{name}.json").read_bytes()
+                )
+            with open(self.PROCESSED / "graph_data.json", encoding="utf-8") as f:
+                self.assertEqual(list(iter_jsonl(str(output / "graph_data.jsonl"))), json.load(f))
+        self.assertEqual(stats["drugs"], 108)
+
+
+class TestDrugResolver(unittest.TestCase):
+    """测试药品名解析"""
+
+    def test_resolve_mentions(self):
+        """测试通用名、商品名、别名和全称解析为 Drug id"""
+        from src.agent.drug_resolver import DrugResolver
+
+        resolver = DrugResolver(
+            drugs=[("1", "盐酸二甲双胍片"), ("2", "盐酸二甲双胍缓释片"), ("3", "西格列汀二甲双胍片"), ("4", "米格列奈钙片")],
+            brands=[("格华止", "1"), ("捷诺维 (Januvia)", "3")],
+            aliases={"甲福明": "二甲双胍"}
+        )
+
+        self.assertEqual(resolver.resolve("盐酸二甲双胍片"), ["1"])
+        self.assertEqual(resolver.resolve("二甲双胍"), ["1", "2"])
+        self.assertEqual(resolver.resolve("甲福明"), ["1", "2"])
+        self.assertEqual(resolver.resolve("格华止"), ["1"])
+        self.assertEqual(resolver.resolve("januvia"), ["3"])
+        self.assertEqual(resolver.resolve("米格列奈"), ["4"])
+        self.assertEqual(resolver.resolve("二甲双胍 0.5g bid"), ["1", "2"])
+        self.assertEqual(resolver.resolve("阿司匹林"), [])
+
+        insulin = DrugResolver(drugs=[("1", "门冬胰岛素注射液"), ("2", "门冬胰岛素 30 注射液"), ("3", "甘精胰岛素 U300")])
+        self.assertEqual(insulin.resolve("门冬胰岛素"), ["1", "2"])
+        self.assertEqual(insulin.resolve("门冬胰岛素 30 注射液"), ["2"])
+        self.assertEqual(insulin.resolve("甘精胰岛素"), ["3"])
+
+
+class TestPopulationScreener(unittest.TestCase):
+    """测试向量化人群筛查"""
+
+    def test_matches_risk_detector(self):
+        """测试向量化筛查结果与逐个 detect_risks 一致"""
+        from src.agent.patient_profile import create_patient_profile
+        from src.agent.risk_detector import RiskDetector
+        from src.agent.population_screener import PopulationScreener
+
+        screener = PopulationScreener()
+        detector = RiskDetector(neo4j_uri=None, rule_engine=screener.rule_engine)
+        profiles = [
+            create_patient_profile(egfr=28, complications=["心力衰竭"], medications=["二甲双胍", "利格列汀"]),
+            create_patient_profile(egfr=90, medications=["利格列汀"]),
+            create_patient_profile(medications=["恩格列净二甲双胍片"], complications=["酮症酸中毒"]),
+            create_patient_profile(egfr=40),
+            create_patient_profile(complications=["低血糖"], medications=["胰岛素", "阿司匹林"]),
+        ]
+
+        result = screener.screen(profiles)
+        self.assertEqual(list(result.flagged_patients()), [0, 2, 4])
+        for i, profile in enumerate(profiles):
+            expected = detector.detect_risks(profile)
+            actual = result.report(i)
+            self.assertEqual([w.to_dict() for w in actual.warnings], [w.to_dict() for w in expected.warnings])
+            self.assertEqual(actual.safe_medications, expected.safe_medications)
+            self.assertEqual(actual.unrecognized_medications, expected.unrecognized_medications)
+
+    def test_chunked_screening_same_result(self):
+        """测试分块计算（含疾病对分块）与整体计算结果一致"""
+        from src.agent.patient_profile import create_patient_profile
+        from src.agent.population_screener import PopulationScreener
+
+        profiles = [
+            create_patient_profile(egfr=28 + i, complications=["心力衰竭", f"病史{i}"],
+                                   medical_history=["酮症酸中毒"] if i % 2 else [],
+                                   medications=["二甲双胍", "恩格列净二甲双胍片"])
+            for i in range(6)
+        ]
+        whole = PopulationScreener().screen(profiles)
+        chunked = PopulationScreener(chunk_size=1).screen(profiles)
+        self.assertGreater(len(whole.violations), 0)
+        self.assertEqual(whole.violations.tolist(), chunked.violations.tolist())
+
+
 class TestDecisionFusion(unittest.TestCase):
     """测试决策融合器"""
     
@@ -186,6 +953,251 @@ class TestDecisionFusion(unittest.TestCase):
             self.assertTrue(len(renal_recs) > 0)
 
 
+class TestFusionCache(unittest.TestCase):
+    """测试决策融合语义缓存"""
+
+    def test_signature_ignores_irrelevant_details(self):
+        """测试年龄、HbA1c 小数位不同但临床签名相同的患者复用 LLM 分析"""
+        from src.agent.patient_profile import create_patient_profile
+        from src.agent.risk_detector import RiskReport, RiskWarning, RiskSeverity
+        from src.agent.decision_fusion import DecisionFusion
+
+        calls = []
+        fusion = DecisionFusion(llm_api=lambda p: calls.append(p) or "建议停用二甲双胍", cache_enabled=True)
+        risk_report = RiskReport(warnings=[RiskWarning(
+            drug_name="二甲双胍", risk_type="指标禁忌",
+            severity=RiskSeverity.CRITICAL, reason="eGFR < 30"
+        )])
+
+        first = create_patient_profile(age=55, hba1c=8.2, egfr=28, medications=["二甲双胍"])
+        second = create_patient_profile(age=61, hba1c=8.47, egfr=25, medications=["二甲双胍"])
+        other = create_patient_profile(age=61, hba1c=9.5, egfr=25, medications=["二甲双胍"])
+
+        fusion.fuse(first, risk_report)
+        report = fusion.fuse(second, risk_report)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(report.llm_response, "建议停用二甲双胍")
+
+        fusion.fuse(other, risk_report)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(fusion.fusion_cache.get_stats()["hits"], 1)
+
+
+class TestPromptBuilder(unittest.TestCase):
+    """测试 Prompt 静态前缀缓存"""
+
+    def test_prefix_rendered_once_per_version(self):
+        """测试同一配置版本的前缀只格式化一次，配置变化后重新生成"""
+        from src.prompt_builder import PromptBuilder
+
+        renders = []
+        builder = PromptBuilder()
+        version = builder.fingerprint({"schema": 1})
+
+        def render():
+            renders.append(1)
+            return "SYSTEM\n"
+
+        first = builder.build((version, "system"), render, "问题A")
+        second = builder.build((version, "system"), render, "问题B")
+        self.assertEqual((first, second), ("SYSTEM\n问题A", "SYSTEM\n问题B"))
+        self.assertEqual(len(renders), 1)
+
+        builder.build((builder.fingerprint({"schema": 2}), "system"), render, "问题A")
+        self.assertEqual(len(renders), 2)
+        self.assertEqual(builder.get_stats()["hits"], 1)
+
+    def test_fusion_prompts_share_static_prefix(self):
+        """测试不同病例的融合 Prompt 以相同的静态前缀开头"""
+        from src.agent.patient_profile import create_patient_profile
+        from src.agent.risk_detector import RiskReport, RiskWarning, RiskSeverity
+        from src.agent.decision_fusion import DecisionFusion
+
+        fusion = DecisionFusion(cache_enabled=False)
+        risk_report = RiskReport(warnings=[RiskWarning(
+            drug_name="二甲双胍", risk_type="指标禁忌",
+            severity=RiskSeverity.CRITICAL, reason="eGFR < 30"
+        )])
+        prompts = [
+            fusion.prepare(create_patient_profile(age=age, egfr=egfr, medications=["二甲双胍"]),
+                           risk_report, require_llm=False)[1]
+            for age, egfr in [(55, 28), (70, 20)]
+        ]
+        for prompt in prompts:
+            self.assertTrue(prompt.startswith(DecisionFusion.FUSION_PROMPT_PREFIX))
+        self.assertNotEqual(prompts[0], prompts[1])
+        self.assertIn("eGFR 28", prompts[0])
+
+
+class TestContextPacker(unittest.TestCase):
+    """测试 token 预算内的证据选择与裁剪"""
+
+    def setUp(self):
+        self.rag_results = [
+            {
+                'document': '【章节】用药安全\n' + '二甲双胍是一线用药。' * 5
+                            + 'eGFR < 30 时应停用二甲双胍。' + '其他说明内容。' * 20,
+                'metadata': {'header': '用药安全', 'page': 45},
+                'rerank_score': 0.9,
+            },
+            {
+                'document': '【章节】运动\n' + '规律运动有助于控制血糖。' * 10,
+                'metadata': {'header': '运动', 'page': 3},
+                'rerank_score': 0.2,
+            },
+        ]
+        self.kg_results = [{'药品名称': '二甲双胍', '严重程度': '绝对禁忌'}]
+
+    def test_within_budget_keeps_hit_sentences(self):
+        """测试预算紧张时保留 KG 行和命中问题关键词的句子"""
+        from src.context_packer import ContextPacker
+
+        packer = ContextPacker(token_budget=80, estimate=len)
+        packed = packer.pack("eGFR小于30能用二甲双胍吗", self.rag_results, self.kg_results)
+
+        self.assertLessEqual(packed.tokens, 80)
+        self.assertEqual(packed.kg_results, self.kg_results)
+        self.assertEqual(len(packed.rag_results), 1)
+        self.assertIn("eGFR < 30 时应停用二甲双胍。", packed.rag_results[0]['packed_content'])
+        self.assertNotIn("用药安全", packed.rag_results[0]['packed_content'])
+
+    def test_large_budget_keeps_full_documents(self):
+        """测试预算充足时保留全部证据原文，顺序不变"""
+        from src.context_packer import ContextPacker
+
+        packed = ContextPacker(token_budget=5000, estimate=len).pack("运动", self.rag_results, self.kg_results)
+        self.assertEqual([d['metadata']['page'] for d in packed.rag_results], [45, 3])
+        self.assertEqual(packed.trimmed, 0)
+        self.assertEqual(packed.rag_results[1]['packed_content'], '规律运动有助于控制血糖。' * 10)
+
+    def test_kg_first_rows_never_compete(self):
+        """测试 kg_first 时 KG 行先占预算、按原顺序保留，超出全部预算的行计入 kg_omitted"""
+        from src.context_packer import ContextPacker, kg_row_text
+
+        kg_results = [{'药品名称': f'药品{i:02d}', '严重程度': '禁忌'} for i in range(80)]
+        row_cost = len(kg_row_text(kg_results[0])) + 2
+        packer = ContextPacker(token_budget=row_cost * 30 + 5, estimate=len)
+
+        packed = packer.pack("eGFR小于30能用二甲双胍吗", self.rag_results, kg_results, kg_first=True)
+        self.assertEqual(packed.kg_results, kg_results[:30])
+        self.assertEqual(packed.kg_omitted, 50)
+        self.assertEqual(packed.rag_results, [])
+        self.assertLessEqual(packed.tokens, packed.budget)
+
+        roomy = ContextPacker(token_budget=row_cost * 80 + 200, estimate=len)
+        packed = roomy.pack("eGFR小于30能用二甲双胍吗", self.rag_results, kg_results, kg_first=True)
+        self.assertEqual(packed.kg_omitted, 0)
+        self.assertEqual(len(packed.kg_results), 80)
+        self.assertIn("eGFR < 30 时应停用二甲双胍。", packed.rag_results[0]['packed_content'])
+
+
+class TestEvidenceMatcher(unittest.TestCase):
+    """测试指南片段与知识图谱规则的重复和冲突比对"""
+
+    def setUp(self):
+        self.kg_results = [
+            {'药品名称': '盐酸二甲双胍片', '运算符': '<', '阈值': 30.0, '严重程度': 'CRITICAL'},
+            {'药品名称': '达格列净片', '运算符': '<', '阈值': 25.0, '严重程度': 'CRITICAL'},
+        ]
+        self.question = "eGFR小于30的患者不能使用哪些药物？"
+
+    def _doc(self, content, page):
+        return {'document': f'【章节】用药安全\n{content}', 'metadata': {'header': '用药安全', 'page': page}}
+
+    def test_drops_sentences_covered_by_kg(self):
+        """测试与 KG 规则同药品、同阈值的指南句子被去掉，其余句子保留"""
+        from src.evidence_matcher import EvidenceMatcher
+
+        rag_results = [
+            self._doc('eGFR < 30 mL/min/1.73m² 时应停用二甲双胍。患者应改用胰岛素治疗。', 45),
+            self._doc('eGFR小于30时，禁用二甲双胍。', 46),
+            self._doc('eGFR ≥ 30 时二甲双胍可以使用。', 47),
+        ]
+        overlap = EvidenceMatcher(self.kg_results, self.question).compare(rag_results)
+
+        self.assertEqual(overlap.removed_sentences, 2)
+        self.assertEqual(overlap.removed_documents, 1)
+        self.assertEqual([d['metadata']['page'] for d in overlap.rag_results], [45, 47])
+        self.assertEqual(overlap.rag_results[0]['document'], '患者应改用胰岛素治疗。')
+        self.assertIs(overlap.rag_results[1], rag_results[2])
+        self.assertEqual(overlap.conflicts, [])
+
+    def test_reports_disagreements(self):
+        """测试指南阈值与 KG 不同、或指南允许使用 KG 禁用的情况被报告为冲突"""
+        from src.evidence_matcher import EvidenceMatcher
+
+        rag_results = [
+            self._doc('eGFR<45时，不推荐起始使用达格列净。', 60),
+            self._doc('eGFR 20~40 时二甲双胍可继续使用。', 61),
+            self._doc('eGFR < 20 时禁用二甲双胍。', 62),
+        ]
+        overlap = EvidenceMatcher(self.kg_results, self.question).compare(rag_results)
+
+        self.assertEqual([(c.drug, c.subject, c.page) for c in overlap.conflicts],
+                         [('达格列净', 'eGFR < 45', '60'), ('二甲双胍', 'eGFR 20-40', '61')])
+        self.assertEqual(overlap.removed_sentences, 0)
+
+    def test_disease_rows_and_metric_from_row(self):
+        """测试疾病禁忌行与带指标名的结果行"""
+        from src.evidence_matcher import EvidenceMatcher
+
+        kg_results = [
+            {'药品名称': '盐酸二甲双胍片', '禁忌疾病': '急性心力衰竭', '严重程度': '禁忌'},
+            {'药品名称': '盐酸二甲双胍片', '关系类型': 'CONTRAINDICATED_IF', '目标名称': 'eGFR',
+             '严重程度': 'WARNING', '运算符': '<', '阈值': 45},
+        ]
+        matcher = EvidenceMatcher(kg_results)
+        self.assertEqual(len(matcher.facts), 2)
+
+        overlap = matcher.compare([
+            self._doc('二甲双胍禁用于心衰患者。eGFR低于45时二甲双胍应减量。心衰患者可以使用二甲双胍。', 10),
+        ])
+        self.assertEqual(overlap.removed_sentences, 2)
+        self.assertEqual([c.subject for c in overlap.conflicts], ['心力衰竭'])
+
+    def test_keeps_clauses_not_covered_by_kg(self):
+        """测试只去掉被 KG 覆盖的分句，提到 KG 未覆盖药品的句子、没有规则的分句保留"""
+        from src.evidence_matcher import EvidenceMatcher
+
+        rag_results = [
+            self._doc('eGFR<30时禁用二甲双胍和恩格列净。', 70),
+            self._doc('eGFR<30 ml/min时二甲双胍禁用，胰岛素可作为首选。', 71),
+        ]
+        overlap = EvidenceMatcher(self.kg_results, self.question).compare(rag_results)
+
+        self.assertEqual(overlap.removed_sentences, 0)
+        self.assertEqual(overlap.removed_clauses, 1)
+        self.assertIs(overlap.rag_results[0], rag_results[0])
+        self.assertEqual(overlap.rag_results[1]['document'], '胰岛素可作为首选。')
+
+    def test_trimmed_document_keeps_layout(self):
+        """测试只从原文中删去重复的句子和分句，换行、表格和没有标点的行保持原样"""
+        from src.evidence_matcher import EvidenceMatcher
+
+        content = (
+            '肾功能不全时的用药调整\n'
+            '| 药物 | eGFR |\n'
+            '| --- | --- |\n'
+            '| 二甲双胍 | <30禁用 |\n'
+            'eGFR<30时禁用二甲双胍。\n'
+            'eGFR<30 ml/min时二甲双胍禁用，胰岛素可作为首选。\n'
+            '定期监测\n'
+            '每3-6个月复查'
+        )
+        overlap = EvidenceMatcher(self.kg_results, self.question).compare([self._doc(content, 80)])
+
+        self.assertEqual((overlap.removed_sentences, overlap.removed_clauses), (1, 1))
+        self.assertEqual(overlap.rag_results[0]['document'], (
+            '肾功能不全时的用药调整\n'
+            '| 药物 | eGFR |\n'
+            '| --- | --- |\n'
+            '| 二甲双胍 | <30禁用 |\n'
+            '胰岛素可作为首选。\n'
+            '定期监测\n'
+            '每3-6个月复查'
+        ))
+
+
 class TestHybridRetriever(unittest.TestCase):
     """测试混合检索器"""
     
@@ -228,11 +1240,12 @@ class TestLangChainCypherRetriever(unittest.TestCase):
         cls.retriever.close()
     
     def test_example_matching(self):
-        """测试示例匹配"""
+        """测试常见问题命中意图模板"""
         result = self.retriever.query("eGFR小于30禁用药物", use_llm=False)
         
         self.assertTrue(result.success)
-        self.assertEqual(result.source, "example_match")
+        self.assertEqual(result.source, "template")
+        self.assertEqual(result.params["threshold"], 30.0)
         self.assertGreater(len(result.results), 0)
     
     def test_category_query(self):
@@ -243,6 +1256,493 @@ class TestLangChainCypherRetriever(unittest.TestCase):
         self.assertGreater(len(result.results), 0)
 
 
+class TestCypherTemplateLibrary(unittest.TestCase):
+    """测试意图 → Cypher 模板库"""
+
+    @classmethod
+    def setUpClass(cls):
+        from src.graph.cypher_templates import CypherTemplateLibrary
+        cls.library = CypherTemplateLibrary()
+
+    def test_slots_fill_parameters(self):
+        """测试槽位填充参数，而不是沿用示例中的固定字面量"""
+        match = self.library.match("ALT大于120时不能用哪些药？")
+        self.assertEqual(match.intent, "metric_threshold_contraindication")
+        self.assertEqual(match.params, {"metric": "ALT", "operator": ">", "threshold": 120.0})
+
+        match = self.library.match("格华止有哪些禁忌？")
+        self.assertEqual(match.intent, "drug_detail")
+        self.assertIn("{id: drug_id}", match.cypher)
+        self.assertEqual(match.params["drug_ids"], self.library.drug_resolver.resolve("二甲双胍"))
+
+        match = self.library.match("肝功能不全患者用药有什么限制？")
+        self.assertEqual(match.intent, "disease_contraindication")
+
+        match = self.library.match("有哪些磺脲类药物？")
+        self.assertEqual(match.params, {"category": "磺脲类"})
+
+    def test_unsupported_questions_go_to_llm(self):
+        """测试模板无法可靠覆盖的问题不匹配"""
+        self.assertIsNone(self.library.match("哪些药物既禁用于心衰又禁用于肾功能不全？"))
+        self.assertIsNone(self.library.match("哪些药物需要监测肾功能？"))
+        self.assertIsNone(self.library.match("有哪些SGLT2抑制剂？"))
+
+
+class TestFewShotExampleIndex(unittest.TestCase):
+    """测试 Few-shot 示例索引"""
+
+    @classmethod
+    def setUpClass(cls):
+        import json
+        from src.graph.few_shot_index import FewShotExampleIndex
+        with open(Path(__file__).parent.parent / "configs" / "few_shot_examples.json", encoding="utf-8") as f:
+            cls.examples = json.load(f)["examples"]
+        cls.index = FewShotExampleIndex(cls.examples, {"禁用": 3, "心力衰竭": 3, "eGFR": 3}, use_embeddings=False)
+        cls.index_cls = FewShotExampleIndex
+
+    def test_select_by_question(self):
+        """测试按问题选择示例，而不是固定取前几条"""
+        selected = self.index.select("心力衰竭患者禁用哪些药物？", top_k=2)
+        self.assertEqual(selected[0]["question"], "心力衰竭患者禁用哪些药物？")
+        self.assertEqual(len(selected), 2)
+
+        example, score = self.index.best_match("eGFR小于30禁用哪些药物？")
+        self.assertIn("eGFR", example["question"])
+        self.assertGreater(score, 0.15)
+
+    def test_embedding_scores(self):
+        """测试向量打分使用预先编码的示例矩阵"""
+        import numpy as np
+        calls = []
+
+        def embed_fn(texts):
+            calls.append(len(texts))
+            return np.array([[t.count("心"), t.count("肾"), 1.0] for t in texts])
+
+        index = self.index_cls(self.examples, embed_fn=embed_fn)
+        self.assertTrue(index.uses_embeddings)
+        self.assertIn("心", index.select("心衰", top_k=1)[0]["question"])
+        self.assertEqual(calls, [len(self.examples), 1])
+
+
+class TestRoutingLLMClient(unittest.TestCase):
+    """测试多提供商路由客户端"""
+
+    class FakeClient:
+        def __init__(self, provider, delay=0.0, fail=False):
+            self.provider = provider
+            self.model = "fake"
+            self.delay = delay
+            self.fail = fail
+
+        def chat(self, prompt, system=None):
+            import time
+            time.sleep(self.delay)
+            if self.fail:
+                raise ConnectionError(f"{self.provider} down")
+            return self.provider
+
+    def test_failover_and_circuit_breaker(self):
+        """测试失败转移与熔断"""
+        from src.llm_client import RoutingLLMClient, CircuitBreaker
+
+        router = RoutingLLMClient(
+            [self.FakeClient("a", fail=True), self.FakeClient("b")],
+            failure_threshold=1,
+            recovery_timeout=60
+        )
+
+        self.assertEqual(router("hi"), "b")
+        self.assertEqual(router.breakers["a/fake"].state, CircuitBreaker.OPEN)
+        self.assertEqual(router("hi"), "b")
+        self.assertEqual(router.get_stats()["a/fake"]["error_rate"], 1.0)
+
+    def test_hedged_request(self):
+        """测试慢提供商触发对冲请求"""
+        from src.llm_client import RoutingLLMClient
+
+        router = RoutingLLMClient(
+            [self.FakeClient("slow", delay=1.0), self.FakeClient("fast")],
+            hedge_default_delay=0.05
+        )
+
+        self.assertEqual(router("hi"), "fast")
+
+    def test_half_open_probe_in_flight_skipped(self):
+        """测试半开且试探请求在途的提供商不参与路由"""
+        from src.llm_client import RoutingLLMClient, CircuitBreaker
+
+        probing = self.FakeClient("a", fail=True)
+        router = RoutingLLMClient([probing, self.FakeClient("b")], failure_threshold=1, recovery_timeout=0)
+        breaker = router.breakers["a/fake"]
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow_request())
+
+        probing.fail = False
+        self.assertEqual(router._candidates(), [1])
+        self.assertEqual(router("hi"), "b")
+        router.close()
+
+    def test_client_errors_do_not_trip_breaker(self):
+        """测试非瞬时错误和内层熔断不计入路由熔断器，半开试探名额被归还"""
+        from src.llm_client import RoutingLLMClient, CircuitBreaker, CircuitOpenError
+
+        class ErrorClient(self.FakeClient):
+            def chat(self, prompt, system=None):
+                raise self.error
+
+        bad_request = ErrorClient("a")
+        bad_request.error = ValueError("invalid parameter")
+        inner_open = ErrorClient("b")
+        inner_open.error = CircuitOpenError("b/fake 熔断中，快速失败")
+        router = RoutingLLMClient([bad_request, inner_open, self.FakeClient("c")],
+                                  failure_threshold=1, recovery_timeout=0)
+
+        for _ in range(3):
+            self.assertEqual(router("hi"), "c")
+        for name in ("a/fake", "b/fake"):
+            self.assertEqual(router.breakers[name].state, CircuitBreaker.CLOSED)
+            self.assertEqual(router.get_stats()[name]["samples"], 0)
+
+        breaker = router.breakers["a/fake"]
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        with self.assertRaises(ValueError):
+            router._call(0, "hi")
+        self.assertTrue(breaker.available())
+        router.close()
+
+    def test_create_from_provider_string(self):
+        """测试逗号分隔的提供商配置"""
+        from src.llm_client import LLMClient, RoutingLLMClient, create_routing_llm_api
+
+        router = create_routing_llm_api("ollama, local")
+        self.assertIsInstance(router, RoutingLLMClient)
+        self.assertEqual(router.names, ["ollama/qwen2.5:7b", "local/default"])
+        router.close()
+
+        single = create_routing_llm_api(" ")
+        self.assertIsInstance(single, LLMClient)
+        self.assertEqual(single.provider, "siliconflow")
+
+
+class TestLLMClientRetry(unittest.TestCase):
+    """测试 LLMClient 重试与熔断"""
+
+    def _client(self, create, **kwargs):
+        from types import SimpleNamespace
+        from src.llm_client import LLMClient
+
+        client = LLMClient(provider="openai", cache_enabled=False, backoff_base=0, **kwargs)
+        client.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        return client
+
+    def test_retry_transient_errors(self):
+        """测试瞬时错误重试后成功，非瞬时错误不重试"""
+        from types import SimpleNamespace
+
+        attempts = []
+        response = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))], usage=None)
+
+        def flaky(**kwargs):
+            attempts.append(kwargs["timeout"])
+            if len(attempts) < 3:
+                raise TimeoutError("read timeout")
+            return response
+
+        client = self._client(flaky, max_retries=2, timeout=5)
+        self.assertEqual(client.chat("hi"), "ok")
+        self.assertEqual(attempts, [5, 5, 5])
+
+        def bad_request(**kwargs):
+            attempts.append(1)
+            raise ValueError("invalid parameter")
+
+        attempts.clear()
+        client = self._client(bad_request, max_retries=2)
+        with self.assertRaises(ValueError):
+            client.chat("hi")
+        self.assertEqual(len(attempts), 1)
+
+    def test_circuit_breaker_fails_fast(self):
+        """测试提供商持续不可用时熔断快速失败"""
+        from src.llm_client import CircuitOpenError
+
+        attempts = []
+
+        def down(**kwargs):
+            attempts.append(1)
+            raise ConnectionError("connection reset")
+
+        client = self._client(down, max_retries=1, breaker_threshold=1, breaker_recovery=60)
+        with self.assertRaises(ConnectionError):
+            client.chat("hi")
+        with self.assertRaises(CircuitOpenError):
+            client.chat("hi")
+        self.assertEqual(len(attempts), 2)
+
+    def test_non_retryable_error_leaves_breaker_untouched(self):
+        """测试鉴权失败等非瞬时错误不关闭半开熔断器、不清零失败计数"""
+        from src.llm_client import CircuitBreaker
+
+        class AuthError(Exception):
+            status_code = 401
+
+        def unauthorized(**kwargs):
+            raise AuthError("invalid api key")
+
+        client = self._client(unauthorized, max_retries=2, breaker_threshold=2, breaker_recovery=0)
+        client.breaker.record_failure()
+        with self.assertRaises(AuthError):
+            client.chat("hi")
+        self.assertEqual(client.breaker._failures, 1)
+
+        client.breaker.record_failure()
+        self.assertEqual(client.breaker.state, CircuitBreaker.HALF_OPEN)
+        with self.assertRaises(AuthError):
+            client.chat("hi")
+        self.assertEqual(client.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(client.breaker.allow_request())
+
+
+class TestLLMMetrics(unittest.TestCase):
+    """测试 LLM 调用遥测"""
+
+    def test_usage_recorded_by_caller_tag(self):
+        """测试按调用方标签记录 token 用量和缓存命中"""
+        from types import SimpleNamespace
+        from src.llm_client import LLMClient
+        from src.llm_metrics import llm_call_tag, get_metrics_registry
+
+        response = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))],
+            usage=SimpleNamespace(prompt_tokens=120, completion_tokens=8, prompt_tokens_details=None)
+        )
+        client = LLMClient(provider="openai", cache_enabled=True)
+        client.client = SimpleNamespace(chat=SimpleNamespace(
+            completions=SimpleNamespace(create=lambda **kwargs: response)
+        ))
+
+        registry = get_metrics_registry()
+        registry.reset()
+        with llm_call_tag("decision_fusion"):
+            client("prompt")
+            client("prompt")
+
+        stats = registry.summary()["decision_fusion"]
+        self.assertEqual(stats["calls"], 2)
+        self.assertEqual(stats["cache_hits"], 1)
+        self.assertEqual(stats["prompt_tokens"], 120)
+        self.assertEqual(stats["completion_tokens"], 8)
+
+    def test_hits_and_failures_cost_no_tokens(self):
+        """测试本地缓存命中和失败调用不计入 token 用量"""
+        from types import SimpleNamespace
+        from src.llm_client import LLMClient
+        from src.llm_metrics import llm_call_tag, get_metrics_registry
+
+        def bad_request(**kwargs):
+            raise ValueError("invalid parameter")
+
+        client = LLMClient(provider="openai", cache_enabled=False, max_retries=0)
+        client.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=bad_request)))
+
+        registry = get_metrics_registry()
+        registry.reset()
+        with llm_call_tag("text_to_cypher"):
+            with self.assertRaises(ValueError):
+                client("a long prompt " * 50)
+
+        stats = registry.summary()["text_to_cypher"]
+        self.assertEqual((stats["calls"], stats["errors"]), (1, 1))
+        self.assertEqual(stats["prompt_tokens"] + stats["completion_tokens"], 0)
+
+
+class TestBulkConsultRunner(unittest.TestCase):
+    """测试离线批量咨询运行器"""
+
+    def test_run_and_resume(self):
+        """测试并发调用 LLM、写出报告，以及重启后跳过已完成病例"""
+        import json
+        import tempfile
+        from types import SimpleNamespace
+        from src.agent.case_analyzer import CaseAnalyzer
+        from src.agent.decision_fusion import DecisionFusion
+        from src.agent.risk_detector import RiskReport, RiskWarning, RiskSeverity
+        from src.agent.bulk_consult import BulkConsultRunner
+
+        analyzer = CaseAnalyzer()
+        fusion = DecisionFusion(cache_enabled=True)
+
+        def prepare_consult(case_text, require_llm=True):
+            profile = analyzer.extract_with_rules(case_text)
+            risk_report = RiskReport(warnings=[RiskWarning(
+                drug_name="二甲双胍", risk_type="指标禁忌",
+                severity=RiskSeverity.CRITICAL, reason="eGFR < 30"
+            )])
+            return fusion.prepare(profile, risk_report, require_llm=require_llm)
+
+        agent = SimpleNamespace(prepare_consult=prepare_consult, decision_fusion=fusion)
+        prompts = []
+
+        def llm(prompt):
+            prompts.append(prompt)
+            return "1. 停用二甲双胍 —— 来源: 图谱规则"
+
+        with tempfile.TemporaryDirectory() as tmp:
+            input_path = f"{tmp}/cases.jsonl"
+            output_path = f"{tmp}/reports.jsonl"
+            with open(input_path, "w", encoding="utf-8") as f:
+                for i in range(3):
+                    f.write(json.dumps({"id": f"c{i}", "case_text": "用药：二甲双胍\neGFR：28"}, ensure_ascii=False) + "\n")
+
+            runner = BulkConsultRunner(agent, output_path, llm_client=llm, chunk_size=2)
+            stats = runner.run(input_path)
+            self.assertEqual(stats["ok"], 3)
+            # 三个病例临床签名相同，只调用一次 LLM
+            self.assertEqual(len(prompts), 1)
+
+            stats = runner.run(input_path)
+            self.assertEqual(stats["skipped"], 3)
+            self.assertEqual(len(prompts), 1)
+
+            with open(output_path, encoding="utf-8") as f:
+                records = [json.loads(line) for line in f]
+            self.assertEqual([r["id"] for r in records], ["c0", "c1", "c2"])
+            self.assertTrue(records[0]["report"]["llm_response"])
+
+    def test_failed_cases_retried_on_resume(self):
+        """测试 LLM 无响应的病例记为 llm_failed、分析出错的病例记为 error，重启后两者都重新处理"""
+        import json
+        import tempfile
+        from types import SimpleNamespace
+        from src.agent.case_analyzer import CaseAnalyzer
+        from src.agent.decision_fusion import DecisionFusion
+        from src.agent.risk_detector import RiskReport, RiskWarning, RiskSeverity
+        from src.agent.bulk_consult import BulkConsultRunner
+
+        analyzer = CaseAnalyzer()
+        fusion = DecisionFusion(cache_enabled=False)
+        broken = {"c1"}
+
+        def prepare_consult(case_text, require_llm=True):
+            if case_text in broken:
+                raise ValueError("病例解析失败")
+            profile = analyzer.extract_with_rules(case_text)
+            risk_report = RiskReport(warnings=[RiskWarning(
+                drug_name="二甲双胍", risk_type="指标禁忌",
+                severity=RiskSeverity.CRITICAL, reason="eGFR < 30"
+            )])
+            return fusion.prepare(profile, risk_report, require_llm=require_llm)
+
+        agent = SimpleNamespace(prepare_consult=prepare_consult, decision_fusion=fusion)
+        llm_up = [False]
+
+        def llm(prompt):
+            if not llm_up[0]:
+                raise ConnectionError("provider down")
+            return "1. 停用二甲双胍 —— 来源: 图谱规则"
+
+        with tempfile.TemporaryDirectory() as tmp:
+            input_path = f"{tmp}/cases.jsonl"
+            output_path = f"{tmp}/reports.jsonl"
+            with open(input_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"id": "c0", "case_text": "用药：二甲双胍\neGFR：28"}, ensure_ascii=False) + "\n")
+                f.write(json.dumps({"id": "c1", "case_text": "c1"}, ensure_ascii=False) + "\n")
+
+            runner = BulkConsultRunner(agent, output_path, llm_client=llm)
+            stats = runner.run(input_path)
+            self.assertEqual((stats["ok"], stats["llm_failed"], stats["error"]), (0, 1, 1))
+
+            llm_up[0] = True
+            broken.clear()
+            stats = runner.run(input_path)
+            self.assertEqual((stats["skipped"], stats["ok"]), (0, 2))
+
+            stats = runner.run(input_path)
+            self.assertEqual(stats["skipped"], 2)
+
+            with open(output_path, encoding="utf-8") as f:
+                records = [json.loads(line) for line in f]
+            self.assertEqual([(r["id"], r["status"]) for r in records],
+                             [("c0", "llm_failed"), ("c1", "error"), ("c0", "ok"), ("c1", "ok")])
+            self.assertTrue(records[2]["report"]["llm_response"])
+
+    def test_batch_poll_errors_do_not_resubmit(self):
+        """测试 Batch 轮询出错时重试，重试耗尽时中止并保留检查点，不回退为并发调用"""
+        import json
+        import tempfile
+        from types import SimpleNamespace
+        from src.agent.case_analyzer import CaseAnalyzer
+        from src.agent.decision_fusion import DecisionFusion
+        from src.agent.risk_detector import RiskReport, RiskWarning, RiskSeverity
+        from src.agent.bulk_consult import BulkConsultRunner, BatchPollError
+
+        analyzer = CaseAnalyzer()
+        fusion = DecisionFusion(cache_enabled=False)
+        risk_report = RiskReport(warnings=[RiskWarning(
+            drug_name="二甲双胍", risk_type="指标禁忌", severity=RiskSeverity.CRITICAL, reason="eGFR < 30"
+        )])
+        agent = SimpleNamespace(
+            prepare_consult=lambda text, require_llm=True: fusion.prepare(
+                analyzer.extract_with_rules(text), risk_report, require_llm=require_llm),
+            decision_fusion=fusion,
+        )
+
+        polls, concurrent, failing = [], [], set()
+        submitted = []
+
+        def retrieve(batch_id):
+            polls.append(batch_id)
+            if len(polls) in failing:
+                raise ConnectionError("connection reset")
+            return SimpleNamespace(status="completed", output_file_id="out-1")
+
+        output = json.dumps({"custom_id": "c0", "response": {"body": {
+            "choices": [{"message": {"content": "建议"}}]}}}, ensure_ascii=False)
+
+        class FakeLLM:
+            provider, model, temperature, max_tokens = "openai", "fake", 0.0, 100
+            client = SimpleNamespace(
+                files=SimpleNamespace(create=lambda **kw: SimpleNamespace(id="in-1"),
+                                      content=lambda file_id: SimpleNamespace(text=output)),
+                batches=SimpleNamespace(create=lambda **kw: submitted.append(1) or SimpleNamespace(id="batch-1"),
+                                        retrieve=retrieve),
+            )
+
+            def __call__(self, prompt):
+                concurrent.append(prompt)
+                return "并发"
+
+        with tempfile.TemporaryDirectory() as tmp:
+            input_path = f"{tmp}/cases.jsonl"
+            with open(input_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"id": "c0", "case_text": "用药：二甲双胍\neGFR：28"}, ensure_ascii=False) + "\n")
+
+            # 第一次查询出错后重试成功
+            failing.add(1)
+            runner = BulkConsultRunner(agent, f"{tmp}/ok.jsonl", llm_client=FakeLLM(), poll_interval=0, poll_retries=2)
+            self.assertTrue(runner.use_batch_api)
+            self.assertEqual(runner.run(input_path)["ok"], 1)
+            self.assertEqual((len(polls), concurrent), (2, []))
+
+            # 连续出错: 中止运行，检查点保留 Batch 任务 id，重启后继续轮询同一任务而不重新提交
+            polls.clear()
+            submitted.clear()
+            failing.update({2, 3})
+            runner = BulkConsultRunner(agent, f"{tmp}/retry.jsonl", llm_client=FakeLLM(), poll_interval=0, poll_retries=2)
+            with self.assertRaises(BatchPollError):
+                runner.run(input_path)
+            self.assertEqual(concurrent, [])
+            self.assertEqual(runner._load_checkpoint()["pending_batch"]["batch_id"], "batch-1")
+
+            failing.clear()
+            self.assertEqual(runner.run(input_path)["ok"], 1)
+            self.assertEqual((len(submitted), concurrent), (1, []))
+            self.assertEqual(runner._load_checkpoint(), {})
+
+
 class TestIntegration(unittest.TestCase):
     """集成测试"""
     
@@ -285,9 +1785,31 @@ def run_tests():
         TestPatientProfile,
         TestCaseAnalyzer,
         TestRiskDetector,
+        TestContraindicationRuleEngine,
+        TestBatchedRiskQuery,
+        TestGraphClient,
+        TestCypherResultCache,
+        TestCypherValidator,
+        TestGraphImportRows,
+        TestEntityExtractor,
+        TestGuidelineParser,
+        TestNearDuplicateDedup,
+        TestDrugDataPipeline,
+        TestDrugResolver,
+        TestPopulationScreener,
         TestDecisionFusion,
+        TestFusionCache,
+        TestPromptBuilder,
+        TestContextPacker,
+        TestEvidenceMatcher,
         TestHybridRetriever,
         TestLangChainCypherRetriever,
+        TestCypherTemplateLibrary,
+        TestFewShotExampleIndex,
+        TestRoutingLLMClient,
+        TestLLMClientRetry,
+        TestLLMMetrics,
+        TestBulkConsultRunner,
         TestIntegration,
     ]
     